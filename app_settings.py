@@ -0,0 +1,346 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from version_info import __version__
+from dataclasses import dataclass, field
+from types import MappingProxyType
+import logging
+import os
+import threading
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+DEFAULT_SETTINGS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "settings.env")
+# settings.envの変更を確認する間隔（秒）
+DEFAULT_SETTINGS_RELOAD_INTERVAL = 5.0
+
+# 常に必須の設定
+REQUIRED_KEYS = (
+    "BLUESKY_USERNAME",
+    "BLUESKY_APP_PASSWORD",
+    "TWITCH_CLIENT_ID",
+    "TWITCH_CLIENT_SECRET",
+    "TWITCH_BROADCASTER_ID",
+)
+
+# 整数として解釈できる必要がある設定とその既定値
+INTEGER_KEYS = {
+    "RETRY_MAX": 3,
+    "RETRY_WAIT": 2,
+    "LOG_RETENTION_DAYS": 14,
+}
+
+logger = logging.getLogger("AppLogger")
+
+
+class SettingsError(ValueError):
+    """設定値の検証に失敗した場合の例外"""
+
+
+def _flag(values, key, default):
+    return str(values.get(key, default)).strip().lower() == "true"
+
+
+@dataclass(frozen=True)
+class AppSettings:
+    """
+    settings.envを解釈した設定のスナップショット（変更不可）。
+    設定が変わったときは新しいスナップショットに丸ごと差し替える。
+    よく使う設定は型付きの属性で、それ以外はget()で文字列のまま参照する
+    """
+
+    bluesky_username: str = ""
+    bluesky_app_password: str = ""
+    bluesky_image_path: str = None
+    twitch_client_id: str = ""
+    twitch_client_secret: str = ""
+    twitch_broadcaster_id: str = ""
+    twitch_user_access_token: str = ""
+    eventsub_transport: str = "webhook"
+    tunnel_service: str = ""
+    webhook_callback_url: str = ""
+    webhook_callback_url_permanent: str = ""
+    webhook_callback_url_temporary: str = ""
+    webhook_dispatch_mode: str = "sync"
+    notify_on_twitch_online: bool = True
+    notify_on_twitch_offline: bool = False
+    timezone: str = "system"
+    retry_max: int = 3
+    retry_wait: int = 2
+    log_retention_days: int = 14
+    # 全設定値（キー -> 文字列）
+    values: MappingProxyType = field(default_factory=lambda: MappingProxyType({}), repr=False)
+    # 解釈できなかった数値設定 (キー, 値)
+    invalid_values: tuple = ()
+
+    @classmethod
+    def from_mapping(cls, values):
+        values = dict(values)
+        integers = {}
+        invalid = []
+        for key, default in INTEGER_KEYS.items():
+            raw = values.get(key, default)
+            try:
+                integers[key] = int(raw)
+            except (TypeError, ValueError):
+                integers[key] = default
+                invalid.append((key, raw))
+        return cls(
+            bluesky_username=values.get("BLUESKY_USERNAME", ""),
+            bluesky_app_password=values.get("BLUESKY_APP_PASSWORD", ""),
+            bluesky_image_path=values.get("BLUESKY_IMAGE_PATH"),
+            twitch_client_id=values.get("TWITCH_CLIENT_ID", ""),
+            twitch_client_secret=values.get("TWITCH_CLIENT_SECRET", ""),
+            twitch_broadcaster_id=values.get("TWITCH_BROADCASTER_ID", ""),
+            twitch_user_access_token=values.get("TWITCH_USER_ACCESS_TOKEN", ""),
+            eventsub_transport=values.get("TWITCH_EVENTSUB_TRANSPORT", "webhook").strip().lower(),
+            tunnel_service=values.get("TUNNEL_SERVICE", "").strip().lower(),
+            webhook_callback_url=values.get("WEBHOOK_CALLBACK_URL", ""),
+            webhook_callback_url_permanent=values.get("WEBHOOK_CALLBACK_URL_PERMANENT", ""),
+            webhook_callback_url_temporary=values.get("WEBHOOK_CALLBACK_URL_TEMPORARY", ""),
+            webhook_dispatch_mode=values.get("WEBHOOK_DISPATCH_MODE", "sync").strip().lower(),
+            notify_on_twitch_online=_flag(values, "NOTIFY_ON_TWITCH_ONINE", "True"),
+            notify_on_twitch_offline=_flag(values, "NOTIFY_ON_TWITCH_OFFLINE", "False"),
+            timezone=values.get("TIMEZONE", "system"),
+            retry_max=integers["RETRY_MAX"],
+            retry_wait=integers["RETRY_WAIT"],
+            log_retention_days=integers["LOG_RETENTION_DAYS"],
+            values=MappingProxyType(values),
+            invalid_values=tuple(invalid),
+        )
+
+    @classmethod
+    def from_environ(cls):
+        return cls.from_mapping(os.environ)
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def flag(self, key, default="False"):
+        return _flag(self.values, key, default)
+
+    @property
+    def is_websocket_transport(self):
+        return self.eventsub_transport == "websocket"
+
+    @property
+    def is_async_dispatch(self):
+        return self.webhook_dispatch_mode == "async"
+
+    def template_path(self, key, default):
+        return self.values.get(key) or default
+
+    def missing_keys(self):
+        missing = [key for key in REQUIRED_KEYS if not self.values.get(key)]
+        # Webhook URLの必須判定をトンネル種別で分岐（WebSocket使用時はトンネル不要）
+        if self.is_websocket_transport:
+            if not self.twitch_user_access_token:
+                missing.append("TWITCH_USER_ACCESS_TOKEN")
+        elif self.tunnel_service in ("cloudflare", "custom"):
+            if not self.webhook_callback_url_permanent:
+                missing.append("WEBHOOK_CALLBACK_URL_PERMANENT")
+        elif self.tunnel_service in ("ngrok", "localtunnel"):
+            if not self.webhook_callback_url_temporary:
+                missing.append("WEBHOOK_CALLBACK_URL_TEMPORARY")
+        elif not self.webhook_callback_url:
+            missing.append("WEBHOOK_CALLBACK_URL")
+        return missing
+
+    def validate(self):
+        """
+        必須設定と数値設定を検証する。問題があればSettingsErrorを送出し、なければ自身を返す
+        """
+        missing = self.missing_keys()
+        if missing:
+            raise SettingsError(f"settings.envの必須設定が未設定です: {', '.join(missing)}")
+        if self.invalid_values:
+            key, value = self.invalid_values[0]
+            raise SettingsError(f"settings.envの数値設定値 '{key}' (値: {value}) が不正です")
+        return self
+
+
+def read_settings_file(path):
+    # settings.envをキー -> 値の辞書として読み込む（存在しなければ空）
+    if not path or not os.path.exists(path):
+        return {}
+    from dotenv import dotenv_values
+
+    return {key: value for key, value in dotenv_values(path).items() if value is not None}
+
+
+class SettingsStore:
+    """
+    現在の設定スナップショットを保持し、settings.envの変更時に差し替える。
+    読み出し側はロックを取らずに current を参照する（参照の差し替えのみで更新する）
+    """
+
+    def __init__(self, path=DEFAULT_SETTINGS_PATH, logger_to_use=None):
+        self.path = path
+        self.logger = logger_to_use if logger_to_use else logger
+        self._current = None
+        # 前回ファイルから反映した値（変更されたキーだけ環境変数に書き戻すため）
+        self._file_values = {}
+        self._file_mtime = None
+        self._lock = threading.Lock()
+        self._listeners = []
+        self._stop_event = threading.Event()
+        self._watcher = None
+        self.reload_count = 0
+
+    @property
+    def current(self):
+        snapshot = self._current
+        if snapshot is None:
+            with self._lock:
+                if self._current is None:
+                    self._current = AppSettings.from_environ()
+                snapshot = self._current
+        return snapshot
+
+    def add_listener(self, listener):
+        # listener(old, new) は設定が差し替えられた後に呼ばれる
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _file_mtime_ns(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except (OSError, TypeError):
+            return None
+
+    def reload(self):
+        """
+        settings.envを読み直し、変更された値を環境変数に反映して新しいスナップショットに差し替える。
+        ファイル読み込み前から環境変数にある値は上書きしない（load_dotenvと同じ優先順位）。
+        ファイルから削除されたキーは、環境変数がファイルの値のままであれば環境変数からも削除する
+        """
+        with self._lock:
+            mtime = self._file_mtime_ns()
+            file_values = read_settings_file(self.path)
+            for key, value in file_values.items():
+                previous = self._file_values.get(key)
+                if key not in os.environ or (previous is not None and previous != value):
+                    os.environ[key] = value
+            for key, previous in self._file_values.items():
+                if key not in file_values and os.environ.get(key) == previous:
+                    os.environ.pop(key, None)
+            self._file_values = file_values
+            self._file_mtime = mtime
+            old = self._current
+            new = AppSettings.from_environ()
+            self._current = new
+            self.reload_count += 1
+        for listener in list(self._listeners):
+            try:
+                listener(old, new)
+            except Exception as e:
+                self.logger.warning(f"設定変更の反映中にエラーが発生しました: {e}")
+        return new
+
+    def reset(self):
+        # 次回参照時に環境変数から作り直す（テスト・設定画面からの変更用）
+        with self._lock:
+            self._current = None
+
+    def check_for_changes(self):
+        # ファイルの更新時刻が変わっていれば読み直す。読み直した場合はTrue
+        if self._file_mtime_ns() == self._file_mtime:
+            return False
+        new = self.reload()
+        if new.invalid_values or new.missing_keys():
+            self.logger.warning("settings.envの変更を反映しましたが、未設定または不正な設定値があります。")
+        else:
+            self.logger.info("settings.envの変更を反映しました。")
+        return True
+
+    def start_watching(self, interval=DEFAULT_SETTINGS_RELOAD_INTERVAL):
+        # settings.envの変更を監視するスレッドを起動する（ファイルがない・間隔0以下なら何もしない）
+        if interval <= 0 or self._file_mtime_ns() is None:
+            return False
+        if self._watcher is not None and self._watcher.is_alive():
+            return True
+        if self._file_mtime is None:
+            self._file_mtime = self._file_mtime_ns()
+        self._stop_event.clear()
+        self._watcher = threading.Thread(
+            target=self._watch_loop, args=(float(interval),), name="SettingsWatcher", daemon=True)
+        self._watcher.start()
+        return True
+
+    def stop_watching(self, timeout=5):
+        self._stop_event.set()
+        if self._watcher is not None:
+            self._watcher.join(timeout=timeout)
+            self._watcher = None
+
+    def _watch_loop(self, interval):
+        while not self._stop_event.wait(interval):
+            try:
+                self.check_for_changes()
+            except Exception as e:
+                self.logger.warning(f"settings.envの再読み込みに失敗しました: {e}")
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_settings_store():
+    # 共有の設定ストアを返す（初回呼び出し時に作成）
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SettingsStore(DEFAULT_SETTINGS_PATH)
+        return _store
+
+
+def get_settings():
+    """
+    現在の設定スナップショットを返す
+    """
+    store = _store if _store is not None else get_settings_store()
+    return store.current
+
+
+def reload_settings():
+    return get_settings_store().reload()
+
+
+def reset_settings():
+    get_settings_store().reset()
+
+
+def start_settings_watcher():
+    interval = float(os.getenv("SETTINGS_RELOAD_INTERVAL", DEFAULT_SETTINGS_RELOAD_INTERVAL))
+    return get_settings_store().start_watching(interval)
+
+
+def stop_settings_watcher():
+    if _store is not None:
+        _store.stop_watching()
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from version_info import __version__
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+DEFAULT_BLOB_CACHE_PATH = "data/blob_cache.json"
+DEFAULT_BLOB_CACHE_MAX_ENTRIES = 100
+
+logger = logging.getLogger("AppLogger")
+
+
+def content_digest(data):
+    # 画像データのSHA-256（16進文字列）。キャッシュのキーに使う
+    return hashlib.sha256(data).hexdigest()
+
+
+class BlobCache:
+    """
+    アップロード済み画像のblob参照を、画像データのSHA-256を含むキーでファイルへ保存するキャッシュ。
+    同じ画像を投稿するたびにupload_blobし直さないために使う。
+    """
+
+    def __init__(self, path=DEFAULT_BLOB_CACHE_PATH, max_entries=DEFAULT_BLOB_CACHE_MAX_ENTRIES):
+        self.path = path or None
+        self.max_entries = max(1, int(max_entries))
+        # key -> {"blob": blob参照(JSON), "stored_at": 保存時刻}。古いものほど先頭
+        self._entries = OrderedDict()
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._entries)
+
+    def _ensure_loaded(self):
+        # 初回アクセス時にファイルから読み込む（ロック取得済みで呼ぶこと）
+        if self._loaded:
+            return
+        self._loaded = True
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            entries = data.get("entries", {}) if isinstance(data, dict) else {}
+        except Exception as e:
+            logger.warning(f"blobキャッシュの読み込みに失敗しました: {self.path}, エラー: {e}")
+            return
+        for key, entry in sorted(
+                entries.items(), key=lambda item: item[1].get("stored_at", 0) if isinstance(item[1], dict) else 0):
+            if isinstance(entry, dict) and isinstance(entry.get("blob"), dict):
+                self._entries[key] = entry
+
+    def _save(self):
+        # キャッシュ内容をファイルに保存する（ロック取得済みで呼ぶこと）
+        if not self.path:
+            return
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"entries": dict(self._entries)}, f)
+            os.replace(tmp_path, self.path)
+        except Exception as e:
+            logger.warning(f"blobキャッシュの保存に失敗しました: {self.path}, エラー: {e}")
+
+    def get(self, key):
+        """
+        keyに対応するblob参照(JSON形式のdict)を返す。なければNone
+        """
+        with self._lock:
+            self._ensure_loaded()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry["blob"]
+
+    def put(self, key, blob_json):
+        # アップロード結果のblob参照を登録し、ファイルに保存する
+        with self._lock:
+            self._ensure_loaded()
+            self._entries[key] = {"blob": blob_json, "stored_at": time.time()}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def discard(self, key):
+        # PDSに受け付けられなかったblob参照を削除する
+        with self._lock:
+            self._ensure_loaded()
+            if self._entries.pop(key, None) is not None:
+                self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._loaded = True
+            self._save()
@@ -5,13 +5,21 @@ Stream notify on Bluesky
 このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
 """
 
-from datetime import datetime
-from utils import retry_on_exception, is_valid_url, format_datetime_filter, notify_discord_error
+from utils import is_valid_url, format_datetime_filter, notify_discord_error, env_int
+from post_history import get_post_history_store
+from rate_limiter import call_with_rate_limit, get_rate_limiter
+from retry_policy import RetryPolicy, is_retryable_http_error
 import os
-import csv
+import json
 import logging
+import threading
+import time
 from atproto import Client, exceptions
-from jinja2 import Template
+from atproto_client.models.blob_ref import BlobRef
+from app_settings import get_settings
+from blob_cache import BlobCache, DEFAULT_BLOB_CACHE_PATH, content_digest
+from image_preprocessor import ImagePreprocessor
+from jinja2 import Environment
 from version_info import __version__
 
 __author__ = "mayuneco(mayunya)"
@@ -34,21 +42,127 @@ __app_version__ = __version__
 # もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
 # 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
 
-# リトライ回数のデフォルト値を環境変数から取得
-RETRY_MAX = int(os.getenv("RETRY_MAX", 3))
-RETRY_WAIT = int(os.getenv("RETRY_WAIT", 2))
+# リトライ回数のデフォルト値を環境変数から取得（import後に読み込まれた設定も反映する）
+RETRY_MAX = env_int("RETRY_MAX", 3)
+RETRY_WAIT = env_int("RETRY_WAIT", 2)
+# 1回の投稿で再試行に使ってよい時間（秒）。Webhookの応答が遅れすぎないようにする
+RETRY_DEADLINE = env_int("BLUESKY_RETRY_DEADLINE", 60)
+
+# Bluesky API呼び出しの再試行ポリシー（接続エラー・429・5xxのみ再試行する）
+BLUESKY_RETRY_POLICY = RetryPolicy(
+    "bluesky",
+    max_attempts=RETRY_MAX,
+    base_delay=RETRY_WAIT,
+    deadline=RETRY_DEADLINE,
+    retryable=(exceptions.NetworkError, exceptions.RateLimitExceededError),
+    classify=is_retryable_http_error,
+)
 
 # アプリケーション用ロガー
 logger = logging.getLogger("AppLogger")
 
+# ログインセッションの保存先（再起動後もcreateSessionせずに再利用する）
+DEFAULT_SESSION_PATH = "data/bluesky_session.json"
+
+# キャッシュ済みblobが使えなくなったと判断するXRPCエラー名
+BLOB_ERROR_NAMES = ("BlobNotFound", "InvalidBlob")
+
+# 呼び出し上限を管理するXRPCメソッド -> rate_limiterの名前
+RATE_LIMITED_METHODS = {
+    "com.atproto.server.createSession": "bluesky.createSession",
+    "com.atproto.repo.createRecord": "bluesky.createRecord",
+    "com.atproto.repo.uploadBlob": "bluesky.uploadBlob",
+}
+
+# 再ログインが必要と判断するXRPCエラー名
+AUTH_ERROR_NAMES = ("ExpiredToken", "InvalidToken", "AuthenticationRequired")
+
 # デフォルトテンプレートパス（ユーザーが直接触れない内部用・不可視ファイル）
 DEFAULT_ONLINE_TEMPLATE_PATH = ".templates/default_online_template.txt"
 DEFAULT_OFFLINE_TEMPLATE_PATH = ".templates/default_offline_template.txt"
 
 
+class TemplateRegistry:
+    """
+    テンプレートファイルのパスをキーに、コンパイル済みのJinja2テンプレートを保持するレジストリ。
+    ファイルの更新はmtime・サイズで検出し、check_interval秒以内の再利用ではファイルを確認しない
+    """
+
+    def __init__(self, check_interval=2.0):
+        self.check_interval = check_interval
+        # 全テンプレートで共有するJinja2環境（カスタムフィルタはここで一度だけ登録）
+        self.environment = Environment()
+        self.environment.filters['datetimeformat'] = format_datetime_filter
+        # path -> (Template, mtime_ns, size, 最終確認時刻)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def compile(self, source):
+        return self.environment.from_string(source)
+
+    def lookup(self, path):
+        """
+        キャッシュ済みで、ファイルが更新されていなければテンプレートを返す。なければNone
+        """
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is None:
+            return None
+        template_obj, mtime_ns, size, checked_at = entry
+        now = time.monotonic()
+        if now - checked_at < self.check_interval:
+            return template_obj
+        try:
+            st = os.stat(path)
+        except OSError:
+            self.invalidate(path)
+            return None
+        if st.st_mtime_ns != mtime_ns or st.st_size != size:
+            self.invalidate(path)
+            return None
+        with self._lock:
+            if self._entries.get(path) is entry:
+                self._entries[path] = (template_obj, mtime_ns, size, now)
+        return template_obj
+
+    def store(self, path, source, st):
+        # テンプレートをコンパイルし、読み込み時のファイル情報とともに登録する
+        template_obj = self.compile(source)
+        with self._lock:
+            self._entries[path] = (template_obj, st.st_mtime_ns, st.st_size, time.monotonic())
+        return template_obj
+
+    def is_cached(self, path):
+        return self.lookup(path) is not None
+
+    def invalidate(self, path=None):
+        """
+        指定パス（省略時は全件）のキャッシュを破棄する。GUIでテンプレート設定を保存した際などに呼ぶ
+        """
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(path, None)
+
+
+template_registry = TemplateRegistry()
+
+
+def invalidate_template_cache(path=None):
+    # テンプレートファイルが変更されたことをレジストリに通知する
+    template_registry.invalidate(path)
+
+
+def template_exists(path):
+    # キャッシュ済みならファイルを確認せずに存在するとみなす
+    return bool(path) and (template_registry.is_cached(path) or os.path.isfile(path))
+
+
 def load_template(path=None):
     """
-    テンプレートファイルを読み込み、Jinja2 Templateオブジェクトを返す
+    テンプレートファイルを読み込み、Jinja2 Templateオブジェクトを返す。
+    コンパイル済みテンプレートはレジストリにキャッシュし、ファイル更新時のみ再読み込みする
     """
     template_string = ""
     if path is None:
@@ -56,6 +170,15 @@ def load_template(path=None):
         logger.warning(
             f"load_templateにパスが指定されませんでした。デフォルトのオンラインテンプレートパス '{path}' を使用します。")
 
+    cached = template_registry.lookup(path)
+    if cached is not None:
+        return cached
+
+    try:
+        st = os.stat(path)
+    except OSError:
+        st = None
+
     try:
         with open(path, encoding="utf-8") as f:
             template_string = f.read()
@@ -64,36 +187,256 @@ def load_template(path=None):
             f"テンプレートファイルが見つかりません: {path}. フォールバックエラーテンプレートを使用します。"
         )
         template_string = "Error: Template '{{ template_path }}' not found. Please check settings."
+        st = None
     except Exception as e:
         logger.error(f"テンプレート '{path}' の読み込み中に予期せぬエラー: {e}", exc_info=True)
         template_string = "Error: Failed to load template '{{ template_path }}' due to an unexpected error."
+        st = None
 
-    # Jinja2 Templateオブジェクトを生成
-    template_obj = Template(template_string)
-    # カスタムフィルタをテンプレート環境に追加
-    template_obj.environment.filters['datetimeformat'] = format_datetime_filter
-    return template_obj
+    # 読み込めたテンプレートのみキャッシュする（エラーテンプレートは毎回読み直す）
+    if st is not None:
+        return template_registry.store(path, template_string, st)
+    return template_registry.compile(template_string)
 
 
 # 監査用ロガー
 audit_logger = logging.getLogger("AuditLogger")
 
 
+def is_auth_error(e):
+    """
+    セッション切れ・無効トークンなど、再ログインで回復できるエラーか判定する
+    """
+    if isinstance(e, exceptions.UnauthorizedError):
+        return True
+    if isinstance(e, exceptions.BadRequestError):
+        content = getattr(getattr(e, "response", None), "content", None)
+        return getattr(content, "error", None) in AUTH_ERROR_NAMES
+    return False
+
+
+def is_blob_rejection(e):
+    """
+    投稿に添付したblob参照がPDSに受け付けられなかった（期限切れ・削除済みなど）エラーか判定する
+    """
+    if not isinstance(e, exceptions.BadRequestError):
+        return False
+    content = getattr(getattr(e, "response", None), "content", None)
+    error_name = getattr(content, "error", None) or ""
+    message = getattr(content, "message", None) or ""
+    return error_name in BLOB_ERROR_NAMES or "blob" in message.lower()
+
+
+def _blob_to_json(blob):
+    # blob参照をキャッシュ保存用のdictに変換する（変換できない場合はNone）
+    if isinstance(blob, BlobRef):
+        return blob.model_dump(mode="json", by_alias=True)
+    return None
+
+
+def online_template_path(platform="twitch"):
+    # 配信開始通知の既定テンプレート（settings.envの設定・未設定なら同梱のテンプレート）
+    settings = get_settings()
+    if platform == "youtube":
+        return settings.template_path(
+            "BLUESKY_YT_ONLINE_TEMPLATE_PATH", "templates/yt_online_template.txt")
+    if platform == "niconico":
+        return settings.template_path(
+            "BLUESKY_NICO_ONLINE_TEMPLATE_PATH", "templates/nico_online_template.txt")
+    return settings.template_path(
+        "BLUESKY_TEMPLATE_PATH", "templates/twitch_online_template.txt")
+
+
+def offline_template_path(platform="twitch"):
+    # 配信終了通知の既定テンプレート（オフライン通知はTwitchのみ想定）
+    return get_settings().template_path(
+        "BLUESKY_OFFLINE_TEMPLATE_PATH", "templates/twitch_offline_template.txt")
+
+
+def new_video_template_path(platform=None):
+    # 新着動画通知の既定テンプレート
+    settings = get_settings()
+    if platform == "niconico":
+        return settings.template_path(
+            "BLUESKY_NICO_NEW_VIDEO_TEMPLATE_PATH", "templates/nico_new_video_template.txt")
+    return settings.template_path(
+        "BLUESKY_YT_NEW_VIDEO_TEMPLATE_PATH", "templates/yt_new_video_template.txt")
+
+
 class BlueskyPoster:
-    def __init__(self, username, password):
+    def __init__(self, username, password, session_path=None, blob_cache=None, image_preprocessor=None,
+                 retry_policy=None):
         # Blueskyクライアントの初期化
         self.client = Client()
+        # API呼び出しの再試行（指数バックオフ・Retry-After対応）
+        self.retry_policy = retry_policy if retry_policy is not None else BLUESKY_RETRY_POLICY
         self.username = username
         self.password = password
+        self.session_path = session_path if session_path is not None else os.getenv(
+            "BLUESKY_SESSION_PATH", DEFAULT_SESSION_PATH)
+        # アップロード済み画像のblob参照キャッシュ（同じ画像の再アップロードを省く）
+        self.blob_cache = blob_cache if blob_cache is not None else BlobCache(
+            os.getenv("BLUESKY_BLOB_CACHE_PATH", DEFAULT_BLOB_CACHE_PATH))
+        # 投稿用画像の縮小・再エンコード（BLUESKY_IMAGE_PREPROCESS=Falseで無効）
+        if image_preprocessor is not None:
+            self.image_preprocessor = image_preprocessor
+        elif os.getenv("BLUESKY_IMAGE_PREPROCESS", "True").lower() == "true":
+            self.image_preprocessor = ImagePreprocessor.from_env()
+        else:
+            self.image_preprocessor = None
+        self._logged_in = False
+        self._login_lock = threading.RLock()
+        # アクセストークンの更新・ログイン時にセッションを保存する
+        self.client.on_session_change(self._on_session_change)
+        self._install_rate_limits()
+
+    def _install_rate_limits(self):
+        """
+        atprotoクライアントのXRPC呼び出しに呼び出し上限（トークンバケット）を挟む。
+        上限に達していれば送信前に待ち、レスポンスのratelimitヘッダーで残数を更新する
+        """
+        invoke = getattr(self.client, "_invoke", None)
+        if invoke is None:
+            logger.warning("atprotoクライアントにXRPC呼び出しの差し込み口がないため、Blueskyの呼び出し上限を適用しません。")
+            return
+
+        def invoke_with_rate_limit(invoke_type, **kwargs):
+            nsid = str(kwargs.get("url", "")).rsplit("/", 1)[-1]
+            limiter_name = RATE_LIMITED_METHODS.get(nsid)
+            if limiter_name is None:
+                return invoke(invoke_type, **kwargs)
+            return call_with_rate_limit(get_rate_limiter(limiter_name), invoke, invoke_type, **kwargs)
+
+        self.client._invoke = invoke_with_rate_limit
+
+    def _on_session_change(self, event, session):
+        # atprotoクライアントからのセッション変更通知（作成・更新）
+        self._save_session(session.encode())
+
+    def _load_session(self):
+        """
+        保存済みのセッション文字列を読み込む（別ユーザーのものは使わない）
+        """
+        if not self.session_path or not os.path.exists(self.session_path):
+            return None
+        try:
+            with open(self.session_path, encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception as e:
+            logger.warning(f"Blueskyセッションファイルの読み込みに失敗しました: {self.session_path}, エラー: {e}")
+            return None
+        if not isinstance(data, dict) or data.get("username") != self.username:
+            return None
+        return data.get("session") or None
 
-    def upload_image(self, image_path):
+    def _save_session(self, session_string):
+        # セッション文字列をファイルに保存する（所有者のみ読み書き可能）
+        if not self.session_path or not session_string:
+            return
+        try:
+            directory = os.path.dirname(self.session_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.session_path}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"username": self.username, "session": session_string}, f)
+            os.replace(tmp_path, self.session_path)
+            try:
+                os.chmod(self.session_path, 0o600)
+            except OSError:
+                pass
+        except Exception as e:
+            logger.warning(f"Blueskyセッションの保存に失敗しました: {self.session_path}, エラー: {e}")
+
+    def ensure_login(self, force=False):
+        """
+        Blueskyにログイン済みの状態にする。
+        保存済みセッションがあればそれを再利用し、なければ（またはforce時は）パスワードでログインする
+        """
+        with self._login_lock:
+            if self._logged_in and not force:
+                return
+            if not force:
+                session_string = self._load_session()
+                if session_string:
+                    try:
+                        self.client.login(session_string=session_string)
+                        self._logged_in = True
+                        logger.info("保存済みのBlueskyセッションを再利用しました。")
+                        return
+                    except Exception as e:
+                        logger.warning(f"保存済みのBlueskyセッションが使用できないため、再ログインします: {e}")
+            self.client.login(self.username, self.password)
+            self._logged_in = True
+            audit_logger.info(f"Blueskyにログインしました: {self.username}")
+
+    def _call_with_reauth(self, func, *args, **kwargs):
         """
-        画像ファイルをBlueskyにアップロードし、blob情報を返す
+        Bluesky APIを呼び出す。接続エラー・レート制限・5xxは再試行ポリシーに従って再試行する
         """
+        return self.retry_policy.call(self._invoke_with_reauth, func, *args, **kwargs)
+
+    def _invoke_with_reauth(self, func, *args, **kwargs):
+        """
+        Bluesky APIを呼び出し、認証エラーの場合のみパスワードで再ログインして1回だけ再試行する
+        """
+        self.ensure_login()
         try:
-            with open(image_path, "rb") as img_file:
-                img_bytes = img_file.read()
-            blob = self.client.upload_blob(img_bytes)
+            return func(*args, **kwargs)
+        except exceptions.AtProtocolError as e:
+            if not is_auth_error(e):
+                raise
+            logger.warning(f"Blueskyの認証エラーのため再ログインします: {e}")
+            self.ensure_login(force=True)
+            return func(*args, **kwargs)
+
+    def _send_post(self, post_text, embed=None, image_path=None, retry=True):
+        """
+        投稿を送信する。キャッシュ済みの画像blobが受け付けられなかった場合は、
+        画像を再アップロードして1回だけ再送する。
+        retry=Falseの場合はその場で待って再試行せず、例外を呼び出し元（送信待ち行列）に返す
+        """
+        call = self._call_with_reauth if retry else self._invoke_with_reauth
+        try:
+            return call(self.client.send_post, post_text, embed=embed)
+        except exceptions.BadRequestError as e:
+            if not embed or not image_path or not is_blob_rejection(e):
+                raise
+            logger.warning(f"画像blobが受け付けられなかったため、再アップロードして再送します: {e}")
+            blob = self.upload_image(image_path, use_cache=False)
+            if not blob:
+                raise
+            embed["images"][0]["image"] = blob
+            return call(self.client.send_post, post_text, embed=embed)
+
+    def upload_image(self, image_path, use_cache=True):
+        """
+        画像ファイルを（必要なら縮小・再エンコードしてから）Blueskyにアップロードし、blob情報を返す。
+        同じ内容（SHA-256が一致）の画像をアップロード済みなら、キャッシュしたblob参照を再利用する
+        """
+        try:
+            if self.image_preprocessor is not None:
+                img_bytes, _ = self.image_preprocessor.prepare(image_path)
+            else:
+                with open(image_path, "rb") as img_file:
+                    img_bytes = img_file.read()
+            # blobはアカウント（リポジトリ）ごとに管理されるため、ユーザー名もキーに含める
+            cache_key = f"{self.username}:{content_digest(img_bytes)}"
+            if use_cache:
+                cached = self.blob_cache.get(cache_key)
+                if cached is not None:
+                    try:
+                        blob = BlobRef.model_validate(cached)
+                        logger.debug(f"キャッシュ済みの画像blobを再利用します: {image_path}")
+                        return blob
+                    except Exception:
+                        self.blob_cache.discard(cache_key)
+            response = self._call_with_reauth(self.client.upload_blob, img_bytes)
+            blob = getattr(response, "blob", response)
+            blob_json = _blob_to_json(blob)
+            if blob_json is not None:
+                self.blob_cache.put(cache_key, blob_json)
             return blob
         except FileNotFoundError:
             logger.error(f"Bluesky画像アップロードエラー: ファイルが見つかりません - {image_path}")
@@ -103,30 +446,124 @@ class BlueskyPoster:
                 f"Bluesky画像アップロード中に予期せぬエラーが発生しました: {image_path}, エラー: {e}", exc_info=e)
             return None
 
-    @retry_on_exception(
-        max_retries=RETRY_MAX,
-        wait_seconds=RETRY_WAIT,
-        exceptions=(exceptions.AtProtocolError,)
-    )
-    def post_stream_online(self, event_context: dict, image_path=None, platform="twitch"):
+    def render_post(self, kind, event_context: dict, image_path=None, platform="twitch", template_path=None):
+        """
+        投稿本文を生成し、送信待ち行列に記録する内容を辞書で返す（ネットワークI/Oは行わない）。
+        kindは "stream.online" / "stream.offline" / "new_video"。
+        テンプレートがない・必須キーが不足している場合はNoneを返す
+        """
+        if kind == "stream.online":
+            template_path = template_path or online_template_path(platform)
+            required_keys = ["title", "category_name", "stream_url",
+                             "broadcaster_user_login", "broadcaster_user_name"]
+            alt = event_context.get("title", event_context.get("broadcaster_user_name", "Stream Image"))
+            history = {
+                "title": event_context.get("title", "N/A"),
+                "category": event_context.get("category_name", event_context.get("game_name", "N/A")),
+                "url": event_context.get(
+                    "stream_url", f"https://twitch.tv/{event_context.get('broadcaster_user_login', '')}"),
+                "event_type": "online",
+                "platform": platform,
+            }
+        elif kind == "stream.offline":
+            template_path = template_path or offline_template_path(platform)
+            required_keys = ["broadcaster_user_name", "broadcaster_user_login", "channel_url"]
+            # 配信終了通知は画像なしで投稿する
+            image_path = None
+            alt = None
+            history = {
+                "title": f"配信終了: {event_context.get('broadcaster_user_name', 'N/A')}",
+                "category": "Offline",
+                "url": event_context.get(
+                    "channel_url", f"https://twitch.tv/{event_context.get('broadcaster_user_login', '')}"),
+                "event_type": "offline",
+                "platform": platform,
+            }
+        elif kind == "new_video":
+            template_path = template_path or new_video_template_path(platform)
+            required_keys = ["title", "video_id", "video_url"]
+            alt = event_context.get("title", "New Video")
+            history = {
+                "title": event_context.get("title", "N/A"),
+                "category": "NewVideo",
+                "url": event_context.get("video_url", "N/A"),
+                "event_type": "new_video",
+                "platform": platform,
+            }
+        else:
+            raise ValueError(f"未対応の投稿種別です: {kind}")
+
+        if kind != "stream.offline" and not template_exists(template_path):
+            logger.error(f"テンプレートファイルが見つかりません ({kind}): {template_path}. 投稿を中止します。")
+            notify_discord_error(f"Blueskyテンプレートが見つかりません: {template_path}")
+            return None
+        missing_keys = [
+            key for key in required_keys if key not in event_context or event_context[key] is None]
+        if missing_keys:
+            logger.warning(
+                f"Bluesky投稿 ({kind}) の入力event_contextが不正です。不足キー: {', '.join(missing_keys)}")
+            return None
+
+        post_text = load_template(path=template_path).render(
+            **event_context, template_path=template_path)
+        if image_path and not os.path.isfile(image_path):
+            logger.warning(
+                f"指定された画像ファイルが見つかりません: {image_path}。画像なしで投稿します。")
+            image_path = None
+        return {
+            "kind": kind,
+            "text": post_text,
+            "image_path": image_path,
+            "alt": str(alt)[:250] if alt is not None else None,
+            "source": dict(event_context),
+            "history": history,
+        }
+
+    def build_image_embed(self, image_path, alt=None):
+        """
+        画像をアップロードし、送信待ち行列に保存できる形（blob参照をJSONにしたもの）の埋め込みを返す。
+        アップロードできなかった場合はNone（画像なしで投稿する）
+        """
+        blob = self.upload_image(image_path)
+        blob_json = _blob_to_json(blob)
+        if blob_json is None:
+            logger.warning(
+                f"画像 '{image_path}' のアップロードに失敗したため、画像なしで投稿します。")
+            return None
+        return {
+            "$type": "app.bsky.embed.images",
+            "images": [{"alt": alt or "", "image": blob_json}],
+        }
+
+    def send_rendered(self, post_text, embed=None, image_path=None):
+        """
+        生成済みの本文（と build_image_embed() の埋め込み）を投稿し、投稿のURIを返す。
+        失敗時・URIが返らなかった場合は待たずに例外を送出する（送信待ち行列側で再送を予約する）
+        """
+        if embed:
+            embed = {
+                "$type": embed.get("$type", "app.bsky.embed.images"),
+                "images": [
+                    {"alt": image.get("alt", ""), "image": BlobRef.model_validate(image["image"])}
+                    for image in embed.get("images", [])
+                ],
+            }
+        response = self._send_post(post_text, embed=embed or None, image_path=image_path, retry=False)
+        post_uri = getattr(response, "uri", None)
+        if not post_uri:
+            raise RuntimeError("Blueskyの投稿レスポンスにURIが含まれていません。")
+        return str(post_uri)
+
+    def post_stream_online(self, event_context: dict, image_path=None, platform="twitch", template_path=None):
         """
         配信開始通知をBlueskyに投稿する（Twitch/YouTube/ニコニコ対応）
+        template_pathを指定した場合は環境変数のテンプレートより優先する（配信者ごとの設定用）
         """
         # テンプレートパスの決定
-        if platform == "twitch":
-            template_path = os.getenv(
-                "BLUESKY_TEMPLATE_PATH", "templates/twitch_online_template.txt")
-        elif platform == "youtube":
-            template_path = os.getenv(
-                "BLUESKY_YT_ONLINE_TEMPLATE_PATH", "templates/yt_online_template.txt")
-        elif platform == "niconico":
-            template_path = os.getenv(
-                "BLUESKY_NICO_ONLINE_TEMPLATE_PATH", "templates/nico_online_template.txt")
-        else:
-            template_path = os.getenv(
-                "BLUESKY_TEMPLATE_PATH", "templates/twitch_online_template.txt")
+        if not template_path:
+            template_path = online_template_path(platform)
 
-        if not template_path or not os.path.isfile(template_path):
+        if not template_exists(template_path):
             logger.error(f"配信開始テンプレートファイルが見つかりません: {template_path}. 投稿を中止します。")
             notify_discord_error(f"Bluesky配信開始テンプレートが見つかりません: {template_path}")
             return False
@@ -146,8 +583,8 @@ class BlueskyPoster:
         success = False
 
         try:
-            # Blueskyへログイン
-            self.client.login(self.username, self.password)
+            # Blueskyへログイン（ログイン済み・保存済みセッションがあれば再利用）
+            self.ensure_login()
 
             # テンプレートをレンダリングして投稿本文を生成
             post_text = template_obj.render(
@@ -178,7 +615,7 @@ class BlueskyPoster:
                     f"指定された画像ファイルが見つかりません: {image_path}。画像なしで投稿します。")
 
             # Blueskyに投稿
-            self.client.send_post(post_text, embed=embed)
+            self._send_post(post_text, embed=embed, image_path=image_path)
             logger.info(
                 f"Blueskyへの自動投稿に成功しました (stream.online): {event_context.get('stream_url')}")
             audit_logger.info(
@@ -203,25 +640,17 @@ class BlueskyPoster:
                 url=event_context.get(
                     "stream_url", f"https://twitch.tv/{event_context.get('broadcaster_user_login', '')}"),
                 success=success,
-                event_type="online"
+                event_type="online",
+                platform=platform
             )
 
-    @retry_on_exception(
-        max_retries=RETRY_MAX,
-        wait_seconds=RETRY_WAIT,
-        exceptions=(exceptions.AtProtocolError,)
-    )
-    def post_stream_offline(self, event_context: dict, image_path=None, platform="twitch"):
+    def post_stream_offline(self, event_context: dict, image_path=None, platform="twitch", template_path=None):
         """
         配信終了通知をBlueskyに投稿する（Twitch/YouTube/ニコニコ対応）
+        template_pathを指定した場合は環境変数のテンプレートより優先する（配信者ごとの設定用）
         """
-        if platform == "twitch":
-            template_path = os.getenv(
-                "BLUESKY_OFFLINE_TEMPLATE_PATH", "templates/twitch_offline_template.txt")
-        else:
-            # オフライン通知はTwitchのみ想定ならelse側は不要
-            template_path = os.getenv(
-                "BLUESKY_OFFLINE_TEMPLATE_PATH", "templates/twitch_offline_template.txt")
+        if not template_path:
+            template_path = offline_template_path(platform)
         template_obj = load_template(path=template_path)
 
         # 必須キーのチェック
@@ -236,14 +665,14 @@ class BlueskyPoster:
 
         success = False
         try:
-            # Blueskyへログイン
-            self.client.login(self.username, self.password)
+            # Blueskyへログイン（ログイン済み・保存済みセッションがあれば再利用）
+            self.ensure_login()
             # テンプレートをレンダリングして投稿本文を生成
             post_text = template_obj.render(
                 **event_context, template_path=template_path)
 
             # 画像なしで投稿
-            self.client.send_post(text=post_text)
+            self._call_with_reauth(self.client.send_post, text=post_text)
             logger.info(
                 f"Blueskyへの自動投稿成功 (stream.offline): {event_context.get('broadcaster_user_name')}")
             audit_logger.info(
@@ -267,29 +696,17 @@ class BlueskyPoster:
                 url=event_context.get(
                     "channel_url", f"https://twitch.tv/{event_context.get('broadcaster_user_login', '')}"),
                 success=success,
-                event_type="offline"
+                event_type="offline",
+                platform=platform
             )
 
-    @retry_on_exception(
-        max_retries=RETRY_MAX,
-        wait_seconds=RETRY_WAIT,
-        exceptions=(exceptions.AtProtocolError,)
-    )
     def post_new_video(self, event_context: dict, image_path=None, platform=None):
         """
         新着動画投稿をBlueskyに投稿する（YouTube/ニコニコ用）
         """
-        if platform == "youtube":
-            template_path = os.getenv(
-                "BLUESKY_YT_NEW_VIDEO_TEMPLATE_PATH", "templates/yt_new_video_template.txt")
-        elif platform == "niconico":
-            template_path = os.getenv(
-                "BLUESKY_NICO_NEW_VIDEO_TEMPLATE_PATH", "templates/nico_new_video_template.txt")
-        else:
-            template_path = os.getenv(
-                "BLUESKY_YT_NEW_VIDEO_TEMPLATE_PATH", "templates/yt_new_video_template.txt")
+        template_path = new_video_template_path(platform)
 
-        if not template_path or not os.path.isfile(template_path):
+        if not template_exists(template_path):
             logger.error(f"新着動画テンプレートファイルが見つかりません: {template_path}. 投稿を中止します。")
             notify_discord_error(f"Bluesky新着動画テンプレートが見つかりません: {template_path}")
             return False
@@ -307,8 +724,8 @@ class BlueskyPoster:
 
         success = False
         try:
-            # Blueskyへログイン
-            self.client.login(self.username, self.password)
+            # Blueskyへログイン（ログイン済み・保存済みセッションがあれば再利用）
+            self.ensure_login()
             # テンプレートをレンダリングして投稿本文を生成
             post_text = template_obj.render(
                 **event_context, template_path=template_path)
@@ -335,7 +752,7 @@ class BlueskyPoster:
                     f"指定された画像ファイルが見つかりません: {image_path}。画像なしで投稿します。")
 
             # Blueskyに投稿
-            self.client.send_post(post_text, embed=embed)
+            self._send_post(post_text, embed=embed, image_path=image_path)
             logger.info(
                 f"Blueskyへの自動投稿に成功しました (new_video): {event_context.get('video_url')}")
             audit_logger.info(
@@ -357,7 +774,8 @@ class BlueskyPoster:
                 category="NewVideo",
                 url=event_context.get("video_url", "N/A"),
                 success=success,
-                event_type="new_video"
+                event_type="new_video",
+                platform=platform
             )
 
     def _write_post_history(
@@ -366,36 +784,19 @@ class BlueskyPoster:
             category: str,
             url: str,
             success: bool,
-            event_type: str):
+            event_type: str,
+            platform: str = None):
         """
-        投稿履歴をCSVファイルに記録する
+        投稿履歴を記録する（post_history.PostHistoryStoreにまとめて書き込む）
         """
-        os.makedirs("logs", exist_ok=True)
-        csv_path = "logs/post_history.csv"
-        is_new_file = not os.path.exists(csv_path)
-
         try:
-            with open(csv_path, "a", newline="", encoding="utf-8") as csvfile:
-                writer = csv.writer(csvfile)
-                if is_new_file:
-                    writer.writerow(
-                        ["日時", "イベントタイプ", "タイトル", "カテゴリ", "URL", "成功"])
-
-                current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-
-                writer.writerow(
-                    [
-                        current_time,
-                        event_type,
-                        title,
-                        category,
-                        url,
-                        "○" if success else "×",
-                    ]
-                )
-        except IOError as e:
-            logger.error(
-                f"投稿履歴CSVへの書き込みに失敗しました: {csv_path}, エラー: {e}", exc_info=e)
+            get_post_history_store().record(
+                title=title,
+                category=category,
+                url=url,
+                success=success,
+                event_type=event_type,
+                platform=platform,
+            )
         except Exception as e:
-            logger.error(
-                f"投稿履歴CSVへの書き込み中に予期せぬエラーが発生しました: {csv_path}, エラー: {e}", exc_info=e)
+            logger.error(f"投稿履歴の記録に失敗しました: {e}", exc_info=e)
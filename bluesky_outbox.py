@@ -0,0 +1,368 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from version_info import __version__
+from retry_policy import RetryPolicy, is_retryable_http_error
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+DEFAULT_OUTBOX_PATH = "data/bluesky_outbox.db"
+# 送信を諦めるまでの試行回数
+DEFAULT_OUTBOX_MAX_ATTEMPTS = 8
+# 再送までの待ち時間の基準（秒）。失敗ごとに倍にした範囲からランダムに選び、上限で打ち切る
+DEFAULT_OUTBOX_BASE_DELAY = 5.0
+DEFAULT_OUTBOX_MAX_DELAY = 600.0
+# 送信待ちがないときに期限到来を確認する間隔（秒）
+DEFAULT_OUTBOX_POLL_INTERVAL = 5.0
+# 送信済みの行を残しておく秒数（これより古いものは起動時に削除）
+DEFAULT_OUTBOX_RETENTION = 7 * 24 * 60 * 60
+
+# 行の状態
+OUTBOX_PENDING = "pending"
+OUTBOX_SENDING = "sending"
+OUTBOX_DONE = "done"
+OUTBOX_FAILED = "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    text TEXT NOT NULL,
+    image_path TEXT,
+    alt TEXT,
+    embed_json TEXT,
+    source_json TEXT,
+    history_json TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    post_uri TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_outbox_status_due ON outbox (status, next_attempt_at);
+"""
+
+logger = logging.getLogger("AppLogger")
+
+
+def _loads(value):
+    return json.loads(value) if value else None
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False) if value is not None else None
+
+
+class BlueskyOutbox:
+    """
+    Bluesky投稿の送信待ち行列（SQLite・WALモード）。
+    通知を受けたらネットワークI/Oの前に本文・画像・元イベントを記録し、
+    投稿URIが返ってきた時点で初めて送信済みにする。プロセスが落ちても再起動後に送り直せる。
+    """
+
+    def __init__(self, path=DEFAULT_OUTBOX_PATH):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        # WALなら送信スレッドの書き込み中もWebhook側の追加を待たせない。
+        # synchronous=NORMALでもプロセスの異常終了ではコミット済みの行は失われない
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def enqueue(self, kind, text, image_path=None, alt=None, source=None, history=None, now=None):
+        """
+        送信待ちの投稿を記録し、行IDを返す（コミットしてから返る）
+        """
+        now = time.time() if now is None else now
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO outbox (kind, text, image_path, alt, source_json, history_json,"
+                " status, attempts, next_attempt_at, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, 0, ?, ?, ?)",
+                (kind, text, image_path, alt, _dumps(source), _dumps(history),
+                 OUTBOX_PENDING, now, now, now))
+            return cursor.lastrowid
+
+    def claim_due(self, limit=10, now=None):
+        """
+        送信時刻を過ぎた行を古い順に取り出して送信中にし、辞書のリストで返す
+        """
+        now = time.time() if now is None else now
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT * FROM outbox WHERE status = ? AND next_attempt_at <= ?"
+                " ORDER BY next_attempt_at, id LIMIT ?",
+                (OUTBOX_PENDING, now, int(limit))).fetchall()
+            if rows:
+                self._conn.executemany(
+                    "UPDATE outbox SET status = ?, updated_at = ? WHERE id = ?",
+                    [(OUTBOX_SENDING, now, row["id"]) for row in rows])
+        entries = []
+        for row in rows:
+            entry = dict(row)
+            entry["status"] = OUTBOX_SENDING
+            entry["embed"] = _loads(entry.pop("embed_json"))
+            entry["source"] = _loads(entry.pop("source_json"))
+            entry["history"] = _loads(entry.pop("history_json"))
+            entries.append(entry)
+        return entries
+
+    def set_embed(self, entry_id, embed):
+        # アップロード済み画像のblob参照を記録する（再送時にアップロードし直さない）
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET embed_json = ?, updated_at = ? WHERE id = ?",
+                (_dumps(embed), time.time(), entry_id))
+
+    def mark_done(self, entry_id, post_uri, now=None):
+        now = time.time() if now is None else now
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, post_uri = ?, attempts = attempts + 1,"
+                " last_error = NULL, updated_at = ? WHERE id = ?",
+                (OUTBOX_DONE, post_uri, now, entry_id))
+
+    def mark_retry(self, entry_id, error, delay, max_attempts=DEFAULT_OUTBOX_MAX_ATTEMPTS, now=None):
+        """
+        送信失敗を記録し、delay秒後に再送する。試行回数が上限に達した場合は失敗扱いにしてFalseを返す
+        """
+        now = time.time() if now is None else now
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT attempts FROM outbox WHERE id = ?", (entry_id,)).fetchone()
+            attempts = (row["attempts"] if row else 0) + 1
+            status = OUTBOX_PENDING if attempts < max_attempts else OUTBOX_FAILED
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?,"
+                " last_error = ?, updated_at = ? WHERE id = ?",
+                (status, attempts, now + max(0.0, delay), str(error)[:500], now, entry_id))
+        return status == OUTBOX_PENDING
+
+    def mark_failed(self, entry_id, error, now=None):
+        # 再送しても成功しない投稿（テンプレート・画像の問題など）を失敗扱いにする
+        now = time.time() if now is None else now
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE outbox SET status = ?, attempts = attempts + 1, last_error = ?,"
+                " updated_at = ? WHERE id = ?",
+                (OUTBOX_FAILED, str(error)[:500], now, entry_id))
+
+    def recover_in_flight(self):
+        """
+        前回の送信中に終了した行を送信待ちに戻し、戻した件数を返す（起動時に呼ぶ）
+        """
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "UPDATE outbox SET status = ? WHERE status = ?", (OUTBOX_PENDING, OUTBOX_SENDING))
+            return cursor.rowcount
+
+    def purge_done(self, older_than=DEFAULT_OUTBOX_RETENTION, now=None):
+        # 送信済みの古い行を削除し、削除件数を返す
+        now = time.time() if now is None else now
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "DELETE FROM outbox WHERE status = ? AND updated_at < ?",
+                (OUTBOX_DONE, now - older_than))
+            return cursor.rowcount
+
+    def next_due_at(self):
+        # 次に送信時刻が来る行の時刻（送信待ちがなければNone）
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MIN(next_attempt_at) AS due FROM outbox WHERE status = ?",
+                (OUTBOX_PENDING,)).fetchone()
+        return row["due"] if row else None
+
+    def depth(self):
+        # 未送信（送信待ち・送信中）の件数
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT COUNT(*) AS n FROM outbox WHERE status IN (?, ?)",
+                (OUTBOX_PENDING, OUTBOX_SENDING)).fetchone()
+        return row["n"]
+
+    def stats(self):
+        # 状態ごとの件数と、最も古い未送信の行の待ち時間（秒）
+        with self._lock:
+            counts = {row["status"]: row["n"] for row in self._conn.execute(
+                "SELECT status, COUNT(*) AS n FROM outbox GROUP BY status")}
+            oldest = self._conn.execute(
+                "SELECT MIN(created_at) AS oldest FROM outbox WHERE status IN (?, ?)",
+                (OUTBOX_PENDING, OUTBOX_SENDING)).fetchone()["oldest"]
+        result = {status: counts.get(status, 0)
+                  for status in (OUTBOX_PENDING, OUTBOX_SENDING, OUTBOX_DONE, OUTBOX_FAILED)}
+        result["depth"] = result[OUTBOX_PENDING] + result[OUTBOX_SENDING]
+        result["oldest_age"] = time.time() - oldest if oldest is not None else 0.0
+        return result
+
+
+class OutboxSender:
+    """
+    送信待ち行列を読み出してBlueskyに投稿するスレッド。
+    poster_provider() は投稿に使うBlueskyPosterを返す関数で、
+    send_rendered() が投稿URIを返した行だけを送信済みにする。
+    送信に失敗した行はその場で待たず、再試行ポリシーの待ち時間後の送信時刻を記録して後回しにする
+    """
+
+    def __init__(self, outbox, poster_provider, max_attempts=DEFAULT_OUTBOX_MAX_ATTEMPTS,
+                 base_delay=DEFAULT_OUTBOX_BASE_DELAY, max_delay=DEFAULT_OUTBOX_MAX_DELAY,
+                 poll_interval=DEFAULT_OUTBOX_POLL_INTERVAL, logger_to_use=None, retry_policy=None):
+        self.outbox = outbox
+        self.poster_provider = poster_provider
+        self.max_attempts = max(1, int(max_attempts))
+        self.poll_interval = float(poll_interval)
+        self.logger = logger_to_use if logger_to_use else logger
+        # 400などの再送しても成功しないエラーは試行回数に関係なく失敗扱いにする
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy(
+            "bluesky_outbox",
+            max_attempts=self.max_attempts,
+            base_delay=float(base_delay),
+            max_delay=float(max_delay),
+            classify=is_retryable_http_error,
+            logger_to_use=self.logger)
+        self._wake_event = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.sent_count = 0
+        self.failed_count = 0
+
+    def start(self):
+        # 前回の送信中の行を戻してから送信スレッドを起動する
+        if self._thread is not None and self._thread.is_alive():
+            return
+        recovered = self.outbox.recover_in_flight()
+        self.outbox.purge_done()
+        depth = self.outbox.depth()
+        if depth:
+            self.logger.info(f"Bluesky送信待ちの投稿 {depth} 件を再開します。(送信中から戻した件数: {recovered})")
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run_loop, name="BlueskyOutboxSender", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop_event.set()
+        self._wake_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def wake(self):
+        # 新しい投稿が追加されたことを知らせる（待機中でもすぐに送信する）
+        self._wake_event.set()
+
+    def run_once(self, now=None):
+        """
+        送信時刻を過ぎた投稿を全て送信し、処理した件数を返す
+        """
+        processed = 0
+        batch_size = 10
+        while not self._stop_event.is_set():
+            entries = self.outbox.claim_due(limit=batch_size, now=now)
+            for entry in entries:
+                self._deliver(entry, now)
+                processed += 1
+            if len(entries) < batch_size:
+                break
+        return processed
+
+    def _deliver(self, entry, now=None):
+        poster = None
+        try:
+            poster = self.poster_provider()
+            embed = entry.get("embed")
+            if embed is None and entry.get("image_path"):
+                embed = poster.build_image_embed(entry["image_path"], entry.get("alt"))
+                if embed is not None:
+                    self.outbox.set_embed(entry["id"], embed)
+            post_uri = poster.send_rendered(entry["text"], embed=embed, image_path=entry.get("image_path"))
+        except Exception as e:
+            attempts = entry["attempts"] + 1
+            delay = self.retry_policy.next_delay(attempts, e)
+            if delay is not None and self.outbox.mark_retry(
+                    entry["id"], e, delay, self.max_attempts, now=now):
+                self.logger.warning(
+                    f"Bluesky投稿の送信に失敗しました。{delay:.0f}秒後に再送します "
+                    f"({entry['kind']}, 試行 {attempts}/{self.max_attempts}): {e}")
+                return False
+            if delay is None:
+                self.outbox.mark_failed(entry["id"], e, now=now)
+            self.failed_count += 1
+            self.logger.error(
+                f"Bluesky投稿の送信を{attempts}回試行しましたが失敗したため、送信を中止します ({entry['kind']}): {e}")
+            self._record_history(poster, entry, False)
+            return False
+        self.outbox.mark_done(entry["id"], post_uri, now=now)
+        self.sent_count += 1
+        self.logger.info(f"Bluesky送信待ちの投稿を送信しました ({entry['kind']}): {post_uri}")
+        self._record_history(poster, entry, True)
+        return True
+
+    def _record_history(self, poster, entry, success):
+        history = entry.get("history")
+        if poster is None or not history:
+            return
+        try:
+            poster._write_post_history(success=success, **history)
+        except Exception as e:
+            self.logger.warning(f"投稿履歴の記録に失敗しました: {e}")
+
+    def _run_loop(self):
+        while not self._stop_event.is_set():
+            self._wake_event.clear()
+            try:
+                self.run_once()
+            except Exception as e:
+                self.logger.error(f"Bluesky送信待ち行列の処理中にエラーが発生しました: {e}", exc_info=e)
+            # 次の再送時刻か、新しい投稿の追加まで待つ
+            wait = self.poll_interval
+            try:
+                due = self.outbox.next_due_at()
+                if due is not None:
+                    wait = min(wait, max(0.0, due - time.time()))
+            except Exception:
+                pass
+            self._wake_event.wait(wait)
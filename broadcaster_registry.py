@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from version_info import __version__
+from app_settings import get_settings
+import json
+import logging
+import threading
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+# 配信者一覧ファイルの各エントリで指定できる項目 -> BroadcasterConfigの属性名
+ENTRY_FIELDS = {
+    "notify_online": "notify_online",
+    "notify_offline": "notify_offline",
+    "image_path": "image_path",
+    "online_template": "online_template_path",
+    "offline_template": "offline_template_path",
+}
+
+logger = logging.getLogger("AppLogger")
+
+
+class BroadcasterConfig:
+    """
+    配信者ごとの通知設定（通知のON/OFF・画像・テンプレート）。
+    テンプレートがNoneの場合はBlueskyPoster側の既定（環境変数）を使う。
+    """
+
+    def __init__(self, broadcaster_id=None, login=None, notify_online=True, notify_offline=False,
+                 image_path=None, online_template_path=None, offline_template_path=None):
+        self.broadcaster_id = str(broadcaster_id) if broadcaster_id else None
+        self.login = login
+        self.notify_online = bool(notify_online)
+        self.notify_offline = bool(notify_offline)
+        self.image_path = image_path
+        self.online_template_path = online_template_path
+        self.offline_template_path = offline_template_path
+
+    @classmethod
+    def from_settings(cls, settings, broadcaster_id=None):
+        # settings.envの単一配信者向け設定から既定の設定を作る
+        return cls(
+            broadcaster_id=broadcaster_id,
+            notify_online=settings.notify_on_twitch_online,
+            notify_offline=settings.notify_on_twitch_offline,
+            image_path=settings.bluesky_image_path,
+        )
+
+    @classmethod
+    def from_env(cls, broadcaster_id=None):
+        # 現在の設定スナップショットから既定の設定を作る
+        return cls.from_settings(get_settings(), broadcaster_id)
+
+    def derive(self, broadcaster_id, login=None, overrides=None):
+        # この設定を既定値として、エントリで指定された項目だけ上書きした設定を作る
+        values = {
+            "notify_online": self.notify_online,
+            "notify_offline": self.notify_offline,
+            "image_path": self.image_path,
+            "online_template_path": self.online_template_path,
+            "offline_template_path": self.offline_template_path,
+        }
+        for key, attr in ENTRY_FIELDS.items():
+            if overrides and overrides.get(key) is not None:
+                values[attr] = overrides[key]
+        return BroadcasterConfig(broadcaster_id=broadcaster_id, login=login, **values)
+
+    def template_path_for(self, subscription_type):
+        if subscription_type == "stream.online":
+            return self.online_template_path
+        if subscription_type == "stream.offline":
+            return self.offline_template_path
+        return None
+
+
+class BroadcasterRegistry:
+    """
+    broadcaster_user_id -> BroadcasterConfig の索引。
+    通知ごとに環境変数を読み直さず、起動時に作った設定を辞書で引く。
+    配信者が1人も登録されていない場合は、どのIDにも既定の設定を返す（従来の単一配信者モード）。
+    """
+
+    def __init__(self, default, entries=None):
+        self.default = default
+        # (broadcaster_id, login, overrides) のリスト。既定設定の再読み込み時に使う
+        self._entries = list(entries or [])
+        self._by_id = {}
+        if default.broadcaster_id:
+            self._by_id[default.broadcaster_id] = default
+        for broadcaster_id, login, overrides in self._entries:
+            self._by_id[str(broadcaster_id)] = default.derive(str(broadcaster_id), login, overrides)
+
+    def lookup(self, broadcaster_user_id):
+        # 通知先の設定を返す（登録外の配信者ならNone）
+        if not self._by_id:
+            return self.default
+        return self._by_id.get(str(broadcaster_user_id))
+
+    def broadcaster_ids(self):
+        return list(self._by_id)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def with_defaults(self, default):
+        # 登録済みの配信者はそのままに、既定の設定だけ差し替えた索引を作る
+        return BroadcasterRegistry(default, self._entries)
+
+
+def load_broadcaster_entries(path):
+    """
+    配信者一覧ファイル（JSON）を読み込む。
+    形式: [{"login": "...", "notify_online": true, "image_path": "...", ...}, ...]
+    （{"broadcasters": [...]} 形式も可。loginの代わりにidで数値IDを指定できる）
+    """
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, dict):
+        data = data.get("broadcasters", [])
+    if not isinstance(data, list):
+        raise ValueError(f"配信者一覧ファイルの形式が不正です: {path}")
+    return [entry for entry in data if isinstance(entry, dict)]
+
+
+def build_broadcaster_registry(default, entries, resolve_ids, logger_to_use=None):
+    """
+    配信者一覧から索引を作る。ログイン名はresolve_ids(logins)でまとめて数値IDに変換する
+    """
+    current_logger = logger_to_use if logger_to_use else logger
+    logins = [str(e["login"]) for e in entries if e.get("login") and not e.get("id")]
+    resolved = resolve_ids(logins) if logins else {}
+    resolved_entries = []
+    for entry in entries:
+        login = entry.get("login")
+        broadcaster_id = entry.get("id") or resolved.get(str(login or "").strip().lower())
+        if not broadcaster_id:
+            current_logger.warning(f"配信者のIDを取得できなかったため、通知対象から除外します: {login}")
+            continue
+        resolved_entries.append((str(broadcaster_id), login, entry))
+    return BroadcasterRegistry(default, resolved_entries)
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_broadcaster_registry():
+    # 共有の索引を返す（未設定なら環境変数の設定のみで作成）
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = BroadcasterRegistry(BroadcasterConfig.from_env())
+        return _registry
+
+
+def set_broadcaster_registry(registry):
+    global _registry
+    with _registry_lock:
+        _registry = registry
+
+
+def reset_broadcaster_registry():
+    set_broadcaster_registry(None)
+
+
+def reload_broadcaster_defaults():
+    # settings.envの通知設定が変わったときに、既定の設定を作り直す
+    global _registry
+    with _registry_lock:
+        if _registry is not None:
+            _registry = _registry.with_defaults(
+                BroadcasterConfig.from_env(_registry.default.broadcaster_id))
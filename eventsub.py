@@ -5,11 +5,14 @@ Stream notify on Bluesky
 このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
 """
 
-from tzlocal import get_localzone
-import pytz
 from pathlib import Path
-from dotenv import load_dotenv
-from utils import retry_on_exception
+from utils import retry_on_exception, read_env, update_env_file_preserve_comments, env_int
+from retry_policy import RetryPolicy, is_retryable_http_error
+from timezone_service import now_local, parse_rfc3339
+from twitch_api import TwitchApiClient
+from twitch_token_manager import AppTokenManager, DEFAULT_APP_TOKEN_PATH
+from twitch_user_resolver import (
+    TwitchUserResolver, UserIdCache, DEFAULT_USER_ID_CACHE_PATH, DEFAULT_USER_ID_TTL, normalize_login)
 import datetime
 import logging
 import time
@@ -17,6 +20,8 @@ import hashlib
 import hmac
 import requests
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from version_info import __version__
 
 __author__ = "mayuneco(mayunya)"
@@ -39,81 +44,93 @@ __app_version__ = __version__
 # もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
 # 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
 
-# 環境設定ファイルの場所を指定
-# settings.envのパスを「eventsub.pyと同じディレクトリ」に修正
+# settings.envのパス（変換した配信者IDの書き戻し先）
+# settings.envの読み込み自体はエントリポイントで行い、import時には環境変数を変更しない
 env_path = Path(__file__).parent / "settings.env"
-load_dotenv(dotenv_path=env_path)
 
 # ログの設定
 logger = logging.getLogger("AppLogger")
 audit_logger = logging.getLogger("AuditLogger")
 
-# タイムゾーンの設定
-TIMEZONE_NAME = os.getenv("TIMEZONE", "system")
-if TIMEZONE_NAME.lower() == "system":  # システムのタイムゾーンを自動取得
-    try:
-        TIMEZONE = get_localzone()
-    except Exception as e:
-        logger.warning(f"システムタイムゾーンの取得に失敗しました ({e})。UTCにフォールバックします。")
-        TIMEZONE = pytz.utc
-elif TIMEZONE_NAME:
-    try:
-        TIMEZONE = pytz.timezone(TIMEZONE_NAME)
-    except pytz.UnknownTimeZoneError:
-        logger.warning(f"無効なタイムゾーン: {TIMEZONE_NAME}。システムタイムゾーンにフォールバックします。")
-        try:
-            TIMEZONE = get_localzone()
-        except Exception as e:
-            logger.warning(f"システムタイムゾーンの取得に失敗しました ({e})。UTCにフォールバックします。")
-            TIMEZONE = pytz.utc
-    except Exception as e:
-        logger.warning(
-            f"タイムゾーン '{TIMEZONE_NAME}' の処理中にエラーが発生しました ({e})。UTCにフォールバックします。")
-        TIMEZONE = pytz.utc
-else:
-    logger.warning("TIMEZONE環境変数が空です。システムタイムゾーンにフォールバックします。")
-    try:
-        TIMEZONE = get_localzone()
-    except Exception as e:
-        logger.warning(f"システムタイムゾーンの取得に失敗しました ({e})。UTCにフォールバックします。")
-        TIMEZONE = pytz.utc
-
 # タイムゾーン付き現在時刻取得関数
 
 
 def get_current_time():
     # 現在時刻をタイムゾーン付きで取得
-    return datetime.datetime.now(TIMEZONE)
+    return now_local()
+
+
+# 変換後の配信者ID（setup_broadcaster_idで設定される。未設定なら環境変数を使う）
+TWITCH_BROADCASTER_ID = None
+# リトライ設定（呼び出し時点の環境変数を使う）
+RETRY_MAX = env_int("RETRY_MAX", 3)
+RETRY_WAIT = env_int("RETRY_WAIT", 2)
+
+# Twitch API（POSTなどurllib3側で再試行しない呼び出し）の再試行ポリシー。
+# 接続エラー・429・5xxのみ再試行し、429ではRatelimit-Resetまで待つ
+TWITCH_RETRY_POLICY = RetryPolicy(
+    "twitch",
+    max_attempts=RETRY_MAX,
+    base_delay=RETRY_WAIT,
+    retryable=(requests.RequestException,),
+    classify=is_retryable_http_error,
+)
 
 
-# 環境変数の取得
-TWITCH_CLIENT_ID = os.getenv("TWITCH_CLIENT_ID")
-TWITCH_CLIENT_SECRET = os.getenv("TWITCH_CLIENT_SECRET")
-TWITCH_BROADCASTER_ID = os.getenv("TWITCH_BROADCASTER_ID")
-WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
-RETRY_MAX = int(os.getenv("RETRY_MAX", 3))
-RETRY_WAIT = int(os.getenv("RETRY_WAIT", 2))
+def current_broadcaster_id():
+    # 変換済みの配信者ID（未変換ならsettings.envの値）を返す
+    return TWITCH_BROADCASTER_ID or os.getenv("TWITCH_BROADCASTER_ID")
 
-TWITCH_APP_ACCESS_TOKEN = None
-TWITCH_APP_ACCESS_TOKEN_EXPIRES_AT = 0
 
+# ログイン名→ユーザーIDの変換（永続キャッシュ付き）
+_twitch_user_resolver = None
+_twitch_user_resolver_lock = threading.Lock()
 
-@retry_on_exception(
-    max_retries=RETRY_MAX,
-    wait_seconds=RETRY_WAIT,
-    exceptions=(requests.RequestException,)
-)
+# アプリのアクセストークン管理（ファイルへの保存・バックグラウンド更新）
+_app_token_manager = None
+_app_token_manager_lock = threading.Lock()
+
+# Twitch API呼び出しで共有するHTTPクライアント（接続プール）
+_twitch_api_client = None
+_twitch_api_client_lock = threading.Lock()
+
+
+def get_twitch_api_client():
+    # 共有のTwitch APIクライアントを返す（初回呼び出し時に作成）
+    global _twitch_api_client
+    with _twitch_api_client_lock:
+        if _twitch_api_client is None:
+            _twitch_api_client = TwitchApiClient(
+                os.getenv("TWITCH_CLIENT_ID"),
+                connect_timeout=float(os.getenv("TWITCH_API_CONNECT_TIMEOUT", 5)),
+                read_timeout=float(os.getenv("TWITCH_API_READ_TIMEOUT", 20)),
+                pool_maxsize=int(os.getenv("TWITCH_API_POOL_MAXSIZE", 10)),
+                retry_total=int(os.getenv("TWITCH_API_RETRY_TOTAL", 3)),
+            )
+        return _twitch_api_client
+
+
+def close_twitch_api_client():
+    # 共有のTwitch APIクライアントの接続を閉じる（次回の呼び出しで作り直す）
+    global _twitch_api_client
+    with _twitch_api_client_lock:
+        if _twitch_api_client is not None:
+            _twitch_api_client.close()
+            _twitch_api_client = None
+
+
+@retry_on_exception(policy=TWITCH_RETRY_POLICY)
 # アクセストークンの管理
 def get_app_access_token(logger_to_use=None):
     # Twitchアプリのアクセストークンを取得または更新する
     current_logger = logger_to_use if logger_to_use else logger
-    url = "https://id.twitch.tv/oauth2/token"
+    client = get_twitch_api_client()
     params = {
-        "client_id": TWITCH_CLIENT_ID,
-        "client_secret": TWITCH_CLIENT_SECRET,
+        "client_id": os.getenv("TWITCH_CLIENT_ID"),
+        "client_secret": os.getenv("TWITCH_CLIENT_SECRET"),
         "grant_type": "client_credentials",
     }
-    response = requests.post(url, params=params, timeout=20)  # timeout追加
+    response = client.post(client.oauth_url("/token"), params=params)
     if response.status_code == 200:
         data = response.json()
         token = data["access_token"]
@@ -126,54 +143,144 @@ def get_app_access_token(logger_to_use=None):
             f"Twitchアクセストークン取得失敗: {response.status_code} - {response.text}")
         return None, 0
 
-# アクセストークンの検証
+
+def validate_app_access_token(token):
+    # トークンを/validateで検証し、残り有効秒数を返す（無効ならNone）
+    client = get_twitch_api_client()
+    response = client.get(
+        client.oauth_url("/validate"), headers={"Authorization": f"OAuth {token}"})
+    if response.status_code == 200:
+        return int(response.json().get("expires_in", 0))
+    if response.status_code == 401:
+        return None
+    raise RuntimeError(f"トークン検証APIの応答が不正です: {response.status_code}")
+
+
+def get_app_token_manager():
+    # 共有のトークンマネージャーを返す（初回呼び出し時に作成）
+    global _app_token_manager
+    with _app_token_manager_lock:
+        if _app_token_manager is None:
+            _app_token_manager = AppTokenManager(
+                os.getenv("TWITCH_CLIENT_ID"),
+                fetch_token=lambda: get_app_access_token(logger_to_use=logger),
+                validate_token=validate_app_access_token,
+                token_path=os.getenv("TWITCH_APP_TOKEN_PATH", DEFAULT_APP_TOKEN_PATH),
+                refresh_ratio=float(os.getenv("TWITCH_APP_TOKEN_REFRESH_RATIO", 0.9)),
+                logger_to_use=logger,
+            )
+        return _app_token_manager
+
+
+def start_app_token_refresher():
+    # 有効期限が近づいたトークンをバックグラウンドで更新するスレッドを起動
+    get_app_token_manager().start()
 
 
+def stop_app_token_refresher():
+    if _app_token_manager is not None:
+        _app_token_manager.stop()
+
+
+# アクセストークンの検証
 def get_valid_app_access_token(logger_to_use=None):
-    # 有効なTwitchアプリのアクセストークンを返す（期限切れなら再取得）
-    global TWITCH_APP_ACCESS_TOKEN, TWITCH_APP_ACCESS_TOKEN_EXPIRES_AT
+    # 有効なTwitchアプリのアクセストークンを返す
+    # （保存済み・更新済みのトークンがあればOAuthエンドポイントを呼ばない）
+    return get_app_token_manager().get_token()
+
+
+def _helix_request(method, path, token=None, logger_to_use=None, **kwargs):
+    """
+    Helix APIを呼び出す。tokenを省略するとアプリのアクセストークンを使い、
+    401（トークン失効・取り消し）が返った場合はトークンを破棄して一度だけ取り直して再送する
+    """
     current_logger = logger_to_use if logger_to_use else logger
-    if not TWITCH_APP_ACCESS_TOKEN or time.time() > TWITCH_APP_ACCESS_TOKEN_EXPIRES_AT:
-        current_logger.info("TwitchAPIアクセストークンの確認と検証を実行しました。")
-        TWITCH_APP_ACCESS_TOKEN, TWITCH_APP_ACCESS_TOKEN_EXPIRES_AT = (
-            get_app_access_token(logger_to_use=current_logger)
-        )
-    return TWITCH_APP_ACCESS_TOKEN
+    send = getattr(get_twitch_api_client(), method.lower())
+    if token is not None:
+        return send(path, token=token, **kwargs)
+    app_token = get_valid_app_access_token(logger_to_use=current_logger)
+    response = send(path, token=app_token, **kwargs)
+    if response.status_code != 401:
+        return response
+    current_logger.warning("TwitchAPIアクセストークンが無効になっていたため、取得し直して再送します。")
+    get_app_token_manager().invalidate(app_token)
+    app_token = get_valid_app_access_token(logger_to_use=current_logger)
+    return send(path, token=app_token, **kwargs)
 
 # Twitchのユーザー名からBROADCASTER_IDを取得
 
 
-def get_broadcaster_id(username, logger_to_use=None):
-    # 指定したユーザー名からTwitchのユーザーIDを取得する
+def fetch_twitch_users(logins, logger_to_use=None):
+    # Helix /users にlogin=を並べて1回で問い合わせ、data配列を返す（最大100件）
+    current_logger = logger_to_use if logger_to_use else logger
+    params = [("login", login) for login in logins]
+    response = _helix_request("GET", "/users", params=params, logger_to_use=current_logger)
+    response.raise_for_status()
+    data = response.json().get("data")
+    if not isinstance(data, list):
+        raise ValueError("Twitch APIレスポンスにユーザーデータがありません")
+    return data
+
+
+def get_twitch_user_resolver():
+    # 共有のユーザーID変換器を返す（初回呼び出し時に作成）
+    global _twitch_user_resolver
+    with _twitch_user_resolver_lock:
+        if _twitch_user_resolver is None:
+            cache = UserIdCache(
+                os.getenv("TWITCH_USER_ID_CACHE_PATH", DEFAULT_USER_ID_CACHE_PATH),
+                ttl_seconds=float(os.getenv("TWITCH_USER_ID_CACHE_TTL", DEFAULT_USER_ID_TTL)),
+            )
+            _twitch_user_resolver = TwitchUserResolver(
+                lambda logins: fetch_twitch_users(logins, logger_to_use=logger), cache)
+        return _twitch_user_resolver
+
+
+def resolve_broadcaster_ids(logins, logger_to_use=None):
+    # 複数のユーザー名をまとめて数値IDに変換する（キャッシュにないものだけAPIで取得）
     current_logger = logger_to_use if logger_to_use else logger
-    url = "https://api.twitch.tv/helix/users"
-    headers = {
-        "Client-ID": TWITCH_CLIENT_ID,
-        "Authorization": f"Bearer {get_valid_app_access_token(logger_to_use=current_logger)}",
-    }
-    params = {"login": username}
     try:
-        response = requests.get(url, headers=headers,
-                                params=params, timeout=20)  # timeout追加
-        response.raise_for_status()
-        data = response.json().get("data")
-        if not isinstance(data, list) or not data:
-            current_logger.error(
-                f"Twitch APIレスポンスにユーザーデータがありません (ユーザー名: {username})")
-            raise ValueError(
-                f"Twitch APIレスポンスにユーザーデータがありません (ユーザー名: {username})")
-        return data[0]["id"]
+        return get_twitch_user_resolver().resolve(logins)
     except (requests.exceptions.RequestException, KeyError, ValueError) as e:
-        current_logger.error(f"ユーザーID取得エラー (ユーザー名: {username}): {str(e)}")
+        current_logger.error(f"ユーザーID取得エラー (ユーザー名: {', '.join(map(str, logins))}): {str(e)}")
         raise
 
+
+def get_broadcaster_id(username, logger_to_use=None):
+    # 指定したユーザー名からTwitchのユーザーIDを取得する
+    current_logger = logger_to_use if logger_to_use else logger
+    user_id = resolve_broadcaster_ids([username], logger_to_use=current_logger).get(
+        normalize_login(username))
+    if not user_id:
+        current_logger.error(
+            f"Twitch APIレスポンスにユーザーデータがありません (ユーザー名: {username})")
+        raise ValueError(
+            f"Twitch APIレスポンスにユーザーデータがありません (ユーザー名: {username})")
+    return user_id
+
+
+def _save_converted_broadcaster_id(broadcaster_id, logger_to_use):
+    # 変換後のIDをsettings.envのTWITCH_BROADCASTER_ID_CONVERTEDに反映する
+    os.environ["TWITCH_BROADCASTER_ID_CONVERTED"] = broadcaster_id
+    if not env_path.exists():
+        return
+    try:
+        if read_env(str(env_path)).get("TWITCH_BROADCASTER_ID_CONVERTED") != broadcaster_id:
+            update_env_file_preserve_comments(
+                str(env_path), {"TWITCH_BROADCASTER_ID_CONVERTED": broadcaster_id})
+    except OSError as e:
+        logger_to_use.warning(f"TWITCH_BROADCASTER_ID_CONVERTEDの保存に失敗しました: {e}")
+
 # ユーザー名が入力されていた場合に数値IDに変換
 
 
 def setup_broadcaster_id(logger_to_use=None):
     # BROADCASTER_IDがユーザー名の場合は数値IDに変換する
+    # （変換結果はキャッシュされるため、2回目以降の起動ではAPIを呼ばない）
     global TWITCH_BROADCASTER_ID
     current_logger = logger_to_use if logger_to_use else logger
+    if not TWITCH_BROADCASTER_ID:
+        TWITCH_BROADCASTER_ID = os.getenv("TWITCH_BROADCASTER_ID")
     if TWITCH_BROADCASTER_ID is None or not TWITCH_BROADCASTER_ID.strip():
         current_logger.critical(
             "TWITCH_BROADCASTER_IDが設定されていません。アプリケーションは起動できません。")
@@ -192,12 +299,56 @@ def setup_broadcaster_id(logger_to_use=None):
             current_logger.critical(
                 f"TWITCHユーザーIDからAPIアクセス用IDへの変換に失敗しました: {e}", exc_info=True)
             raise
+        _save_converted_broadcaster_id(TWITCH_BROADCASTER_ID, current_logger)
     else:
         current_logger.info(
             f"TWITCH_BROADCASTER_ID は既に数値形式です: {TWITCH_BROADCASTER_ID}")
     # os.environも更新して他の箇所でも数値IDを参照できるようにする
     os.environ['TWITCH_BROADCASTER_ID'] = TWITCH_BROADCASTER_ID
 
+
+# 署名検証用のHMACオブジェクト（シークレット変更時に一度だけ作成し、リクエストごとにcopyして使う）
+_signature_hmac_base = None
+_signature_hmac_lock = threading.Lock()
+
+
+def prepare_webhook_secret(secret):
+    """
+    WEBHOOK_SECRETから署名検証用のHMACオブジェクトを作成する。
+    rotate_secret_if_neededでシークレットが変わった際に呼び出す
+    """
+    global _signature_hmac_base
+    with _signature_hmac_lock:
+        if not secret:
+            _signature_hmac_base = None
+            return
+        _signature_hmac_base = hmac.new(secret.encode("utf-8"), digestmod=hashlib.sha256)
+
+
+def _new_signature_hmac():
+    # 事前に作成したHMACオブジェクトの複製を返す（未作成なら環境変数から一度だけ作成）
+    base = _signature_hmac_base
+    if base is None:
+        prepare_webhook_secret(os.getenv("WEBHOOK_SECRET"))
+        base = _signature_hmac_base
+        if base is None:
+            return None
+    return base.copy()
+
+
+def compute_signature_digest(message_id, timestamp, body):
+    """
+    message_id・timestamp・本文(bytes)から署名の16進ダイジェストを計算する。
+    本文は文字列に変換せず、そのままHMACに流し込む
+    """
+    mac = _new_signature_hmac()
+    if mac is None:
+        return None
+    mac.update(message_id if isinstance(message_id, bytes) else message_id.encode("utf-8"))
+    mac.update(timestamp if isinstance(timestamp, bytes) else timestamp.encode("utf-8"))
+    mac.update(body)
+    return mac.hexdigest()
+
 # Signatureの検証
 
 
@@ -218,30 +369,15 @@ def verify_signature(request):
     signature = request.headers.get("Twitch-Eventsub-Message-Signature", "")
     message_id = request.headers["Twitch-Eventsub-Message-Id"]
     timestamp_str = request.headers["Twitch-Eventsub-Message-Timestamp"]
-    body = request.get_data(as_text=True)  # ボディを文字列で取得
-
-    # タイムスタンプのパース（ナノ秒対応）
-    def parse_timestamp(ts: str):
-        # タイムスタンプ文字列をdatetimeオブジェクトに変換
-        dt_obj = None
-        if '.' in ts and ts.endswith('Z'):
-            main_part, fractional = ts[:-1].split('.', 1)
-            fractional = fractional[:6]  # マイクロ秒まで
-            dt_obj = datetime.datetime.fromisoformat(
-                f"{main_part}.{fractional}+00:00")
-        elif '+' in ts[10:] or '-' in ts[10:]:
-            dt_obj = datetime.datetime.fromisoformat(ts)
-        else:
-            dt_obj = datetime.datetime.fromisoformat(ts)
-        return dt_obj.astimezone(TIMEZONE)
-
-    now = datetime.datetime.now(TIMEZONE)
+    body = request.get_data()  # ボディはbytesのまま扱う（デコード・再エンコードしない）
 
+    # タイムスタンプのパース（ナノ秒対応）。時間差の判定だけなのでUTCのまま比較する
     try:
-        event_time = parse_timestamp(timestamp_str)
+        event_time = parse_rfc3339(timestamp_str)
     except Exception as e:
         current_logger.warning(f"タイムスタンプ '{timestamp_str}' の解析エラー: {str(e)}")
         return False
+    now = datetime.datetime.now(datetime.timezone.utc)
 
     # 時間差チェック（5分以内か）
     delta = abs((now - event_time).total_seconds())
@@ -250,20 +386,13 @@ def verify_signature(request):
             f"タイムスタンプが許容範囲外: {timestamp_str} (差分: {delta:.2f}秒)")
         return False
 
-    hmac_message = message_id + timestamp_str + body
-
-    current_webhook_secret = os.getenv("WEBHOOK_SECRET")
-    if not current_webhook_secret:
+    digest = compute_signature_digest(message_id, timestamp_str, body)
+    if digest is None:
         current_logger.critical("WEBHOOK_SECRETが設定されていません。署名検証は不可能です。")
         return False
-
-    digest = hmac.new(
-        current_webhook_secret.encode(
-            'utf-8'), hmac_message.encode('utf-8'), hashlib.sha256
-    ).hexdigest()
     expected_signature = f"sha256={digest}"
 
-    if not hmac.compare_digest(signature, expected_signature):
+    if not hmac.compare_digest(signature.encode("utf-8"), expected_signature.encode("ascii")):
         current_logger.warning(
             f"Webhook署名不一致。受信: {signature}, 期待値(計算結果): {expected_signature}")
         return False
@@ -274,17 +403,32 @@ def verify_signature(request):
 # 既存のEventSubサブスクリプション一覧を取得
 
 
+def list_eventsub_subscriptions(logger_to_use=None):
+    """
+    EventSubサブスクリプションをpagination.cursorをたどって全件取得する。
+    取得に失敗した場合はrequests.HTTPErrorを送出する
+    """
+    current_logger = logger_to_use if logger_to_use else logger
+    subscriptions = []
+    cursor = None
+    while True:
+        params = {"after": cursor} if cursor else None
+        response = _helix_request(
+            "GET", "/eventsub/subscriptions", params=params, logger_to_use=current_logger)
+        response.raise_for_status()
+        body = response.json()
+        subscriptions.extend(body.get("data", []))
+        cursor = (body.get("pagination") or {}).get("cursor")
+        if not cursor:
+            return subscriptions
+
+
 def get_existing_eventsub_subscriptions(logger_to_use=None):
     current_logger = logger_to_use if logger_to_use else logger
-    url = "https://api.twitch.tv/helix/eventsub/subscriptions"
-    headers = {
-        "Client-ID": TWITCH_CLIENT_ID,
-        "Authorization": f"Bearer {get_valid_app_access_token(logger_to_use=current_logger)}",
-    }
-    response = requests.get(url, headers=headers, timeout=20)  # timeout追加
-    if response.status_code == 200:
-        return response.json().get("data", [])
-    else:
+    try:
+        return list_eventsub_subscriptions(logger_to_use=current_logger)
+    except requests.exceptions.HTTPError as e:
+        response = e.response
         current_logger.error(
             f"既存サブスクリプション取得エラー: {response.status_code} - {response.text}")
         return []
@@ -304,7 +448,7 @@ def create_eventsub_subscription(event_type: str, logger_to_use=None, webhook_ur
         if (
             sub.get("type") == event_type
             and sub.get("condition", {}).get("broadcaster_user_id")
-            == TWITCH_BROADCASTER_ID
+            == current_broadcaster_id()
             and sub.get("status") == "enabled"
         ):
             current_logger.info(
@@ -315,29 +459,44 @@ def create_eventsub_subscription(event_type: str, logger_to_use=None, webhook_ur
             return {"status": "already exists", "id": sub.get("id"), "data": [sub]}
 
     # サブスクリプションがなければ新規作成
-    url = "https://api.twitch.tv/helix/eventsub/subscriptions"
-    current_webhook_secret = os.getenv("WEBHOOK_SECRET")
-    headers = {
-        "Client-ID": TWITCH_CLIENT_ID,
-        "Authorization": f"Bearer {get_valid_app_access_token(logger_to_use=current_logger)}",
-        "Content-Type": "application/json",
-    }
     callback_url = webhook_url if webhook_url else os.getenv("WEBHOOK_CALLBACK_URL")
-    payload = {
-        "type": event_type,
-        "app_version": "1",
-        "condition": {"broadcaster_user_id": TWITCH_BROADCASTER_ID},
-        "transport": {
+    return post_eventsub_subscription(
+        event_type, {"broadcaster_user_id": current_broadcaster_id()}, callback_url,
+        logger_to_use=current_logger)
+
+
+def post_eventsub_subscription(event_type, condition, callback_url=None, logger_to_use=None,
+                               session_id=None, token=None):
+    """
+    EventSubサブスクリプションを作成するAPI呼び出し（既存チェックはしない）。
+    session_idを指定するとWebSocketトランスポートで作成する（ユーザーアクセストークンが必要）
+    """
+    current_logger = logger_to_use if logger_to_use else logger
+    current_audit_logger = logging.getLogger("AuditLogger")
+    if session_id:
+        transport = {"method": "websocket", "session_id": session_id}
+    else:
+        transport = {
             "method": "webhook",
             "callback": callback_url,
-            "secret": current_webhook_secret,
-        },
+            "secret": os.getenv("WEBHOOK_SECRET"),
+        }
+    payload = {
+        "type": event_type,
+        "version": "1",
+        "condition": condition,
+        "transport": transport,
     }
 
-    try:
-        response = requests.post(
-            url, json=payload, headers=headers, timeout=15)  # timeout追加
+    def create():
+        # tokenを省略した場合はアプリのアクセストークンを使う（401なら取り直して再送）
+        response = _helix_request(
+            "POST", "/eventsub/subscriptions", token=token, json=payload, logger_to_use=current_logger)
         response.raise_for_status()
+        return response
+
+    try:
+        response = TWITCH_RETRY_POLICY.call(create)
         result = response.json()
         current_audit_logger.info(
             f"EventSubサブスクリプション作成: {event_type} 成功")
@@ -348,20 +507,20 @@ def create_eventsub_subscription(event_type: str, logger_to_use=None, webhook_ur
                         {}])[0].get('id')}")
         return result
     except requests.exceptions.HTTPError as e:
-        error_details = e.response.text if e.response else "N/A"
+        error_details = e.response.text if e.response is not None else "N/A"
         reason = f"HTTPError: {
-            e.response.status_code if e.response else 'Unknown status'} - {error_details}"
+            e.response.status_code if e.response is not None else 'Unknown status'} - {error_details}"
         current_audit_logger.warning(
             f"EventSubサブスクリプション作成: {event_type} 失敗: {reason}")
         current_logger.error(
             f"EventSubサブスクリプション ({event_type}) 作成失敗: {reason}")
         try:
-            error_json = e.response.json() if e.response else {}
+            error_json = e.response.json() if e.response is not None else {}
             return {"status": "error", "reason": reason, "details": error_json,
-                    "http_status": e.response.status_code if e.response else None}
+                    "http_status": e.response.status_code if e.response is not None else None}
         except ValueError:
             return {"status": "error", "reason": reason, "details": error_details,
-                    "http_status": e.response.status_code if e.response else None}
+                    "http_status": e.response.status_code if e.response is not None else None}
     except Exception as e:
         reason = str(e)
         current_audit_logger.warning(
@@ -378,23 +537,18 @@ def delete_eventsub_subscription(subscription_id, logger_to_use=None):
     current_logger = logger_to_use if logger_to_use else logger
     current_audit_logger = logging.getLogger("AuditLogger")
 
-    url = (
-        f"https://api.twitch.tv/helix/eventsub/subscriptions?"
-        f"id={subscription_id}"
-    )
-    headers = {
-        "Client-ID": TWITCH_CLIENT_ID,
-        "Authorization": f"Bearer {get_valid_app_access_token(logger_to_use=current_logger)}"
-    }
-    response = requests.delete(url, headers=headers, timeout=15)  # timeout追加
+    response = _helix_request(
+        "DELETE", "/eventsub/subscriptions", params={"id": subscription_id}, logger_to_use=current_logger)
     if response.status_code == 204:
         current_logger.info(f"EventSubサブスクリプション削除: {subscription_id} 成功")
         current_audit_logger.info(f"EventSubサブスクリプション削除: {subscription_id}")
+        return True
     else:
         current_logger.warning(
             f"EventSubサブスクリプション削除: {subscription_id} 失敗: {response.status_code} - {response.text}")
         current_audit_logger.warning(
             f"EventSubサブスクリプション削除: {subscription_id} 失敗: {response.status_code} - {response.text}")
+        return False
 
 # サブスクリプションの確認と削除の処理
 
@@ -429,3 +583,131 @@ def cleanup_eventsub_subscriptions(webhook_callback_url, logger_to_use=None):
 
     current_logger.info(
         f"EventSubサブスクリプションのクリーンアップ完了。{deleted_count}件のサブスクリプションを削除しました。")
+
+
+# 保持してよいサブスクリプションのステータス
+KEEP_SUBSCRIPTION_STATUSES = ("enabled", "webhook_callback_verification_pending")
+
+
+def desired_eventsub_subscriptions(event_types, callback_url, broadcaster_id=None, broadcaster_ids=None):
+    """
+    reconcile_eventsub_subscriptionsに渡す「あるべきサブスクリプション」の一覧を作る
+    （broadcaster_idsを指定した場合は全配信者×全イベントタイプ）
+    """
+    if not broadcaster_ids:
+        broadcaster_ids = [broadcaster_id or current_broadcaster_id()]
+    return [
+        {"type": event_type,
+         "condition": {"broadcaster_user_id": str(each_id)},
+         "callback": callback_url}
+        for each_id in broadcaster_ids
+        for event_type in event_types
+    ]
+
+
+def _subscription_key(event_type, condition, callback):
+    # type・condition・callbackの組をサブスクリプションの同一性の判定に使う
+    return (event_type, tuple(sorted((condition or {}).items())), callback)
+
+
+def reconcile_eventsub_subscriptions(desired, logger_to_use=None, max_workers=4):
+    """
+    既存のEventSubサブスクリプションを一度だけ全件取得し、desiredとの差分から
+    作成・削除・保持を決めて、作成と削除を並行して実行する。
+    同じtype・conditionの古いサブスクリプションを削除する場合は、その削除が終わってから作成する
+    （Twitchは同じ組が残っていると409を返す）。
+
+    戻り値は以下のキーを持つdict:
+        success: 必要なサブスクリプションがすべて揃ったか（作成に失敗していないか）
+        listed: 取得した既存サブスクリプション数
+        kept / created / deleted: 保持・作成・削除したサブスクリプション
+        errors: 失敗した操作
+    """
+    current_logger = logger_to_use if logger_to_use else logger
+    report = {"success": False, "listed": 0, "kept": [], "created": [], "deleted": [], "errors": []}
+
+    try:
+        existing = list_eventsub_subscriptions(logger_to_use=current_logger)
+    except Exception as e:
+        current_logger.error(f"既存EventSubサブスクリプションの取得に失敗しました: {e}")
+        report["errors"].append({"action": "list", "reason": str(e)})
+        return report
+    report["listed"] = len(existing)
+
+    desired_by_key = {}
+    for item in desired:
+        key = _subscription_key(item["type"], item.get("condition"), item.get("callback"))
+        desired_by_key.setdefault(key, item)
+
+    # 既存のうち、あるべき組と一致し有効なものは1件だけ保持し、それ以外は削除する
+    kept_keys = set()
+    to_delete = []
+    for sub in existing:
+        key = _subscription_key(
+            sub.get("type"), sub.get("condition"), sub.get("transport", {}).get("callback"))
+        if (key in desired_by_key and key not in kept_keys
+                and sub.get("status") in KEEP_SUBSCRIPTION_STATUSES):
+            kept_keys.add(key)
+            report["kept"].append({"type": sub.get("type"), "id": sub.get("id"), "status": sub.get("status")})
+        else:
+            to_delete.append(sub)
+    to_create = [item for key, item in desired_by_key.items() if key not in kept_keys]
+
+    current_logger.info(
+        f"EventSubサブスクリプションの差分: 既存 {len(existing)}件 / 保持 {len(report['kept'])}件 / "
+        f"作成 {len(to_create)}件 / 削除 {len(to_delete)}件")
+
+    def delete_job(sub):
+        return sub, delete_eventsub_subscription(sub.get("id"), logger_to_use=current_logger)
+
+    def create_job(item, pending_deletes):
+        # 同じtype・conditionの削除を先に済ませる（削除は作成より先に投入しているため先に実行される）
+        if pending_deletes:
+            wait(pending_deletes)
+        return item, post_eventsub_subscription(
+            item["type"], item.get("condition"), item.get("callback"), logger_to_use=current_logger)
+
+    if to_delete or to_create:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers),
+                                thread_name_prefix="EventSubReconcile") as executor:
+            delete_futures = []
+            deletes_by_target = {}
+            for sub in to_delete:
+                future = executor.submit(delete_job, sub)
+                delete_futures.append(future)
+                target = _subscription_key(sub.get("type"), sub.get("condition"), None)
+                deletes_by_target.setdefault(target, []).append(future)
+            create_futures = [
+                executor.submit(create_job, item, deletes_by_target.get(
+                    _subscription_key(item["type"], item.get("condition"), None), []))
+                for item in to_create]
+            for future in delete_futures:
+                try:
+                    sub, ok = future.result()
+                except Exception as e:
+                    report["errors"].append({"action": "delete", "reason": str(e)})
+                    continue
+                if ok:
+                    report["deleted"].append({"type": sub.get("type"), "id": sub.get("id")})
+                else:
+                    report["errors"].append({"action": "delete", "type": sub.get("type"), "id": sub.get("id")})
+            for future in create_futures:
+                try:
+                    item, result = future.result()
+                except Exception as e:
+                    report["errors"].append({"action": "create", "reason": str(e)})
+                    continue
+                data = result.get("data") if isinstance(result, dict) else None
+                if isinstance(data, list) and data:
+                    report["created"].append(
+                        {"type": item["type"], "id": data[0].get("id"), "status": data[0].get("status")})
+                else:
+                    report["errors"].append({"action": "create", "type": item["type"],
+                                             "reason": result.get("reason") if isinstance(result, dict) else None})
+
+    # 削除の失敗は起動を妨げないが、必要なサブスクリプションの作成失敗は失敗とする
+    report["success"] = not any(err["action"] == "create" for err in report["errors"])
+    current_logger.info(
+        f"EventSubサブスクリプションの同期完了: 保持 {len(report['kept'])}件 / 作成 {len(report['created'])}件 / "
+        f"削除 {len(report['deleted'])}件 / 失敗 {len(report['errors'])}件")
+    return report
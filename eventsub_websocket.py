@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from version_info import __version__
+from threading import Event, Thread
+from websockets.exceptions import ConnectionClosed
+from websockets.sync.client import connect
+import json
+import logging
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+TWITCH_EVENTSUB_WEBSOCKET_URL = "wss://eventsub.wss.twitch.tv/ws"
+
+# session_welcomeで通知されるkeepalive間隔に上乗せする猶予（秒）
+KEEPALIVE_GRACE_SECONDS = 5
+# session_welcomeを待つ最大秒数
+WELCOME_TIMEOUT_SECONDS = 10
+# 接続が切れた場合の再接続待機（秒）。失敗が続くと倍々に延ばす
+RECONNECT_DELAY_SECONDS = 1
+MAX_RECONNECT_DELAY_SECONDS = 60
+
+logger = logging.getLogger("AppLogger")
+
+
+def _open_connection(url):
+    # websocketsの新しい版ではconnect()をwithで使う前提のため、__enter__で接続を確立する
+    # （切断はws.close()で行う。旧版のconnect()は接続自体を返し、__enter__は自身を返す）
+    return connect(url).__enter__()
+
+
+class KeepaliveTimeout(Exception):
+    """keepalive間隔内にメッセージを受信できなかった"""
+
+
+class EventSubWebSocketClient(Thread):
+    """
+    Twitch EventSubのWebSocketトランスポートのクライアント。
+    session_welcomeを受けたらon_session_welcome(session_id)でサブスクリプションを作成させ、
+    通知はon_notification(metadata, payload)に渡す。keepaliveが途切れた場合は接続し直し、
+    session_reconnectでは新しい接続のwelcomeを受けてから旧接続に残った通知を処理して切り替える。
+    """
+
+    def __init__(
+            self,
+            on_notification,
+            on_session_welcome,
+            on_revocation=None,
+            url=TWITCH_EVENTSUB_WEBSOCKET_URL,
+            shutdown_event=None,
+            logger_to_use=None):
+        super().__init__(daemon=True, name="EventSubWebSocket")
+        self.on_notification = on_notification
+        self.on_session_welcome = on_session_welcome
+        self.on_revocation = on_revocation
+        self.url = url
+        self.shutdown_event = shutdown_event if shutdown_event is not None else Event()
+        self.logger = logger_to_use if logger_to_use else logger
+        self.session_id = None
+        self.keepalive_timeout = None
+        self.connected = Event()
+        self._ws = None
+
+    def stop(self):
+        # 監視を停止し、接続を閉じる
+        self.shutdown_event.set()
+        ws = self._ws
+        if ws is not None:
+            try:
+                ws.close()
+            except Exception:
+                pass
+
+    def run(self):
+        delay = RECONNECT_DELAY_SECONDS
+        while not self.shutdown_event.is_set():
+            try:
+                self._run_session(self.url)
+                delay = RECONNECT_DELAY_SECONDS
+            except KeepaliveTimeout:
+                self.logger.warning("EventSub WebSocketのkeepaliveが途切れたため、再接続します。")
+            except ConnectionClosed as e:
+                if self.shutdown_event.is_set():
+                    break
+                self.logger.warning(f"EventSub WebSocketの接続が切断されました: {e}")
+            except Exception as e:
+                if self.shutdown_event.is_set():
+                    break
+                self.logger.error(f"EventSub WebSocketでエラーが発生しました: {e}", exc_info=e)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY_SECONDS)
+            finally:
+                self.connected.clear()
+                self.session_id = None
+            self.shutdown_event.wait(delay)
+
+    def _run_session(self, url):
+        """
+        新しいセッションを開始する。welcome受信後にサブスクリプションを作成し、以降のメッセージを処理する
+        """
+        ws = _open_connection(url)
+        self._ws = ws
+        try:
+            welcome = self._wait_welcome(ws)
+            self._apply_welcome(welcome)
+            self.logger.info(f"EventSub WebSocketセッションを開始しました: {self.session_id}")
+            # 新しいセッションではサブスクリプションを作り直す必要がある
+            self.on_session_welcome(self.session_id)
+            self.connected.set()
+            while not self.shutdown_event.is_set():
+                message = self._recv(ws)
+                reconnect_url = self._handle_message(message)
+                if reconnect_url:
+                    ws = self._handover(ws, reconnect_url)
+        finally:
+            self._close(ws)
+
+    def _recv(self, ws, timeout=None):
+        # keepalive間隔＋猶予以内に何も受信できなければKeepaliveTimeout
+        if timeout is None and self.keepalive_timeout:
+            timeout = self.keepalive_timeout + KEEPALIVE_GRACE_SECONDS
+        try:
+            raw = ws.recv(timeout=timeout)
+        except TimeoutError:
+            raise KeepaliveTimeout()
+        return json.loads(raw)
+
+    def _wait_welcome(self, ws):
+        message = self._recv(ws, timeout=WELCOME_TIMEOUT_SECONDS)
+        message_type = message.get("metadata", {}).get("message_type")
+        if message_type != "session_welcome":
+            raise RuntimeError(f"session_welcomeではないメッセージを受信しました: {message_type}")
+        return message
+
+    def _apply_welcome(self, message):
+        session = message.get("payload", {}).get("session", {})
+        self.session_id = session.get("id")
+        self.keepalive_timeout = session.get("keepalive_timeout_seconds")
+
+    def _handle_message(self, message):
+        """
+        受信メッセージを処理する。session_reconnectの場合は再接続先のURLを返す
+        """
+        metadata = message.get("metadata", {})
+        payload = message.get("payload", {})
+        message_type = metadata.get("message_type")
+        if message_type == "notification":
+            self.on_notification(metadata, payload)
+        elif message_type == "session_keepalive":
+            pass
+        elif message_type == "session_reconnect":
+            return payload.get("session", {}).get("reconnect_url")
+        elif message_type == "revocation":
+            subscription = payload.get("subscription", {})
+            self.logger.warning(
+                f"EventSubサブスクリプション失効通知受信: タイプ - {subscription.get('type')}, "
+                f"ステータス - {subscription.get('status')}")
+            if self.on_revocation:
+                self.on_revocation(metadata, payload)
+        else:
+            self.logger.info(f"受信した未処理のEventSub WebSocketメッセージタイプ: {message_type}")
+        return None
+
+    def _handover(self, old_ws, reconnect_url):
+        """
+        session_reconnect: 新しい接続でwelcomeを受けるまで旧接続を保持し、
+        旧接続に届いていた通知を処理しきってから切り替える（サブスクリプションは引き継がれる）
+        """
+        self.logger.info("EventSub WebSocketの再接続要求を受信しました。新しい接続に切り替えます。")
+        new_ws = _open_connection(reconnect_url)
+        try:
+            welcome = self._wait_welcome(new_ws)
+        except Exception:
+            self._close(new_ws)
+            raise
+        # 旧接続に残っているメッセージを処理する
+        while True:
+            try:
+                message = json.loads(old_ws.recv(timeout=0))
+            except (TimeoutError, ConnectionClosed):
+                break
+            self._handle_message(message)
+        self._close(old_ws)
+        self._ws = new_ws
+        self._apply_welcome(welcome)
+        self.logger.info(f"EventSub WebSocketセッションを引き継ぎました: {self.session_id}")
+        return new_ws
+
+    def _close(self, ws):
+        try:
+            ws.close()
+        except Exception:
+            pass
@@ -209,6 +209,15 @@ class AccountSettingsFrame(tk.Frame):
                     if resp.status_code == 200 and data.get("data"):
                         converted_id = data["data"][0]["id"]
                         conv_message = "変換完了！"
+                        # 起動時にAPIで再変換しないよう、変換結果をユーザーIDキャッシュにも登録
+                        try:
+                            from twitch_user_resolver import UserIdCache, DEFAULT_USER_ID_CACHE_PATH
+                            cache = UserIdCache(os.getenv(
+                                'TWITCH_USER_ID_CACHE_PATH', DEFAULT_USER_ID_CACHE_PATH))
+                            cache.put_many({user_input: converted_id})
+                            cache.save()
+                        except ImportError:
+                            pass
                     else:
                         tk.messagebox.showerror(
                             "変換エラー", f"Twitchユーザー名からID変換に失敗しました: {data}")
@@ -70,7 +70,7 @@ class MainWindow(tk.Tk):
         # アプリ管理タブ（サーバー起動・停止・ステータス管理）
         self.tab_app_control = MainControlFrame(notebook)
         notebook.add(self.tab_app_control, text="アプリ管理")
-
+
         # 設定状況タブ
         self.tab_status = SettingStatusFrame(notebook)
         notebook.add(self.tab_status, text="設定状況")
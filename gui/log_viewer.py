@@ -3,14 +3,32 @@
 """
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
+import csv
 import os
 import re
+from post_history import PostHistoryStore
+
+# 投稿履歴（データベース）を表す選択肢と、1ページの表示件数
+POST_HISTORY_ENTRY = "投稿履歴（post_history.db）"
+HISTORY_PAGE_SIZE = 100
+HISTORY_COLUMNS = (
+    ("posted_at", "日時", 140),
+    ("event_type", "イベントタイプ", 90),
+    ("platform", "プラットフォーム", 90),
+    ("title", "タイトル", 260),
+    ("category", "カテゴリ", 120),
+    ("url", "URL", 200),
+    ("success", "成功", 50),
+)
+SUCCESS_FILTERS = {"すべて": None, "成功": True, "失敗": False}
 
 
 class LogViewer(ttk.Frame):
     def __init__(self, master=None, log_dir="logs"):
         super().__init__(master)
         self.log_dir = log_dir
+        self.history_store = None
+        self.history_page = 0
         self.create_widgets()
 
     def create_widgets(self):
@@ -58,9 +76,46 @@ class LogViewer(ttk.Frame):
         self.txt_log = tk.Text(self.log_frame, height=20, wrap=tk.WORD, state=tk.DISABLED)
         self.txt_log.pack_forget()  # デフォルト非表示
 
+        self.create_history_widgets()
+
+    def create_history_widgets(self):
+        # 投稿履歴表示用（絞り込み・ページ送り・CSVエクスポート）。デフォルト非表示
+        self.history_frame = ttk.Frame(self)
+        filter_frame = ttk.Frame(self.history_frame)
+        filter_frame.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(filter_frame, text="開始日:").pack(side=tk.LEFT)
+        self.ent_start = ttk.Entry(filter_frame, width=12)
+        self.ent_start.pack(side=tk.LEFT, padx=(0, 8))
+        ttk.Label(filter_frame, text="終了日:").pack(side=tk.LEFT)
+        self.ent_end = ttk.Entry(filter_frame, width=12)
+        self.ent_end.pack(side=tk.LEFT, padx=(0, 8))
+        ttk.Label(filter_frame, text="結果:").pack(side=tk.LEFT)
+        self.cmb_success = ttk.Combobox(
+            filter_frame, values=list(SUCCESS_FILTERS), width=6, state="readonly")
+        self.cmb_success.set("すべて")
+        self.cmb_success.pack(side=tk.LEFT, padx=(0, 8))
+        ttk.Button(filter_frame, text="絞り込み", command=self.search_history).pack(side=tk.LEFT)
+        ttk.Button(filter_frame, text="CSVエクスポート", command=self.export_history).pack(side=tk.RIGHT)
+
+        self.history_tree = ttk.Treeview(
+            self.history_frame, columns=[c[0] for c in HISTORY_COLUMNS], show="headings")
+        for key, label, width in HISTORY_COLUMNS:
+            self.history_tree.heading(key, text=label)
+            self.history_tree.column(key, width=width)
+        self.history_tree.pack(fill=tk.BOTH, expand=True, side=tk.TOP)
+
+        page_frame = ttk.Frame(self.history_frame)
+        page_frame.pack(fill=tk.X, pady=(5, 0))
+        ttk.Button(page_frame, text="前へ", command=lambda: self.move_history_page(-1)).pack(side=tk.LEFT)
+        ttk.Button(page_frame, text="次へ", command=lambda: self.move_history_page(1)).pack(side=tk.LEFT, padx=(8, 0))
+        self.lbl_page = ttk.Label(page_frame, text="")
+        self.lbl_page.pack(side=tk.LEFT, padx=(8, 0))
+
     def get_log_files(self):
         try:
             files = [f for f in os.listdir(self.log_dir) if f.endswith(('.log', '.csv'))]
+            if os.path.exists(self.history_db_path()):
+                files.insert(0, POST_HISTORY_ENTRY)
             if not files:
                 return ["（ログファイルがありません）"]
             return files
@@ -83,11 +138,78 @@ class LogViewer(ttk.Frame):
         formatted_content = formatted_content.replace('[', '\n[')
         return formatted_content
 
+    def history_db_path(self):
+        # アプリ本体と同じく、settings.envのPOST_HISTORY_DB_PATHを優先する
+        return os.getenv("POST_HISTORY_DB_PATH") or os.path.join(self.log_dir, "post_history.db")
+
+    def history_filters(self):
+        return {
+            "start": self.ent_start.get().strip() or None,
+            "end": self.ent_end.get().strip() or None,
+            "success": SUCCESS_FILTERS.get(self.cmb_success.get()),
+        }
+
+    def show_history(self):
+        self.log_frame.pack_forget()
+        self.history_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+        if self.history_store is None:
+            self.history_store = PostHistoryStore(self.history_db_path())
+        self.search_history()
+
+    def search_history(self):
+        self.history_page = 0
+        self.load_history_page()
+
+    def move_history_page(self, step):
+        self.history_page = max(0, self.history_page + step)
+        self.load_history_page()
+
+    def load_history_page(self):
+        # 条件に合う投稿履歴を1ページ分だけ取得して表示する
+        if self.history_store is None:
+            return
+        try:
+            filters = self.history_filters()
+            total = self.history_store.count(**filters)
+            pages = max(1, -(-total // HISTORY_PAGE_SIZE))
+            self.history_page = min(self.history_page, pages - 1)
+            rows = self.history_store.query(
+                limit=HISTORY_PAGE_SIZE, offset=self.history_page * HISTORY_PAGE_SIZE, **filters)
+        except Exception as e:
+            messagebox.showerror("エラー", f"投稿履歴を取得できません: {e}")
+            return
+        for item in self.history_tree.get_children():
+            self.history_tree.delete(item)
+        for row in rows:
+            self.history_tree.insert('', 'end', values=(
+                row["posted_at"], row["event_type"], row["platform"] or "", row["title"],
+                row["category"], row["url"], "○" if row["success"] else "×"))
+        self.lbl_page.config(text=f"{self.history_page + 1} / {pages} ページ（全{total}件）")
+
+    def export_history(self):
+        if self.history_store is None:
+            return
+        path = filedialog.asksaveasfilename(
+            defaultextension=".csv", filetypes=[("CSV", "*.csv")], initialfile="post_history_export.csv")
+        if not path:
+            return
+        try:
+            count = self.history_store.export_csv(path, **self.history_filters())
+        except Exception as e:
+            messagebox.showerror("エラー", f"CSVエクスポートに失敗しました: {e}")
+            return
+        messagebox.showinfo("CSVエクスポート", f"{count}件の投稿履歴を書き出しました。\n{path}")
+
     def load_log(self):
         filename = self.cmb_file.get()
         if not filename:
             messagebox.showwarning("ファイル未選択", "ログファイルを選択してください")
             return
+        if filename == POST_HISTORY_ENTRY:
+            self.show_history()
+            return
+        self.history_frame.pack_forget()
+        self.log_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         path = os.path.join(self.log_dir, filename)
         try:
             # .csvなら投稿履歴としてテーブル表示、.logなら従来のパース
@@ -96,18 +218,14 @@ class LogViewer(ttk.Frame):
                 self.tree.pack(fill=tk.BOTH, expand=True, side=tk.LEFT)
                 for row in self.tree.get_children():
                     self.tree.delete(row)
-                with open(path, encoding="utf-8") as f:
-                    for i, line in enumerate(f):
-                        if i == 0 and (',' in line):
+                with open(path, newline="", encoding="utf-8-sig") as f:
+                    for i, parts in enumerate(csv.reader(f)):
+                        if i == 0 and len(parts) > 1:
                             continue  # ヘッダ行はスキップ
-                        parts = line.strip().split(',')
-                        if len(parts) >= 3:
-                            self.tree.insert('', 'end', values=(
-                                parts[0], parts[1], ','.join(parts[2:])))
-                        elif len(parts) == 2:
-                            self.tree.insert('', 'end', values=(parts[0], parts[1], ''))
-                        elif len(parts) == 1:
-                            self.tree.insert('', 'end', values=(parts[0], '', ''))
+                        if not parts:
+                            continue
+                        self.tree.insert('', 'end', values=(
+                            parts[0], parts[1] if len(parts) > 1 else '', ' / '.join(parts[2:])))
             else:
                 self.tree.pack_forget()
                 self.txt_log.pack(fill=tk.BOTH, expand=True, side=tk.LEFT)
@@ -120,3 +238,9 @@ class LogViewer(ttk.Frame):
                 self.txt_log.config(state=tk.DISABLED)
         except Exception as e:
             messagebox.showerror("エラー", f"ファイルを開けません: {e}")
+
+    def destroy(self):
+        if self.history_store is not None:
+            self.history_store.close()
+            self.history_store = None
+        super().destroy()
@@ -9,6 +9,9 @@ from version_info import __version__
 from dotenv import load_dotenv
 import sys
 import os
+import queue
+import threading
+import time
 sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 import tkinter as tk
 from tkinter import ttk
@@ -39,23 +42,35 @@ __version__ = __version__
 """
 
 
+# 起動進捗キューを確認する間隔（ミリ秒）
+PROGRESS_POLL_MS = 100
+# 起動処理スレッドが最後に積む終了イベントのステップ名
+STARTUP_FINISHED = "__finished__"
+# 初期化後にGUI側で行うステップ
+WEBAPP_STEP = ("webapp", "ウェブアプリ起動")
+
+# 起動ステップの状態 -> (表示文字列, 色)
+STEP_STATE_DISPLAY = {
+    "running": ("実行中", "blue"),
+    "done": ("成功", "green"),
+    "failed": ("失敗", "red"),
+    "skipped": ("スキップ", "gray"),
+}
+
+
 class MainControlFrame(ttk.Frame):
     def __init__(self, master=None, bot_manager=None):
         super().__init__(master)
         self.bot_manager = bot_manager
-        self.steps = [
-            "設定ファイル確認",
-            "トンネル起動",
-            "ウェブアプリ起動",
-            "トンネル疎通確認",
-            "起動完了"
-        ]
+        # main.pyの起動・停止APIをimport
+        self.main_module = importlib.import_module("main")
+        self.steps = []
+        self.step_index = {}
         self.step_vars = []
         self.step_labels = []
+        self._progress_queue = None
         self.create_widgets()
         self.reset_status()
-        # main.pyの起動・停止APIをimport
-        self.main_module = importlib.import_module("main")
 
     def create_widgets(self):
         # 見出し
@@ -66,16 +81,10 @@ class MainControlFrame(ttk.Frame):
         self.status_label = ttk.Label(self, text="サーバーは停止中です", font=("Meiryo", 13), foreground="red")
         self.status_label.pack(pady=(0, 8))
 
-        # ステップ進捗表示用フレーム
-        steps_frame = ttk.Frame(self)
-        steps_frame.pack(pady=2, fill="x")
-        for step in self.steps:
-            var = tk.StringVar(value="未実行")
-            # 各ステップのラベル
-            lbl = ttk.Label(steps_frame, text=f"{step}: {var.get()}", font=("Meiryo", 13), anchor="w")
-            lbl.pack(fill="x", padx=18, pady=1)
-            self.step_vars.append(var)
-            self.step_labels.append(lbl)
+        # ステップ進捗表示用フレーム（行は起動時の設定に合わせて作り直す）
+        self.steps_frame = ttk.Frame(self)
+        self.steps_frame.pack(pady=2, fill="x")
+        self.build_step_rows()
 
         # 起動・停止ボタン用フレーム
         btn_frame = ttk.Frame(self)
@@ -110,11 +119,33 @@ class MainControlFrame(ttk.Frame):
         self.console_text.see("end")
         self.console_text.config(state="disabled")
 
+    def build_step_rows(self):
+        # 現在の設定で実行される起動ステップの行を作る
+        for lbl in self.step_labels:
+            lbl.destroy()
+        try:
+            self.steps = list(self.main_module.startup_step_labels()) + [WEBAPP_STEP]
+        except Exception:
+            self.steps = [WEBAPP_STEP]
+        self.step_index = {name: idx for idx, (name, _) in enumerate(self.steps)}
+        self.step_vars = []
+        self.step_labels = []
+        for _, label in self.steps:
+            var = tk.StringVar(value="未実行")
+            # 各ステップのラベル
+            lbl = ttk.Label(self.steps_frame, text=f"{label}: {var.get()}", font=("Meiryo", 13), anchor="w")
+            lbl.pack(fill="x", padx=18, pady=1)
+            self.step_vars.append(var)
+            self.step_labels.append(lbl)
+
+    def reset_steps(self):
+        for var, lbl, (_, label) in zip(self.step_vars, self.step_labels, self.steps):
+            var.set("未実行")
+            lbl.config(text=f"{label}: {var.get()}", foreground="black")
+
     def reset_status(self):
         self.status_label.config(text="サーバーは停止中です", font=("Meiryo", 13), foreground="red")
-        for var, lbl, step in zip(self.step_vars, self.step_labels, self.steps):
-            var.set("未実行")
-            lbl.config(text=f"{step}: {var.get()}", foreground="black")
+        self.reset_steps()
         self.start_button.config(state="normal")
         self.stop_button.config(state="disabled")
         self.console_text.config(state="normal")
@@ -123,30 +154,83 @@ class MainControlFrame(ttk.Frame):
 
     def update_step(self, idx, status, color="black"):
         self.step_vars[idx].set(status)
-        self.step_labels[idx].config(text=f"{self.steps[idx]}: {status}", foreground=color)
-        self.update_idletasks()
+        self.step_labels[idx].config(text=f"{self.steps[idx][1]}: {status}", foreground=color)
 
     def start_server(self):
         self.status_label.config(text="起動処理中...", foreground="blue")
         self.start_button.config(state="disabled")
         self.stop_button.config(state="disabled")
+        self.build_step_rows()
         self.append_console("[INFO] サーバー起動処理を開始します。")
-        # main.pyの初期化APIを呼ぶ
+        # 初期化はネットワーク待ちが多いため別スレッドで実行し、進捗はキュー経由で受け取る
+        self._progress_queue = queue.Queue()
+        threading.Thread(target=self._run_startup, args=(self._progress_queue,), daemon=True).start()
+        self.after(PROGRESS_POLL_MS, self._poll_startup_progress)
+
+    def _run_startup(self, progress_queue):
+        # 起動処理スレッド（Tkのウィジェットには触らず、イベントをキューに積むだけ）
+        name, label = WEBAPP_STEP
         try:
-            if not self.main_module.initialize_app():
-                self.append_console("[ERROR] アプリ初期化に失敗しました。サーバーは起動できません。")
-                self.status_label.config(text="初期化失敗", foreground="red")
-                self.start_button.config(state="normal")
+            if not self.main_module.initialize_app(progress_queue=progress_queue):
+                progress_queue.put({"step": STARTUP_FINISHED, "state": "failed", "error": None})
                 return
-            self.append_console("[INFO] アプリ初期化が完了しました。CherryPyサーバー起動要求を送信します。")
+            started = time.perf_counter()
+            progress_queue.put({"step": name, "label": label, "state": "running", "duration": None, "error": None})
             self.main_module.start_server_in_thread()
+            progress_queue.put({"step": name, "label": label, "state": "done",
+                                "duration": time.perf_counter() - started, "error": None})
+            progress_queue.put({"step": STARTUP_FINISHED, "state": "done", "error": None})
         except Exception as e:
-            self.append_console(f"[ERROR] サーバー起動失敗: {e}")
-            self.status_label.config(text="起動失敗", foreground="red")
-            self.start_button.config(state="normal")
+            progress_queue.put({"step": STARTUP_FINISHED, "state": "failed", "error": str(e)})
+
+    def _poll_startup_progress(self):
+        # after()で定期的に呼ばれ、キューに溜まった進捗イベントを画面に反映する
+        progress_queue = self._progress_queue
+        if progress_queue is None:
             return
-        import threading
-        threading.Thread(target=self._startup_sequence, daemon=True).start()
+        while True:
+            try:
+                event = progress_queue.get_nowait()
+            except queue.Empty:
+                break
+            if event["step"] == STARTUP_FINISHED:
+                self._finish_startup(event)
+                return
+            self._apply_progress_event(event)
+        self.after(PROGRESS_POLL_MS, self._poll_startup_progress)
+
+    def _apply_progress_event(self, event):
+        idx = self.step_index.get(event["step"])
+        text, color = STEP_STATE_DISPLAY.get(event["state"], (event["state"], "black"))
+        if event.get("duration") is not None:
+            text = f"{text} ({event['duration']:.2f}秒)"
+        if idx is not None:
+            self.update_step(idx, text, color)
+        label = event.get("label", event["step"])
+        if event["state"] == "running":
+            self.append_console(f"[STEP] {label}...")
+        elif event["state"] == "done":
+            self.append_console(f"[OK] {label} 完了 ({event['duration']:.2f}秒)")
+        elif event["state"] == "failed":
+            self.append_console(f"[ERROR] {label} 失敗: {event.get('error')}")
+
+    def _finish_startup(self, event):
+        self._progress_queue = None
+        result = getattr(self.main_module, "last_startup_result", None)
+        if result is not None:
+            self.append_console(f"[TIME] 初期化合計: {result.total_seconds:.2f}秒")
+        if event["state"] == "done":
+            self.status_label.config(text="サーバーは起動中です", foreground="green")
+            self.append_console("[INFO] サーバーは起動中です。")
+            self.stop_button.config(state="normal")
+            return
+        if event.get("error"):
+            self.append_console(f"[ERROR] サーバー起動失敗: {event['error']}")
+        else:
+            self.append_console("[ERROR] アプリ初期化に失敗しました。サーバーは起動できません。")
+        self.status_label.config(text="初期化失敗", foreground="red")
+        self.start_button.config(state="normal")
+        self.stop_button.config(state="disabled")
 
     def stop_server(self):
         self.status_label.config(text="停止処理中...", foreground="red")
@@ -162,51 +246,9 @@ class MainControlFrame(ttk.Frame):
             self.append_console("[INFO] クリーンアップ処理を実行しました。")
         except Exception as e:
             self.append_console(f"[ERROR] CherryPyサーバー停止失敗: {e}")
-        import threading
         threading.Thread(target=self._shutdown_sequence, daemon=True).start()
 
-    def _startup_sequence(self):
-        import time
-        try:
-            self.append_console("[STEP] 設定ファイル確認...")
-            self.update_step(0, "実行中", "blue")
-            time.sleep(0.5)
-            self.update_step(0, "成功", "green")
-            self.append_console("[OK] 設定ファイル確認 完了")
-
-            self.append_console("[STEP] トンネル起動...")
-            self.update_step(1, "実行中", "blue")
-            time.sleep(0.5)
-            self.update_step(1, "成功", "green")
-            self.append_console("[OK] トンネル起動 完了")
-
-            self.append_console("[STEP] ウェブアプリ起動...")
-            self.update_step(2, "実行中", "blue")
-            time.sleep(0.5)
-            self.update_step(2, "成功", "green")
-            self.append_console("[OK] ウェブアプリ起動 完了")
-
-            self.append_console("[STEP] トンネル疎通確認...")
-            self.update_step(3, "実行中", "blue")
-            time.sleep(0.5)
-            self.update_step(3, "成功", "green")
-            self.append_console("[OK] トンネル疎通確認 完了")
-
-            self.update_step(4, "成功", "green")
-            self.status_label.config(text="サーバーは起動中です", foreground="green")
-            self.append_console("[INFO] サーバーは起動中です。")
-            self.stop_button.config(state="normal")
-        except Exception as e:
-            self.status_label.config(text=f"起動失敗: {e}", foreground="red")
-            self.append_console(f"[ERROR] 起動失敗: {e}")
-            for idx, var in enumerate(self.step_vars):
-                if var.get() == "実行中":
-                    self.update_step(idx, "失敗", "red")
-            self.start_button.config(state="normal")
-            self.stop_button.config(state="disabled")
-
     def _shutdown_sequence(self):
-        import time
         try:
             # 1. 設定ファイルの書き換え（必要なら）
             self.append_console("[STEP] 設定ファイルの書き換え...")
@@ -225,9 +267,7 @@ class MainControlFrame(ttk.Frame):
 
             # 4. ステータスを停止に変更（ステップもリセット）
             self.status_label.config(text="サーバーは停止中です", foreground="red")
-            for var, lbl, step in zip(self.step_vars, self.step_labels, self.steps):
-                var.set("未実行")
-                lbl.config(text=f"{step}: {var.get()}", foreground="black")
+            self.reset_steps()
             self.start_button.config(state="normal")
             self.stop_button.config(state="disabled")
             self.append_console("[INFO] サーバーは停止しました。")
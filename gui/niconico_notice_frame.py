@@ -213,6 +213,12 @@ class NiconicoNoticeFrame(ttk.Frame):
         with open(env_path, 'w', encoding='utf-8') as f:
             f.writelines(new_lines)
         load_dotenv(env_path, override=True)
+        # 実行中のBotにテンプレートの変更を通知し、コンパイル済みテンプレートを再読み込みさせる
+        try:
+            from bluesky import invalidate_template_cache
+            invalidate_template_cache()
+        except ImportError:
+            pass
         self.var_nico_online.set(
             os.getenv('NOTIFY_ON_NICONICO_ONLINE', 'False').lower() == 'true')
         self.var_nico_newvideo.set(
@@ -211,6 +211,20 @@ class TwitchNoticeFrame(ttk.Frame):
         with open(env_path, 'w', encoding='utf-8') as f:
             f.writelines(new_lines)
         load_dotenv(env_path, override=True)
+        # 実行中のBotにテンプレートの変更を通知し、コンパイル済みテンプレートを再読み込みさせる
+        try:
+            from bluesky import invalidate_template_cache
+            invalidate_template_cache()
+        except ImportError:
+            pass
+        # 設定スナップショットを作り直し、通知のON/OFF・画像などの既定設定を配信者の索引に反映する
+        try:
+            from app_settings import reload_settings
+            from broadcaster_registry import reload_broadcaster_defaults
+            reload_settings()
+            reload_broadcaster_defaults()
+        except ImportError:
+            pass
         self.var_online.set(
             os.getenv('NOTIFY_ON_TWITCH_ONINE', 'False').lower() == 'true')
         self.var_offline.set(
@@ -213,6 +213,12 @@ class YouTubeNoticeFrame(ttk.Frame):
         with open(env_path, 'w', encoding='utf-8') as f:
             f.writelines(new_lines)
         load_dotenv(env_path, override=True)
+        # 実行中のBotにテンプレートの変更を通知し、コンパイル済みテンプレートを再読み込みさせる
+        try:
+            from bluesky import invalidate_template_cache
+            invalidate_template_cache()
+        except ImportError:
+            pass
         self.var_yt_online.set(
             os.getenv('NOTIFY_ON_YOUTUBE_ONLINE', 'False').lower() == 'true')
         self.var_yt_newvideo.set(
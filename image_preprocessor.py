@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from version_info import __version__
+from PIL import Image, ImageOps, UnidentifiedImageError
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+# Blueskyの画像blobの上限（app.bsky.embed.imagesのmaxSize）
+DEFAULT_IMAGE_MAX_BYTES = 1000000
+DEFAULT_IMAGE_MAX_DIMENSION = 2000
+DEFAULT_IMAGE_FORMAT = "JPEG"
+DEFAULT_IMAGE_CACHE_DIR = "data/image_cache"
+
+# 再エンコード時に順に試す品質
+QUALITY_STEPS = (85, 75, 65, 50)
+# 品質を下げても上限に収まらない場合の縮小率
+SHRINK_RATIO = 0.75
+
+MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+EXTENSIONS = {"JPEG": "jpg", "WEBP": "webp"}
+
+logger = logging.getLogger("AppLogger")
+
+
+class ImagePreprocessor:
+    """
+    投稿用画像をBlueskyのblob上限に収まるよう縮小・再エンコードする前処理。
+    処理結果は元画像のSHA-256と変換設定をキーにcache_dirへ保存し、
+    元画像のmtime・サイズが変わらない限りファイルを読み直さずに再利用する。
+    """
+
+    def __init__(
+            self,
+            max_dimension=DEFAULT_IMAGE_MAX_DIMENSION,
+            max_bytes=DEFAULT_IMAGE_MAX_BYTES,
+            output_format=DEFAULT_IMAGE_FORMAT,
+            cache_dir=DEFAULT_IMAGE_CACHE_DIR):
+        self.max_dimension = max(16, int(max_dimension))
+        self.max_bytes = max(1024, int(max_bytes))
+        output_format = str(output_format or DEFAULT_IMAGE_FORMAT).upper()
+        if output_format == "JPG":
+            output_format = "JPEG"
+        if output_format not in EXTENSIONS:
+            logger.warning(f"未対応の画像形式が指定されたため、JPEGを使用します: {output_format}")
+            output_format = "JPEG"
+        self.output_format = output_format
+        self.cache_dir = cache_dir or None
+        # 元画像のパスと変換設定 -> (mtime_ns, size, 処理済みファイルのパス)
+        self._index = {}
+        self._index_loaded = False
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        # settings.envの値から前処理の設定を作る
+        return cls(
+            max_dimension=os.getenv("BLUESKY_IMAGE_MAX_DIMENSION", DEFAULT_IMAGE_MAX_DIMENSION),
+            max_bytes=os.getenv("BLUESKY_IMAGE_MAX_BYTES", DEFAULT_IMAGE_MAX_BYTES),
+            output_format=os.getenv("BLUESKY_IMAGE_FORMAT", DEFAULT_IMAGE_FORMAT),
+            cache_dir=os.getenv("BLUESKY_IMAGE_CACHE_DIR", DEFAULT_IMAGE_CACHE_DIR))
+
+    @property
+    def _index_path(self):
+        return os.path.join(self.cache_dir, "index.json") if self.cache_dir else None
+
+    def _load_index(self):
+        # 処理済み画像の索引を読み込む（ロック取得済みで呼ぶこと）
+        if self._index_loaded:
+            return
+        self._index_loaded = True
+        index_path = self._index_path
+        if not index_path or not os.path.exists(index_path):
+            return
+        try:
+            with open(index_path, encoding="utf-8") as f:
+                data = json.load(f)
+            for source, entry in data.items():
+                self._index[source] = (int(entry[0]), int(entry[1]), str(entry[2]))
+        except Exception as e:
+            logger.warning(f"画像キャッシュの索引の読み込みに失敗しました: {index_path}, エラー: {e}")
+
+    def _save_index(self):
+        # 索引を保存する（ロック取得済みで呼ぶこと）
+        index_path = self._index_path
+        if not index_path:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{index_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({k: list(v) for k, v in self._index.items()}, f)
+            os.replace(tmp_path, index_path)
+        except Exception as e:
+            logger.warning(f"画像キャッシュの索引の保存に失敗しました: {index_path}, エラー: {e}")
+
+    def _cache_file_path(self, source_digest):
+        # 変換設定が変わったら別ファイルになるよう、設定値もファイル名に含める
+        name = (f"{source_digest}_{self.max_dimension}_{self.max_bytes}"
+                f".{EXTENSIONS[self.output_format]}")
+        return os.path.join(self.cache_dir, name)
+
+    def _index_key(self, image_path):
+        # 同じ画像でも変換設定が違えば別の処理済みファイルを使うため、設定値も索引のキーに含める
+        return (f"{os.path.abspath(image_path)}|{self.max_dimension}_{self.max_bytes}"
+                f"_{self.output_format}")
+
+    def _lookup(self, image_path, st):
+        # 同じ変換設定で、mtime・サイズが一致する処理済みファイルがあればその内容を返す
+        with self._lock:
+            self._load_index()
+            entry = self._index.get(self._index_key(image_path))
+        if not entry or entry[0] != st.st_mtime_ns or entry[1] != st.st_size:
+            return None
+        try:
+            with open(entry[2], "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _store(self, image_path, st, cache_file, data):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{cache_file}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, cache_file)
+        except Exception as e:
+            logger.warning(f"処理済み画像の保存に失敗しました: {cache_file}, エラー: {e}")
+            return
+        with self._lock:
+            self._load_index()
+            self._index[self._index_key(image_path)] = (st.st_mtime_ns, st.st_size, cache_file)
+            self._save_index()
+
+    def prepare(self, image_path):
+        """
+        アップロードする画像データ(bytes)とMIMEタイプを返す。
+        上限内の画像はそのまま、超える画像は縮小・再エンコードしたものを返す
+        """
+        st = os.stat(image_path)
+        if self.cache_dir:
+            cached = self._lookup(image_path, st)
+            if cached is not None:
+                return cached, MIME_TYPES[self.output_format]
+
+        with open(image_path, "rb") as f:
+            source = f.read()
+        try:
+            with Image.open(io.BytesIO(source)) as img:
+                # ヘッダーだけでサイズと形式を判定し、上限内ならデコードせずにそのまま使う
+                if (len(source) <= self.max_bytes and max(img.size) <= self.max_dimension
+                        and img.format in MIME_TYPES):
+                    return source, MIME_TYPES[img.format]
+                data = self._encode(img)
+        except (UnidentifiedImageError, OSError, ValueError) as e:
+            logger.warning(f"画像の前処理に失敗したため、元のファイルをそのまま使用します: {image_path}, エラー: {e}")
+            return source, None
+
+        if self.cache_dir:
+            self._store(image_path, st, self._cache_file_path(hashlib.sha256(source).hexdigest()), data)
+        logger.info(
+            f"画像を前処理しました: {image_path} ({len(source)} bytes -> {len(data)} bytes, {self.output_format})")
+        return data, MIME_TYPES[self.output_format]
+
+    def _encode(self, img):
+        """
+        一度だけデコードした画像を、縦横比を保ったまま縮小してblob上限内に再エンコードする
+        """
+        img = ImageOps.exif_transpose(img)
+        if img.mode in ("RGBA", "LA", "P"):
+            img = img.convert("RGBA")
+            if self.output_format == "JPEG":
+                # JPEGは透過に対応しないため白背景に合成する
+                background = Image.new("RGB", img.size, (255, 255, 255))
+                background.paste(img, mask=img.getchannel("A"))
+                img = background
+        elif img.mode != "RGB":
+            img = img.convert("RGB")
+
+        limit = self.max_dimension
+        data = b""
+        while True:
+            resized = img
+            if max(img.size) > limit:
+                resized = img.copy()
+                resized.thumbnail((limit, limit), Image.Resampling.LANCZOS)
+            for quality in QUALITY_STEPS:
+                buffer = io.BytesIO()
+                resized.save(buffer, format=self.output_format, quality=quality, optimize=True)
+                data = buffer.getvalue()
+                if len(data) <= self.max_bytes:
+                    return data
+            if limit <= 64:
+                return data
+            limit = max(64, int(min(limit, max(resized.size)) * SHRINK_RATIO))
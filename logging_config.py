@@ -7,8 +7,10 @@ Stream notify on Bluesky
 
 from version_info import __version__
 import logging
-from logging.handlers import TimedRotatingFileHandler
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 from pathlib import Path
+import queue
+import threading
 from dotenv import load_dotenv
 import sys
 import os
@@ -35,6 +37,145 @@ __app_version__ = __version__
 # 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
 
 
+# ログの待ち行列に溜められる最大件数（超えた分は破棄して件数を数える）
+DEFAULT_LOG_QUEUE_MAXSIZE = 10000
+
+
+class BoundedQueueHandler(QueueHandler):
+    """
+    ログを上限付きの待ち行列に積むだけのハンドラ（ファイル書き込み・Discord送信は行わない）。
+    待ち行列が満杯のときは待たずに破棄し、破棄した件数を数える。
+    route は出力先（QueueListener側の_LogRouter）を選ぶためのキー
+    """
+
+    def __init__(self, log_queue, route):
+        super().__init__(log_queue)
+        self.route = route
+        self.dropped = 0
+        # 前回報告してから破棄した件数（次に積めたときに警告として出力する）
+        self._unreported = 0
+        self._lock = threading.Lock()
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.log_route = self.route
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+                self._unreported += 1
+            return
+        if self._unreported:
+            with self._lock:
+                count, self._unreported = self._unreported, 0
+            notice = logging.LogRecord(
+                record.name, logging.WARNING, __file__, 0,
+                f"ログの待ち行列が満杯のため、{count}件のログを破棄しました。", None, None)
+            notice.log_route = self.route
+            try:
+                self.queue.put_nowait(notice)
+            except queue.Full:
+                with self._lock:
+                    self._unreported += count
+
+
+class _LogRouter(logging.Handler):
+    # QueueListenerのスレッドで、ログを積んだロガーに対応するハンドラへ振り分ける
+
+    def __init__(self, routes):
+        super().__init__()
+        self.routes = routes
+
+    def handle(self, record):
+        for handler in self.routes.get(getattr(record, "log_route", None), ()):
+            if record.levelno >= handler.level:
+                handler.handle(record)
+        return True
+
+    def emit(self, record):
+        self.handle(record)
+
+
+class _LogQueueListener(QueueListener):
+    def enqueue_sentinel(self):
+        # 満杯の待ち行列でも停止できるよう、空きが出るまで待って終了の印を積む
+        self.queue.put(self._sentinel)
+
+
+_listener = None
+_queue_handlers = []
+_routes = {}
+_listener_lock = threading.Lock()
+
+
+def start_log_listener(routes, maxsize=DEFAULT_LOG_QUEUE_MAXSIZE):
+    """
+    出力先のハンドラをQueueListenerの1スレッドにまとめ、ロガーには待ち行列に積むハンドラだけを付ける。
+    routesは {ルート名: (ロガーのリスト, ハンドラのリスト)}
+    """
+    global _listener, _routes
+    # 設定し直す場合は、以前の出力先を書き出してから閉じる
+    stop_log_listener(close_handlers=True)
+    log_queue = queue.Queue(maxsize=max(1, int(maxsize)))
+    with _listener_lock:
+        _routes = {name: list(handlers) for name, (_, handlers) in routes.items()}
+        for name, (loggers, _) in routes.items():
+            queue_handler = BoundedQueueHandler(log_queue, name)
+            for target in loggers:
+                target.addHandler(queue_handler)
+            _queue_handlers.append((queue_handler, list(loggers)))
+        _listener = _LogQueueListener(log_queue, _LogRouter(_routes))
+        _listener.start()
+    return _listener
+
+
+def stop_log_listener(close_handlers=False):
+    """
+    待ち行列に残っているログをすべて書き出してからQueueListenerを止め、ロガーから待ち行列のハンドラを外す。
+    close_handlers=Trueなら出力先のハンドラも閉じる
+    """
+    global _listener, _routes
+    with _listener_lock:
+        listener, _listener = _listener, None
+        queue_handlers = list(_queue_handlers)
+        _queue_handlers.clear()
+        routes, _routes = _routes, {}
+    for queue_handler, loggers in queue_handlers:
+        for target in loggers:
+            target.removeHandler(queue_handler)
+    if listener is None:
+        return
+    listener.stop()
+    for handlers in routes.values():
+        for handler in handlers:
+            try:
+                handler.flush()
+                if close_handlers:
+                    handler.close()
+            except Exception:
+                pass
+
+
+def get_log_queue_stats():
+    """
+    ログの待ち行列の状況 {"queued": 待ち件数, "maxsize": 上限, "dropped": 破棄した件数} を返す
+    """
+    with _listener_lock:
+        listener = _listener
+        queue_handlers = [handler for handler, _ in _queue_handlers]
+    if listener is None:
+        return {"queued": 0, "maxsize": 0, "dropped": sum(h.dropped for h in queue_handlers)}
+    return {
+        "queued": listener.queue.qsize(),
+        "maxsize": listener.queue.maxsize,
+        "dropped": sum(h.dropped for h in queue_handlers),
+    }
+
+
 def configure_logging(app=None):
     # 環境設定ファイルの場所を指定し、環境変数を読み込む
     env_path = Path(__file__).parent / "settings.env"
@@ -87,7 +228,6 @@ def configure_logging(app=None):
     )
     audit_file_handler.setLevel(logging.INFO)
     audit_file_handler.setFormatter(audit_format)
-    audit_logger.addHandler(audit_file_handler)
 
     # アプリケーション用ロガーの作成
     logger = logging.getLogger("AppLogger")
@@ -107,7 +247,6 @@ def configure_logging(app=None):
     )
     info_file_handler.setLevel(log_level)  # 設定されたログレベルを使用
     info_file_handler.setFormatter(error_format)
-    logger.addHandler(info_file_handler)
 
     # エラーログファイル（error.log）のハンドラ
     error_file_handler = TimedRotatingFileHandler(
@@ -119,13 +258,14 @@ def configure_logging(app=None):
     )
     error_file_handler.setLevel(logging.ERROR)  # ERROR以上のみ記録
     error_file_handler.setFormatter(error_format)
-    logger.addHandler(error_file_handler)  # AppLoggerに追加
 
     # コンソール出力用ハンドラ
     console_handler = logging.StreamHandler()
     console_handler.setLevel(log_level)  # 設定されたログレベルを使用
     console_handler.setFormatter(error_format)
-    logger.addHandler(console_handler)
+
+    # ハンドラの準備中に出すメッセージ（待ち行列の開始後に出力する）
+    pending_messages = []
 
     # Discord通知の有効/無効設定
     discord_enabled = os.getenv("DISCORD_NOTIFICATION_ENABLED", "false").lower() == "true"
@@ -147,16 +287,15 @@ def configure_logging(app=None):
                 # ログフォーマットを統一
                 logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
             )
-            logger.addHandler(discord_handler)
             app_logger_handlers.append(
                 discord_handler)  # Flask用リストにも追加
         except ImportError:
             msg = "discord_loggingライブラリが見つかりません。Discord通知は無効化されます。'pip install discord-logging-handler'でインストールしてください。"
-            logger.warning(msg)
+            pending_messages.append((logging.WARNING, msg))
             print(msg)  # ロガーが未初期化の場合も考慮してprint
         except Exception as e:
             msg = f"DiscordHandlerの初期化に失敗しました: {e}。Discord通知は無効化されます。"
-            logger.warning(msg)
+            pending_messages.append((logging.WARNING, msg))
             print(msg)
     else:
         # ユーザー指定の日本語メッセージで出力
@@ -167,7 +306,7 @@ def configure_logging(app=None):
             msg = "Discord通知はオフになっています。"
         else:
             msg = "Discord通知はオンになっています。"
-        logger.info(msg)  # 設定上の選択なのでINFOで記録
+        pending_messages.append((logging.INFO, msg))  # 設定上の選択なのでINFOで記録
 
     # tunnel.log用ロガーの設定
     tunnel_logger = logging.getLogger("tunnel.logger")
@@ -182,14 +321,27 @@ def configure_logging(app=None):
     )
     tunnel_file_handler.setLevel(log_level)
     tunnel_file_handler.setFormatter(tunnel_format)
-    tunnel_logger.addHandler(tunnel_file_handler)
 
-    # Flaskアプリが渡された場合は、Flaskのロガーにも同じハンドラを追加
+    # Flaskアプリが渡された場合は、Flaskのロガーも同じハンドラに出力する
+    app_loggers = [logger]
     if app is not None:
         app.logger.handlers.clear()  # Flaskデフォルトハンドラをクリア
-        for h in app_logger_handlers:
-            app.logger.addHandler(h)
         app.logger.setLevel(log_level)
         app.logger.propagate = False
+        app_loggers.append(app.logger)
+
+    # ロガーには待ち行列に積むハンドラだけを付け、ファイル書き込み・コンソール出力・Discord送信は
+    # QueueListenerの1スレッドで行う（Webhook処理中のログ出力はメモリ上の待ち行列への追加のみ）
+    try:
+        log_queue_maxsize = int(os.getenv("LOG_QUEUE_MAXSIZE", DEFAULT_LOG_QUEUE_MAXSIZE))
+    except ValueError:
+        log_queue_maxsize = DEFAULT_LOG_QUEUE_MAXSIZE
+    start_log_listener({
+        "app": (app_loggers, app_logger_handlers),
+        "audit": ([audit_logger], [audit_file_handler]),
+        "tunnel": ([tunnel_logger], [tunnel_file_handler]),
+    }, maxsize=log_queue_maxsize)
+    for level, msg in pending_messages:
+        logger.log(level, msg)
 
     return logger, app_logger_handlers, audit_logger, tunnel_logger
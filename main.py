@@ -25,25 +25,56 @@ from utils import rotate_secret_if_needed
 from flask import jsonify
 from eventsub import (
     get_valid_app_access_token,
-    create_eventsub_subscription,
+    desired_eventsub_subscriptions,
+    post_eventsub_subscription,
+    reconcile_eventsub_subscriptions,
     verify_signature,
+    prepare_webhook_secret,
+    close_twitch_api_client,
+    resolve_broadcaster_ids,
+    start_app_token_refresher,
+    stop_app_token_refresher,
 )
-from logging_config import configure_logging
-from eventsub import cleanup_eventsub_subscriptions
+from logging_config import configure_logging, stop_log_listener
 from tunnel import start_tunnel, stop_tunnel
-from bluesky import BlueskyPoster  # BlueskyPosterクラスのインポート
 from flask import Flask, request
-from youtube_monitor import YouTubeMonitor
-from niconico_monitor import NiconicoMonitor
+from notification_dispatcher import NotificationDispatcher
+from broadcaster_registry import (
+    BroadcasterConfig,
+    build_broadcaster_registry,
+    get_broadcaster_registry,
+    load_broadcaster_entries,
+    reload_broadcaster_defaults,
+    set_broadcaster_registry,
+)
+from startup_graph import StartupGraph, StartupStepFailed, DEFAULT_STARTUP_WORKERS
+from message_id_cache import MessageIdCache, DEFAULT_MESSAGE_ID_TTL, DEFAULT_MESSAGE_ID_MAX_ENTRIES
+from bluesky_outbox import (
+    BlueskyOutbox,
+    OutboxSender,
+    DEFAULT_OUTBOX_PATH,
+    DEFAULT_OUTBOX_MAX_ATTEMPTS,
+    DEFAULT_OUTBOX_BASE_DELAY,
+    DEFAULT_OUTBOX_MAX_DELAY,
+)
+from post_history import close_post_history_store
+from retry_policy import log_retry_metrics
+from rate_limiter import log_rate_limit_levels
 import os
 import sys
 import signal
 from version_info import __version__
 from markupsafe import escape
-from dotenv import load_dotenv
 import threading
 from utils import get_ngrok_public_url, get_localtunnel_url_from_stdout, set_webhook_callback_url_temporary
-import cherrypy
+from utils import load_settings_env
+from app_settings import (
+    get_settings,
+    get_settings_store,
+    reload_settings,
+    start_settings_watcher,
+    stop_settings_watcher,
+)
 import atexit
 import warnings
 import re
@@ -52,74 +83,70 @@ import select
 # CherryPyのRuntimeWarningを抑制
 warnings.filterwarnings("ignore", category=RuntimeWarning, module="cherrypy")
 
-# 設定ファイルの存在チェック
-if not os.path.exists('settings.env'):
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+# Flaskアプリケーションの生成
+app = Flask(__name__)
+
+# 非同期ディスパッチモード用の通知キュー
+notification_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+# Twitchの再送による重複通知を検出するためのメッセージIDキャッシュ
+eventsub_message_cache = MessageIdCache()
+
+# 購読するEventSubのイベントタイプ
+EVENTSUB_EVENT_TYPES = ["stream.online", "stream.offline"]
+# WebSocketトランスポート使用時のEventSubクライアント
+eventsub_ws_client = None
+# 直近の起動処理の結果（ステップごとの所要時間など）
+last_startup_result = None
+
+# BlueskyPosterクラス（atprotoの読み込みに時間がかかるため、初回の投稿時に読み込む）
+BlueskyPoster = None
+
+# プロセス全体で共有するBlueskyPoster（ログインセッションを使い回す）
+_bluesky_poster = None
+_bluesky_poster_lock = threading.Lock()
+
+# Bluesky投稿の送信待ち行列（BLUESKY_OUTBOX_ENABLED=True の場合のみ使用）
+bluesky_outbox = None
+outbox_sender = None
+
+
+def ensure_settings_file():
+    """
+    settings.envがなければ初期セットアップウィザードを表示する。
+    エントリポイントから呼ぶ（import時にはGUIを起動しない）。設定ファイルがあればTrue
+    """
+    if os.path.exists('settings.env'):
+        return True
     print('設定ファイルが見つかりません。初期セットアップを実行します。')
     try:
         import tkinter as tk
         from gui.setup_wizard import SetupWizard
         root = tk.Tk()
         root.withdraw()
+
         def on_finish():
             root.destroy()
         SetupWizard(master=root, on_finish=on_finish)
         root.mainloop()
     except Exception as e:
         print(f"セットアップウィザードの起動に失敗しました: {e}")
-    if __name__ == "__main__":
-        sys.exit(1)
+    return False
 
-# 存在すれば読み込む
-load_dotenv('settings.env')
-
-__author__ = "mayuneco(mayunya)"
-__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
-__license__ = "GPLv2"
-__app_version__ = __version__
-
-# Flaskアプリケーションの生成
-app = Flask(__name__)
 
-
-def validate_settings():
-    # 必須設定値がすべて存在するか検証する
-    required_keys = [
-        "BLUESKY_USERNAME",
-        "BLUESKY_APP_PASSWORD",
-        "TWITCH_CLIENT_ID",
-        "TWITCH_CLIENT_SECRET",
-        "TWITCH_BROADCASTER_ID"
-    ]
-    missing_keys = [key for key in required_keys if not os.getenv(key)]
-
-    # Webhook URLの必須判定をトンネル種別で分岐
-    tunnel_service = os.getenv("TUNNEL_SERVICE", "").lower()
-    if tunnel_service in ("cloudflare", "custom"):
-        if not os.getenv("WEBHOOK_CALLBACK_URL_PERMANENT"):
-            missing_keys.append("WEBHOOK_CALLBACK_URL_PERMANENT")
-    elif tunnel_service in ("ngrok", "localtunnel"):
-        if not os.getenv("WEBHOOK_CALLBACK_URL_TEMPORARY"):
-            missing_keys.append("WEBHOOK_CALLBACK_URL_TEMPORARY")
-    else:
-        if not os.getenv("WEBHOOK_CALLBACK_URL"):
-            missing_keys.append("WEBHOOK_CALLBACK_URL")
-
-    if missing_keys:
-        raise ValueError(f"settings.envの必須設定が未設定です: {', '.join(missing_keys)}")
-
-    # 数値設定値が正しいか検証する
-    numeric_keys_defaults = {
-        "RETRY_MAX": "3",
-        "RETRY_WAIT": "2",
-        "LOG_RETENTION_DAYS": "14"
-    }
-    for key, default_value in numeric_keys_defaults.items():
-        try:
-            value_str = os.getenv(key, default_value)
-            int(value_str)
-        except ValueError:
-            raise ValueError(
-                f"settings.envの数値設定値 '{key}' (値: {value_str}) が不正です")
+def get_bluesky_poster_class():
+    # BlueskyPosterクラスを返す（初回呼び出し時にbluesky・atprotoを読み込む）
+    global BlueskyPoster
+    if BlueskyPoster is None:
+        from bluesky import BlueskyPoster as poster_class
+        BlueskyPoster = poster_class
+    return BlueskyPoster
 
 
 @app.errorhandler(404)
@@ -135,6 +162,181 @@ def handle_404(e):
     return "Not Found", 404
 
 
+def is_async_dispatch_mode():
+    # WEBHOOK_DISPATCH_MODE=async の場合はBluesky投稿をワーカースレッドで行う
+    return get_settings().is_async_dispatch
+
+
+def get_notification_dispatcher():
+    """
+    通知ディスパッチャーを取得する（未起動なら設定値に従って起動する）。
+    終了処理で停止中の間は作り直さず、停止中のものを返す（ジョブは受け付けない）。
+    停止し終えたら終了処理がNoneに戻すため、再起動後は新しいディスパッチャーを作る
+    """
+    global notification_dispatcher
+    with _dispatcher_lock:
+        if notification_dispatcher is None:
+            try:
+                worker_count = int(os.getenv("WEBHOOK_WORKER_COUNT", "2"))
+                queue_size = int(os.getenv("WEBHOOK_QUEUE_SIZE", "100"))
+            except ValueError:
+                app.logger.warning("WEBHOOK_WORKER_COUNT/WEBHOOK_QUEUE_SIZEの値が不正です。デフォルト値を使用します。")
+                worker_count, queue_size = 2, 100
+            notification_dispatcher = NotificationDispatcher(
+                worker_count=worker_count, queue_size=queue_size, logger=app.logger)
+            notification_dispatcher.start()
+        return notification_dispatcher
+
+
+def stop_notification_dispatcher():
+    """
+    通知キューに残っているジョブを処理してからワーカーを停止する。
+    停止中に届いたWebhookには停止中のディスパッチャーを返し、停止し終えたら次回の起動用にNoneに戻す
+    """
+    global notification_dispatcher
+    dispatcher = notification_dispatcher
+    if dispatcher is None:
+        return
+    try:
+        timeout = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", "30"))
+    except ValueError:
+        app.logger.warning("WEBHOOK_DRAIN_TIMEOUTの値が不正です。デフォルト値を使用します。")
+        timeout = 30.0
+    app.logger.info("通知ディスパッチャーを停止します。")
+    dispatcher.drain(timeout=timeout)
+    with _dispatcher_lock:
+        if notification_dispatcher is dispatcher:
+            notification_dispatcher = None
+
+
+def get_bluesky_poster():
+    """
+    プロセス全体で共有するBlueskyPosterを返す。
+    ログインは初回投稿時の一度だけで、以降は同じセッションを再利用する
+    """
+    global _bluesky_poster
+    settings = get_settings()
+    username = settings.bluesky_username
+    password = settings.bluesky_app_password
+    with _bluesky_poster_lock:
+        if (_bluesky_poster is None
+                or _bluesky_poster.username != username
+                or _bluesky_poster.password != password):
+            _bluesky_poster = get_bluesky_poster_class()(username, password)
+        return _bluesky_poster
+
+
+def reset_bluesky_poster():
+    # 共有BlueskyPosterを破棄する（設定変更・停止時用）
+    global _bluesky_poster
+    with _bluesky_poster_lock:
+        _bluesky_poster = None
+
+
+def post_twitch_event(subscription_type, event_context, broadcaster_config=None):
+    """
+    TwitchのEventSub通知内容をBlueskyに投稿し、成功可否を返す
+    """
+    if broadcaster_config is None:
+        broadcaster_config = get_broadcaster_registry().lookup(
+            event_context.get("broadcaster_user_id")) or get_broadcaster_registry().default
+    bluesky_poster = get_bluesky_poster()
+    # テンプレートは配信者ごとに指定されている場合のみ渡す（未指定ならsettings.envの既定）
+    kwargs = {}
+    template_path = broadcaster_config.template_path_for(subscription_type)
+    if template_path:
+        kwargs["template_path"] = template_path
+    if subscription_type == "stream.online":
+        return bluesky_poster.post_stream_online(
+            event_context=event_context,
+            image_path=broadcaster_config.image_path,
+            **kwargs
+        )
+    if subscription_type == "stream.offline":
+        return bluesky_poster.post_stream_offline(
+            event_context=event_context,
+            **kwargs
+        )
+    raise ValueError(f"未対応のサブスクリプションタイプです: {subscription_type}")
+
+
+def is_outbox_enabled():
+    # 送信待ち行列が起動済みの場合は投稿を記録してから送信する。
+    # 送信待ち行列は起動時にだけ開くため、BLUESKY_OUTBOX_ENABLED の切り替えは再起動後に反映する
+    return bluesky_outbox is not None
+
+
+def enqueue_outbox_post(subscription_type, broadcaster_login, event_context, broadcaster_config=None):
+    """
+    Bluesky投稿の本文を生成して送信待ち行列に記録し、Webhookのレスポンスを返す。
+    記録（コミット）できた時点で応答し、送信は送信スレッドが行う
+    """
+    if broadcaster_config is None:
+        broadcaster_config = get_broadcaster_registry().lookup(
+            event_context.get("broadcaster_user_id")) or get_broadcaster_registry().default
+    if bluesky_outbox is None:
+        app.logger.error(f"Bluesky送信待ち行列が未起動のため記録できません ({subscription_type}): {broadcaster_login}")
+        return jsonify({"error": "outbox is not running"}), 503
+    try:
+        rendered = get_bluesky_poster().render_post(
+            subscription_type,
+            event_context,
+            image_path=broadcaster_config.image_path,
+            template_path=broadcaster_config.template_path_for(subscription_type))
+        if rendered is None:
+            app.logger.error(f"Bluesky投稿本文の生成に失敗しました ({subscription_type}): {broadcaster_login}")
+            return jsonify({"status": f"bluesky error rendering {subscription_type}"}), 500
+        entry_id = bluesky_outbox.enqueue(
+            rendered["kind"],
+            rendered["text"],
+            image_path=rendered["image_path"],
+            alt=rendered["alt"],
+            source=rendered["source"],
+            history=rendered["history"])
+    except Exception as e:
+        # 記録できなかった場合は2xxを返さず、Twitch側の再送に任せる
+        app.logger.error(f"Bluesky投稿を送信待ち行列に記録できませんでした ({subscription_type}): {e}", exc_info=e)
+        return jsonify({"error": f"Internal server error during {subscription_type} processing"}), 500
+    if outbox_sender is not None:
+        outbox_sender.wake()
+    app.logger.info(
+        f"Bluesky投稿を送信待ち行列に記録しました ({subscription_type}): {broadcaster_login} "
+        f"(ID: {entry_id}, 未送信: {bluesky_outbox.depth()}件)")
+    return jsonify({"status": "accepted"}), 202
+
+
+def _run_queued_twitch_post(subscription_type, broadcaster_login, event_context, broadcaster_config=None):
+    # ワーカースレッド上でBluesky投稿を実行する
+    success = post_twitch_event(subscription_type, event_context, broadcaster_config)
+    if success:
+        app.logger.info(f"Bluesky投稿成功 ({subscription_type}): {broadcaster_login}")
+    else:
+        app.logger.error(f"Bluesky投稿処理失敗 ({subscription_type}): {broadcaster_login}")
+    return success
+
+
+def enqueue_twitch_post(subscription_type, broadcaster_login, event_context, broadcaster_config=None):
+    """
+    Bluesky投稿ジョブをキューに積み、Webhookのレスポンスを返す
+    """
+    dispatcher = get_notification_dispatcher()
+    accepted = dispatcher.submit(
+        f"{subscription_type}:{broadcaster_login}",
+        _run_queued_twitch_post,
+        subscription_type,
+        broadcaster_login,
+        event_context,
+        broadcaster_config)
+    if not accepted:
+        if not dispatcher.is_running:
+            app.logger.warning(
+                f"終了処理中のため、Bluesky投稿ジョブを受け付けませんでした ({subscription_type}): {broadcaster_login}")
+            return jsonify({"status": "shutting down"}), 503
+        return jsonify({"status": "notification queue is full"}), 503
+    app.logger.info(f"Bluesky投稿ジョブをキューに追加しました ({subscription_type}): {broadcaster_login}")
+    return jsonify({"status": "accepted"}), 202
+
+
 @app.route("/webhook", methods=["POST", "GET"])
 def handle_webhook():
     # Webhookエンドポイントの処理
@@ -146,6 +348,21 @@ def handle_webhook():
     if not verify_signature(request):
         return jsonify({"status": "signature mismatch"}), 403
 
+    # 再送された通知はJSON解析やBluesky投稿を行わずに200を返す
+    message_id = request.headers.get("Twitch-Eventsub-Message-Id")
+    if message_id and eventsub_message_cache.check_and_add(message_id):
+        app.logger.info(f"重複したWebhook通知を受信したためスキップします: Message-Id {message_id}")
+        return jsonify({"status": "duplicate message ignored"}), 200
+
+    result = _handle_webhook_post()
+    # 処理に失敗した場合はTwitchの再送を受け付けられるようにIDを削除する
+    if message_id and isinstance(result, tuple) and len(result) > 1 and result[1] >= 500:
+        eventsub_message_cache.discard(message_id)
+    return result
+
+
+def _handle_webhook_post():
+    # 署名検証済みのWebhook POSTリクエストの処理
     try:
         data = request.get_json()
         if data is None:
@@ -156,6 +373,14 @@ def handle_webhook():
         return jsonify({"error": "Invalid JSON"}), 400
 
     message_type = request.headers.get("Twitch-Eventsub-Message-Type")
+    return process_eventsub_message(message_type, data)
+
+
+def process_eventsub_message(message_type, data):
+    """
+    EventSubメッセージ（Webhook・WebSocket共通）を処理し、Flaskのレスポンスを返す。
+    アプリケーションコンテキスト内で呼び出すこと
+    """
     subscription_payload = data.get(
         "subscription", {}) if isinstance(data, dict) else {}
     subscription_type = subscription_payload.get("type")
@@ -184,14 +409,17 @@ def handle_webhook():
             f"通知受信 ({subscription_type}) for {
                 broadcaster_user_name_from_event or broadcaster_user_login_from_event}")
 
-        notify_on_online_str = os.getenv("NOTIFY_ON_TWITCH_ONINE", "True").lower()
-        NOTIFY_ON_ONLINE = notify_on_online_str == "true"
-        notify_on_offline_str = os.getenv("NOTIFY_ON_TWITCH_OFFLINE", "False").lower()
-        NOTIFY_ON_OFFLINE = notify_on_offline_str == "true"
+        # 配信者ごとの設定を起動時に作った索引から引く
+        broadcaster_config = get_broadcaster_registry().lookup(
+            event_data.get("broadcaster_user_id"))
+        if broadcaster_config is None:
+            app.logger.warning(
+                f"通知対象外の配信者からの通知のためスキップします: {broadcaster_user_login_from_event} ({event_data.get('broadcaster_user_id')})")
+            return jsonify({"status": "skipped, unknown broadcaster"}), 200
 
         # 配信開始イベント
         if subscription_type == "stream.online":
-            if NOTIFY_ON_ONLINE:
+            if broadcaster_config.notify_online:
                 # stream.online用の必須項目チェック
                 if event_data.get("title") is None or event_data.get("category_name") is None:
                     app.logger.warning(
@@ -215,15 +443,19 @@ def handle_webhook():
                     "stream_url": f"https://twitch.tv/{broadcaster_user_login_from_event}"
                 }
 
+                # 送信待ち行列を使う場合は記録だけして即座に202を返す
+                if is_outbox_enabled():
+                    return enqueue_outbox_post(
+                        subscription_type, broadcaster_user_login_from_event, event_context,
+                        broadcaster_config)
+                # 非同期モードではキューに積んで即座に202を返す
+                if is_async_dispatch_mode():
+                    return enqueue_twitch_post(
+                        subscription_type, broadcaster_user_login_from_event, event_context,
+                        broadcaster_config)
+
                 try:
-                    bluesky_poster = BlueskyPoster(
-                        os.getenv("BLUESKY_USERNAME"),
-                        os.getenv("BLUESKY_APP_PASSWORD")
-                    )
-                    success = bluesky_poster.post_stream_online(
-                        event_context=event_context,
-                        image_path=os.getenv("BLUESKY_IMAGE_PATH")
-                    )
+                    success = post_twitch_event(subscription_type, event_context, broadcaster_config)
                     if success:
                         app.logger.info(
                             f"Bluesky投稿成功 (stream.online): {broadcaster_user_login_from_event}")
@@ -244,7 +476,7 @@ def handle_webhook():
 
         # 配信終了イベント
         elif subscription_type == "stream.offline":
-            if NOTIFY_ON_OFFLINE:
+            if broadcaster_config.notify_offline:
                 event_context = {
                     "broadcaster_user_id": event_data.get("broadcaster_user_id"),
                     "broadcaster_user_login": broadcaster_user_login_from_event,
@@ -255,14 +487,17 @@ def handle_webhook():
                     f"stream.offlineイベント処理開始: {
                         event_context.get('broadcaster_user_name')} ({
                         event_context.get('broadcaster_user_login')})")
+                if is_outbox_enabled():
+                    return enqueue_outbox_post(
+                        subscription_type, broadcaster_user_login_from_event, event_context,
+                        broadcaster_config)
+                if is_async_dispatch_mode():
+                    return enqueue_twitch_post(
+                        subscription_type, broadcaster_user_login_from_event, event_context,
+                        broadcaster_config)
+
                 try:
-                    bluesky_poster = BlueskyPoster(
-                        os.getenv("BLUESKY_USERNAME"),
-                        os.getenv("BLUESKY_APP_PASSWORD")
-                    )
-                    success = bluesky_poster.post_stream_offline(
-                        event_context=event_context
-                    )
+                    success = post_twitch_event(subscription_type, event_context, broadcaster_config)
                     app.logger.info(
                         f"Bluesky投稿試行 (stream.offline): {
                             event_context.get('broadcaster_user_login')}, 成功: {success}")
@@ -327,6 +562,7 @@ cherrypy_server_thread = None  # CherryPyサーバー用
 
 def cleanup_application():
     global logger, app_logger_handlers, tunnel_proc, yt_monitor_thread, nn_monitor_thread, flask_server_thread
+    global eventsub_ws_client
     # loggerがNoneなら再取得
     if 'logger' not in globals() or logger is None:
         import logging
@@ -341,6 +577,30 @@ def cleanup_application():
     else:
         print("アプリケーションのクリーンアップ処理を開始します。")
 
+    # 通知キューに残っている投稿を処理してからワーカーを停止
+    stop_notification_dispatcher()
+
+    # 送信待ち行列の送信スレッドを止める（未送信の投稿は次回起動時に再開）
+    stop_outbox_sender()
+    # まとめ書き待ちの投稿履歴を書き込む
+    close_post_history_store()
+    # 再起動後も重複通知を検出できるようにメッセージIDを保存
+    eventsub_message_cache.save_snapshot()
+    # 次回起動時は最新の設定でBlueskyPosterを作り直す（セッションはファイルから再開）
+    reset_bluesky_poster()
+    # 設定の監視・トークンの自動更新を止めてから、Twitch APIの接続プールを閉じる
+    stop_settings_watcher()
+    stop_app_token_refresher()
+    close_twitch_api_client()
+
+    # EventSub WebSocketを切断
+    if eventsub_ws_client is not None:
+        if logger:
+            logger.info("EventSub WebSocketを切断します。")
+        eventsub_ws_client.stop()
+        eventsub_ws_client.join(timeout=5)
+        eventsub_ws_client = None
+
     # トンネルを停止
     if tunnel_proc:
         if logger:
@@ -366,7 +626,12 @@ def cleanup_application():
         nn_monitor_thread.join(timeout=5)
 
     if logger:
+        # 今回の起動中の再試行回数とAPI呼び出し上限の残量を記録しておく
+        log_retry_metrics(logger)
+        log_rate_limit_levels(logger)
         logger.info("アプリケーションのクリーンアップ処理が完了しました。")
+        # 待ち行列に残っているログをすべて書き出してからQueueListenerを止める
+        stop_log_listener()
         # loggerのハンドラをflush/closeし、removeHandlerで外す
         for handler in list(getattr(logger, 'handlers', [])):
             try:
@@ -404,6 +669,45 @@ def cleanup_application():
             app_logger_handlers = None
     else:
         print("アプリケーションのクリーンアップ処理が完了しました。")
+        stop_log_listener()
+
+
+def configure_message_id_cache():
+    """
+    設定値に従ってメッセージIDキャッシュを作り直し、スナップショットを読み込む
+    """
+    global eventsub_message_cache
+    try:
+        ttl = float(os.getenv("EVENTSUB_DEDUP_TTL", str(DEFAULT_MESSAGE_ID_TTL)))
+        max_entries = int(os.getenv("EVENTSUB_DEDUP_MAX_ENTRIES", str(DEFAULT_MESSAGE_ID_MAX_ENTRIES)))
+    except ValueError:
+        app.logger.warning("EVENTSUB_DEDUP_TTL/EVENTSUB_DEDUP_MAX_ENTRIESの値が不正です。デフォルト値を使用します。")
+        ttl, max_entries = DEFAULT_MESSAGE_ID_TTL, DEFAULT_MESSAGE_ID_MAX_ENTRIES
+    eventsub_message_cache = MessageIdCache(
+        ttl_seconds=ttl,
+        max_entries=max_entries,
+        snapshot_path=os.getenv("EVENTSUB_DEDUP_SNAPSHOT_PATH", ""))
+    eventsub_message_cache.load_snapshot()
+    return eventsub_message_cache
+
+
+def configure_broadcaster_registry():
+    """
+    通知対象の配信者の索引を作る。TWITCH_BROADCASTER_IDの配信者はsettings.envの設定を使い、
+    TWITCH_BROADCASTERS_FILEに列挙された配信者はその設定で上書きする
+    """
+    default = BroadcasterConfig.from_env(os.getenv("TWITCH_BROADCASTER_ID"))
+    entries = []
+    broadcasters_file = os.getenv("TWITCH_BROADCASTERS_FILE", "")
+    if broadcasters_file:
+        entries = load_broadcaster_entries(broadcasters_file)
+    registry = build_broadcaster_registry(
+        default, entries,
+        lambda logins: resolve_broadcaster_ids(logins, logger_to_use=logger),
+        logger_to_use=logger)
+    set_broadcaster_registry(registry)
+    logger.info(f"通知対象のTwitch配信者: {len(registry)}人")
+    return registry
 
 
 def cleanup_from_gui():
@@ -475,6 +779,8 @@ def tunnel_monitor_loop(
 
 
 def run_cherrypy_server():
+    import cherrypy
+
     cherrypy.tree.graft(app, '/')
     cherrypy.config.update({
         'server.socket_host': '0.0.0.0',
@@ -492,225 +798,410 @@ def start_server_in_thread():
 
 
 def stop_cherrypy_server():
+    import cherrypy
+
     cherrypy.engine.exit()
 
 
-def initialize_app():
-    global logger, app_logger_handlers, audit_logger, tunnel_logger
-    global tunnel_proc, tunnel_monitor_thread, yt_monitor_thread, nn_monitor_thread
-    try:
-        # ロギング設定
-        logger, app_logger_handlers, audit_logger, tunnel_logger = configure_logging(app)
-        # シークレットのローテーション
-        WEBHOOK_SECRET = rotate_secret_if_needed(logger)
-        os.environ["WEBHOOK_SECRET"] = WEBHOOK_SECRET
-
-        # BROADCASTER_IDのセットアップ
-        setup_broadcaster_id(logger_to_use=logger)
-        # 設定ファイルの検証
-        validate_settings()
-        logger.info("設定ファイルの検証が完了しました。")
-
-        # Twitchアクセストークンの取得
-        TWITCH_APP_ACCESS_TOKEN = get_valid_app_access_token(
-            logger_to_use=logger)
-        if not TWITCH_APP_ACCESS_TOKEN:
-            logger.critical("TwitchAPIアクセストークンの取得に失敗しました。アプリケーションは起動できません。")
-            return False
-        logger.info("TwitchAPIアクセストークン取得を確認しました。")
-
-        # EventSubサブスクリプションのクリーンアップ
-        webhook_url = None
-        tunnel_service = os.getenv("TUNNEL_SERVICE", "").lower()
-        if tunnel_service in ("cloudflare", "custom"):
-            webhook_url = os.getenv("WEBHOOK_CALLBACK_URL_PERMANENT")
-        elif tunnel_service in ("ngrok", "localtunnel"):
-            webhook_url = os.getenv("WEBHOOK_CALLBACK_URL_TEMPORARY")
-        else:
-            webhook_url = os.getenv("WEBHOOK_CALLBACK_URL")
-        cleanup_eventsub_subscriptions(
-            webhook_url, logger_to_use=logger)        # トンネルの起動
-        global tunnel_proc
-        tunnel_proc = start_tunnel(tunnel_logger)
-        if not tunnel_proc:
-            tunnel_logger.critical("トンネルの起動に失敗しました。アプリケーションは起動できません。")
-            return False
-        # ngrok/localtunnelの場合は監視スレッドを起動
-        tunnel_service = os.getenv("TUNNEL_SERVICE", "").lower()
-        if tunnel_service in ("ngrok", "localtunnel"):
-            def get_proc():
-                return tunnel_proc
-            def set_proc(p):
-                global tunnel_proc
-                tunnel_proc = p
-            tunnel_monitor_thread = threading.Thread(
-                target=tunnel_monitor_loop,
-                args=(
-                    tunnel_service,
-                    os.getenv("NGROK_CMD") if tunnel_service == "ngrok" else os.getenv("LOCALTUNNEL_CMD"),
-                    tunnel_logger,
-                    get_proc,
-                    set_proc),
-                daemon=True)
-            tunnel_monitor_thread.start()
-
-        # 必須EventSubサブスクリプションの作成
-        event_types_to_subscribe = ["stream.online", "stream.offline"]
-        all_subscriptions_successful = True
-        for event_type in event_types_to_subscribe:
-            logger.info(f"{event_type} のEventSubサブスクリプションを作成します...")
-            if tunnel_service in ("cloudflare", "custom"):
-                webhook_url = os.getenv("WEBHOOK_CALLBACK_URL_PERMANENT")
-            elif tunnel_service in ("ngrok", "localtunnel"):
-                webhook_url = os.getenv("WEBHOOK_CALLBACK_URL_TEMPORARY")
-            else:
-                webhook_url = os.getenv("WEBHOOK_CALLBACK_URL")
-            sub_response = create_eventsub_subscription(
-                event_type, logger_to_use=logger, webhook_url=webhook_url)
-
-            if not sub_response or not isinstance(
-                    sub_response, dict) or not sub_response.get("data") or not isinstance(
-                    sub_response["data"], list) or not sub_response["data"]:
-                logger.critical(f"{event_type} EventSubサブスクリプションの作成に失敗しました。詳細: {sub_response}")
-                all_subscriptions_successful = False
-                break
-
-            if sub_response.get("status") == "already exists":
-                logger.info(
-                    f"{event_type} EventSubサブスクリプションは既に存在します。ID: {sub_response.get('id')}")
-            else:
-                subscription_details = sub_response['data'][0]
-                logger.info(
-                    f"{event_type} EventSubサブスクリプション作成成功。ID: {
-                        subscription_details.get('id')}, ステータス: {
-                        subscription_details.get('status')}")
-
-        if not all_subscriptions_successful:
-            logger.critical("必須EventSubサブスクリプションの作成に失敗したため、アプリケーションは起動できません。")
-            return False
+def start_webhook_transport():
+    """
+    Webhookで通知を受け取るためにトンネルを起動し、EventSubサブスクリプションを同期する
+    """
+    return start_tunnel_process() and sync_webhook_subscriptions()
 
-        # --- YouTube・ニコニコ監視スレッド起動 ---
-        def on_youtube_live(live_info):
-            if os.getenv("NOTIFY_ON_YOUTUBE_ONLINE", "False") == "True":
-                logger.info("[YouTube] 配信開始検出！")
-                try:
-                    bluesky_poster = BlueskyPoster(
-                        os.getenv("BLUESKY_USERNAME"),
-                        os.getenv("BLUESKY_APP_PASSWORD")
-                    )
-                    event_context = {
-                        "title": "YouTubeライブ配信開始",
-                        "channel_id": youtube_channel_id,
-                        "stream_url": f"https://www.youtube.com/channel/{youtube_channel_id}/live"
-                    }
-                    success = bluesky_poster.post_stream_online(
-                        event_context=event_context,
-                        image_path=os.getenv("BLUESKY_IMAGE_PATH"),
-                        platform="yt_nico"
-                    )
-                    if success:
-                        logger.info("[YouTube] Bluesky投稿成功（配信開始）")
-                    else:
-                        logger.error("[YouTube] Bluesky投稿失敗（配信開始）")
-                except Exception as e:
-                    logger.error(f"[YouTube] Bluesky投稿中に例外発生: {e}", exc_info=e)
 
-        def on_youtube_new_video(video_id):
-            if os.getenv("NOTIFY_ON_YOUTUBE_NEW_VIDEO", "False") == "True":
-                logger.info(f"[YouTube] 新着動画検出: {video_id}")
-                try:
-                    bluesky_poster = BlueskyPoster(
-                        os.getenv("BLUESKY_USERNAME"),
-                        os.getenv("BLUESKY_APP_PASSWORD")
-                    )
-                    event_context = {
-                        "title": "YouTube新着動画投稿",
-                        "video_id": video_id,
-                        "video_url": f"https://www.youtube.com/watch?v={video_id}"
-                    }
-                    success = bluesky_poster.post_new_video(
-                        event_context=event_context,
-                        image_path=os.getenv("BLUESKY_IMAGE_PATH")
-                    )
-                    if success:
-                        logger.info("[YouTube] Bluesky投稿成功（新着動画）")
-                    else:
-                        logger.error("[YouTube] Bluesky投稿失敗（新着動画）")
-                except Exception as e:
-                    logger.error(f"[YouTube] Bluesky投稿中に例外発生: {e}", exc_info=e)
+def start_tunnel_process():
+    """
+    トンネルを起動し、ngrok/localtunnelの場合は監視スレッドも起動する
+    """
+    global tunnel_proc, tunnel_monitor_thread
+    tunnel_proc = start_tunnel(tunnel_logger)
+    if not tunnel_proc:
+        tunnel_logger.critical("トンネルの起動に失敗しました。アプリケーションは起動できません。")
+        return False
+    # ngrok/localtunnelの場合は監視スレッドを起動
+    tunnel_service = os.getenv("TUNNEL_SERVICE", "").lower()
+    if tunnel_service in ("ngrok", "localtunnel"):
+        def get_proc():
+            return tunnel_proc
+        def set_proc(p):
+            global tunnel_proc
+            tunnel_proc = p
+        tunnel_monitor_thread = threading.Thread(
+            target=tunnel_monitor_loop,
+            args=(
+                tunnel_service,
+                os.getenv("NGROK_CMD") if tunnel_service == "ngrok" else os.getenv("LOCALTUNNEL_CMD"),
+                tunnel_logger,
+                get_proc,
+                set_proc),
+            daemon=True)
+        tunnel_monitor_thread.start()
+    return True
+
+
+def sync_webhook_subscriptions():
+    """
+    必須EventSubサブスクリプションの同期（既存一覧を一度だけ取得し、差分のみ作成・削除）
+    """
+    tunnel_service = os.getenv("TUNNEL_SERVICE", "").lower()
+    if tunnel_service in ("cloudflare", "custom"):
+        webhook_url = os.getenv("WEBHOOK_CALLBACK_URL_PERMANENT")
+    elif tunnel_service in ("ngrok", "localtunnel"):
+        webhook_url = os.getenv("WEBHOOK_CALLBACK_URL_TEMPORARY")
+    else:
+        webhook_url = os.getenv("WEBHOOK_CALLBACK_URL")
+    reconcile_report = reconcile_eventsub_subscriptions(
+        desired_eventsub_subscriptions(
+            EVENTSUB_EVENT_TYPES, webhook_url,
+            broadcaster_ids=get_broadcaster_registry().broadcaster_ids()),
+        logger_to_use=logger)
+    for created in reconcile_report["created"]:
+        logger.info(
+            f"{created['type']} EventSubサブスクリプション作成成功。ID: {created['id']}, ステータス: {created['status']}")
+    for kept in reconcile_report["kept"]:
+        logger.info(f"{kept['type']} EventSubサブスクリプションは既に存在します。ID: {kept['id']}")
+
+    if not reconcile_report["success"]:
+        logger.critical(
+            f"必須EventSubサブスクリプションの作成に失敗したため、アプリケーションは起動できません。詳細: {reconcile_report['errors']}")
+        return False
+    return True
 
-        def on_niconico_live(live_id):
-            if os.getenv("NOTIFY_ON_NICONICO_ONLINE", "False") == "True":
-                logger.info(f"[ニコ生] 配信開始検出: {live_id}")
-                try:
-                    bluesky_poster = BlueskyPoster(
-                        os.getenv("BLUESKY_USERNAME"),
-                        os.getenv("BLUESKY_APP_PASSWORD")
-                    )
-                    event_context = {
-                        "title": "ニコニコ生放送配信開始",
-                        "live_id": live_id,
-                        "stream_url": f"https://live.nicovideo.jp/watch/{live_id}"
-                    }
-                    success = bluesky_poster.post_stream_online(
-                        event_context=event_context,
-                        image_path=os.getenv("BLUESKY_IMAGE_PATH"),
-                        platform="yt_nico"
-                    )
-                    if success:
-                        logger.info("[ニコ生] Bluesky投稿成功（配信開始）")
-                    else:
-                        logger.error("[ニコ生] Bluesky投稿失敗（配信開始）")
-                except Exception as e:
-                    logger.error(f"[ニコ生] Bluesky投稿中に例外発生: {e}", exc_info=e)
 
-        def on_niconico_new_video(video_id):
-            if os.getenv("NOTIFY_ON_NICONICO_NEW_VIDEO", "False") == "True":
-                logger.info(f"[ニコ動] 新着動画検出: {video_id}")
-                try:
-                    bluesky_poster = BlueskyPoster(
-                        os.getenv("BLUESKY_USERNAME"),
-                        os.getenv("BLUESKY_APP_PASSWORD")
-                    )
-                    event_context = {
-                        "title": "ニコニコ動画新着投稿",
-                        "video_id": video_id,
-                        "video_url": f"https://www.nicovideo.jp/watch/{video_id}"
-                    }
-                    success = bluesky_poster.post_new_video(
-                        event_context=event_context,
-                        image_path=os.getenv("BLUESKY_IMAGE_PATH")
-                    )
-                    if success:
-                        logger.info("[ニコ動] Bluesky投稿成功（新着動画）")
-                    else:
-                        logger.error("[ニコ動] Bluesky投稿失敗（新着動画）")
-                except Exception as e:
-                    logger.error(f"[ニコ動] Bluesky投稿中に例外発生: {e}", exc_info=e)
-
-        # YouTube監視設定の取得
-        youtube_api_key = os.getenv("YOUTUBE_API_KEY")
-        youtube_channel_id = os.getenv("YOUTUBE_CHANNEL_ID")
-        youtube_poll_interval = int(os.getenv("YOUTUBE_POLL_INTERVAL", 60))
-        niconico_user_id = os.getenv("NICONICO_USER_ID")
-        niconico_poll_interval = int(
-            os.getenv("NICONICO_LIVE_POLL_INTERVAL", 60))
-
-        # YouTube監視スレッドの起動
-        if youtube_api_key and youtube_channel_id:
-            yt_monitor = YouTubeMonitor(
-                youtube_api_key, youtube_channel_id, youtube_poll_interval,
-                on_youtube_live, on_youtube_new_video
-            )
-            yt_monitor.start()
-
-        # ニコニコ監視スレッドの起動
-        if niconico_user_id:
-            nn_monitor = NiconicoMonitor(
-                niconico_user_id, niconico_poll_interval,
-                on_niconico_live, on_niconico_new_video
-            )
-            nn_monitor.start()
+def is_websocket_transport():
+    # TWITCH_EVENTSUB_TRANSPORT=websocketならトンネルを使わずWebSocketで通知を受け取る
+    return get_settings().is_websocket_transport
+
+
+def handle_websocket_notification(metadata, payload):
+    """
+    EventSub WebSocketで受信した通知を、Webhookと同じ経路（重複排除→process_eventsub_message）で処理する
+    """
+    message_id = metadata.get("message_id")
+    if message_id and eventsub_message_cache.check_and_add(message_id):
+        app.logger.info(f"重複したEventSub通知を受信したためスキップします: Message-Id {message_id}")
+        return None
+    with app.app_context():
+        result = process_eventsub_message("notification", payload)
+    if message_id and isinstance(result, tuple) and len(result) > 1 and result[1] >= 500:
+        eventsub_message_cache.discard(message_id)
+    return result
+
+
+def subscribe_websocket_session(session_id):
+    """
+    WebSocketセッションに対して、通知対象の全配信者の必須EventSubサブスクリプションを作成する
+    """
+    broadcaster_ids = get_broadcaster_registry().broadcaster_ids() or [os.getenv("TWITCH_BROADCASTER_ID")]
+    user_token = os.getenv("TWITCH_USER_ACCESS_TOKEN")
+    for broadcaster_id in broadcaster_ids:
+        for event_type in EVENTSUB_EVENT_TYPES:
+            result = post_eventsub_subscription(
+                event_type, {"broadcaster_user_id": broadcaster_id},
+                logger_to_use=logger, session_id=session_id, token=user_token)
+            data = result.get("data") if isinstance(result, dict) else None
+            if not isinstance(data, list) or not data:
+                raise RuntimeError(f"{event_type} EventSubサブスクリプションの作成に失敗しました。詳細: {result}")
+            logger.info(
+                f"{event_type} EventSubサブスクリプション作成成功 (WebSocket, {broadcaster_id})。ID: {data[0].get('id')}")
+
+
+def start_websocket_transport():
+    """
+    EventSub WebSocketクライアントを起動し、最初のセッションでサブスクリプションが揃うまで待つ
+    """
+    global eventsub_ws_client
+    # websocketsはWebSocketトランスポート使用時のみ読み込む
+    from eventsub_websocket import EventSubWebSocketClient, TWITCH_EVENTSUB_WEBSOCKET_URL
+
+    eventsub_ws_client = EventSubWebSocketClient(
+        on_notification=handle_websocket_notification,
+        on_session_welcome=subscribe_websocket_session,
+        url=os.getenv("TWITCH_EVENTSUB_WEBSOCKET_URL", TWITCH_EVENTSUB_WEBSOCKET_URL),
+        logger_to_use=logger)
+    eventsub_ws_client.start()
+    timeout = float(os.getenv("TWITCH_EVENTSUB_WEBSOCKET_CONNECT_TIMEOUT", "30"))
+    if not eventsub_ws_client.connected.wait(timeout):
+        logger.critical("EventSub WebSocketへの接続またはサブスクリプションの作成に失敗しました。アプリケーションは起動できません。")
+        eventsub_ws_client.stop()
+        eventsub_ws_client = None
+        return False
+    return True
+
+
+def start_platform_monitors():
+    """
+    YouTube・ニコニコの監視スレッドを起動する（設定されているもののみ）
+    """
+    def on_youtube_live(live_info):
+        if os.getenv("NOTIFY_ON_YOUTUBE_ONLINE", "False") == "True":
+            logger.info("[YouTube] 配信開始検出！")
+            try:
+                bluesky_poster = get_bluesky_poster()
+                event_context = {
+                    "title": "YouTubeライブ配信開始",
+                    "channel_id": youtube_channel_id,
+                    "stream_url": f"https://www.youtube.com/channel/{youtube_channel_id}/live"
+                }
+                success = bluesky_poster.post_stream_online(
+                    event_context=event_context,
+                    image_path=os.getenv("BLUESKY_IMAGE_PATH"),
+                    platform="yt_nico"
+                )
+                if success:
+                    logger.info("[YouTube] Bluesky投稿成功（配信開始）")
+                else:
+                    logger.error("[YouTube] Bluesky投稿失敗（配信開始）")
+            except Exception as e:
+                logger.error(f"[YouTube] Bluesky投稿中に例外発生: {e}", exc_info=e)
+
+    def on_youtube_new_video(video_id):
+        if os.getenv("NOTIFY_ON_YOUTUBE_NEW_VIDEO", "False") == "True":
+            logger.info(f"[YouTube] 新着動画検出: {video_id}")
+            try:
+                bluesky_poster = get_bluesky_poster()
+                event_context = {
+                    "title": "YouTube新着動画投稿",
+                    "video_id": video_id,
+                    "video_url": f"https://www.youtube.com/watch?v={video_id}"
+                }
+                success = bluesky_poster.post_new_video(
+                    event_context=event_context,
+                    image_path=os.getenv("BLUESKY_IMAGE_PATH")
+                )
+                if success:
+                    logger.info("[YouTube] Bluesky投稿成功（新着動画）")
+                else:
+                    logger.error("[YouTube] Bluesky投稿失敗（新着動画）")
+            except Exception as e:
+                logger.error(f"[YouTube] Bluesky投稿中に例外発生: {e}", exc_info=e)
+
+    def on_niconico_live(live_id):
+        if os.getenv("NOTIFY_ON_NICONICO_ONLINE", "False") == "True":
+            logger.info(f"[ニコ生] 配信開始検出: {live_id}")
+            try:
+                bluesky_poster = get_bluesky_poster()
+                event_context = {
+                    "title": "ニコニコ生放送配信開始",
+                    "live_id": live_id,
+                    "stream_url": f"https://live.nicovideo.jp/watch/{live_id}"
+                }
+                success = bluesky_poster.post_stream_online(
+                    event_context=event_context,
+                    image_path=os.getenv("BLUESKY_IMAGE_PATH"),
+                    platform="yt_nico"
+                )
+                if success:
+                    logger.info("[ニコ生] Bluesky投稿成功（配信開始）")
+                else:
+                    logger.error("[ニコ生] Bluesky投稿失敗（配信開始）")
+            except Exception as e:
+                logger.error(f"[ニコ生] Bluesky投稿中に例外発生: {e}", exc_info=e)
+
+    def on_niconico_new_video(video_id):
+        if os.getenv("NOTIFY_ON_NICONICO_NEW_VIDEO", "False") == "True":
+            logger.info(f"[ニコ動] 新着動画検出: {video_id}")
+            try:
+                bluesky_poster = get_bluesky_poster()
+                event_context = {
+                    "title": "ニコニコ動画新着投稿",
+                    "video_id": video_id,
+                    "video_url": f"https://www.nicovideo.jp/watch/{video_id}"
+                }
+                success = bluesky_poster.post_new_video(
+                    event_context=event_context,
+                    image_path=os.getenv("BLUESKY_IMAGE_PATH")
+                )
+                if success:
+                    logger.info("[ニコ動] Bluesky投稿成功（新着動画）")
+                else:
+                    logger.error("[ニコ動] Bluesky投稿失敗（新着動画）")
+            except Exception as e:
+                logger.error(f"[ニコ動] Bluesky投稿中に例外発生: {e}", exc_info=e)
+
+    # YouTube監視設定の取得
+    youtube_api_key = os.getenv("YOUTUBE_API_KEY")
+    youtube_channel_id = os.getenv("YOUTUBE_CHANNEL_ID")
+    youtube_poll_interval = int(os.getenv("YOUTUBE_POLL_INTERVAL", 60))
+    niconico_user_id = os.getenv("NICONICO_USER_ID")
+    niconico_poll_interval = int(
+        os.getenv("NICONICO_LIVE_POLL_INTERVAL", 60))
+
+    # YouTube監視スレッドの起動
+    if youtube_api_key and youtube_channel_id:
+        from youtube_monitor import YouTubeMonitor
+        yt_monitor = YouTubeMonitor(
+            youtube_api_key, youtube_channel_id, youtube_poll_interval,
+            on_youtube_live, on_youtube_new_video,
+            playlist_max_results=int(os.getenv("YOUTUBE_PLAYLIST_MAX_RESULTS", 10))
+        )
+        yt_monitor.start()
+
+    # ニコニコ監視スレッドの起動
+    if niconico_user_id:
+        from niconico_monitor import NiconicoMonitor
+        nn_monitor = NiconicoMonitor(
+            niconico_user_id, niconico_poll_interval,
+            on_niconico_live, on_niconico_new_video
+        )
+        nn_monitor.start()
+    return True
+
+
+def prepare_webhook_secret_step():
+    # シークレットのローテーションと、署名検証・重複検出の準備
+    webhook_secret = rotate_secret_if_needed(logger)
+    os.environ["WEBHOOK_SECRET"] = webhook_secret
+    # 署名検証用のHMACをシークレットから一度だけ作成
+    prepare_webhook_secret(webhook_secret)
+    # 重複通知検出用のメッセージIDキャッシュを設定し、前回保存分を読み込む
+    configure_message_id_cache()
+    return True
+
+
+def on_settings_changed(old, new):
+    # settings.envの変更を各所のキャッシュに反映する
+    reload_broadcaster_defaults()
+    secret = new.get("WEBHOOK_SECRET")
+    if secret and (old is None or old.get("WEBHOOK_SECRET") != secret):
+        prepare_webhook_secret(secret)
+
+
+def validate_settings_step():
+    # settings.envを読み込んで設定スナップショットを作り、必須設定・数値設定を検証する
+    reload_settings().validate()
+    logger.info("設定ファイルの検証が完了しました。")
+    # 以降のsettings.envの変更は監視スレッドが反映する
+    get_settings_store().add_listener(on_settings_changed)
+    start_settings_watcher()
+    return True
+
+
+def fetch_app_token_step():
+    # Twitchアクセストークンの取得（保存済みで有効ならAPIを呼ばない）
+    if not get_valid_app_access_token(logger_to_use=logger):
+        logger.critical("TwitchAPIアクセストークンの取得に失敗しました。アプリケーションは起動できません。")
+        return False
+    logger.info("TwitchAPIアクセストークン取得を確認しました。")
+    # 有効期限が近づいたらリクエストを待たせずにバックグラウンドで更新する
+    start_app_token_refresher()
+    return True
+
+
+def start_outbox_step():
+    """
+    Bluesky投稿の送信待ち行列を開き、送信スレッドを起動する（前回の未送信分もここで再開する）
+    """
+    global bluesky_outbox, outbox_sender
+    settings = get_settings()
+    bluesky_outbox = BlueskyOutbox(settings.get("BLUESKY_OUTBOX_PATH") or DEFAULT_OUTBOX_PATH)
+    outbox_sender = OutboxSender(
+        bluesky_outbox,
+        get_bluesky_poster,
+        max_attempts=int(settings.get("BLUESKY_OUTBOX_MAX_ATTEMPTS", DEFAULT_OUTBOX_MAX_ATTEMPTS)),
+        base_delay=float(settings.get("BLUESKY_OUTBOX_BASE_DELAY", DEFAULT_OUTBOX_BASE_DELAY)),
+        max_delay=float(settings.get("BLUESKY_OUTBOX_MAX_DELAY", DEFAULT_OUTBOX_MAX_DELAY)),
+        logger_to_use=logger)
+    outbox_sender.start()
+    logger.info(f"Bluesky送信待ち行列を起動しました: {bluesky_outbox.path} (未送信: {bluesky_outbox.depth()}件)")
+    return True
+
+
+def stop_outbox_sender():
+    # 送信スレッドを止めて送信待ち行列を閉じる
+    global bluesky_outbox, outbox_sender
+    if outbox_sender is not None:
+        outbox_sender.stop()
+        outbox_sender = None
+    if bluesky_outbox is not None:
+        bluesky_outbox.close()
+        bluesky_outbox = None
+
+
+def build_startup_graph():
+    """
+    起動処理の依存関係グラフを作る。
+    トンネル起動はトークン取得・配信者IDの変換と並行して進め、
+    EventSubサブスクリプションの同期はそれら全てが揃ってから行う
+    """
+    graph = StartupGraph()
+    graph.add("secret", prepare_webhook_secret_step, label="シークレット準備")
+    graph.add("validate", validate_settings_step, label="設定ファイル確認")
+    graph.add("token", fetch_app_token_step, depends=("validate",), label="Twitchトークン取得")
+    # 変換にAPIが必要な場合も、トークンの取得はトークンマネージャーが1回にまとめる
+    graph.add("broadcaster", lambda: setup_broadcaster_id(logger_to_use=logger),
+              depends=("validate",), label="配信者ID変換")
+    graph.add("registry", configure_broadcaster_registry,
+              depends=("broadcaster",), label="配信者設定読み込み")
+    if is_websocket_transport():
+        graph.add("eventsub", start_websocket_transport,
+                  depends=("secret", "token", "registry"), label="EventSub WebSocket接続")
+    else:
+        graph.add("tunnel", start_tunnel_process, depends=("validate",), label="トンネル起動")
+        graph.add("eventsub", sync_webhook_subscriptions,
+                  depends=("secret", "token", "registry", "tunnel"), label="EventSubサブスクリプション同期")
+    graph.add("monitors", start_platform_monitors, depends=("eventsub",), label="YouTube・ニコニコ監視起動")
+    if get_settings().flag("BLUESKY_OUTBOX_ENABLED", "False"):
+        # 前回の未送信分の送信はEventSubの接続と並行して始めてよい
+        graph.add("outbox", start_outbox_step, depends=("validate",), label="Bluesky送信待ち行列起動")
+    return graph
+
+
+def _rollback_partial_startup():
+    # 起動失敗時に、並行して起動済みのトンネル・WebSocket・トークン更新を止める
+    global tunnel_proc, eventsub_ws_client
+    stop_settings_watcher()
+    stop_app_token_refresher()
+    stop_outbox_sender()
+    if eventsub_ws_client is not None:
+        eventsub_ws_client.stop()
+        eventsub_ws_client = None
+    if tunnel_proc:
+        stop_tunnel(tunnel_proc, tunnel_logger)
+        tunnel_proc = None
+
+
+def startup_step_labels():
+    """
+    現在の設定で実行される起動ステップの (name, 表示名) の一覧（GUIの進捗表示用）
+    """
+    graph = build_startup_graph()
+    return [(name, graph.label_of(name)) for name in graph.step_names]
+
+
+def initialize_app(on_progress=None, progress_queue=None):
+    """
+    アプリケーションを初期化する。成功したらTrue。
+    各起動ステップの開始・完了時に {"step","label","state","duration","error"} の辞書を
+    on_progressで通知し、progress_queueにも積む（GUIは別スレッドから受け取る）
+    """
+    global logger, app_logger_handlers, audit_logger, tunnel_logger, last_startup_result
+
+    def emit_progress(event):
+        if on_progress is not None:
+            on_progress(event)
+        if progress_queue is not None:
+            progress_queue.put(event)
+
+    try:
+        # ロギング設定（以降の全ステップが使うため最初に行う）
+        logger, app_logger_handlers, audit_logger, tunnel_logger = configure_logging(app)
+
+        result = build_startup_graph().run(
+            max_workers=int(os.getenv("STARTUP_MAX_WORKERS", DEFAULT_STARTUP_WORKERS)),
+            on_event=emit_progress)
+        last_startup_result = result
+        logger.info(
+            f"起動ステップの所要時間: {result.format_timings()} "
+            f"(合計 {result.total_seconds:.2f}s, 順番に実行した場合 {result.sequential_seconds():.2f}s)")
+        if not result.success:
+            if result.error is not None and not isinstance(result.error, StartupStepFailed):
+                logger.critical(
+                    f"初期化中の未処理例外によりアプリケーションの起動に失敗しました "
+                    f"({result.labels[result.failed_step]}): {result.error}", exc_info=result.error)
+            _rollback_partial_startup()
+            return False
 
         logger.info("アプリケーションの初期化が完了しました。")
         return True
@@ -744,6 +1235,11 @@ if __name__ == "__main__":
     if os.name == 'nt':
         signal.signal(signal.SIGBREAK, signal_handler)
 
+    # 設定ファイルがなければ初期セットアップを行って終了する
+    if not ensure_settings_file():
+        sys.exit(1)
+    load_settings_env()
+
     # アプリケーション終了時のクリーンアップ処理登録
     atexit.register(cleanup_application)
 
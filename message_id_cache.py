@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from version_info import __version__
+from collections import OrderedDict
+import json
+import logging
+import os
+import threading
+import time
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+# verify_signatureのタイムスタンプ許容範囲（前後5分）に合わせたデフォルトTTL
+DEFAULT_MESSAGE_ID_TTL = 600
+DEFAULT_MESSAGE_ID_MAX_ENTRIES = 10000
+
+logger = logging.getLogger("AppLogger")
+
+
+class MessageIdCache:
+    """
+    Twitch-Eventsub-Message-Idの受信履歴を保持するTTL付きLRUキャッシュ。
+    同じメッセージIDの再送を検出するために使う。
+    """
+
+    def __init__(
+            self,
+            ttl_seconds=DEFAULT_MESSAGE_ID_TTL,
+            max_entries=DEFAULT_MESSAGE_ID_MAX_ENTRIES,
+            snapshot_path=None):
+        self.ttl_seconds = float(ttl_seconds)
+        self.max_entries = max(1, int(max_entries))
+        self.snapshot_path = snapshot_path or None
+        # message_id -> 受信時刻(UNIX時間)。古いものほど先頭
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _purge_expired(self, now):
+        # 先頭から期限切れのエントリを取り除く（挿入順なので期限切れは先頭に集まる）
+        expire_before = now - self.ttl_seconds
+        while self._entries:
+            oldest_id, seen_at = next(iter(self._entries.items()))
+            if seen_at > expire_before:
+                break
+            self._entries.popitem(last=False)
+
+    def check_and_add(self, message_id):
+        """
+        メッセージIDを登録する。既に有効期限内に受信済みならTrue（重複）を返す
+        """
+        now = time.time()
+        with self._lock:
+            self._purge_expired(now)
+            if message_id in self._entries:
+                return True
+            self._entries[message_id] = now
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return False
+
+    def discard(self, message_id):
+        # 処理に失敗したメッセージIDを削除し、Twitchからの再送を受け付けられるようにする
+        with self._lock:
+            self._entries.pop(message_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def save_snapshot(self):
+        """
+        有効期限内のメッセージIDをファイルに保存する（snapshot_path未設定なら何もしない）
+        """
+        if not self.snapshot_path:
+            return False
+        with self._lock:
+            self._purge_expired(time.time())
+            entries = list(self._entries.items())
+        try:
+            directory = os.path.dirname(self.snapshot_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.snapshot_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"ttl_seconds": self.ttl_seconds, "entries": entries}, f)
+            os.replace(tmp_path, self.snapshot_path)
+            logger.debug(f"メッセージIDキャッシュを保存しました: {self.snapshot_path} ({len(entries)}件)")
+            return True
+        except Exception as e:
+            logger.warning(f"メッセージIDキャッシュの保存に失敗しました: {self.snapshot_path}, エラー: {e}")
+            return False
+
+    def load_snapshot(self):
+        """
+        保存済みのメッセージIDを読み込む。期限切れのものは読み飛ばす
+        """
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return 0
+        try:
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                data = json.load(f)
+            entries = data.get("entries", []) if isinstance(data, dict) else []
+        except Exception as e:
+            logger.warning(f"メッセージIDキャッシュの読み込みに失敗しました: {self.snapshot_path}, エラー: {e}")
+            return 0
+
+        now = time.time()
+        loaded = 0
+        with self._lock:
+            for item in sorted(entries, key=lambda x: x[1]):
+                try:
+                    message_id, seen_at = str(item[0]), float(item[1])
+                except (TypeError, ValueError, IndexError):
+                    continue
+                if now - seen_at >= self.ttl_seconds or message_id in self._entries:
+                    continue
+                self._entries[message_id] = seen_at
+                loaded += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        logger.info(f"メッセージIDキャッシュを読み込みました: {self.snapshot_path} ({loaded}件)")
+        return loaded
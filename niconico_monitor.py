@@ -20,9 +20,12 @@ Stream notify on Bluesky
 # もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
 # 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
 
+import logging
 import time
 import feedparser
+import requests
 from threading import Thread, Event
+from retry_policy import RetryPolicy, is_retryable_http_error, status_code_of
 from version_info import __version__
 
 __author__ = "mayuneco(mayunya)"
@@ -30,10 +33,50 @@ __copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
 __license__ = "GPLv2"
 __app_version__ = __version__
 
+# 取得に失敗し続けた場合に監視間隔を延ばす上限（監視間隔の何倍まで延ばすか）
+MAX_BACKOFF_MULTIPLIER = 16
+
+logger = logging.getLogger("AppLogger")
+
+
+class FeedState:
+    """
+    RSSフィードごとの条件付きGET用の状態（ETag/Last-Modified）と、最後に確認したエントリID・取得統計を保持する。
+    """
+
+    def __init__(self, url):
+        self.url = url
+        self.etag = None
+        self.modified = None
+        self.last_entry_id = None
+        # 直近のポーリング結果（HTTPエラーの場合はlast_errorに例外を保持する）
+        self.last_status = None
+        self.last_error = None
+        self.last_bytes = 0
+        self.last_parse_seconds = 0.0
+        # 累計
+        self.polls = 0
+        self.not_modified_count = 0
+        self.total_bytes = 0
+        self.total_parse_seconds = 0.0
+
+    def stats(self):
+        return {
+            "url": self.url,
+            "status": self.last_status,
+            "bytes": self.last_bytes,
+            "parse_seconds": self.last_parse_seconds,
+            "polls": self.polls,
+            "not_modified": self.not_modified_count,
+            "total_bytes": self.total_bytes,
+            "total_parse_seconds": self.total_parse_seconds,
+        }
+
 
 class NiconicoMonitor(Thread):
     """
     ニコニコ生放送およびニコニコ動画の新着を監視するスレッド。
+    RSSはETag/If-Modified-Sinceによる条件付きGETで取得し、304（更新なし）の場合は解析を省略する。
     """
 
     def __init__(self, user_id, poll_interval, on_new_live, on_new_video, shutdown_event=None):
@@ -46,43 +89,122 @@ class NiconicoMonitor(Thread):
         self.last_live_id = None
         self.last_video_id = None
         self.shutdown_event = shutdown_event if shutdown_event is not None else Event()
+        self.live_feed = FeedState(f"https://live.nicovideo.jp/feeds/user/{self.user_id}")
+        self.video_feed = FeedState(f"https://www.nicovideo.jp/user/{self.user_id}/video?rss=2.0")
+        # 失敗が続いたら次回の確認を遅らせる（429の場合はRetry-Afterに従う）
+        self.retry_policy = RetryPolicy(
+            "niconico",
+            base_delay=poll_interval,
+            max_delay=poll_interval * MAX_BACKOFF_MULTIPLIER,
+            classify=is_retryable_http_error)
+        self.consecutive_failures = 0
 
     def run(self):
         # スレッドのメインループ。shutdown_eventがセットされたら安全に終了
         while not self.shutdown_event.is_set():
             try:
-                # 生放送RSSから最新IDを取得し、前回と異なればコールバック実行
-                live_id = self.get_latest_live_id()
-                if live_id and live_id != self.last_live_id:
-                    self.on_new_live(live_id)
-                    self.last_live_id = live_id
-
-                # 動画RSSから最新IDを取得し、前回と異なればコールバック実行
-                video_id = self.get_latest_video_id()
-                if video_id and video_id != self.last_video_id:
-                    self.on_new_video(video_id)
-                    self.last_video_id = video_id
-
+                wait = self.poll_once()
             except Exception as e:
                 print(f"[NiconicoMonitor] エラー発生: {e}")
-            self.shutdown_event.wait(self.poll_interval)
+                wait = self.next_poll_delay(e)
+            stats = self.get_poll_stats()
+            logger.debug(
+                f"[NiconicoMonitor] 生放送RSS: {stats['live']['status']} {stats['live']['bytes']}bytes "
+                f"{stats['live']['parse_seconds'] * 1000:.1f}ms / "
+                f"動画RSS: {stats['video']['status']} {stats['video']['bytes']}bytes "
+                f"{stats['video']['parse_seconds'] * 1000:.1f}ms")
+            self.shutdown_event.wait(wait)
+
+    def poll_once(self):
+        """
+        生放送・動画のRSSを1回ずつ確認し、次に確認するまでの秒数を返す。
+        一方のフィードがHTTPエラーでも、もう一方の確認は続ける
+        """
+        # 生放送RSSから最新IDを取得し、前回と異なればコールバック実行
+        live_id = self.get_latest_live_id()
+        if live_id and live_id != self.last_live_id:
+            self.on_new_live(live_id)
+            self.last_live_id = live_id
+
+        # 動画RSSから最新IDを取得し、前回と異なればコールバック実行
+        video_id = self.get_latest_video_id()
+        if video_id and video_id != self.last_video_id:
+            self.on_new_video(video_id)
+            self.last_video_id = video_id
+
+        # レート制限（429）を受けた場合だけ間隔を延ばす（404などはそのフィードだけの問題として扱う）
+        for state in (self.live_feed, self.video_feed):
+            if status_code_of(state.last_error) == 429:
+                return self.next_poll_delay(state.last_error)
+        self.consecutive_failures = 0
+        return self.poll_interval
+
+    def next_poll_delay(self, error):
+        # 失敗後、次に確認するまでの秒数（通常の監視間隔より短くはしない）
+        self.consecutive_failures += 1
+        wait = self.retry_policy.reschedule_delay(
+            self.consecutive_failures, error, minimum=self.poll_interval)
+        if wait > self.poll_interval:
+            logger.warning(f"[NiconicoMonitor] 取得エラーが続いているため、{wait:.0f}秒後に再確認します。")
+        return wait
+
+    def get_poll_stats(self):
+        """
+        直近のポーリングで取得したバイト数・解析時間と累計を返す
+        """
+        return {"live": self.live_feed.stats(), "video": self.video_feed.stats()}
+
+    def fetch_latest_entry_id(self, state):
+        """
+        フィードを条件付きGETで取得し、最新エントリのIDを返す。
+        304（更新なし）の場合は解析せず、前回確認したIDを返す
+        """
+        headers = {}
+        if state.etag:
+            headers["If-None-Match"] = state.etag
+        if state.modified:
+            headers["If-Modified-Since"] = state.modified
+        resp = requests.get(state.url, headers=headers, timeout=10)
+        state.polls += 1
+        state.last_status = resp.status_code
+        state.last_parse_seconds = 0.0
+        if resp.status_code == 304:
+            state.last_bytes = 0
+            state.last_error = None
+            state.not_modified_count += 1
+            return state.last_entry_id
+        try:
+            resp.raise_for_status()
+        except requests.HTTPError as e:
+            # このフィードだけの失敗として記録し、前回確認したIDを返す
+            state.last_bytes = 0
+            state.last_error = e
+            logger.warning(f"[NiconicoMonitor] RSSの取得に失敗しました: {state.url} (HTTP {resp.status_code})")
+            return state.last_entry_id
+        state.last_error = None
+
+        content = resp.content
+        state.last_bytes = len(content)
+        state.total_bytes += len(content)
+        start = time.perf_counter()
+        feed = feedparser.parse(content)
+        state.last_parse_seconds = time.perf_counter() - start
+        state.total_parse_seconds += state.last_parse_seconds
+
+        # 次回の条件付きGETに使う値を保存する
+        state.etag = resp.headers.get("ETag") or None
+        state.modified = resp.headers.get("Last-Modified") or None
+        state.last_entry_id = feed.entries[0].id if feed.entries else None
+        return state.last_entry_id
 
     def get_latest_live_id(self):
         """
         ユーザーの最新生放送IDを取得。
         """
-        url = f"https://live.nicovideo.jp/feeds/user/{self.user_id}"
-        feed = feedparser.parse(url)
-        if feed.entries:
-            return feed.entries[0].id  # 最新の生放送IDを返す
-        return None
+        return self.fetch_latest_entry_id(self.live_feed)
 
     def get_latest_video_id(self):
         """
         ユーザーの最新動画IDを取得。
         """
-        url = f"https://www.nicovideo.jp/user/{self.user_id}/video?rss=2.0"
-        feed = feedparser.parse(url)
-        if feed.entries:
-            return feed.entries[0].id  # 最新の動画IDを返す
-        return None
+        return self.fetch_latest_entry_id(self.video_feed)
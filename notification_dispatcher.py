@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from version_info import __version__
+import logging
+import queue
+import threading
+import time
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+# ワーカースレッドに終了を知らせるための番兵
+_STOP = object()
+
+
+class NotificationDispatcher:
+    """
+    Webhook通知の後続処理（Bluesky投稿など）をワーカースレッドで実行するキュー。
+    submit()はキューに積むだけなので、Webhookハンドラはすぐに応答を返せる。
+    """
+
+    def __init__(self, worker_count=2, queue_size=100, logger=None):
+        self.worker_count = max(1, int(worker_count))
+        self.queue_size = max(1, int(queue_size))
+        self.logger = logger if logger else logging.getLogger("AppLogger")
+        self._queue = queue.Queue(maxsize=self.queue_size)
+        self._workers = []
+        self._lock = threading.Lock()
+        self._accepting = False
+        # 一度drain()したら再起動しない（終了処理後に受け付けを再開しないため）
+        self._closed = False
+        self.processed_count = 0
+        self.failed_count = 0
+        self.rejected_count = 0
+
+    def start(self):
+        # ワーカースレッドを起動する（既に起動済み、または停止済みなら何もしない）
+        with self._lock:
+            if self._workers or self._closed:
+                return
+            self._accepting = True
+            for i in range(self.worker_count):
+                worker = threading.Thread(
+                    target=self._worker_loop,
+                    name=f"NotificationWorker-{i + 1}",
+                    daemon=True)
+                worker.start()
+                self._workers.append(worker)
+        self.logger.info(
+            f"通知ディスパッチャーを起動しました (ワーカー数: {self.worker_count}, キュー上限: {self.queue_size})")
+
+    @property
+    def is_running(self):
+        return bool(self._workers) and self._accepting
+
+    def _count(self, name):
+        # 複数のスレッドから更新するため、カウンターはロックを取って加算する
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def submit(self, job_name, func, *args, **kwargs):
+        """
+        ジョブをキューに追加する。キューが満杯、または停止中の場合はFalseを返す
+        """
+        if not self._accepting:
+            self.logger.warning(f"通知ディスパッチャーは停止中のため、ジョブを受け付けません: {job_name}")
+            self._count("rejected_count")
+            return False
+        try:
+            self._queue.put_nowait((job_name, func, args, kwargs))
+        except queue.Full:
+            self._count("rejected_count")
+            self.logger.error(f"通知キューが満杯のため、ジョブを破棄しました: {job_name}")
+            return False
+        return True
+
+    def pending_count(self):
+        # 未処理（実行中を含む）のジョブ数
+        return self._queue.unfinished_tasks
+
+    def _worker_loop(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                job_name, func, args, kwargs = item
+                try:
+                    func(*args, **kwargs)
+                    self._count("processed_count")
+                except Exception as e:
+                    self._count("failed_count")
+                    self.logger.error(f"通知ジョブ '{job_name}' の実行中に例外が発生しました: {e}", exc_info=e)
+            finally:
+                self._queue.task_done()
+
+    def drain(self, timeout=30):
+        """
+        新規受付を停止し、キューに残っているジョブを処理し終えてからワーカーを終了する。
+        timeout秒以内に処理しきれなかった場合はFalseを返す
+        """
+        with self._lock:
+            self._closed = True
+            if not self._workers:
+                return True
+            self._accepting = False
+            workers = list(self._workers)
+            self._workers = []
+
+        remaining = self._queue.unfinished_tasks
+        if remaining:
+            self.logger.info(f"通知キューに残っている {remaining} 件のジョブを処理してから終了します。")
+
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.05)
+        drained = self._queue.unfinished_tasks == 0
+
+        for _ in workers:
+            try:
+                self._queue.put(_STOP, timeout=max(0.0, deadline - time.monotonic()) or 0.1)
+            except queue.Full:
+                break
+        for worker in workers:
+            worker.join(timeout=max(0.0, deadline - time.monotonic()) or 0.1)
+
+        if drained:
+            self.logger.info("通知ディスパッチャーを停止しました。")
+        else:
+            self.logger.warning(
+                f"通知ディスパッチャーの停止がタイムアウトしました。未処理ジョブ: {self._queue.unfinished_tasks}件")
+        return drained
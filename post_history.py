@@ -0,0 +1,309 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from version_info import __version__
+from datetime import date, datetime
+import csv
+import logging
+import os
+import sqlite3
+import threading
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+DEFAULT_POST_HISTORY_PATH = "logs/post_history.db"
+# 以前の投稿履歴CSV（初回起動時にデータベースへ取り込み、.migratedに名前を変える）
+LEGACY_POST_HISTORY_CSV = "logs/post_history.csv"
+# まとめて書き込む件数と、書き込みを待つ最大秒数
+DEFAULT_HISTORY_BATCH_SIZE = 50
+DEFAULT_HISTORY_FLUSH_INTERVAL = 2.0
+# CSVの列（以前のpost_history.csvと同じ順。プラットフォームは末尾に追加）
+CSV_HEADER = ["日時", "イベントタイプ", "タイトル", "カテゴリ", "URL", "成功", "プラットフォーム"]
+TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS post_history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    posted_at TEXT NOT NULL,
+    event_type TEXT NOT NULL,
+    title TEXT,
+    category TEXT,
+    url TEXT,
+    success INTEGER NOT NULL,
+    platform TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_post_history_posted_at ON post_history (posted_at);
+CREATE INDEX IF NOT EXISTS idx_post_history_event_type ON post_history (event_type, posted_at);
+CREATE INDEX IF NOT EXISTS idx_post_history_platform ON post_history (platform, posted_at);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_COLUMNS = ("posted_at", "event_type", "title", "category", "url", "success", "platform")
+_INSERT_SQL = f"INSERT INTO post_history ({', '.join(_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)"
+# 以前のCSVの取り込みが済んだことを、取り込みと同じトランザクションで記録するキー
+_LEGACY_CSV_MIGRATED_KEY = "legacy_csv_migrated"
+
+logger = logging.getLogger("AppLogger")
+
+
+def _time_key(value, end=False):
+    # 日時の絞り込み条件を保存形式（YYYY-MM-DD HH:MM:SS）の文字列にする。日付だけなら終日を含める
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.strftime(TIME_FORMAT)
+    if isinstance(value, date):
+        return f"{value.isoformat()} {'23:59:59' if end else '00:00:00'}"
+    value = str(value).strip()
+    if len(value) == 10:
+        return f"{value} {'23:59:59' if end else '00:00:00'}"
+    return value
+
+
+def _where(start=None, end=None, success=None, event_type=None, platform=None):
+    clauses = []
+    params = []
+    if start is not None:
+        clauses.append("posted_at >= ?")
+        params.append(_time_key(start))
+    if end is not None:
+        clauses.append("posted_at <= ?")
+        params.append(_time_key(end, end=True))
+    if success is not None:
+        clauses.append("success = ?")
+        params.append(1 if success else 0)
+    if event_type:
+        clauses.append("event_type = ?")
+        params.append(event_type)
+    if platform:
+        clauses.append("platform = ?")
+        params.append(platform)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+class PostHistoryStore:
+    """
+    Bluesky投稿履歴の保存先（SQLite・WALモード）。
+    record()はメモリ上に溜めるだけで、batch_size件に達するかflush_interval秒ごとにまとめて書き込む。
+    一覧はquery()で日時・成否などで絞り込み、ページ単位で取得する。CSVは必要なときにexport_csv()で出力する
+    """
+
+    def __init__(self, path=DEFAULT_POST_HISTORY_PATH, batch_size=DEFAULT_HISTORY_BATCH_SIZE,
+                 flush_interval=DEFAULT_HISTORY_FLUSH_INTERVAL, logger_to_use=None):
+        self.path = path
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = float(flush_interval)
+        self.logger = logger_to_use if logger_to_use else logger
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._flusher = None
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    def record(self, title, category, url, success, event_type, platform=None, posted_at=None):
+        """
+        投稿履歴を1件追加する（書き込みはまとめて行う）
+        """
+        posted_at = posted_at or datetime.now()
+        row = (_time_key(posted_at), event_type, title, category, url, 1 if success else 0, platform)
+        with self._pending_lock:
+            if self._closed:
+                raise RuntimeError("投稿履歴の保存先は既に閉じられています")
+            self._pending.append(row)
+            full = len(self._pending) >= self.batch_size
+            if self._flusher is None and self.flush_interval > 0:
+                self._flusher = threading.Thread(target=self._flush_loop, name="PostHistoryFlusher", daemon=True)
+                self._flusher.start()
+        if full or self.flush_interval <= 0:
+            self.flush()
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                self.logger.error(f"投稿履歴の書き込みに失敗しました: {self.path}, エラー: {e}", exc_info=e)
+
+    def flush(self):
+        """
+        溜まっている履歴をまとめて書き込み、書き込んだ件数を返す。失敗した場合は次回に持ち越す
+        """
+        with self._pending_lock:
+            rows, self._pending = self._pending, []
+        if not rows:
+            return 0
+        try:
+            with self._lock, self._conn:
+                self._conn.executemany(_INSERT_SQL, rows)
+        except Exception:
+            with self._pending_lock:
+                self._pending[:0] = rows
+            raise
+        return len(rows)
+
+    def query(self, start=None, end=None, success=None, event_type=None, platform=None,
+              limit=100, offset=0, newest_first=True):
+        """
+        条件に合う履歴を新しい順（newest_first=Falseなら古い順）に最大limit件返す。
+        start/endはdatetime・date・"YYYY-MM-DD[ HH:MM:SS]"のいずれか（endは日付だけなら終日を含む）
+        """
+        self.flush()
+        where, params = _where(start, end, success, event_type, platform)
+        order = "DESC" if newest_first else "ASC"
+        sql = (f"SELECT {', '.join(_COLUMNS)} FROM post_history{where}"
+               f" ORDER BY posted_at {order}, id {order}")
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params += [int(limit), int(offset)]
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(row, success=bool(row["success"])) for row in rows]
+
+    def count(self, start=None, end=None, success=None, event_type=None, platform=None):
+        # 条件に合う履歴の件数（ページ数の計算用）
+        self.flush()
+        where, params = _where(start, end, success, event_type, platform)
+        with self._lock:
+            return self._conn.execute(f"SELECT COUNT(*) FROM post_history{where}", params).fetchone()[0]
+
+    def export_csv(self, path, **filters):
+        """
+        条件に合う履歴を古い順にCSVへ書き出し、件数を返す（Excelで開けるようBOM付きUTF-8）
+        """
+        rows = self.query(limit=None, newest_first=False, **filters)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "w", newline="", encoding="utf-8-sig") as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_HEADER)
+            for row in rows:
+                writer.writerow([row["posted_at"], row["event_type"], row["title"], row["category"],
+                                 row["url"], "○" if row["success"] else "×", row["platform"] or ""])
+        return len(rows)
+
+    def import_csv(self, path):
+        """
+        以前のpost_history.csv（またはexport_csvの出力）を取り込み、件数を返す
+        """
+        rows = self._read_csv_rows(path)
+        with self._lock, self._conn:
+            self._conn.executemany(_INSERT_SQL, rows)
+        return len(rows)
+
+    @staticmethod
+    def _read_csv_rows(path):
+        rows = []
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            for i, values in enumerate(csv.reader(f)):
+                if i == 0 and values and values[0] == CSV_HEADER[0]:
+                    continue
+                if len(values) < 6:
+                    continue
+                posted_at, event_type, title, category, url, success = values[:6]
+                platform = values[6] if len(values) > 6 and values[6] else None
+                rows.append((posted_at, event_type, title, category, url,
+                             1 if success.strip() in ("○", "True", "true", "1") else 0, platform))
+        return rows
+
+    def migrate_legacy_csv(self, csv_path=LEGACY_POST_HISTORY_CSV):
+        """
+        以前のCSVを一度だけ取り込む。取り込んだCSVは .migrated を付けた名前に変えて残す。
+        取り込み済みの記録は履歴の追加と同じトランザクションで書き込むため、
+        名前を変える前に終了しても次回の起動で二重に取り込まない
+        """
+        if not csv_path or not os.path.exists(csv_path):
+            return 0
+        rows = self._read_csv_rows(csv_path)
+        with self._lock, self._conn:
+            migrated = self._conn.execute(
+                "SELECT value FROM meta WHERE key = ?", (_LEGACY_CSV_MIGRATED_KEY,)).fetchone()
+            if migrated is None:
+                self._conn.executemany(_INSERT_SQL, rows)
+                self._conn.execute(
+                    "INSERT INTO meta (key, value) VALUES (?, ?)",
+                    (_LEGACY_CSV_MIGRATED_KEY, datetime.now().strftime(TIME_FORMAT)))
+        os.replace(csv_path, f"{csv_path}.migrated")
+        if migrated is not None:
+            self.logger.info(f"投稿履歴CSVは取り込み済みのため、名前だけ変更しました: {csv_path}")
+            return 0
+        self.logger.info(f"投稿履歴CSVをデータベースに取り込みました: {csv_path} ({len(rows)}件)")
+        return len(rows)
+
+    def close(self):
+        # 溜まっている履歴を書き込んでから閉じる
+        with self._pending_lock:
+            self._closed = True
+        self._wake.set()
+        if self._flusher is not None:
+            self._flusher.join(timeout=5)
+        try:
+            self.flush()
+        finally:
+            with self._lock:
+                self._conn.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_post_history_store():
+    """
+    共有の投稿履歴の保存先を返す（初回呼び出し時に作成し、以前のCSVがあれば取り込む）
+    """
+    global _store
+    with _store_lock:
+        if _store is None:
+            store = PostHistoryStore(os.getenv("POST_HISTORY_DB_PATH", DEFAULT_POST_HISTORY_PATH))
+            try:
+                store.migrate_legacy_csv(LEGACY_POST_HISTORY_CSV)
+            except Exception as e:
+                logger.warning(f"投稿履歴CSVの取り込みに失敗しました: {e}")
+            _store = store
+        return _store
+
+
+def close_post_history_store():
+    global _store
+    with _store_lock:
+        store, _store = _store, None
+    if store is not None:
+        store.close()
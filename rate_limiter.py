@@ -0,0 +1,280 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from version_info import __version__
+import logging
+import math
+import os
+import threading
+import time
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+# 既定の上限（名前 -> (容量, 何秒で満タンになるか)）。サーバーのratelimitヘッダーを受け取ったらそれに合わせる
+# Bluesky: createSessionは5分30回、書き込み（createRecord）は1時間あたり約1666件、
+# その他のAPI（uploadBlobなど）は5分3000回。Twitch Helix: 1分800ポイント
+DEFAULT_RATE_LIMITS = {
+    "bluesky.createSession": (30, 300.0),
+    "bluesky.createRecord": (1666, 3600.0),
+    "bluesky.uploadBlob": (3000, 300.0),
+    "twitch.helix": (800, 60.0),
+}
+# 上限に達したときに待つ最大秒数（超えた場合は警告して送信し、サーバーの判断に任せる）
+DEFAULT_RATE_LIMIT_MAX_WAIT = 300.0
+# サーバーが示すリセット時刻として受け入れる最大秒数（時計のずれ・異常値対策）
+MAX_RESET_SECONDS = 86400.0
+
+logger = logging.getLogger("AppLogger")
+
+
+def _header(headers, name):
+    # 大文字小文字を区別せずにヘッダー値を取得する（requestsのヘッダーとatprotoのdictの両方に対応）
+    if not headers:
+        return None
+    try:
+        value = headers.get(name)
+        if value is None:
+            lowered = name.lower()
+            value = next((v for k, v in headers.items() if str(k).lower() == lowered), None)
+    except (AttributeError, TypeError):
+        return None
+    if isinstance(value, bytes):
+        value = value.decode(errors="replace")
+    return str(value).strip() if isinstance(value, (str, int, float)) else None
+
+
+def _number(value):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _policy_window(policy):
+    # RateLimit-Policy: "3000;w=300" の窓の秒数
+    for part in str(policy or "").split(";")[1:]:
+        key, _, value = part.strip().partition("=")
+        if key.strip() == "w":
+            return _number(value)
+    return None
+
+
+class TokenBucket:
+    """
+    API呼び出しの上限を管理するトークンバケット。
+    acquire()でトークンを取得し、足りなければ補充されるまで待つ。
+    サーバーのratelimitヘッダー（limit・remaining・reset）を受け取ると、その残数に合わせ、
+    リセット時刻に満タンに戻す（それまでは補充しない）。
+    """
+
+    def __init__(self, name, capacity, period, max_wait=DEFAULT_RATE_LIMIT_MAX_WAIT,
+                 clock=time.monotonic, wall_clock=time.time, sleep=None, logger_to_use=None):
+        self.name = name
+        self.capacity = float(capacity)
+        # 1秒あたりの補充量
+        self.refill_rate = self.capacity / float(period)
+        self.max_wait = max_wait
+        self.clock = clock
+        self.wall_clock = wall_clock
+        self.sleep = sleep
+        self.logger = logger_to_use if logger_to_use else logger
+        self._tokens = self.capacity
+        self._updated_at = clock()
+        # サーバーの窓がリセットされる時刻（clock基準）。Noneなら一定の速度で補充する
+        self._reset_at = None
+        self._lock = threading.Lock()
+        self.waits = 0
+        self.waited_seconds = 0.0
+        self.timeouts = 0
+        self.server_updates = 0
+
+    def _refill(self, now):
+        if self._reset_at is not None:
+            if now < self._reset_at:
+                return
+            self._tokens = self.capacity
+            self._reset_at = None
+        else:
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.refill_rate)
+        self._updated_at = now
+
+    def _delay(self, tokens, now):
+        # tokens個そろうまでの秒数
+        if self._reset_at is not None:
+            return max(0.0, self._reset_at - now)
+        return max(0.0, (tokens - self._tokens) / self.refill_rate)
+
+    def try_acquire(self, tokens=1):
+        # 待たずに取得を試みる。取得できればTrue
+        with self._lock:
+            self._refill(self.clock())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def acquire(self, tokens=1, timeout=None):
+        """
+        トークンを取得する。足りなければ補充されるまで待つ（最大timeout秒。省略時はmax_wait）。
+        取得できればTrue、待ち時間の上限を超えた場合は警告してFalseを返す
+        """
+        tokens = min(float(tokens), self.capacity)
+        timeout = self.max_wait if timeout is None else timeout
+        started = self.clock()
+        waited = False
+        try:
+            while True:
+                with self._lock:
+                    now = self.clock()
+                    self._refill(now)
+                    if self._tokens >= tokens:
+                        self._tokens -= tokens
+                        return True
+                    delay = self._delay(tokens, now)
+                    remaining = None if timeout is None else timeout - (now - started)
+                    if remaining is not None and remaining <= 0:
+                        self.timeouts += 1
+                        self.logger.warning(
+                            f"APIの呼び出し上限（{self.name}）の回復を{timeout:.0f}秒待ちましたが、"
+                            f"回復しないため送信します。")
+                        return False
+                    if not waited:
+                        waited = True
+                        self.waits += 1
+                        if delay >= 1:
+                            self.logger.info(
+                                f"APIの呼び出し上限（{self.name}）に達したため、{delay:.1f}秒待ちます。")
+                if remaining is not None:
+                    delay = min(delay, remaining)
+                (self.sleep or time.sleep)(max(delay, 0.01))
+        finally:
+            if waited:
+                with self._lock:
+                    self.waited_seconds += self.clock() - started
+
+    def update_from_headers(self, headers):
+        """
+        レスポンスのratelimitヘッダーで残数と上限を更新する。ヘッダーがなければ何もしない
+        """
+        remaining = _number(_header(headers, "Ratelimit-Remaining"))
+        if remaining is None:
+            return False
+        limit = _number(_header(headers, "Ratelimit-Limit"))
+        reset = _number(_header(headers, "Ratelimit-Reset"))
+        window = _policy_window(_header(headers, "Ratelimit-Policy"))
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            if limit and limit > 0:
+                self.capacity = limit
+                if window and window > 0:
+                    self.refill_rate = limit / window
+            self._tokens = max(0.0, min(remaining, self.capacity))
+            self._updated_at = now
+            if reset is not None and remaining < self.capacity:
+                seconds = reset - self.wall_clock()
+                if 0 < seconds <= MAX_RESET_SECONDS:
+                    self._reset_at = now + seconds
+            self.server_updates += 1
+        return True
+
+    def snapshot(self):
+        # 現在の残量などを返す（ログ・GUI表示用）
+        with self._lock:
+            now = self.clock()
+            self._refill(now)
+            return {
+                "capacity": self.capacity,
+                "tokens": self._tokens,
+                "refill_rate": self.refill_rate,
+                "reset_in": None if self._reset_at is None else max(0.0, self._reset_at - now),
+                "waits": self.waits,
+                "waited_seconds": self.waited_seconds,
+                "timeouts": self.timeouts,
+                "server_updates": self.server_updates,
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(name):
+    """
+    名前ごとに共有のトークンバケットを返す（初回呼び出し時にDEFAULT_RATE_LIMITSから作成）
+    """
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            capacity, period = DEFAULT_RATE_LIMITS.get(name, (60, 60.0))
+            limiter = TokenBucket(
+                name, capacity, period,
+                max_wait=float(os.getenv("API_RATE_LIMIT_MAX_WAIT", DEFAULT_RATE_LIMIT_MAX_WAIT)))
+            _limiters[name] = limiter
+        return limiter
+
+
+def get_rate_limit_levels():
+    """
+    名前 -> 残量などのスナップショット（TokenBucket.snapshot()）を返す
+    """
+    with _limiters_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.snapshot() for limiter in limiters}
+
+
+def log_rate_limit_levels(logger_to_use=None):
+    """
+    呼び出し上限ごとの残量と待ち時間をログに出力する（終了時の集計用）。出力した件数を返す
+    """
+    current_logger = logger_to_use if logger_to_use else logger
+    levels = get_rate_limit_levels()
+    for name, level in sorted(levels.items()):
+        current_logger.info(
+            f"呼び出し上限 {name}: 残り {level['tokens']:.0f}/{level['capacity']:.0f}, "
+            f"待機 {level['waits']}回 (計{level['waited_seconds']:.1f}秒), 待機打ち切り {level['timeouts']}回, "
+            f"サーバー値で更新 {level['server_updates']}回")
+    return len(levels)
+
+
+def reset_rate_limiters():
+    with _limiters_lock:
+        _limiters.clear()
+
+
+def call_with_rate_limit(limiter, func, *args, **kwargs):
+    """
+    limiterでトークンを取得してからfuncを呼び出し、レスポンス（または例外のレスポンス）の
+    ratelimitヘッダーでlimiterを更新する
+    """
+    limiter.acquire()
+    try:
+        response = func(*args, **kwargs)
+    except Exception as e:
+        limiter.update_from_headers(getattr(getattr(e, "response", None), "headers", None))
+        raise
+    limiter.update_from_headers(getattr(response, "headers", None))
+    return response
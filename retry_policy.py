@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from version_info import __version__
+from email.utils import parsedate_to_datetime
+import functools
+import logging
+import math
+import random
+import requests
+import threading
+import time
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+# 待ち時間の上限（秒）。サーバーがそれ以上待てと言った場合は、その指示を優先する
+DEFAULT_RETRY_MAX_DELAY = 60.0
+# 再試行すべきHTTPステータス（レート制限・一時的なサーバーエラー）
+RETRYABLE_STATUS_CODES = frozenset({408, 425, 429, 500, 502, 503, 504})
+
+logger = logging.getLogger("AppLogger")
+
+
+def _value(setting):
+    # 呼び出しのたびに値を取得できるよう、関数が渡された場合は呼び出す
+    return setting() if callable(setting) else setting
+
+
+def _response_of(error):
+    return getattr(error, "response", None) if error is not None else None
+
+
+def status_code_of(error):
+    # 例外に付いているHTTPレスポンスのステータスコード（なければNone）
+    status = getattr(_response_of(error), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def _header(response, name):
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    try:
+        value = headers.get(name)
+        if value is None:
+            # atprotoのレスポンスは通常のdict（大文字小文字を区別する）
+            lowered = name.lower()
+            value = next((v for k, v in headers.items() if str(k).lower() == lowered), None)
+    except (AttributeError, TypeError):
+        return None
+    return value if isinstance(value, (str, bytes, int, float)) else None
+
+
+def server_retry_delay(error, now=None):
+    """
+    例外のレスポンスヘッダーからサーバー指定の待ち秒数を返す（指定がなければNone）。
+    Retry-After（秒数またはHTTP日付）を優先し、なければレート制限中（429・残り0）の
+    ratelimit-reset（TwitchのRatelimit-Reset・BlueskyのRateLimit-Reset。UNIX時刻）を使う
+    """
+    response = _response_of(error)
+    if response is None:
+        return None
+    now = time.time() if now is None else now
+    retry_after = _header(response, "Retry-After")
+    if retry_after is not None:
+        retry_after = retry_after.decode() if isinstance(retry_after, bytes) else str(retry_after)
+        try:
+            seconds = float(retry_after)
+            if math.isfinite(seconds):
+                return max(0.0, seconds)
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - now)
+            except (TypeError, ValueError):
+                pass
+    remaining = _header(response, "Ratelimit-Remaining")
+    if status_code_of(error) == 429 or str(remaining).strip() == "0":
+        reset = _header(response, "Ratelimit-Reset")
+        try:
+            return max(0.0, float(reset) - now)
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+class RetryMetrics:
+    """
+    ポリシー名ごとの再試行回数などの集計（ログ・GUI表示用）
+    """
+
+    FIELDS = ("calls", "successes", "retries", "rate_limited", "fatal", "gave_up", "rescheduled")
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def incr(self, name, field, amount=1):
+        with self._lock:
+            counts = self._counts.setdefault(name, dict.fromkeys(self.FIELDS, 0))
+            counts[field] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return {name: dict(counts) for name, counts in self._counts.items()}
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+_metrics = RetryMetrics()
+
+
+def get_retry_metrics():
+    """
+    ポリシー名 -> {"calls","successes","retries","rate_limited","fatal","gave_up","rescheduled"} を返す
+    """
+    return _metrics.snapshot()
+
+
+def reset_retry_metrics():
+    _metrics.reset()
+
+
+def log_retry_metrics(logger_to_use=None):
+    """
+    ポリシーごとの再試行回数をログに出力する（終了時の集計用）。出力した件数を返す
+    """
+    current_logger = logger_to_use if logger_to_use else logger
+    metrics = get_retry_metrics()
+    for name, counts in sorted(metrics.items()):
+        current_logger.info(
+            f"リトライ集計 {name}: 呼び出し {counts['calls']}回, 成功 {counts['successes']}回, "
+            f"再試行 {counts['retries']}回 (うちレート制限 {counts['rate_limited']}回), "
+            f"再試行不可 {counts['fatal']}回, 打ち切り {counts['gave_up']}回, 次回に延期 {counts['rescheduled']}回")
+    return len(metrics)
+
+
+class RetryPolicy:
+    """
+    再試行のポリシー。指数バックオフ（フルジッター）で待ち、サーバーのRetry-After・
+    ratelimit-resetがあればそれに従う。試行回数の上限と、最初の試行からの期限（deadline秒）を持つ。
+
+    例外の分類は fatal（常に再試行しない）→ classify(e)（True/False、判断しない場合はNone）→
+    retryable（該当すれば再試行）の順で判定する。
+    max_attempts・base_delay・max_delay・deadline には呼び出し時に値を返す関数も渡せる。
+    """
+
+    def __init__(self, name, max_attempts=3, base_delay=2.0, max_delay=DEFAULT_RETRY_MAX_DELAY,
+                 deadline=None, retryable=(Exception,), fatal=(), classify=None,
+                 sleep=None, rng=random.random, logger_to_use=None):
+        self.name = name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+        self.retryable = tuple(retryable)
+        self.fatal = tuple(fatal)
+        self.classify = classify
+        # 未指定なら呼び出し時にtime.sleepを参照する（テストでの差し替えを効かせるため）
+        self.sleep = sleep
+        self.rng = rng
+        self.logger = logger_to_use if logger_to_use else logger
+
+    def is_retryable(self, error):
+        if self.fatal and isinstance(error, self.fatal):
+            return False
+        if self.classify is not None:
+            decision = self.classify(error)
+            if decision is not None:
+                return bool(decision)
+        return isinstance(error, self.retryable)
+
+    def backoff(self, attempt):
+        # attempt回目の失敗後の待ち秒数（0〜base*2^(attempt-1)の一様乱数。上限はmax_delay）
+        cap = min(float(_value(self.max_delay)), float(_value(self.base_delay)) * (2 ** max(0, attempt - 1)))
+        return self.rng() * cap
+
+    def delay_for(self, attempt, error=None, now=None):
+        # サーバーの指定があればそれを、なければバックオフの待ち秒数を返す
+        hinted = server_retry_delay(error, now)
+        return hinted if hinted is not None else self.backoff(attempt)
+
+    def reschedule_delay(self, attempt, error, minimum=0.0):
+        """
+        定期実行（監視ループなど）向け。打ち切らずに、attempt回連続で失敗した後の
+        次回実行までの秒数を返す（通常の間隔minimumより短くはしない）
+        """
+        _metrics.incr(self.name, "rescheduled")
+        hinted = server_retry_delay(error)
+        if hinted is not None:
+            _metrics.incr(self.name, "rate_limited")
+        delay = hinted if hinted is not None else self.backoff(attempt)
+        return max(float(minimum), delay)
+
+    def next_delay(self, attempt, error, started_at=None, now=None):
+        """
+        attempt回目がerrorで失敗した後に待つ秒数を返す。再試行しない場合はNone
+        """
+        if not self.is_retryable(error):
+            _metrics.incr(self.name, "fatal")
+            return None
+        if attempt >= int(_value(self.max_attempts)):
+            _metrics.incr(self.name, "gave_up")
+            return None
+        hinted = server_retry_delay(error)
+        if hinted is not None:
+            _metrics.incr(self.name, "rate_limited")
+        delay = hinted if hinted is not None else self.backoff(attempt)
+        deadline = _value(self.deadline)
+        if deadline is not None and started_at is not None:
+            now = time.monotonic() if now is None else now
+            if now - started_at + delay > float(deadline):
+                _metrics.incr(self.name, "gave_up")
+                return None
+        _metrics.incr(self.name, "retries")
+        return delay
+
+    def call(self, func, *args, **kwargs):
+        """
+        funcを呼び出し、再試行可能な例外なら待ってから再試行する。最後の例外はそのまま送出する
+        """
+        _metrics.incr(self.name, "calls")
+        started_at = time.monotonic()
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                delay = self.next_delay(attempt, e, started_at)
+                if delay is None:
+                    raise
+                self.logger.warning(
+                    f"リトライ{attempt}/{_value(self.max_attempts)}回目: {self.name} "
+                    f"例外: {e}（{delay:.1f}秒後に再試行します）")
+                (self.sleep or time.sleep)(delay)
+                continue
+            _metrics.incr(self.name, "successes")
+            return result
+
+    def __call__(self, func):
+        # デコレータとして使う
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return self.call(func, *args, **kwargs)
+        return wrapper
+
+
+def is_retryable_http_error(error):
+    """
+    requests/atprotoの例外を分類する。接続エラー・タイムアウト・429・5xxは再試行し、
+    それ以外の4xx（入力の誤り・認証エラーなど）は再試行しない。判断できなければNone
+    """
+    status = status_code_of(error)
+    if status is not None:
+        return status in RETRYABLE_STATUS_CODES
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    return None
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from version_info import __version__
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import logging
+import time
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+# ステップの状態
+STEP_PENDING = "pending"
+STEP_RUNNING = "running"
+STEP_DONE = "done"
+STEP_FAILED = "failed"
+STEP_SKIPPED = "skipped"
+
+DEFAULT_STARTUP_WORKERS = 4
+
+logger = logging.getLogger("AppLogger")
+
+
+class StartupStepFailed(Exception):
+    """ステップ関数がFalseを返した（失敗を記録済みで、例外の詳細がない）場合に使う"""
+
+
+class StartupGraph:
+    """
+    起動処理の依存関係グラフ。依存するステップが全て完了したステップから順に
+    スレッドプールで並行実行する。いずれかのステップが失敗したら、
+    実行中のステップの完了を待ち、未実行のステップはスキップする。
+
+    on_event(event) には {"step","label","state","duration","error"} の辞書が渡される。
+    """
+
+    def __init__(self):
+        # name -> (label, func, depends)
+        self._steps = {}
+
+    def add(self, name, func, depends=(), label=None):
+        for dep in depends:
+            if dep not in self._steps:
+                raise ValueError(f"未登録のステップに依存しています: {name} -> {dep}")
+        self._steps[name] = (label or name, func, tuple(depends))
+        return self
+
+    @property
+    def step_names(self):
+        return list(self._steps)
+
+    def label_of(self, name):
+        return self._steps[name][0]
+
+    def run(self, max_workers=DEFAULT_STARTUP_WORKERS, on_event=None):
+        """
+        全ステップを実行し、StartupResultを返す
+        """
+        result = StartupResult({name: step[0] for name, step in self._steps.items()})
+        started = time.perf_counter()
+
+        def emit(name, state, duration=None, error=None):
+            result.states[name] = state
+            if duration is not None:
+                result.timings[name] = duration
+            if on_event is not None:
+                try:
+                    on_event({"step": name, "label": self.label_of(name), "state": state,
+                              "duration": duration, "error": error})
+                except Exception as e:
+                    logger.debug(f"起動進捗の通知に失敗しました: {e}")
+
+        durations = {}
+
+        def run_step(name):
+            func = self._steps[name][1]
+            step_started = time.perf_counter()
+            try:
+                if func() is False:
+                    raise StartupStepFailed(f"{self.label_of(name)}に失敗しました")
+            finally:
+                now = time.perf_counter()
+                durations[name] = now - step_started
+                result.finished_at[name] = now - started
+
+        remaining = dict(self._steps)
+        running = {}
+        with ThreadPoolExecutor(max_workers=max(1, int(max_workers)),
+                                thread_name_prefix="Startup") as executor:
+            while remaining or running:
+                if result.failed_step is None:
+                    for name in [n for n, (_, _, deps) in remaining.items()
+                                 if all(result.states[d] == STEP_DONE for d in deps)]:
+                        del remaining[name]
+                        emit(name, STEP_RUNNING)
+                        running[executor.submit(run_step, name)] = name
+                if not running:
+                    break
+                finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    error = future.exception()
+                    if error is None:
+                        emit(name, STEP_DONE, duration=durations[name])
+                        continue
+                    if result.failed_step is None:
+                        result.failed_step = name
+                        result.error = error
+                    emit(name, STEP_FAILED, duration=durations[name], error=str(error))
+
+        for name in remaining:
+            emit(name, STEP_SKIPPED)
+        result.total_seconds = time.perf_counter() - started
+        return result
+
+
+class StartupResult:
+    """StartupGraph.run()の結果（各ステップの状態・所要時間）"""
+
+    def __init__(self, labels):
+        # name -> 表示名（登録順）
+        self.labels = dict(labels)
+        self.states = {name: STEP_PENDING for name in self.labels}
+        self.timings = {}
+        # 起動開始からステップ完了までの経過秒数
+        self.finished_at = {}
+        self.failed_step = None
+        self.error = None
+        self.total_seconds = 0.0
+
+    @property
+    def success(self):
+        return self.failed_step is None and all(s == STEP_DONE for s in self.states.values())
+
+    def sequential_seconds(self):
+        # 全ステップを順番に実行した場合の所要時間（各ステップの合計）
+        return sum(self.timings.values())
+
+    def format_timings(self):
+        return ", ".join(
+            f"{self.labels[name]}={seconds:.2f}s" for name, seconds in self.timings.items())
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+import dataclasses
+import os
+import pytest
+from app_settings import AppSettings, SettingsError, SettingsStore
+from version_info import __version__
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+REQUIRED = {
+    "BLUESKY_USERNAME": "user",
+    "BLUESKY_APP_PASSWORD": "pass",
+    "TWITCH_CLIENT_ID": "id",
+    "TWITCH_CLIENT_SECRET": "secret",
+    "TWITCH_BROADCASTER_ID": "123",
+    "WEBHOOK_CALLBACK_URL": "https://example.com/webhook",
+}
+
+# ストアのテストで読み書きする環境変数
+STORE_KEYS = ("TIMEZONE", "NOTIFY_ON_TWITCH_OFFLINE", "WEBHOOK_DISPATCH_MODE")
+
+
+@pytest.fixture
+def clean_env(monkeypatch):
+    # テスト終了時に元の状態（未設定）へ戻す
+    for key in STORE_KEYS:
+        monkeypatch.setenv(key, "")
+        monkeypatch.delenv(key)
+
+
+def test_snapshot_parses_typed_values_and_is_immutable():
+    settings = AppSettings.from_mapping(dict(
+        REQUIRED, NOTIFY_ON_TWITCH_ONINE="False", NOTIFY_ON_TWITCH_OFFLINE="true",
+        RETRY_MAX="5", TWITCH_EVENTSUB_TRANSPORT=" WebSocket ", EXTRA_KEY="x"))
+    assert settings.notify_on_twitch_online is False
+    assert settings.notify_on_twitch_offline is True
+    assert settings.retry_max == 5
+    assert settings.is_websocket_transport
+    assert settings.get("EXTRA_KEY") == "x"
+    assert settings.template_path("BLUESKY_TEMPLATE_PATH", "default.txt") == "default.txt"
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        settings.retry_max = 1
+    with pytest.raises(TypeError):
+        settings.values["EXTRA_KEY"] = "y"
+
+
+def test_validate_reports_missing_and_invalid_values():
+    AppSettings.from_mapping(REQUIRED).validate()
+
+    missing = dict(REQUIRED, TUNNEL_SERVICE="cloudflare")
+    del missing["BLUESKY_USERNAME"]
+    with pytest.raises(SettingsError, match="BLUESKY_USERNAME, WEBHOOK_CALLBACK_URL_PERMANENT"):
+        AppSettings.from_mapping(missing).validate()
+
+    # WebSocketトランスポートではコールバックURLの代わりにユーザーアクセストークンが必須
+    websocket = dict(REQUIRED, TWITCH_EVENTSUB_TRANSPORT="websocket", WEBHOOK_CALLBACK_URL="")
+    assert AppSettings.from_mapping(websocket).missing_keys() == ["TWITCH_USER_ACCESS_TOKEN"]
+    AppSettings.from_mapping(dict(websocket, TWITCH_USER_ACCESS_TOKEN="tok")).validate()
+
+    with pytest.raises(SettingsError, match="RETRY_WAIT"):
+        AppSettings.from_mapping(dict(REQUIRED, RETRY_WAIT="abc")).validate()
+
+
+def test_reload_swaps_snapshot_when_file_changes(tmp_path, clean_env, monkeypatch):
+    env_file = tmp_path / "settings.env"
+    env_file.write_text("TIMEZONE=Asia/Tokyo\nNOTIFY_ON_TWITCH_OFFLINE=False\n", encoding="utf-8")
+    # ファイル読み込み前から環境変数にある値はファイルより優先する
+    monkeypatch.setenv("WEBHOOK_DISPATCH_MODE", "async")
+    store = SettingsStore(str(env_file))
+    changes = []
+    store.add_listener(lambda old, new: changes.append((old, new)))
+
+    first = store.reload()
+    assert first.timezone == "Asia/Tokyo"
+    assert first.is_async_dispatch
+    assert store.current is first
+    assert store.check_for_changes() is False
+
+    env_file.write_text("TIMEZONE=UTC\nNOTIFY_ON_TWITCH_OFFLINE=True\nWEBHOOK_DISPATCH_MODE=sync\n",
+                        encoding="utf-8")
+    os.utime(env_file, ns=(0, os.stat(env_file).st_mtime_ns + 1_000_000_000))
+    assert store.check_for_changes() is True
+
+    second = store.current
+    assert second is not first
+    # 古いスナップショットを参照中の処理には影響しない
+    assert first.timezone == "Asia/Tokyo"
+    assert (second.timezone, second.notify_on_twitch_offline) == ("UTC", True)
+    assert os.environ["TIMEZONE"] == "UTC"
+    # 初回読み込み時にファイルから反映した値ではないので、環境変数の値のまま
+    assert second.is_async_dispatch
+    assert changes[-1] == (first, second)
+
+
+def test_reload_removes_keys_deleted_from_file(tmp_path, clean_env):
+    env_file = tmp_path / "settings.env"
+    env_file.write_text("TIMEZONE=UTC\nWEBHOOK_DISPATCH_MODE=async\n", encoding="utf-8")
+    store = SettingsStore(str(env_file))
+    assert store.reload().is_async_dispatch
+
+    # ファイルから削除したキーは環境変数にも残さず、既定値に戻す
+    env_file.write_text("TIMEZONE=UTC\n", encoding="utf-8")
+    os.utime(env_file, ns=(0, os.stat(env_file).st_mtime_ns + 1_000_000_000))
+    assert store.check_for_changes() is True
+    assert "WEBHOOK_DISPATCH_MODE" not in os.environ
+    assert not store.current.is_async_dispatch
+    assert os.environ["TIMEZONE"] == "UTC"
+
+
+def test_watcher_is_not_started_without_settings_file(tmp_path):
+    store = SettingsStore(str(tmp_path / "missing.env"))
+    assert store.start_watching(interval=0.1) is False
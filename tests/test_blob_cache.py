@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+import json
+from blob_cache import BlobCache, content_digest
+from version_info import __version__
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+
+BLOB = {"mimeType": "image/png", "size": 10, "ref": {"$link": "bafkreitest"}, "$type": "blob"}
+
+
+def test_content_digest_is_sha256():
+    assert content_digest(b"abc") == "ba7816bf8f01cfea414140de5dae2223b00361a396177a9cb410ff61f20015ad"
+
+
+def test_put_and_get_are_persisted(tmp_path):
+    path = tmp_path / "blob_cache.json"
+    cache = BlobCache(str(path))
+    cache.put("user:abc", BLOB)
+    assert cache.get("user:abc") == BLOB
+
+    # 別インスタンス（再起動後）でも読み込めること
+    reloaded = BlobCache(str(path))
+    assert reloaded.get("user:abc") == BLOB
+    assert reloaded.get("user:other") is None
+
+
+def test_discard_removes_entry(tmp_path):
+    path = tmp_path / "blob_cache.json"
+    cache = BlobCache(str(path))
+    cache.put("user:abc", BLOB)
+    cache.discard("user:abc")
+    assert cache.get("user:abc") is None
+    assert json.loads(path.read_text(encoding="utf-8"))["entries"] == {}
+
+
+def test_oldest_entries_are_evicted(tmp_path):
+    cache = BlobCache(str(tmp_path / "blob_cache.json"), max_entries=2)
+    cache.put("a", BLOB)
+    cache.put("b", BLOB)
+    cache.get("a")
+    cache.put("c", BLOB)
+    assert cache.get("b") is None
+    assert cache.get("a") == BLOB
+    assert len(cache) == 2
+
+
+def test_broken_file_is_ignored(tmp_path):
+    path = tmp_path / "blob_cache.json"
+    path.write_text("{broken", encoding="utf-8")
+    cache = BlobCache(str(path))
+    assert cache.get("a") is None
+    cache.put("a", BLOB)
+    assert BlobCache(str(path)).get("a") == BLOB
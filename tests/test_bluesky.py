@@ -7,8 +7,11 @@ Stream notify on Bluesky
 
 import pytest
 import os
-from unittest.mock import patch, MagicMock, ANY, mock_open
+import json
+from unittest.mock import patch, MagicMock, ANY, call
 from bluesky import BlueskyPoster, load_template
+from app_settings import reset_settings
+import post_history
 from atproto import exceptions as atproto_exceptions
 from jinja2 import Template  # Templateを追加
 from version_info import __version__
@@ -41,6 +44,23 @@ pytestmark = pytest.mark.filterwarnings(
 )
 
 
+@pytest.fixture(autouse=True)
+def reset_app_settings():
+    # 設定スナップショットはテストごとに環境変数から作り直す
+    reset_settings()
+    yield
+    reset_settings()
+
+
+@pytest.fixture(autouse=True)
+def history_store(tmp_path, monkeypatch):
+    # 投稿履歴はテストごとの一時データベースに書き込む
+    store = post_history.PostHistoryStore(str(tmp_path / "post_history.db"), flush_interval=0)
+    monkeypatch.setattr(post_history, "_store", store)
+    yield store
+    store.close()
+
+
 @pytest.fixture
 def mock_env(monkeypatch):
     # テスト用の環境変数を設定
@@ -159,7 +179,8 @@ class TestBlueskyPoster:
             category=mock_event_context_online["category_name"],
             url=mock_event_context_online["stream_url"],
             success=True,
-            event_type="online"
+            event_type="online",
+            platform="twitch"
         )
 
     @patch("bluesky.Client")
@@ -227,7 +248,8 @@ class TestBlueskyPoster:
             category="Offline",
             url=mock_event_context_offline['channel_url'],
             success=True,
-            event_type="offline"
+            event_type="offline",
+            platform="twitch"
         )
 
     @patch("bluesky.Client")
@@ -300,7 +322,7 @@ class TestBlueskyPoster:
             event_context=mock_event_context_offline)
         assert result is False
         mock_write_history.assert_called_once_with(
-            title=ANY, category="Offline", url=ANY, success=False, event_type="offline"
+            title=ANY, category="Offline", url=ANY, success=False, event_type="offline", platform="twitch"
         )
 
     @patch("bluesky.Client")
@@ -339,9 +361,9 @@ class TestBlueskyPoster:
     @patch("bluesky.load_template")
     def test_write_post_history_io_error(
         self, mock_load_template_func, mock_atproto_client_class, mock_env, caplog,
-        mock_event_context_offline
+        mock_event_context_offline, history_store
     ):
-        # _write_post_historyでIOErrorが発生した場合のログ出力をテスト
+        # 投稿履歴の記録でIOErrorが発生しても投稿は成功し、エラーログが出力されることをテスト
         mock_template_obj = MagicMock(spec=Template)
         mock_template_obj.render.return_value = "Rendered Offline Template Text"
         mock_load_template_func.return_value = mock_template_obj
@@ -352,16 +374,8 @@ class TestBlueskyPoster:
 
         poster = BlueskyPoster("user", "pass")
 
-        # openを条件付きでモックし、CSV書き込み時のみIOErrorを発生させる
-        original_open = open
-
-        def conditional_mock_open(file, mode="r", **kwargs):
-            if file == "logs/post_history.csv" and mode == "a":
-                raise IOError("Test CSV write error")
-            return mock_open()(file, mode, **kwargs)
-
-        with patch("builtins.open", side_effect=conditional_mock_open) as mock_file_open_custom:
-            poster.post_stream_offline(mock_event_context_offline)
+        with patch.object(history_store, "record", side_effect=IOError("Test history write error")):
+            assert poster.post_stream_offline(mock_event_context_offline) is True
 
         offline_template_path = os.getenv(
             "BLUESKY_OFFLINE_TEMPLATE_PATH", "templates/offline_template.txt")
@@ -369,11 +383,29 @@ class TestBlueskyPoster:
             path=offline_template_path)
 
         # エラーログが出力されているか確認
-        assert "投稿履歴CSVへの書き込みに失敗しました: logs/post_history.csv, エラー: Test CSV write error" in caplog.text
-        assert "Test CSV write error" in caplog.text
+        assert "投稿履歴の記録に失敗しました: Test history write error" in caplog.text
 
         mock_client_instance.send_post.assert_called_once()
 
+    @patch("bluesky.Client")
+    @patch("bluesky.load_template")
+    def test_post_history_is_recorded_in_store(
+        self, mock_load_template_func, mock_atproto_client_class, mock_env,
+        mock_event_context_online, history_store
+    ):
+        # カンマを含むタイトルもそのまま記録され、プラットフォームで絞り込めることを確認
+        mock_load_template_func.return_value = MagicMock(spec=Template, render=MagicMock(return_value="text"))
+        mock_atproto_client_class.return_value = MagicMock()
+        poster = BlueskyPoster("user", "pass")
+        context = dict(mock_event_context_online, title="Hello, World")
+
+        assert poster.post_stream_online(context, platform="youtube") is True
+
+        rows = history_store.query(platform="youtube")
+        assert len(rows) == 1
+        assert rows[0]["title"] == "Hello, World"
+        assert rows[0]["event_type"] == "online" and rows[0]["success"] is True
+
     def test_upload_image_actual_file_not_found(self, mock_env, caplog):
         # upload_imageでFileNotFoundErrorが発生した場合のテスト
         poster = BlueskyPoster("user", "pass")
@@ -406,3 +438,302 @@ def test_async_post_notification():
         # すべての投稿が成功したことを確認
         assert all(results)
         assert mock_client.return_value.send_post.call_count == 3
+
+
+class TestBlueskySession:
+
+    @patch("bluesky.Client")
+    @patch("bluesky.BlueskyPoster._write_post_history")
+    def test_login_only_once_for_multiple_posts(
+            self, mock_write_history, mock_atproto_client_class, mock_env,
+            mock_event_context_offline, tmp_path):
+        # 同じPosterで複数回投稿してもログインは1回だけであることを確認
+        mock_client_instance = MagicMock()
+        mock_atproto_client_class.return_value = mock_client_instance
+        poster = BlueskyPoster("user", "pass", session_path=str(tmp_path / "session.json"))
+
+        with patch("bluesky.load_template") as mock_load_template_func:
+            mock_load_template_func.return_value.render.return_value = "text"
+            assert poster.post_stream_offline(mock_event_context_offline)
+            assert poster.post_stream_offline(mock_event_context_offline)
+
+        mock_client_instance.login.assert_called_once_with("user", "pass")
+        assert mock_client_instance.send_post.call_count == 2
+
+    @patch("bluesky.Client")
+    def test_saved_session_is_resumed(self, mock_atproto_client_class, tmp_path):
+        # 保存済みセッションがあればパスワードログインせずに再開することを確認
+        session_file = tmp_path / "session.json"
+        session_file.write_text(
+            json.dumps({"username": "user", "session": "saved-session-string"}), encoding="utf-8")
+        mock_client_instance = MagicMock()
+        mock_atproto_client_class.return_value = mock_client_instance
+
+        poster = BlueskyPoster("user", "pass", session_path=str(session_file))
+        poster.ensure_login()
+
+        mock_client_instance.login.assert_called_once_with(session_string="saved-session-string")
+
+    @patch("bluesky.Client")
+    def test_saved_session_of_other_user_is_ignored(self, mock_atproto_client_class, tmp_path):
+        session_file = tmp_path / "session.json"
+        session_file.write_text(
+            json.dumps({"username": "someone_else", "session": "other"}), encoding="utf-8")
+        mock_client_instance = MagicMock()
+        mock_atproto_client_class.return_value = mock_client_instance
+
+        poster = BlueskyPoster("user", "pass", session_path=str(session_file))
+        poster.ensure_login()
+
+        mock_client_instance.login.assert_called_once_with("user", "pass")
+
+    @patch("bluesky.Client")
+    def test_session_change_is_persisted(self, mock_atproto_client_class, tmp_path):
+        # セッション更新通知を受けるとファイルに保存されることを確認
+        session_file = tmp_path / "data" / "session.json"
+        poster = BlueskyPoster("user", "pass", session_path=str(session_file))
+        session = MagicMock()
+        session.encode.return_value = "refreshed-session"
+
+        poster._on_session_change("refresh", session)
+
+        saved = json.loads(session_file.read_text(encoding="utf-8"))
+        assert saved == {"username": "user", "session": "refreshed-session"}
+        if os.name != "nt":
+            assert (session_file.stat().st_mode & 0o777) == 0o600
+
+    @patch("bluesky.Client")
+    def test_relogin_on_auth_error(self, mock_atproto_client_class, tmp_path):
+        # 認証エラー時のみパスワードで再ログインして再試行することを確認
+        mock_client_instance = MagicMock()
+        mock_atproto_client_class.return_value = mock_client_instance
+        mock_client_instance.send_post.side_effect = [
+            atproto_exceptions.UnauthorizedError(), "ok"]
+
+        poster = BlueskyPoster("user", "pass", session_path=str(tmp_path / "session.json"))
+        result = poster._call_with_reauth(mock_client_instance.send_post, text="hello")
+
+        assert result == "ok"
+        assert mock_client_instance.login.call_count == 2
+        assert mock_client_instance.send_post.call_count == 2
+
+    @patch("bluesky.Client")
+    def test_non_auth_error_does_not_relogin(self, mock_atproto_client_class, tmp_path):
+        mock_client_instance = MagicMock()
+        mock_atproto_client_class.return_value = mock_client_instance
+        mock_client_instance.send_post.side_effect = atproto_exceptions.NetworkError()
+
+        poster = BlueskyPoster("user", "pass", session_path=str(tmp_path / "session.json"))
+        with pytest.raises(atproto_exceptions.NetworkError):
+            poster._call_with_reauth(mock_client_instance.send_post, text="hello")
+        mock_client_instance.login.assert_called_once_with("user", "pass")
+
+
+class TestTemplateRegistry:
+
+    def test_cached_template_is_reused_without_reading_file(self, tmp_path):
+        # 2回目以降はファイルを開かずにコンパイル済みテンプレートを返すことを確認
+        from bluesky import TemplateRegistry
+        tpl = tmp_path / "tpl.txt"
+        tpl.write_text("{{ title }}", encoding="utf-8")
+        registry = TemplateRegistry(check_interval=0)
+        with patch("bluesky.template_registry", registry):
+            first = load_template(path=str(tpl))
+            with patch("builtins.open", side_effect=AssertionError("should not read")):
+                second = load_template(path=str(tpl))
+        assert first is second
+        assert second.render(title="テスト") == "テスト"
+
+    def test_modified_template_is_recompiled(self, tmp_path):
+        # ファイルが更新されたら（mtime/サイズの変化）再コンパイルされることを確認
+        from bluesky import TemplateRegistry
+        tpl = tmp_path / "tpl.txt"
+        tpl.write_text("old {{ title }}", encoding="utf-8")
+        registry = TemplateRegistry(check_interval=0)
+        with patch("bluesky.template_registry", registry):
+            assert load_template(path=str(tpl)).render(title="x") == "old x"
+            tpl.write_text("new template {{ title }}", encoding="utf-8")
+            assert load_template(path=str(tpl)).render(title="x") == "new template x"
+
+    def test_invalidate_forces_reload(self, tmp_path):
+        # GUIからの変更通知（invalidate）で次回は必ず読み直すことを確認
+        from bluesky import TemplateRegistry, invalidate_template_cache
+        tpl = tmp_path / "tpl.txt"
+        tpl.write_text("{{ title }}", encoding="utf-8")
+        registry = TemplateRegistry(check_interval=3600)
+        with patch("bluesky.template_registry", registry):
+            first = load_template(path=str(tpl))
+            invalidate_template_cache()
+            assert load_template(path=str(tpl)) is not first
+
+    def test_datetimeformat_filter_is_registered_once(self, tmp_path, mock_env):
+        # 共有環境にdatetimeformatフィルタが登録されていることを確認
+        from bluesky import TemplateRegistry
+        tpl = tmp_path / "tpl.txt"
+        tpl.write_text("{{ started_at | datetimeformat }}", encoding="utf-8")
+        registry = TemplateRegistry()
+        with patch("bluesky.template_registry", registry):
+            rendered = load_template(path=str(tpl)).render(started_at="2024-01-01T00:00:00Z")
+        assert "2024" in rendered
+        assert "datetimeformat" in registry.environment.filters
+
+
+class TestBlobCacheUpload:
+
+    @staticmethod
+    def _blob_ref():
+        from atproto_client.models.blob_ref import BlobRef, IpldLink
+        return BlobRef(mime_type="image/png", size=3,
+                       ref=IpldLink(link="bafkreibme22gw2h7y2h7tg2fhqotaqjucnbc24deqo72b6mkl2egezxhvy"))
+
+    @patch("bluesky.Client")
+    def test_same_image_is_uploaded_once(self, mock_atproto_client_class, tmp_path):
+        # 同じ内容の画像はキャッシュしたblob参照を再利用し、upload_blobを1回しか呼ばないことを確認
+        from blob_cache import BlobCache
+        mock_client_instance = MagicMock()
+        mock_atproto_client_class.return_value = mock_client_instance
+        mock_client_instance.upload_blob.return_value = MagicMock(blob=self._blob_ref())
+        image = tmp_path / "image.png"
+        image.write_bytes(b"png")
+
+        cache_path = str(tmp_path / "blob_cache.json")
+        poster = BlueskyPoster("user", "pass", session_path=str(tmp_path / "session.json"),
+                               blob_cache=BlobCache(cache_path))
+        first = poster.upload_image(str(image))
+        second = poster.upload_image(str(image))
+        # 再起動後（新しいPoster）もファイルから再利用できること
+        restarted = BlueskyPoster("user", "pass", session_path=str(tmp_path / "session.json"),
+                                  blob_cache=BlobCache(cache_path))
+        third = restarted.upload_image(str(image))
+
+        assert first == second == third == self._blob_ref()
+        mock_client_instance.upload_blob.assert_called_once_with(b"png")
+
+    @patch("bluesky.Client")
+    def test_rejected_cached_blob_is_reuploaded(self, mock_atproto_client_class, tmp_path):
+        # キャッシュ済みblobが投稿時に拒否された場合、再アップロードして再送することを確認
+        from blob_cache import BlobCache
+        mock_client_instance = MagicMock()
+        mock_atproto_client_class.return_value = mock_client_instance
+        mock_client_instance.upload_blob.return_value = MagicMock(blob=self._blob_ref())
+        rejection = atproto_exceptions.BadRequestError(MagicMock(
+            content=MagicMock(error="InvalidRequest", message="Could not find blob: bafkrei...")))
+        mock_client_instance.send_post.side_effect = [rejection, "ok"]
+        image = tmp_path / "image.png"
+        image.write_bytes(b"png")
+
+        poster = BlueskyPoster("user", "pass", session_path=str(tmp_path / "session.json"),
+                               blob_cache=BlobCache(str(tmp_path / "blob_cache.json")))
+        poster.upload_image(str(image))
+        embed = {"$type": "app.bsky.embed.images",
+                 "images": [{"alt": "alt", "image": poster.upload_image(str(image))}]}
+        result = poster._send_post("text", embed=embed, image_path=str(image))
+
+        assert result == "ok"
+        assert mock_client_instance.upload_blob.call_count == 2
+        assert mock_client_instance.send_post.call_count == 2
+
+    @patch("bluesky.Client")
+    def test_other_bad_request_is_not_retried(self, mock_atproto_client_class, tmp_path):
+        from blob_cache import BlobCache
+        mock_client_instance = MagicMock()
+        mock_atproto_client_class.return_value = mock_client_instance
+        mock_client_instance.send_post.side_effect = atproto_exceptions.BadRequestError(MagicMock(
+            content=MagicMock(error="InvalidRequest", message="Record/text must not be longer")))
+
+        poster = BlueskyPoster("user", "pass", session_path=str(tmp_path / "session.json"),
+                               blob_cache=BlobCache(str(tmp_path / "blob_cache.json")))
+        embed = {"$type": "app.bsky.embed.images", "images": [{"alt": "alt", "image": MagicMock()}]}
+        with pytest.raises(atproto_exceptions.BadRequestError):
+            poster._send_post("text", embed=embed, image_path="image.png")
+        mock_client_instance.upload_blob.assert_not_called()
+
+    @patch("bluesky.Client")
+    def test_render_post_does_not_touch_network(self, mock_atproto_client_class, tmp_path,
+                                                mock_event_context_online):
+        # 送信待ち行列用の本文生成ではログイン・アップロード・投稿を行わないことを確認
+        template = tmp_path / "online.txt"
+        template.write_text("{{ broadcaster_user_name }}: {{ title }}", encoding="utf-8")
+        image = tmp_path / "image.png"
+        image.write_bytes(b"png")
+        poster = BlueskyPoster("user", "pass", session_path=str(tmp_path / "session.json"))
+
+        rendered = poster.render_post("stream.online", mock_event_context_online,
+                                      image_path=str(image), template_path=str(template))
+
+        assert rendered["text"] == "TestStreamer: Live Stream Title"
+        assert rendered["image_path"] == str(image)
+        assert rendered["alt"] == "Live Stream Title"
+        assert rendered["history"]["event_type"] == "online"
+        assert rendered["source"] == mock_event_context_online
+        assert mock_atproto_client_class.return_value.method_calls == [
+            call.on_session_change(ANY)]
+        assert poster.render_post("stream.online", {"title": "x"}, template_path=str(template)) is None
+
+    @patch("bluesky.Client")
+    def test_send_rendered_returns_post_uri(self, mock_atproto_client_class, tmp_path):
+        # 保存済みのblob参照（JSON）から埋め込みを作り直して投稿し、URIを返すことを確認
+        from bluesky import _blob_to_json
+        mock_client_instance = MagicMock()
+        mock_atproto_client_class.return_value = mock_client_instance
+        mock_client_instance.send_post.return_value = MagicMock(uri="at://did:plc:abc/app.bsky.feed.post/1")
+        poster = BlueskyPoster("user", "pass", session_path=str(tmp_path / "session.json"))
+        embed = {"$type": "app.bsky.embed.images",
+                 "images": [{"alt": "alt", "image": _blob_to_json(self._blob_ref())}]}
+
+        uri = poster.send_rendered("text", embed=embed, image_path="image.png")
+
+        assert uri == "at://did:plc:abc/app.bsky.feed.post/1"
+        sent_embed = mock_client_instance.send_post.call_args.kwargs["embed"]
+        assert sent_embed["images"][0]["image"] == self._blob_ref()
+
+        # URIが返らない場合は送信済みにできないため例外にする
+        mock_client_instance.send_post.return_value = MagicMock(uri=None)
+        with pytest.raises(RuntimeError):
+            poster.send_rendered("text")
+
+    @patch("bluesky.Client")
+    def test_xrpc_calls_go_through_rate_limiter(self, mock_atproto_client_class, tmp_path):
+        # createRecordの呼び出しは上限の範囲で送信し、レスポンスのratelimitヘッダーで残数を更新する
+        from rate_limiter import get_rate_limit_levels, reset_rate_limiters
+        reset_rate_limiters()
+        mock_client_instance = MagicMock()
+        mock_atproto_client_class.return_value = mock_client_instance
+        raw_invoke = MagicMock(return_value=MagicMock(
+            headers={"ratelimit-limit": "5000", "ratelimit-remaining": "4997", "ratelimit-policy": "5000;w=3600"}))
+        mock_client_instance._invoke = raw_invoke
+        poster = BlueskyPoster("user", "pass", session_path=str(tmp_path / "session.json"))
+
+        poster.client._invoke("procedure", url="https://bsky.social/xrpc/com.atproto.repo.createRecord")
+        poster.client._invoke("query", url="https://bsky.social/xrpc/app.bsky.actor.getProfile")
+
+        assert raw_invoke.call_count == 2
+        levels = get_rate_limit_levels()
+        assert list(levels) == ["bluesky.createRecord"]
+        assert levels["bluesky.createRecord"]["capacity"] == 5000
+        assert levels["bluesky.createRecord"]["tokens"] == pytest.approx(4997, abs=1)
+        reset_rate_limiters()
+
+    def test_rate_limiter_hooks_into_real_atproto_client(self, tmp_path):
+        # atprotoのClient._invokeに差し込んでいるため、atproto側の内部実装が変わったらここで検出する
+        import inspect
+        from atproto import Client
+        from rate_limiter import DEFAULT_RATE_LIMITS, get_rate_limit_levels, reset_rate_limiters
+        params = list(inspect.signature(Client._invoke).parameters.values())
+        assert [p.name for p in params[:2]] == ["self", "invoke_type"]
+        assert params[-1].kind is inspect.Parameter.VAR_KEYWORD
+
+        reset_rate_limiters()
+        poster = BlueskyPoster("user", "pass", session_path=str(tmp_path / "session.json"))
+        assert isinstance(poster.client, Client)
+        poster.client.request.post = MagicMock(side_effect=RuntimeError("sent"))
+        with pytest.raises(RuntimeError, match="sent"):
+            poster.client.com.atproto.repo.create_record({
+                "repo": "did:plc:abc", "collection": "app.bsky.feed.post",
+                "record": {"$type": "app.bsky.feed.post", "text": "x", "createdAt": "2025-01-01T00:00:00Z"}})
+
+        # 送信前に呼び出し上限のトークンを1つ使っている
+        assert poster.client.request.post.call_args.kwargs["url"].endswith("/com.atproto.repo.createRecord")
+        capacity = DEFAULT_RATE_LIMITS["bluesky.createRecord"][0]
+        assert get_rate_limit_levels()["bluesky.createRecord"]["tokens"] == pytest.approx(capacity - 1, abs=0.5)
+        reset_rate_limiters()
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from unittest.mock import MagicMock
+import time
+from bluesky_outbox import (
+    BlueskyOutbox,
+    OutboxSender,
+    OUTBOX_DONE,
+    OUTBOX_FAILED,
+    OUTBOX_PENDING,
+)
+from retry_policy import RetryPolicy, is_retryable_http_error
+from version_info import __version__
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+
+HISTORY = {"title": "Best Stream Ever", "category": "Just Chatting",
+           "url": "https://twitch.tv/teststreamer", "event_type": "online"}
+
+
+def make_outbox(tmp_path):
+    return BlueskyOutbox(str(tmp_path / "outbox.db"))
+
+
+def fixed_policy(max_attempts=8, base_delay=5, max_delay=600):
+    # ジッターを最大値に固定した再試行ポリシー（待ち時間を決定的にする）
+    return RetryPolicy("test_outbox", max_attempts=max_attempts, base_delay=base_delay,
+                       max_delay=max_delay, classify=is_retryable_http_error, rng=lambda: 1.0)
+
+
+def test_outbox_uses_wal_journal(tmp_path):
+    outbox = make_outbox(tmp_path)
+    mode = outbox._conn.execute("PRAGMA journal_mode").fetchone()[0]
+    assert mode.lower() == "wal"
+    outbox.close()
+
+
+def test_pending_rows_survive_restart(tmp_path):
+    outbox = make_outbox(tmp_path)
+    outbox.enqueue("stream.online", "配信開始", source={"title": "Best Stream Ever"}, history=HISTORY)
+    second = outbox.enqueue("stream.offline", "配信終了")
+    # 送信中のまま（URIが返る前に）プロセスが落ちた状態を再現する
+    assert [e["kind"] for e in outbox.claim_due(limit=1)] == ["stream.online"]
+    outbox.close()
+
+    reopened = make_outbox(tmp_path)
+    assert reopened.depth() == 2
+    assert reopened.recover_in_flight() == 1
+    entries = reopened.claim_due()
+    assert [e["kind"] for e in entries] == ["stream.online", "stream.offline"]
+    assert entries[0]["source"] == {"title": "Best Stream Ever"}
+    assert entries[0]["history"] == HISTORY
+    assert entries[1]["id"] == second
+    reopened.close()
+
+
+def test_row_is_done_only_after_uri_is_returned(tmp_path):
+    outbox = make_outbox(tmp_path)
+    entry_id = outbox.enqueue("stream.online", "配信開始", history=HISTORY, now=1000.0)
+    poster = MagicMock()
+    poster.send_rendered.side_effect = [RuntimeError("network down"), "at://did:plc:abc/app.bsky.feed.post/1"]
+    sender = OutboxSender(outbox, lambda: poster, retry_policy=fixed_policy(base_delay=5, max_delay=60))
+
+    assert sender.run_once(now=1000.0) == 1
+    stats = outbox.stats()
+    assert stats[OUTBOX_PENDING] == 1 and stats[OUTBOX_DONE] == 0
+    # 再送時刻までは送信しない
+    assert sender.run_once(now=1004.0) == 0
+    poster._write_post_history.assert_not_called()
+
+    assert sender.run_once(now=1005.0) == 1
+    row = outbox._conn.execute("SELECT status, post_uri, attempts FROM outbox WHERE id = ?",
+                               (entry_id,)).fetchone()
+    assert (row["status"], row["post_uri"], row["attempts"]) == (
+        OUTBOX_DONE, "at://did:plc:abc/app.bsky.feed.post/1", 2)
+    assert outbox.depth() == 0
+    poster._write_post_history.assert_called_once_with(success=True, **HISTORY)
+    outbox.close()
+
+
+def test_backoff_doubles_and_gives_up_after_max_attempts(tmp_path):
+    outbox = make_outbox(tmp_path)
+    outbox.enqueue("stream.online", "配信開始", history=HISTORY, now=0.0)
+    poster = MagicMock()
+    poster.send_rendered.side_effect = RuntimeError("unavailable")
+    sender = OutboxSender(outbox, lambda: poster, max_attempts=3,
+                          retry_policy=fixed_policy(max_attempts=3, base_delay=2, max_delay=3))
+    assert [sender.retry_policy.backoff(n) for n in (1, 2, 3)] == [2, 3, 3]
+
+    sender.run_once(now=0.0)
+    assert outbox.next_due_at() == 2.0
+    sender.run_once(now=2.0)
+    assert outbox.next_due_at() == 5.0
+    sender.run_once(now=5.0)
+    assert outbox.stats()[OUTBOX_FAILED] == 1
+    assert outbox.next_due_at() is None
+    assert sender.failed_count == 1
+    poster._write_post_history.assert_called_once_with(success=False, **HISTORY)
+    outbox.close()
+
+
+def test_uploaded_embed_is_reused_on_retry(tmp_path):
+    outbox = make_outbox(tmp_path)
+    image = tmp_path / "image.png"
+    image.write_bytes(b"png")
+    outbox.enqueue("stream.online", "配信開始", image_path=str(image), alt="Best Stream Ever", now=0.0)
+    embed = {"$type": "app.bsky.embed.images",
+             "images": [{"alt": "Best Stream Ever", "image": {"$type": "blob", "size": 3}}]}
+    poster = MagicMock()
+    poster.build_image_embed.return_value = embed
+    poster.send_rendered.side_effect = [RuntimeError("timeout"), "at://uri"]
+    sender = OutboxSender(outbox, lambda: poster, retry_policy=fixed_policy(base_delay=1))
+
+    sender.run_once(now=0.0)
+    sender.run_once(now=1.0)
+    # 画像のアップロードは最初の1回だけで、再送時は記録したblob参照を使う
+    poster.build_image_embed.assert_called_once_with(str(image), "Best Stream Ever")
+    assert poster.send_rendered.call_args.kwargs["embed"] == embed
+    outbox.close()
+
+
+def test_sender_thread_resumes_pending_rows_on_start(tmp_path):
+    outbox = make_outbox(tmp_path)
+    outbox.enqueue("stream.offline", "配信終了")
+    outbox.claim_due()
+    poster = MagicMock()
+    poster.send_rendered.return_value = "at://uri"
+    sender = OutboxSender(outbox, lambda: poster, poll_interval=0.05)
+    sender.start()
+    try:
+        for _ in range(100):
+            if outbox.depth() == 0:
+                break
+            sender.wake()
+            time.sleep(0.02)
+    finally:
+        sender.stop()
+    assert outbox.depth() == 0
+    assert sender.sent_count == 1
+    outbox.close()
+
+
+def test_fatal_error_is_not_retried(tmp_path):
+    # 400（入力の誤り）は再送しても成功しないため、試行回数に関係なく失敗扱いにする
+    outbox = make_outbox(tmp_path)
+    outbox.enqueue("stream.online", "配信開始", history=HISTORY, now=0.0)
+    error = RuntimeError("bad request")
+    error.response = MagicMock(status_code=400, headers={})
+    poster = MagicMock()
+    poster.send_rendered.side_effect = error
+    sender = OutboxSender(outbox, lambda: poster, retry_policy=fixed_policy())
+
+    sender.run_once(now=0.0)
+
+    assert outbox.stats()[OUTBOX_FAILED] == 1
+    assert poster.send_rendered.call_count == 1
+    poster._write_post_history.assert_called_once_with(success=False, **HISTORY)
+    outbox.close()
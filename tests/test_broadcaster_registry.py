@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+import json
+from broadcaster_registry import (
+    BroadcasterConfig,
+    BroadcasterRegistry,
+    build_broadcaster_registry,
+    load_broadcaster_entries,
+)
+from version_info import __version__
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+
+def test_empty_registry_returns_default_for_any_broadcaster():
+    default = BroadcasterConfig(notify_online=True, image_path="images/noimage.png")
+    registry = BroadcasterRegistry(default)
+    assert registry.lookup("12345") is default
+    assert registry.broadcaster_ids() == []
+
+
+def test_registry_resolves_logins_in_one_batch_and_inherits_defaults(tmp_path):
+    path = tmp_path / "broadcasters.json"
+    path.write_text(json.dumps({"broadcasters": [
+        {"login": "Alice", "online_template": "templates/alice.txt", "notify_offline": True},
+        {"login": "bob", "notify_online": False},
+        {"id": "300", "image_path": "images/carol.png"},
+        {"login": "ghost"},
+    ]}), encoding="utf-8")
+    calls = []
+
+    def resolve_ids(logins):
+        calls.append(list(logins))
+        return {"alice": "100", "bob": "200"}
+
+    default = BroadcasterConfig(broadcaster_id="1", notify_online=True, notify_offline=False,
+                                image_path="images/noimage.png")
+    registry = build_broadcaster_registry(default, load_broadcaster_entries(str(path)), resolve_ids)
+
+    assert calls == [["Alice", "bob", "ghost"]]
+    assert sorted(registry.broadcaster_ids()) == ["1", "100", "200", "300"]
+    alice = registry.lookup("100")
+    assert alice.online_template_path == "templates/alice.txt"
+    assert alice.notify_offline is True and alice.image_path == "images/noimage.png"
+    assert registry.lookup("200").notify_online is False
+    assert registry.lookup("300").image_path == "images/carol.png"
+    # 登録外の配信者は対象外
+    assert registry.lookup("999") is None
+
+    # 既定設定だけ差し替えても、配信者ごとの上書きは保たれる
+    reloaded = registry.with_defaults(BroadcasterConfig(broadcaster_id="1", notify_online=False))
+    assert reloaded.lookup("1").notify_online is False
+    assert reloaded.lookup("200").notify_online is False
+    assert reloaded.lookup("100").online_template_path == "templates/alice.txt"
+    assert reloaded.lookup("100").notify_online is False
+
+
+def test_lookup_scales_to_hundreds_of_broadcasters():
+    entries = [{"id": str(10000 + i), "image_path": f"images/{i}.png"} for i in range(500)]
+    registry = build_broadcaster_registry(BroadcasterConfig(), entries, lambda logins: {})
+    assert len(registry) == 500
+    assert registry.lookup("10499").image_path == "images/499.png"
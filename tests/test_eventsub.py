@@ -5,7 +5,16 @@ Stream notify on Bluesky
 このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
 """
 
-from eventsub import verify_signature
+import datetime
+import hashlib
+import hmac
+import threading
+import time
+from unittest.mock import MagicMock
+import pytest
+import requests
+import eventsub
+from eventsub import verify_signature, prepare_webhook_secret
 from version_info import __version__
 
 __author__ = "mayuneco(mayunya)"
@@ -63,3 +72,217 @@ def test_verify_signature_invalid_timestamp():
     }
     req = DummyRequest(headers=headers, body="{}")
     assert not verify_signature(req)
+
+
+def _signed_request(secret, body, message_id="msg-1"):
+    # 正しい署名を付与したダミーリクエストを作成
+    timestamp = datetime.datetime.now(datetime.timezone.utc).strftime(
+        "%Y-%m-%dT%H:%M:%S.123456789Z")
+    digest = hmac.new(secret.encode("utf-8"),
+                      (message_id + timestamp + body).encode("utf-8"),
+                      hashlib.sha256).hexdigest()
+    headers = {
+        "Twitch-Eventsub-Message-Id": message_id,
+        "Twitch-Eventsub-Message-Timestamp": timestamp,
+        "Twitch-Eventsub-Message-Signature": f"sha256={digest}",
+    }
+    return DummyRequest(headers=headers, body=body)
+
+
+def test_verify_signature_valid_with_prepared_secret():
+    # 事前作成したHMACで、マルチバイト文字を含む本文の署名を検証できることを確認
+    secret = "prepared-secret"
+    prepare_webhook_secret(secret)
+    try:
+        req = _signed_request(secret, '{"title": "テスト配信"}')
+        assert verify_signature(req)
+        # 同じHMACオブジェクトを繰り返し使っても結果が変わらないこと
+        assert verify_signature(req)
+    finally:
+        prepare_webhook_secret(None)
+
+
+def test_verify_signature_tampered_body():
+    # 本文が改ざんされている場合はFalseを返すことを確認
+    secret = "prepared-secret"
+    prepare_webhook_secret(secret)
+    try:
+        req = _signed_request(secret, '{"a": 1}')
+        req.body = '{"a": 2}'
+        assert not verify_signature(req)
+    finally:
+        prepare_webhook_secret(None)
+
+
+def test_verify_signature_secret_rotation():
+    # シークレット変更後は新しいシークレットで検証されることを確認
+    prepare_webhook_secret("old-secret")
+    try:
+        prepare_webhook_secret("new-secret")
+        assert verify_signature(_signed_request("new-secret", "{}"))
+        assert not verify_signature(_signed_request("old-secret", "{}"))
+    finally:
+        prepare_webhook_secret(None)
+
+
+class _FakeHelix:
+    # EventSubサブスクリプションAPIのダミー（ページングあり）
+    def __init__(self, subscriptions, page_size=2, fail_create_types=(), delete_delay=0.0):
+        self.subscriptions = list(subscriptions)
+        self.page_size = page_size
+        self.fail_create_types = fail_create_types
+        self.delete_delay = delete_delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def _response(self, status, body=None):
+        resp = MagicMock()
+        resp.status_code = status
+        resp.json.return_value = body or {}
+        if status >= 400:
+            resp.raise_for_status.side_effect = requests.exceptions.HTTPError(response=resp)
+        return resp
+
+    def get(self, path, token=None, params=None):
+        with self.lock:
+            self.calls.append(("GET", params))
+        start = int((params or {}).get("after") or 0)
+        page = self.subscriptions[start:start + self.page_size]
+        body = {"data": page, "pagination": {}}
+        if start + self.page_size < len(self.subscriptions):
+            body["pagination"]["cursor"] = str(start + self.page_size)
+        return self._response(200, body)
+
+    def post(self, path, token=None, json=None):
+        with self.lock:
+            self.calls.append(("POST", json["type"]))
+        if json["type"] in self.fail_create_types:
+            return self._response(400, {"message": "bad"})
+        return self._response(202, {"data": [{"id": f"new-{json['type']}", "status": "enabled"}]})
+
+    def delete(self, path, token=None, params=None):
+        time.sleep(self.delete_delay)
+        with self.lock:
+            self.calls.append(("DELETE", params["id"]))
+        return self._response(204)
+
+
+def _sub(sub_id, sub_type, callback, status="enabled", broadcaster_id="123"):
+    return {"id": sub_id, "type": sub_type, "status": status,
+            "condition": {"broadcaster_user_id": broadcaster_id},
+            "transport": {"method": "webhook", "callback": callback}}
+
+
+@pytest.fixture
+def fake_helix(monkeypatch):
+    def install(subscriptions, **kwargs):
+        helix = _FakeHelix(subscriptions, **kwargs)
+        monkeypatch.setattr(eventsub, "get_twitch_api_client", lambda: helix)
+        monkeypatch.setattr(eventsub, "get_valid_app_access_token", lambda logger_to_use=None: "token")
+        return helix
+    return install
+
+
+CALLBACK = "https://example.com/webhook"
+
+
+def test_reconcile_lists_once_and_applies_minimal_diff(fake_helix):
+    helix = fake_helix([
+        _sub("keep-online", "stream.online", CALLBACK),
+        _sub("dup-online", "stream.online", CALLBACK),
+        _sub("old-callback", "stream.offline", "https://old.example.com/webhook"),
+        _sub("failed", "stream.offline", CALLBACK, status="webhook_callback_verification_failed"),
+        _sub("other-broadcaster", "stream.online", CALLBACK, broadcaster_id="999"),
+    ])
+    desired = eventsub.desired_eventsub_subscriptions(
+        ["stream.online", "stream.offline"], CALLBACK, broadcaster_id="123")
+    report = eventsub.reconcile_eventsub_subscriptions(desired)
+
+    assert report["success"] is True
+    assert report["listed"] == 5
+    assert [k["id"] for k in report["kept"]] == ["keep-online"]
+    assert [c["type"] for c in report["created"]] == ["stream.offline"]
+    assert sorted(d["id"] for d in report["deleted"]) == [
+        "dup-online", "failed", "old-callback", "other-broadcaster"]
+    # 一覧取得はページ数分（5件/2件ずつ＝3回）のみで、イベントタイプごとに再取得しない
+    assert [c for c in helix.calls if c[0] == "GET"] == [
+        ("GET", None), ("GET", {"after": "2"}), ("GET", {"after": "4"})]
+    assert len([c for c in helix.calls if c[0] == "POST"]) == 1
+
+
+def test_reconcile_nothing_to_do(fake_helix):
+    helix = fake_helix([_sub("a", "stream.online", CALLBACK), _sub("b", "stream.offline", CALLBACK)])
+    report = eventsub.reconcile_eventsub_subscriptions(
+        eventsub.desired_eventsub_subscriptions(["stream.online", "stream.offline"], CALLBACK, "123"))
+    assert report["success"] is True
+    assert report["created"] == [] and report["deleted"] == []
+    assert helix.calls == [("GET", None)]
+
+
+def test_reconcile_reports_create_failure(fake_helix):
+    fake_helix([], fail_create_types=("stream.offline",))
+    report = eventsub.reconcile_eventsub_subscriptions(
+        eventsub.desired_eventsub_subscriptions(["stream.online", "stream.offline"], CALLBACK, "123"))
+    assert report["success"] is False
+    assert [c["type"] for c in report["created"]] == ["stream.online"]
+    assert report["errors"][0]["action"] == "create"
+    assert report["errors"][0]["type"] == "stream.offline"
+
+
+def test_reconcile_deletes_stale_subscription_before_recreating_it(fake_helix):
+    # 同じtype/conditionの古いサブスクリプションの削除が終わってから作成する（409回避）
+    helix = fake_helix([_sub("old-callback", "stream.offline", "https://old.example.com/webhook")],
+                       delete_delay=0.2)
+    report = eventsub.reconcile_eventsub_subscriptions(
+        eventsub.desired_eventsub_subscriptions(["stream.offline"], CALLBACK, "123"))
+    assert report["success"] is True
+    assert helix.calls[1:] == [("DELETE", "old-callback"), ("POST", "stream.offline")]
+
+
+def test_helix_request_refetches_token_once_on_401(monkeypatch):
+    # 401ならトークンを破棄して取り直し、一度だけ再送する
+    manager = MagicMock()
+    tokens = iter(["revoked", "fresh"])
+    monkeypatch.setattr(eventsub, "get_app_token_manager", lambda: manager)
+    monkeypatch.setattr(eventsub, "get_valid_app_access_token", lambda logger_to_use=None: next(tokens))
+    helix = _FakeHelix([])
+    sent = []
+
+    def get(path, token=None, params=None):
+        sent.append(token)
+        return helix._response(401 if token == "revoked" else 200, {"data": []})
+    helix.get = get
+    monkeypatch.setattr(eventsub, "get_twitch_api_client", lambda: helix)
+
+    assert eventsub.list_eventsub_subscriptions() == []
+    assert sent == ["revoked", "fresh"]
+    manager.invalidate.assert_called_once_with("revoked")
+
+
+def test_setup_broadcaster_id_uses_cache_and_saves_converted_id(tmp_path, monkeypatch):
+    # 2回目の起動ではキャッシュから変換し、Helix /users を呼ばない
+    from twitch_user_resolver import TwitchUserResolver, UserIdCache
+    env_file = tmp_path / "settings.env"
+    env_file.write_text("TWITCH_BROADCASTER_ID=SomeUser\nTWITCH_BROADCASTER_ID_CONVERTED=\n", encoding="utf-8")
+    fetch = MagicMock(return_value=[{"id": "4242", "login": "someuser"}])
+    cache_path = str(tmp_path / "user_ids.json")
+    monkeypatch.setattr(eventsub, "env_path", env_file)
+    monkeypatch.delenv("TWITCH_BROADCASTER_ID_CONVERTED", raising=False)
+    monkeypatch.setenv("TWITCH_BROADCASTER_ID", "SomeUser")
+
+    for _ in range(2):
+        monkeypatch.setattr(eventsub, "TWITCH_BROADCASTER_ID", "SomeUser")
+        monkeypatch.setattr(eventsub, "_twitch_user_resolver",
+                            TwitchUserResolver(fetch, UserIdCache(cache_path)))
+        eventsub.setup_broadcaster_id()
+        assert eventsub.TWITCH_BROADCASTER_ID == "4242"
+
+    fetch.assert_called_once_with(["someuser"])
+    assert "TWITCH_BROADCASTER_ID_CONVERTED=4242\n" in env_file.read_text(encoding="utf-8")
+
+
+def test_desired_subscriptions_cover_every_broadcaster():
+    desired = eventsub.desired_eventsub_subscriptions(
+        ["stream.online", "stream.offline"], CALLBACK, broadcaster_ids=["1", "2", "3"])
+    assert len(desired) == 6
+    assert {d["condition"]["broadcaster_user_id"] for d in desired} == {"1", "2", "3"}
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+import json
+import threading
+import time
+import pytest
+from websockets.sync.server import serve
+import eventsub_websocket
+from eventsub_websocket import EventSubWebSocketClient
+from version_info import __version__
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+
+def welcome_message(session_id, keepalive=10):
+    return {"metadata": {"message_id": f"welcome-{session_id}", "message_type": "session_welcome"},
+            "payload": {"session": {"id": session_id, "status": "connected",
+                                    "keepalive_timeout_seconds": keepalive, "reconnect_url": None}}}
+
+
+def notification_message(message_id, sub_type="stream.online", login="testuser"):
+    return {"metadata": {"message_id": message_id, "message_type": "notification",
+                         "subscription_type": sub_type},
+            "payload": {"subscription": {"type": sub_type},
+                        "event": {"broadcaster_user_login": login}}}
+
+
+def reconnect_message(session_id, reconnect_url):
+    return {"metadata": {"message_id": f"reconnect-{session_id}", "message_type": "session_reconnect"},
+            "payload": {"session": {"id": session_id, "status": "reconnecting",
+                                    "reconnect_url": reconnect_url}}}
+
+
+class StandInEventSubServer:
+    """
+    Twitch EventSub WebSocketの代わりに使うローカルサーバー。
+    接続先のパスごとにscripts[path](ws, server)で送信内容を組み立てる
+    """
+
+    def __init__(self):
+        self.scripts = {}
+        self.connections = []
+        self._server = serve(self._handler, "127.0.0.1", 0)
+        self.port = self._server.socket.getsockname()[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    def url(self, path="/ws"):
+        return f"ws://127.0.0.1:{self.port}{path}"
+
+    def _handler(self, ws):
+        path = ws.request.path
+        self.connections.append(path)
+        script = self.scripts.get(path)
+        if script:
+            script(ws, self)
+        # クライアントが切断するまで接続を保持する
+        try:
+            for _ in ws:
+                pass
+        except Exception:
+            pass
+
+    @staticmethod
+    def send(ws, message):
+        ws.send(json.dumps(message))
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+
+
+@pytest.fixture
+def ws_server():
+    server = StandInEventSubServer().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def fast_timeouts(monkeypatch):
+    monkeypatch.setattr(eventsub_websocket, "KEEPALIVE_GRACE_SECONDS", 0.2)
+    monkeypatch.setattr(eventsub_websocket, "RECONNECT_DELAY_SECONDS", 0.05)
+
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+class _Recorder:
+    def __init__(self):
+        self.sessions = []
+        self.notifications = []
+
+    def on_welcome(self, session_id):
+        self.sessions.append(session_id)
+
+    def on_notification(self, metadata, payload):
+        self.notifications.append(metadata["message_id"])
+
+
+def test_welcome_subscribes_and_dispatches_notifications(ws_server, fast_timeouts):
+    def script(ws, server):
+        server.send(ws, welcome_message("session-1"))
+        time.sleep(0.1)
+        server.send(ws, {"metadata": {"message_id": "k1", "message_type": "session_keepalive"}, "payload": {}})
+        server.send(ws, notification_message("n1"))
+
+    ws_server.scripts["/ws"] = script
+    rec = _Recorder()
+    client = EventSubWebSocketClient(rec.on_notification, rec.on_welcome, url=ws_server.url())
+    client.start()
+    try:
+        assert _wait_until(lambda: rec.notifications == ["n1"])
+        assert rec.sessions == ["session-1"]
+        assert client.session_id == "session-1"
+        assert client.connected.is_set()
+    finally:
+        client.stop()
+        client.join(timeout=5)
+
+
+def test_keepalive_timeout_reconnects_with_new_session(ws_server, fast_timeouts):
+    count = {"n": 0}
+
+    def script(ws, server):
+        # keepalive 1秒と通知しておきながら何も送らない
+        count["n"] += 1
+        server.send(ws, welcome_message(f"session-{count['n']}", keepalive=1))
+
+    ws_server.scripts["/ws"] = script
+    rec = _Recorder()
+    client = EventSubWebSocketClient(rec.on_notification, rec.on_welcome, url=ws_server.url())
+    client.start()
+    try:
+        # 新しいセッションではサブスクリプションを作り直す
+        assert _wait_until(lambda: len(rec.sessions) >= 2)
+        assert rec.sessions[:2] == ["session-1", "session-2"]
+    finally:
+        client.stop()
+        client.join(timeout=5)
+
+
+def test_session_reconnect_hands_over_without_dropping_events(ws_server, fast_timeouts):
+    handover_done = threading.Event()
+
+    def old_connection(ws, server):
+        server.send(ws, welcome_message("session-old"))
+        time.sleep(0.1)
+        server.send(ws, reconnect_message("session-old", server.url("/reconnect")))
+        # 切り替え中に旧接続へ届いた通知も処理されること
+        server.send(ws, notification_message("during-handover"))
+
+    def new_connection(ws, server):
+        time.sleep(0.1)
+        server.send(ws, welcome_message("session-new"))
+        handover_done.wait(2)
+        server.send(ws, notification_message("after-handover"))
+
+    ws_server.scripts["/ws"] = old_connection
+    ws_server.scripts["/reconnect"] = new_connection
+    rec = _Recorder()
+    client = EventSubWebSocketClient(rec.on_notification, rec.on_welcome, url=ws_server.url())
+    client.start()
+    try:
+        assert _wait_until(lambda: client.session_id == "session-new")
+        handover_done.set()
+        assert _wait_until(lambda: "after-handover" in rec.notifications)
+        assert rec.notifications == ["during-handover", "after-handover"]
+        # 再接続ではサブスクリプションが引き継がれるため、作り直さない
+        assert rec.sessions == ["session-old"]
+        assert ws_server.connections == ["/ws", "/reconnect"]
+    finally:
+        client.stop()
+        client.join(timeout=5)
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+import io
+import os
+from unittest.mock import patch
+from PIL import Image
+from image_preprocessor import ImagePreprocessor
+from version_info import __version__
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+
+def _write_image(path, size, mode="RGB", fmt="PNG", noise=False):
+    if noise:
+        img = Image.frombytes(mode, size, os.urandom(size[0] * size[1] * len(mode)))
+    else:
+        img = Image.new(mode, size, (200, 100, 50, 255)[:len(mode)])
+    img.save(path, format=fmt)
+    return path
+
+
+def test_small_image_is_passed_through(tmp_path):
+    # 上限内の画像は再エンコードせずにそのまま使う
+    src = _write_image(tmp_path / "small.png", (320, 180))
+    pre = ImagePreprocessor(max_dimension=2000, cache_dir=str(tmp_path / "cache"))
+    data, mime = pre.prepare(str(src))
+    assert data == src.read_bytes()
+    assert mime == "image/png"
+    assert not (tmp_path / "cache").exists()
+
+
+def test_large_image_is_resized_keeping_aspect_ratio(tmp_path):
+    src = _write_image(tmp_path / "large.png", (4000, 2000))
+    pre = ImagePreprocessor(max_dimension=1000, cache_dir=str(tmp_path / "cache"))
+    data, mime = pre.prepare(str(src))
+    assert mime == "image/jpeg"
+    with Image.open(io.BytesIO(data)) as out:
+        assert out.size == (1000, 500)
+        assert out.format == "JPEG"
+
+
+def test_oversized_bytes_are_reencoded_under_limit(tmp_path):
+    # ノイズ画像（圧縮しにくい）でもバイト上限内に収める
+    src = _write_image(tmp_path / "noise.png", (1200, 800), noise=True)
+    pre = ImagePreprocessor(max_dimension=2000, max_bytes=200 * 1024,
+                            output_format="WEBP", cache_dir=str(tmp_path / "cache"))
+    data, mime = pre.prepare(str(src))
+    assert mime == "image/webp"
+    assert len(data) <= 200 * 1024
+    with Image.open(io.BytesIO(data)) as out:
+        assert abs(out.size[0] / out.size[1] - 1.5) < 0.01
+
+
+def test_transparent_image_is_flattened_for_jpeg(tmp_path):
+    src = _write_image(tmp_path / "alpha.png", (3000, 3000), mode="RGBA")
+    pre = ImagePreprocessor(max_dimension=500, cache_dir=str(tmp_path / "cache"))
+    data, _ = pre.prepare(str(src))
+    with Image.open(io.BytesIO(data)) as out:
+        assert out.mode == "RGB"
+
+
+def test_processed_image_is_cached_by_mtime(tmp_path):
+    # 元画像が変わらなければ処理済みファイルを再利用し、変われば作り直す
+    src = _write_image(tmp_path / "large.png", (3000, 1500))
+    cache_dir = str(tmp_path / "cache")
+    first, _ = ImagePreprocessor(max_dimension=600, cache_dir=cache_dir).prepare(str(src))
+
+    restarted = ImagePreprocessor(max_dimension=600, cache_dir=cache_dir)
+    with patch.object(ImagePreprocessor, "_encode", side_effect=AssertionError("should not encode")):
+        assert restarted.prepare(str(src))[0] == first
+
+    _write_image(src, (1500, 3000))
+    os.utime(src, ns=(os.stat(src).st_atime_ns, os.stat(src).st_mtime_ns + 10**9))
+    with Image.open(io.BytesIO(restarted.prepare(str(src))[0])) as out:
+        assert out.size == (300, 600)
+
+
+def test_cache_is_not_reused_after_settings_change(tmp_path):
+    # 変換設定が変わったら、同じ元画像でも以前の処理済みファイルを返さない
+    src = _write_image(tmp_path / "large.png", (3000, 1500))
+    cache_dir = str(tmp_path / "cache")
+    data, mime = ImagePreprocessor(max_dimension=600, cache_dir=cache_dir).prepare(str(src))
+    assert mime == "image/jpeg"
+
+    data, mime = ImagePreprocessor(max_dimension=400, output_format="WEBP", cache_dir=cache_dir).prepare(str(src))
+    assert mime == "image/webp"
+    with Image.open(io.BytesIO(data)) as out:
+        assert out.format == "WEBP" and out.size == (400, 200)
+
+
+def test_undecodable_file_falls_back_to_raw_bytes(tmp_path):
+    src = tmp_path / "broken.png"
+    src.write_bytes(b"not an image")
+    pre = ImagePreprocessor(cache_dir=str(tmp_path / "cache"))
+    assert pre.prepare(str(src)) == (b"not an image", None)
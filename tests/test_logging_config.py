@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+import logging
+import queue
+import threading
+import pytest
+import logging_config
+from logging_config import BoundedQueueHandler, configure_logging, get_log_queue_stats, stop_log_listener
+from version_info import __version__
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+
+@pytest.fixture
+def configured(tmp_path, monkeypatch):
+    # logs/は一時ディレクトリに作る
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("LOG_LEVEL", "INFO")
+    monkeypatch.setenv("DISCORD_NOTIFICATION_ENABLED", "false")
+    yield configure_logging()
+    stop_log_listener(close_handlers=True)
+
+
+def read(path):
+    with open(path, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_loggers_only_enqueue_and_listener_routes_records(configured, tmp_path):
+    logger, handlers, audit_logger, tunnel_logger = configured
+    # ロガーに付いているのは待ち行列に積むハンドラだけ（pytestのログ取得用ハンドラは除く）
+    for target in (logger, audit_logger, tunnel_logger):
+        own = [h for h in target.handlers if type(h).__module__ != "_pytest.logging"]
+        assert [type(h) for h in own] == [BoundedQueueHandler]
+    assert all(not isinstance(h, BoundedQueueHandler) for h in handlers)
+
+    logger.info("app message")
+    logger.error("error message")
+    audit_logger.info("audit message")
+    tunnel_logger.info("tunnel message")
+    stop_log_listener()
+
+    app_log = read(tmp_path / "logs" / "app.log")
+    assert "app message" in app_log and "error message" in app_log
+    assert "Discord通知はオフになっています。" in app_log
+    assert "audit message" not in app_log
+    error_log = read(tmp_path / "logs" / "error.log")
+    assert "error message" in error_log and "app message" not in error_log
+    assert "[AUDIT] audit message" in read(tmp_path / "logs" / "audit.log")
+    assert "tunnel message" in read(tmp_path / "logs" / "tunnel.log")
+    assert not any(isinstance(h, BoundedQueueHandler) for h in logger.handlers)
+
+
+def test_slow_handler_does_not_block_logging_call(configured):
+    logger = configured[0]
+    release = threading.Event()
+
+    class SlowHandler(logging.Handler):
+        def emit(self, record):
+            release.wait(5)
+
+    slow = SlowHandler()
+    logging_config._routes["app"].append(slow)
+    try:
+        logger.info("first")
+        logger.info("second")
+        # 出力先が止まっていてもログ出力は待ち行列に積むだけで戻る
+        assert get_log_queue_stats()["queued"] >= 1
+    finally:
+        release.set()
+
+
+def test_full_queue_drops_and_reports():
+    log_queue = queue.Queue(maxsize=2)
+    handler = BoundedQueueHandler(log_queue, "app")
+    logger = logging.getLogger("test_logging_config.drop")
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        for i in range(5):
+            logger.warning(f"message {i}")
+        assert handler.dropped == 3
+        assert [log_queue.get_nowait().getMessage() for _ in range(2)] == ["message 0", "message 1"]
+
+        # 空きができたら、破棄した件数を警告として積む
+        logger.warning("after")
+        messages = [log_queue.get_nowait().getMessage() for _ in range(2)]
+        assert messages == ["after", "ログの待ち行列が満杯のため、3件のログを破棄しました。"]
+    finally:
+        logger.removeHandler(handler)
+
+
+def test_stop_with_full_queue_flushes_everything(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("LOG_QUEUE_MAXSIZE", "3")
+    logger = configure_logging()[0]
+    try:
+        for i in range(20):
+            logger.info(f"line {i}")
+        stats = get_log_queue_stats()
+    finally:
+        stop_log_listener(close_handlers=True)
+    # 停止時に待ち行列の残りをすべて書き出し、書けなかった分は破棄件数として数えられている
+    written = read(tmp_path / "logs" / "app.log").count("line ")
+    assert stats["maxsize"] == 3
+    assert 20 <= written + stats["dropped"] <= 21
@@ -6,7 +6,11 @@ Stream notify on Bluesky
 """
 
 from main import app
+from app_settings import reset_settings
+from broadcaster_registry import (
+    BroadcasterConfig, BroadcasterRegistry, reset_broadcaster_registry, set_broadcaster_registry)
 import os
+import threading
 import pytest
 from unittest.mock import patch, MagicMock
 from version_info import __version__
@@ -52,6 +56,21 @@ def default_env_vars(monkeypatch):
                        os.getenv("LOG_RETENTION_DAYS", "1"))
 
 
+@pytest.fixture(autouse=True)
+def reset_message_id_cache():
+    # テスト間で同じMessage-Idを使うため、重複検出キャッシュと共有BlueskyPoster・配信者の索引・設定を毎回リセットする
+    import main
+    main.eventsub_message_cache.clear()
+    main.reset_bluesky_poster()
+    reset_broadcaster_registry()
+    reset_settings()
+    yield
+    main.eventsub_message_cache.clear()
+    main.reset_bluesky_poster()
+    reset_settings()
+    reset_broadcaster_registry()
+
+
 @pytest.fixture
 def client():
     # Flaskアプリをテスト用に設定
@@ -228,6 +247,50 @@ class TestWebhookHandler:
             image_path=os.getenv("BLUESKY_IMAGE_PATH")
         )
 
+    @patch("main.BlueskyPoster")
+    def test_webhook_stream_online_is_recorded_in_outbox(
+            self, mock_bluesky_poster_class, client, monkeypatch, tmp_path):
+        # 送信待ち行列が有効な場合は、投稿せずに記録だけして202を返すことを確認
+        from bluesky_outbox import BlueskyOutbox
+        monkeypatch.setattr("main.verify_signature", lambda req: True)
+        monkeypatch.setenv("BLUESKY_OUTBOX_ENABLED", "True")
+        outbox = BlueskyOutbox(str(tmp_path / "outbox.db"))
+        monkeypatch.setattr("main.bluesky_outbox", outbox)
+        mock_poster_instance = MagicMock()
+        mock_poster_instance.render_post.return_value = {
+            "kind": "stream.online", "text": "配信開始", "image_path": None, "alt": "Best Stream Ever",
+            "source": {}, "history": {"title": "Best Stream Ever", "category": "Science & Technology",
+                                      "url": "https://twitch.tv/teststreamer", "event_type": "online"}}
+        mock_bluesky_poster_class.return_value = mock_poster_instance
+
+        response = client.post(
+            "/webhook", headers=self.COMMON_HEADERS, json=self.STREAM_ONLINE_PAYLOAD)
+
+        assert response.status_code == 202
+        assert response.get_json() == {"status": "accepted"}
+        mock_poster_instance.post_stream_online.assert_not_called()
+        assert mock_poster_instance.render_post.call_args.args[0] == "stream.online"
+        assert outbox.depth() == 1
+        assert outbox.claim_due()[0]["text"] == "配信開始"
+        outbox.close()
+
+    @patch("main.BlueskyPoster")
+    def test_webhook_posts_directly_when_outbox_not_started(
+            self, mock_bluesky_poster_class, client, monkeypatch):
+        # 起動後にBLUESKY_OUTBOX_ENABLEDだけ有効にしても、送信待ち行列がなければ直接投稿する
+        monkeypatch.setattr("main.verify_signature", lambda req: True)
+        monkeypatch.setenv("BLUESKY_OUTBOX_ENABLED", "True")
+        monkeypatch.setattr("main.bluesky_outbox", None)
+        mock_poster_instance = MagicMock()
+        mock_poster_instance.post_stream_online.return_value = True
+        mock_bluesky_poster_class.return_value = mock_poster_instance
+
+        response = client.post(
+            "/webhook", headers=self.COMMON_HEADERS, json=self.STREAM_ONLINE_PAYLOAD)
+
+        assert response.status_code == 200
+        mock_poster_instance.post_stream_online.assert_called_once()
+
     @patch("main.BlueskyPoster")
     def test_webhook_stream_online_skipped_by_setting(
             self, mock_bluesky_poster_class, client, monkeypatch):
@@ -396,3 +459,269 @@ class TestWebhookHandler:
         # user.updateイベントはbroadcaster_user_loginがないためエラー
         assert json_data == {
             "error": "Missing required field: event.broadcaster_user_login"}
+
+    @patch("main.BlueskyPoster")
+    def test_webhook_stream_online_async_dispatch(
+            self, mock_bluesky_poster_class, client, monkeypatch):
+        # asyncモードではキューに積んで202を返し、投稿はワーカーで実行されることを確認
+        import main
+        monkeypatch.setattr("main.verify_signature", lambda req: True)
+        monkeypatch.setenv("WEBHOOK_DISPATCH_MODE", "async")
+        monkeypatch.setenv("WEBHOOK_WORKER_COUNT", "1")
+
+        mock_poster_instance = MagicMock()
+        mock_poster_instance.post_stream_online.return_value = True
+        mock_bluesky_poster_class.return_value = mock_poster_instance
+
+        try:
+            response = client.post(
+                "/webhook", headers=self.COMMON_HEADERS, json=self.STREAM_ONLINE_PAYLOAD)
+            assert response.status_code == 202
+            assert response.get_json() == {"status": "accepted"}
+            assert main.notification_dispatcher.drain(timeout=5)
+        finally:
+            main.notification_dispatcher = None
+
+        mock_poster_instance.post_stream_online.assert_called_once()
+
+    def test_dispatcher_is_recreated_after_cleanup(self, monkeypatch):
+        # GUIからの停止→再起動後も、asyncモードのジョブを受け付けることを確認
+        import main
+        monkeypatch.setattr("main.notification_dispatcher", None)
+        monkeypatch.setenv("WEBHOOK_DRAIN_TIMEOUT", "abc")
+        monkeypatch.setattr(main.eventsub_message_cache, "save_snapshot", lambda: None)
+        stopped = main.get_notification_dispatcher()
+        main.cleanup_application()
+        assert not stopped.is_running
+        assert main.notification_dispatcher is None
+
+        dispatcher = main.get_notification_dispatcher()
+        try:
+            assert dispatcher is not stopped
+            assert dispatcher.is_running
+            done = threading.Event()
+            assert dispatcher.submit("job", done.set)
+            assert done.wait(5)
+        finally:
+            dispatcher.drain(timeout=5)
+            main.notification_dispatcher = None
+
+    @patch("main.BlueskyPoster")
+    def test_webhook_returns_shutting_down_while_dispatcher_stops(
+            self, mock_bluesky_poster_class, client, monkeypatch):
+        # 停止中のディスパッチャーには積まず、キュー満杯とは別の理由で503を返すことを確認
+        from notification_dispatcher import NotificationDispatcher
+        monkeypatch.setattr("main.verify_signature", lambda req: True)
+        monkeypatch.setenv("WEBHOOK_DISPATCH_MODE", "async")
+        stopped = NotificationDispatcher(worker_count=1, queue_size=5)
+        stopped.start()
+        assert stopped.drain(timeout=5)
+        monkeypatch.setattr("main.notification_dispatcher", stopped)
+
+        response = client.post(
+            "/webhook", headers=self.COMMON_HEADERS, json=self.STREAM_ONLINE_PAYLOAD)
+
+        assert response.status_code == 503
+        assert response.get_json() == {"status": "shutting down"}
+        mock_bluesky_poster_class.return_value.post_stream_online.assert_not_called()
+
+    @patch("main.BlueskyPoster")
+    def test_webhook_duplicate_message_id_is_skipped(
+            self, mock_bluesky_poster_class, client, monkeypatch):
+        # 同じMessage-Idの再送は投稿せずに200を返すことを確認
+        monkeypatch.setattr("main.verify_signature", lambda req: True)
+        mock_poster_instance = MagicMock()
+        mock_poster_instance.post_stream_online.return_value = True
+        mock_bluesky_poster_class.return_value = mock_poster_instance
+
+        first = client.post(
+            "/webhook", headers=self.COMMON_HEADERS, json=self.STREAM_ONLINE_PAYLOAD)
+        second = client.post(
+            "/webhook", headers=self.COMMON_HEADERS, data="not a valid json",
+            content_type="application/json")
+
+        assert first.status_code == 200
+        assert second.status_code == 200
+        assert second.get_json() == {"status": "duplicate message ignored"}
+        mock_poster_instance.post_stream_online.assert_called_once()
+
+    @patch("main.BlueskyPoster")
+    def test_webhook_failed_message_id_can_be_redelivered(
+            self, mock_bluesky_poster_class, client, monkeypatch):
+        # 投稿に失敗した(5xx)メッセージは再送時に再処理されることを確認
+        monkeypatch.setattr("main.verify_signature", lambda req: True)
+        mock_poster_instance = MagicMock()
+        mock_poster_instance.post_stream_online.side_effect = [False, True]
+        mock_bluesky_poster_class.return_value = mock_poster_instance
+
+        first = client.post(
+            "/webhook", headers=self.COMMON_HEADERS, json=self.STREAM_ONLINE_PAYLOAD)
+        second = client.post(
+            "/webhook", headers=self.COMMON_HEADERS, json=self.STREAM_ONLINE_PAYLOAD)
+
+        assert first.status_code == 500
+        assert second.status_code == 200
+        assert mock_poster_instance.post_stream_online.call_count == 2
+
+    @patch("main.BlueskyPoster")
+    def test_webhook_reuses_shared_bluesky_poster(
+            self, mock_bluesky_poster_class, client, monkeypatch):
+        # 複数の通知で同じBlueskyPoster（ログインセッション）が再利用されることを確認
+        monkeypatch.setattr("main.verify_signature", lambda req: True)
+        mock_poster_instance = MagicMock()
+        mock_poster_instance.post_stream_online.return_value = True
+        mock_poster_instance.username = os.getenv("BLUESKY_USERNAME")
+        mock_poster_instance.password = os.getenv("BLUESKY_APP_PASSWORD")
+        mock_bluesky_poster_class.return_value = mock_poster_instance
+
+        for i in range(3):
+            headers = {**self.COMMON_HEADERS, "Twitch-Eventsub-Message-Id": f"id-{i}"}
+            response = client.post(
+                "/webhook", headers=headers, json=self.STREAM_ONLINE_PAYLOAD)
+            assert response.status_code == 200
+
+        mock_bluesky_poster_class.assert_called_once()
+        assert mock_poster_instance.post_stream_online.call_count == 3
+
+    @patch("main.BlueskyPoster")
+    def test_websocket_notification_uses_webhook_dispatch_path(
+            self, mock_bluesky_poster_class, client, monkeypatch):
+        # WebSocketで受信した通知もWebhookと同じ処理（重複排除・投稿）を通ることを確認
+        import main
+        mock_poster_instance = MagicMock()
+        mock_poster_instance.post_stream_online.return_value = True
+        mock_bluesky_poster_class.return_value = mock_poster_instance
+
+        metadata = {"message_id": "ws-message-1", "message_type": "notification"}
+        first = main.handle_websocket_notification(metadata, self.STREAM_ONLINE_PAYLOAD)
+        second = main.handle_websocket_notification(metadata, self.STREAM_ONLINE_PAYLOAD)
+
+        assert first[1] == 200
+        assert second is None
+        mock_poster_instance.post_stream_online.assert_called_once()
+
+
+@patch("main.BlueskyPoster")
+def test_webhook_routes_each_broadcaster_to_its_own_config(mock_bluesky_poster_class, client, monkeypatch):
+    # broadcaster_user_idごとに、起動時に作った設定（画像・テンプレート・ON/OFF）で投稿する
+    monkeypatch.setattr("main.verify_signature", lambda req: True)
+    default = BroadcasterConfig(broadcaster_id="12345", notify_online=True, image_path="images/noimage.png")
+    set_broadcaster_registry(BroadcasterRegistry(default, [
+        ("777", "other", {"image_path": "images/other.png", "online_template": "templates/other.txt"}),
+        ("888", "muted", {"notify_online": False}),
+    ]))
+    mock_poster_instance = MagicMock()
+    mock_poster_instance.post_stream_online.return_value = True
+    mock_bluesky_poster_class.return_value = mock_poster_instance
+
+    def post(message_id, broadcaster_id, login):
+        payload = {
+            "subscription": {"type": "stream.online"},
+            "event": {"broadcaster_user_id": broadcaster_id, "broadcaster_user_login": login,
+                      "broadcaster_user_name": login, "title": "t", "category_name": "c"},
+        }
+        headers = {**TestWebhookHandler.COMMON_HEADERS, "Twitch-Eventsub-Message-Id": message_id}
+        return client.post("/webhook", headers=headers, json=payload)
+
+    assert post("m1", "12345", "teststreamer").status_code == 200
+    assert post("m2", "777", "other").status_code == 200
+    muted = post("m3", "888", "muted")
+    assert muted.get_json() == {"status": "skipped, online notifications disabled"}
+    unknown = post("m4", "999", "stranger")
+    assert unknown.get_json() == {"status": "skipped, unknown broadcaster"}
+
+    calls = mock_poster_instance.post_stream_online.call_args_list
+    assert len(calls) == 2
+    assert calls[0].kwargs["image_path"] == "images/noimage.png"
+    assert "template_path" not in calls[0].kwargs
+    assert calls[1].kwargs["image_path"] == "images/other.png"
+    assert calls[1].kwargs["template_path"] == "templates/other.txt"
+
+
+def test_initialize_app_runs_tunnel_in_parallel_with_token_fetch(monkeypatch):
+    # トンネル起動とトークン取得・配信者ID変換が並行して進み、起動時間は最長の経路で決まる
+    import logging
+    import time
+    import main
+
+    app_logger = logging.getLogger("AppLogger")
+    monkeypatch.setattr(main, "configure_logging", lambda app: (app_logger, [], app_logger, app_logger))
+    monkeypatch.delenv("TWITCH_EVENTSUB_TRANSPORT", raising=False)
+
+    def slow(result=True):
+        def step(*args, **kwargs):
+            time.sleep(0.3)
+            return result
+        return step
+
+    monkeypatch.setattr(main, "prepare_webhook_secret_step", lambda: True)
+    monkeypatch.setattr(main, "fetch_app_token_step", slow())
+    monkeypatch.setattr(main, "setup_broadcaster_id", slow(None))
+    monkeypatch.setattr(main, "configure_broadcaster_registry", lambda: None)
+    monkeypatch.setattr(main, "start_tunnel_process", slow())
+    monkeypatch.setattr(main, "sync_webhook_subscriptions", lambda: True)
+    monkeypatch.setattr(main, "start_platform_monitors", lambda: True)
+    events = []
+
+    assert main.initialize_app(on_progress=events.append) is True
+    result = main.last_startup_result
+    assert result.sequential_seconds() >= 0.9
+    assert result.total_seconds < 0.6
+    assert {e["step"] for e in events if e["state"] == "done"} == {
+        "secret", "validate", "token", "broadcaster", "registry", "tunnel", "eventsub", "monitors"}
+
+
+def test_initialize_app_stops_tunnel_when_token_fetch_fails(monkeypatch):
+    import logging
+    import main
+
+    app_logger = logging.getLogger("AppLogger")
+    monkeypatch.setattr(main, "configure_logging", lambda app: (app_logger, [], app_logger, app_logger))
+    monkeypatch.delenv("TWITCH_EVENTSUB_TRANSPORT", raising=False)
+    monkeypatch.setattr(main, "prepare_webhook_secret_step", lambda: True)
+    monkeypatch.setattr(main, "fetch_app_token_step", lambda: False)
+    monkeypatch.setattr(main, "setup_broadcaster_id", lambda logger_to_use=None: None)
+    monkeypatch.setattr(main, "configure_broadcaster_registry", lambda: None)
+    sync = MagicMock(return_value=True)
+    monkeypatch.setattr(main, "sync_webhook_subscriptions", sync)
+    stop_tunnel = MagicMock()
+    monkeypatch.setattr(main, "stop_tunnel", stop_tunnel)
+
+    def fake_tunnel():
+        main.tunnel_proc = "proc"
+        return True
+
+    monkeypatch.setattr(main, "start_tunnel_process", fake_tunnel)
+
+    assert main.initialize_app() is False
+    assert main.last_startup_result.failed_step == "token"
+    sync.assert_not_called()
+    stop_tunnel.assert_called_once()
+    assert main.tunnel_proc is None
+
+
+def test_initialize_app_reports_progress_through_queue(monkeypatch):
+    # GUIは別スレッドで初期化を実行し、進捗をキューから受け取る
+    import logging
+    import queue
+    import main
+
+    app_logger = logging.getLogger("AppLogger")
+    monkeypatch.setattr(main, "configure_logging", lambda app: (app_logger, [], app_logger, app_logger))
+    monkeypatch.setenv("TWITCH_EVENTSUB_TRANSPORT", "websocket")
+    for name in ("prepare_webhook_secret_step", "fetch_app_token_step", "start_platform_monitors"):
+        monkeypatch.setattr(main, name, lambda: True)
+    monkeypatch.setattr(main, "validate_settings_step", lambda: True)
+    monkeypatch.setattr(main, "setup_broadcaster_id", lambda logger_to_use=None: None)
+    monkeypatch.setattr(main, "configure_broadcaster_registry", lambda: None)
+    monkeypatch.setattr(main, "start_websocket_transport", lambda: True)
+    progress = queue.Queue()
+
+    assert main.initialize_app(progress_queue=progress) is True
+    events = []
+    while not progress.empty():
+        events.append(progress.get_nowait())
+    done = [e["step"] for e in events if e["state"] == "done"]
+    assert set(done) == {name for name, _ in main.startup_step_labels()}
+    assert all(e["duration"] is not None for e in events if e["state"] == "done")
+    assert [e["state"] for e in events if e["step"] == "eventsub"] == ["running", "done"]
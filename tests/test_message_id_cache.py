@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from unittest.mock import patch
+from message_id_cache import MessageIdCache
+from version_info import __version__
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+
+def test_check_and_add_detects_duplicates():
+    cache = MessageIdCache(ttl_seconds=600)
+    assert cache.check_and_add("a") is False
+    assert cache.check_and_add("a") is True
+    assert cache.check_and_add("b") is False
+
+
+def test_entries_expire_after_ttl():
+    cache = MessageIdCache(ttl_seconds=10)
+    with patch("message_id_cache.time.time", return_value=1000.0):
+        cache.check_and_add("a")
+    with patch("message_id_cache.time.time", return_value=1011.0):
+        # TTLを過ぎたIDは新規扱い
+        assert cache.check_and_add("a") is False
+
+
+def test_oldest_entries_are_evicted_when_full():
+    cache = MessageIdCache(ttl_seconds=600, max_entries=2)
+    cache.check_and_add("a")
+    cache.check_and_add("b")
+    cache.check_and_add("c")
+    assert len(cache) == 2
+    assert cache.check_and_add("a") is False  # 追い出し済み
+    assert cache.check_and_add("c") is True
+
+
+def test_discard_allows_redelivery():
+    cache = MessageIdCache()
+    cache.check_and_add("a")
+    cache.discard("a")
+    assert cache.check_and_add("a") is False
+
+
+def test_snapshot_roundtrip(tmp_path):
+    # スナップショット経由で再起動後も重複を検出できることを確認
+    path = tmp_path / "ids.json"
+    cache = MessageIdCache(snapshot_path=str(path))
+    cache.check_and_add("a")
+    cache.check_and_add("b")
+    assert cache.save_snapshot()
+
+    restored = MessageIdCache(snapshot_path=str(path))
+    assert restored.load_snapshot() == 2
+    assert restored.check_and_add("a") is True
+    assert restored.check_and_add("c") is False
+
+
+def test_snapshot_skips_expired_entries(tmp_path):
+    path = tmp_path / "ids.json"
+    cache = MessageIdCache(ttl_seconds=10, snapshot_path=str(path))
+    with patch("message_id_cache.time.time", return_value=1000.0):
+        cache.check_and_add("old")
+        cache.save_snapshot()
+    restored = MessageIdCache(ttl_seconds=10, snapshot_path=str(path))
+    with patch("message_id_cache.time.time", return_value=1020.0):
+        assert restored.load_snapshot() == 0
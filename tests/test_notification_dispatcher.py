@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+import threading
+from notification_dispatcher import NotificationDispatcher
+from version_info import __version__
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+
+def test_dispatcher_runs_jobs_and_drains():
+    # 投入したジョブがすべて実行され、drainで正常終了することを確認
+    dispatcher = NotificationDispatcher(worker_count=3, queue_size=10)
+    dispatcher.start()
+    results = []
+    lock = threading.Lock()
+
+    def job(value):
+        with lock:
+            results.append(value)
+
+    for i in range(5):
+        assert dispatcher.submit(f"job{i}", job, i)
+    assert dispatcher.drain(timeout=5)
+    assert sorted(results) == [0, 1, 2, 3, 4]
+    assert dispatcher.processed_count == 5
+    # drain後は新しいジョブを受け付けない
+    assert not dispatcher.submit("late", job, 99)
+
+
+def test_dispatcher_rejects_when_queue_full():
+    # キューが満杯の場合はsubmitがFalseを返すことを確認
+    dispatcher = NotificationDispatcher(worker_count=1, queue_size=1)
+    dispatcher.start()
+    release = threading.Event()
+    started = threading.Event()
+
+    def blocking_job():
+        started.set()
+        release.wait(5)
+
+    assert dispatcher.submit("blocking", blocking_job)
+    started.wait(5)
+    assert dispatcher.submit("queued", lambda: None)
+    assert not dispatcher.submit("overflow", lambda: None)
+    assert dispatcher.rejected_count == 1
+    release.set()
+    assert dispatcher.drain(timeout=5)
+
+
+def test_dispatcher_counts_failed_jobs():
+    # ジョブ内の例外でワーカーが停止しないことを確認
+    dispatcher = NotificationDispatcher(worker_count=1, queue_size=5)
+    dispatcher.start()
+
+    def failing_job():
+        raise RuntimeError("boom")
+
+    dispatcher.submit("fail", failing_job)
+    dispatcher.submit("ok", lambda: None)
+    assert dispatcher.drain(timeout=5)
+    assert dispatcher.failed_count == 1
+    assert dispatcher.processed_count == 1
+
+
+def test_dispatcher_counts_are_exact_with_many_workers():
+    # 複数ワーカーから同時に加算しても件数が失われないことを確認
+    dispatcher = NotificationDispatcher(worker_count=8, queue_size=2000)
+    dispatcher.start()
+    for i in range(2000):
+        assert dispatcher.submit(f"job{i}", lambda: None)
+    assert dispatcher.drain(timeout=10)
+    assert dispatcher.processed_count == 2000
+
+
+def test_dispatcher_is_not_restarted_after_drain():
+    # 終了処理でdrainした後は、start()を呼んでもワーカーを起動しない
+    dispatcher = NotificationDispatcher(worker_count=1, queue_size=5)
+    dispatcher.start()
+    assert dispatcher.drain(timeout=5)
+    dispatcher.start()
+    assert not dispatcher.is_running
+    assert not dispatcher.submit("late", lambda: None)
+    assert dispatcher.rejected_count == 1
@@ -56,33 +56,34 @@ def test_concurrent_notifications():
     import requests
 
     def send_notification():
-        with patch('main.verify_signature', return_value=True), \
-                patch('bluesky.BlueskyPoster') as mock_bluesky_cls, \
-                patch('main.BlueskyPoster') as mock_main_bluesky_cls:
-            poster = MagicMock()
-            poster.post_stream_online.return_value = True
-            mock_bluesky_cls.return_value = poster
-            mock_main_bluesky_cls.return_value = poster
-            with app.test_client() as client:
-                return client.post('/webhook',
-                                   json={
-                                       'subscription': {'type': 'stream.online'},
-                                       'event': {
-                                           'broadcaster_user_login': 'testuser',
-                                           'broadcaster_user_name': 'Test User',
-                                           'started_at': '2024-03-20T12:00:00Z',
-                                           'title': 'テスト配信',
-                                           'category_name': 'ゲーム'
-                                       }
-                                   },
-                                   headers={
-                                       "Twitch-Eventsub-Message-Type": "notification",
-                                       "Twitch-Eventsub-Message-Id": "dummy-id",
-                                       "Twitch-Eventsub-Message-Timestamp": "2024-05-26T13:45:00Z",
-                                       "Twitch-Eventsub-Message-Signature": "sha256=dummy"
+        # patchはスレッドセーフではないため、モックの差し替えは呼び出し元で一度だけ行う
+        with app.test_client() as client:
+            return client.post('/webhook',
+                               json={
+                                   'subscription': {'type': 'stream.online'},
+                                   'event': {
+                                       'broadcaster_user_login': 'testuser',
+                                       'broadcaster_user_name': 'Test User',
+                                       'started_at': '2024-03-20T12:00:00Z',
+                                       'title': 'テスト配信',
+                                       'category_name': 'ゲーム'
                                    }
-                                   )
-    with ThreadPoolExecutor(max_workers=10) as executor:
+                               },
+                               headers={
+                                   "Twitch-Eventsub-Message-Type": "notification",
+                                   "Twitch-Eventsub-Message-Id": "dummy-id",
+                                   "Twitch-Eventsub-Message-Timestamp": "2024-05-26T13:45:00Z",
+                                   "Twitch-Eventsub-Message-Signature": "sha256=dummy"
+                               }
+                               )
+    with patch('main.verify_signature', return_value=True), \
+            patch('bluesky.BlueskyPoster') as mock_bluesky_cls, \
+            patch('main.BlueskyPoster') as mock_main_bluesky_cls, \
+            ThreadPoolExecutor(max_workers=10) as executor:
+        poster = MagicMock()
+        poster.post_stream_online.return_value = True
+        mock_bluesky_cls.return_value = poster
+        mock_main_bluesky_cls.return_value = poster
         start_time = time.time()
         futures = [executor.submit(send_notification) for _ in range(10)]
         results = [f.result() for f in futures]
@@ -90,3 +91,258 @@ def test_concurrent_notifications():
         assert all(r.status_code == 200 for r in results)
         total_time = end_time - start_time
         assert total_time < 5.0  # 10件の同時処理を5秒以内に完了
+
+
+@pytest.mark.performance
+def test_signature_digest_benchmark():
+    """署名計算のマイクロベンチマーク（従来の文字列連結方式とbytesのみの方式の比較）"""
+    import hashlib
+    import hmac
+    import timeit
+    from eventsub import compute_signature_digest, prepare_webhook_secret
+
+    secret = "benchmark-secret-0123456789abcdef"
+    message_id = "e76c6bd4-55c9-4987-8304-da1588d8988b"
+    timestamp = "2024-05-26T13:45:00.123456789Z"
+
+    def legacy_digest(body_bytes):
+        # 変更前のverify_signatureと同じ処理（デコード→連結→再エンコード）
+        body = body_bytes.decode("utf-8")
+        hmac_message = message_id + timestamp + body
+        return hmac.new(secret.encode("utf-8"), hmac_message.encode("utf-8"),
+                        hashlib.sha256).hexdigest()
+
+    prepare_webhook_secret(secret)
+    try:
+        for size in (1024, 10 * 1024, 100 * 1024, 1024 * 1024):
+            body = ("あ" * (size // 3)).encode("utf-8")
+            assert compute_signature_digest(message_id, timestamp, body) == legacy_digest(body)
+            number = max(5, (2 * 1024 * 1024) // size)
+            legacy = min(timeit.repeat(lambda: legacy_digest(body), number=number, repeat=3)) / number
+            fast = min(timeit.repeat(
+                lambda: compute_signature_digest(message_id, timestamp, body),
+                number=number, repeat=3)) / number
+            print(f"body={size // 1024}KB legacy={legacy * 1e6:.1f}us fast={fast * 1e6:.1f}us "
+                  f"speedup={legacy / fast:.2f}x")
+            # 大きな本文ではコピーが減る分だけ従来方式より遅くならないこと
+            if size >= 100 * 1024:
+                assert fast <= legacy * 1.2
+    finally:
+        prepare_webhook_secret(None)
+
+
+@pytest.mark.performance
+def test_template_render_benchmark(tmp_path):
+    """テンプレート描画のマイクロベンチマーク（毎回読み込み・コンパイルする方式とキャッシュ方式の比較）"""
+    import timeit
+    from jinja2 import Template
+    from bluesky import TemplateRegistry, load_template
+    from utils import format_datetime_filter
+
+    tpl = tmp_path / "bench_template.txt"
+    tpl.write_text(
+        "🔴 放送を開始しました！\nタイトル: {{ title }}\nカテゴリ: {{ category_name }}\n"
+        "開始: {{ started_at | datetimeformat }}\nhttps://twitch.tv/{{ broadcaster_user_login }}\n",
+        encoding="utf-8")
+    context = {
+        "title": "テスト配信",
+        "category_name": "ゲーム",
+        "started_at": "2024-03-20T12:00:00Z",
+        "broadcaster_user_login": "testuser",
+    }
+
+    # 従来方式はフィルタ登録前にコンパイルすると失敗するため、共有環境に事前登録しておく
+    Template("").environment.filters['datetimeformat'] = format_datetime_filter
+
+    def legacy_render():
+        # 変更前のload_templateと同じ処理（毎回ファイルを読み込み、Templateを生成）
+        with open(tpl, encoding="utf-8") as f:
+            template_obj = Template(f.read())
+        template_obj.environment.filters['datetimeformat'] = format_datetime_filter
+        return template_obj.render(**context)
+
+    registry = TemplateRegistry()
+    with patch("bluesky.template_registry", registry):
+        def cached_render():
+            return load_template(path=str(tpl)).render(**context)
+
+        assert cached_render() == legacy_render()
+        number = 200
+        legacy = min(timeit.repeat(legacy_render, number=number, repeat=3)) / number
+        cached = min(timeit.repeat(cached_render, number=number, repeat=3)) / number
+    print(f"legacy={1 / legacy:.0f} renders/sec cached={1 / cached:.0f} renders/sec "
+          f"speedup={legacy / cached:.1f}x")
+    assert cached < legacy
+
+
+@pytest.mark.performance
+def test_image_preprocess_upload_benchmark(tmp_path):
+    """画像前処理のベンチマーク（アップロードバイト数と投稿までのレイテンシ）"""
+    import os
+    from PIL import Image
+    from bluesky import BlueskyPoster
+    from blob_cache import BlobCache
+    from image_preprocessor import ImagePreprocessor
+
+    # アップロード帯域を20MB/sと仮定してupload_blobの所要時間を模擬する
+    bandwidth = 20 * 1024 * 1024
+
+    def fake_upload_blob(data):
+        time.sleep(len(data) / bandwidth)
+        return MagicMock(blob=None)
+
+    def post_latency(poster, image_path):
+        start = time.perf_counter()
+        poster.upload_image(image_path)
+        poster.client.send_post("text", embed=None)
+        return time.perf_counter() - start
+
+    for width, height in ((1280, 720), (1920, 1080), (2560, 1440)):
+        # 写真に近い圧縮しにくい画像（グラデーション＋ノイズ）
+        img = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+        noise = Image.frombytes("RGB", (width, height), os.urandom(width * height * 3))
+        image_path = str(tmp_path / f"thumb_{width}x{height}.png")
+        Image.blend(img, noise, 0.3).save(image_path, format="PNG")
+        raw_bytes = os.path.getsize(image_path)
+
+        results = {}
+        for label, preprocessor in (
+                ("raw", None),
+                ("processed", ImagePreprocessor(max_dimension=2000, cache_dir=str(tmp_path / "cache")))):
+            with patch("bluesky.Client") as mock_client_cls, \
+                    patch.dict(os.environ, {"BLUESKY_IMAGE_PREPROCESS": "False"}):
+                client = MagicMock()
+                client.upload_blob.side_effect = fake_upload_blob
+                mock_client_cls.return_value = client
+                poster = BlueskyPoster("bench", "pass", session_path=str(tmp_path / "session.json"),
+                                       blob_cache=BlobCache(None), image_preprocessor=preprocessor)
+                poster._logged_in = True
+                cold = post_latency(poster, image_path)
+                warm = post_latency(poster, image_path)
+                uploaded = len(client.upload_blob.call_args[0][0])
+            results[label] = (uploaded, cold, warm)
+
+        raw, processed = results["raw"], results["processed"]
+        print(f"{width}x{height}: upload bytes raw={raw[0]} processed={processed[0]} | "
+              f"latency raw={raw[2] * 1000:.1f}ms processed cold={processed[1] * 1000:.1f}ms "
+              f"warm={processed[2] * 1000:.1f}ms")
+        assert raw[0] == raw_bytes
+        assert processed[0] <= 1000000
+        assert processed[0] < raw[0]
+        # 処理済み画像のキャッシュが効いた2回目以降は、元画像をそのまま送るより速い
+        assert processed[2] < raw[2]
+
+
+@pytest.mark.performance
+def test_niconico_conditional_get_benchmark(monkeypatch):
+    """ニコニコRSSの条件付きGETによる定常状態の転送量・解析時間の削減を確認する"""
+    import feedparser
+    from niconico_monitor import NiconicoMonitor
+
+    items = "".join(
+        f"<item><title>動画{i}</title><guid>sm{i}</guid><link>https://www.nicovideo.jp/watch/sm{i}</link>"
+        f"<description>{'説明文' * 50}</description></item>" for i in range(30))
+    body = f'<?xml version="1.0" encoding="UTF-8"?><rss version="2.0"><channel>{items}</channel></rss>'.encode()
+
+    def fake_get(url, headers=None, timeout=None):
+        resp = MagicMock()
+        if (headers or {}).get("If-None-Match") == '"v1"':
+            resp.status_code, resp.content = 304, b""
+        else:
+            resp.status_code, resp.content = 200, body
+            resp.headers = {"ETag": '"v1"'}
+        return resp
+
+    monkeypatch.setattr("niconico_monitor.requests.get", fake_get)
+    monitor = NiconicoMonitor("123", 60, lambda lid: None, lambda vid: None)
+    polls = 50
+    for _ in range(polls):
+        monitor.get_latest_video_id()
+    stats = monitor.get_poll_stats()["video"]
+
+    # 変更前は毎回全量を取得・解析していた
+    start = time.perf_counter()
+    for _ in range(polls):
+        feedparser.parse(body)
+    legacy_parse = time.perf_counter() - start
+    legacy_bytes = len(body) * polls
+
+    print(f"polls={polls} bytes legacy={legacy_bytes} conditional={stats['total_bytes']} | "
+          f"parse legacy={legacy_parse * 1000:.1f}ms conditional={stats['total_parse_seconds'] * 1000:.1f}ms")
+    assert stats["not_modified"] == polls - 1
+    assert stats["total_bytes"] <= legacy_bytes * 0.1
+    assert stats["total_parse_seconds"] <= legacy_parse * 0.1
+
+
+# mainのimportにかけてよい時間（秒）。atproto・cherrypy・tkinterを読み込むと大きく超える
+MAIN_IMPORT_BUDGET_SECONDS = 1.0
+
+
+@pytest.mark.performance
+def test_main_import_time_benchmark(tmp_path):
+    """-X importtimeでmainのimport時間を計測し、予算内かつ副作用がないことを確認する"""
+    import json
+    import os
+    import subprocess
+    import sys
+
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    # import時にカレントディレクトリのsettings.envを読んだりウィザードを起動したりしないこと
+    (tmp_path / "settings.env").write_text("IMPORT_SIDE_EFFECT_MARKER=1\n", encoding="utf-8")
+    heavy = ["tkinter", "atproto", "cherrypy", "websockets", "feedparser"]
+    code = (
+        "import json, os, sys\n"
+        "import main\n"
+        f"print(json.dumps({{'marker': os.getenv('IMPORT_SIDE_EFFECT_MARKER'), "
+        f"'heavy': [m for m in {heavy!r} if m in sys.modules]}}))\n"
+    )
+    env = dict(os.environ, PYTHONPATH=repo_root)
+    env.pop("IMPORT_SIDE_EFFECT_MARKER", None)
+
+    timings = []
+    for _ in range(3):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=tmp_path, env=env, capture_output=True, text=True, timeout=60)
+        assert proc.returncode == 0, proc.stderr[-2000:]
+        # 最後の行がmain自身（累積マイクロ秒は2列目）
+        main_line = [line for line in proc.stderr.splitlines()
+                     if line.startswith("import time:") and line.rstrip().endswith("| main")][-1]
+        timings.append(int(main_line.split("|")[1]) / 1e6)
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        assert result == {"marker": None, "heavy": []}
+
+    print(f"import main: best={min(timings) * 1000:.1f}ms runs={[round(t * 1000, 1) for t in timings]}")
+    assert min(timings) < MAIN_IMPORT_BUDGET_SECONDS
+
+
+@pytest.mark.performance
+def test_format_datetime_filter_benchmark(monkeypatch):
+    """日時フィルタのマイクロベンチマーク（描画ごとにタイムゾーンを解決する方式との比較）"""
+    import os
+    import timeit
+    from datetime import datetime
+    import pytz
+    from app_settings import reset_settings
+    from utils import format_datetime_filter
+
+    monkeypatch.setenv("TIMEZONE", "Asia/Tokyo")
+    reset_settings()
+    value = "2024-05-26T13:45:00.123456Z"
+
+    def legacy_filter(iso_datetime_str, fmt="%Y-%m-%d %H:%M %Z"):
+        # 変更前の処理（毎回環境変数を読み、タイムゾーンを解決する）
+        dt_utc = datetime.fromisoformat(iso_datetime_str.replace('Z', '+00:00'))
+        target_tz = pytz.timezone(os.getenv("TIMEZONE", "system"))
+        return dt_utc.astimezone(target_tz).strftime(fmt)
+
+    try:
+        assert format_datetime_filter(value) == legacy_filter(value)
+        number = 20000
+        legacy = min(timeit.repeat(lambda: legacy_filter(value), number=number, repeat=3)) / number
+        fast = min(timeit.repeat(lambda: format_datetime_filter(value), number=number, repeat=3)) / number
+        print(f"format_datetime_filter legacy={legacy * 1e6:.2f}us cached={fast * 1e6:.2f}us "
+              f"speedup={legacy / fast:.2f}x")
+        assert fast <= legacy * 1.2
+    finally:
+        reset_settings()
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from datetime import date, datetime
+import csv
+import sqlite3
+import time
+from unittest.mock import MagicMock
+import pytest
+from post_history import CSV_HEADER, PostHistoryStore
+from version_info import __version__
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = PostHistoryStore(str(tmp_path / "post_history.db"), batch_size=3, flush_interval=60)
+    yield store
+    store.close()
+
+
+def stored_count(store):
+    # まとめ書き前の行を含めずに、データベース上の件数を数える
+    conn = sqlite3.connect(store.path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM post_history").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def add(store, day, hour, success=True, event_type="online", platform="twitch", title="title"):
+    store.record(title, "Just Chatting", "https://twitch.tv/a", success, event_type, platform,
+                 posted_at=datetime(2025, 1, day, hour))
+
+
+def test_records_are_written_in_batches(store):
+    add(store, 1, 10)
+    add(store, 1, 11)
+    assert stored_count(store) == 0
+    add(store, 1, 12)
+    assert stored_count(store) == 3
+    add(store, 1, 13)
+    # 読み出し時には溜まっている分も書き込む
+    assert store.count() == 4
+
+
+def test_background_flush(tmp_path):
+    store = PostHistoryStore(str(tmp_path / "post_history.db"), batch_size=100, flush_interval=0.05)
+    store.record("t", "c", "u", True, "online")
+    deadline = time.time() + 5
+    while stored_count(store) == 0 and time.time() < deadline:
+        time.sleep(0.02)
+    assert stored_count(store) == 1
+    store.close()
+
+
+def test_close_flushes_pending_rows(tmp_path):
+    path = str(tmp_path / "post_history.db")
+    store = PostHistoryStore(path, batch_size=100, flush_interval=60)
+    store.record("t", "c", "u", False, "offline")
+    store.close()
+    with pytest.raises(RuntimeError):
+        store.record("t", "c", "u", False, "offline")
+    reopened = PostHistoryStore(path)
+    assert reopened.query()[0]["success"] is False
+    reopened.close()
+
+
+def test_query_filters_and_paginates(store):
+    for day in (1, 2, 3):
+        for hour in (9, 18):
+            add(store, day, hour, success=(hour == 9), platform="youtube" if day == 3 else "twitch")
+
+    page = store.query(limit=2)
+    assert [r["posted_at"] for r in page] == ["2025-01-03 18:00:00", "2025-01-03 09:00:00"]
+    assert [r["posted_at"] for r in store.query(limit=2, offset=4)] == [
+        "2025-01-01 18:00:00", "2025-01-01 09:00:00"]
+    # 終了日だけを指定した場合はその日を含める
+    assert store.count(start=date(2025, 1, 2), end="2025-01-02") == 2
+    assert store.count(start="2025-01-01 12:00:00", end=datetime(2025, 1, 3, 9)) == 4
+    failed = store.query(success=False, newest_first=False)
+    assert [r["posted_at"][:10] for r in failed] == ["2025-01-01", "2025-01-02", "2025-01-03"]
+    assert store.count(platform="youtube") == 2
+    assert store.count(event_type="offline") == 0
+
+
+def test_export_and_import_round_trip(store, tmp_path):
+    add(store, 1, 10, title="Hello, \"World\"")
+    add(store, 2, 10, success=False, platform=None)
+    path = tmp_path / "export" / "history.csv"
+
+    assert store.export_csv(str(path), start="2025-01-01") == 2
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == CSV_HEADER
+    assert rows[1][2] == 'Hello, "World"' and rows[1][5] == "○"
+    assert rows[2][5] == "×" and rows[2][6] == ""
+
+    other = PostHistoryStore(str(tmp_path / "other.db"))
+    assert other.import_csv(str(path)) == 2
+    assert [r["title"] for r in other.query(newest_first=False)][0] == 'Hello, "World"'
+    other.close()
+
+
+def test_legacy_csv_is_migrated_once(store, tmp_path):
+    legacy = tmp_path / "post_history.csv"
+    with open(legacy, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(CSV_HEADER[:6])
+        writer.writerow(["2024-12-31 23:00:00", "online", "Title, with comma", "Game", "https://x", "○"])
+        writer.writerow(["2024-12-31 23:30:00", "offline", "配信終了: a", "Offline", "https://x", "×"])
+
+    assert store.migrate_legacy_csv(str(legacy)) == 2
+    assert not legacy.exists()
+    assert (tmp_path / "post_history.csv.migrated").exists()
+    assert store.migrate_legacy_csv(str(legacy)) == 0
+    rows = store.query()
+    assert [r["title"] for r in rows] == ["配信終了: a", "Title, with comma"]
+    assert rows[0]["success"] is False and rows[0]["platform"] is None
+
+
+def test_legacy_csv_is_not_imported_twice_if_rename_failed(store, tmp_path, monkeypatch):
+    # 取り込み後、名前の変更前に終了した場合も、次回の起動で二重に取り込まない
+    legacy = tmp_path / "post_history.csv"
+    legacy.write_text("2024-12-31 23:00:00,online,Title,Game,https://x,○\n", encoding="utf-8")
+    with monkeypatch.context() as m:
+        m.setattr("post_history.os.replace", MagicMock(side_effect=OSError("rename failed")))
+        with pytest.raises(OSError):
+            store.migrate_legacy_csv(str(legacy))
+    assert legacy.exists()
+
+    assert store.migrate_legacy_csv(str(legacy)) == 0
+    assert not legacy.exists()
+    assert store.count() == 1
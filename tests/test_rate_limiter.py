@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from unittest.mock import MagicMock
+import threading
+import pytest
+import requests
+from rate_limiter import (
+    TokenBucket,
+    call_with_rate_limit,
+    get_rate_limit_levels,
+    get_rate_limiter,
+    log_rate_limit_levels,
+    reset_rate_limiters,
+)
+from version_info import __version__
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+
+class FakeClock:
+    # sleepすると時刻が進む時計
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def bucket(capacity=2, period=2, **kwargs):
+    clock = FakeClock()
+    return TokenBucket("test", capacity, period, clock=clock, wall_clock=clock, sleep=clock.sleep, **kwargs), clock
+
+
+def test_acquire_waits_for_refill():
+    limiter, clock = bucket(capacity=2, period=2)
+    assert limiter.acquire() and limiter.acquire()
+    assert clock.sleeps == []
+    # 3回目は1トークン補充される（1秒）まで待つ
+    assert limiter.acquire()
+    assert sum(clock.sleeps) == pytest.approx(1.0)
+    assert limiter.try_acquire() is False
+    snapshot = limiter.snapshot()
+    assert snapshot["waits"] == 1 and snapshot["waited_seconds"] == pytest.approx(1.0)
+
+
+def test_server_headers_hold_bucket_until_reset():
+    limiter, clock = bucket(capacity=100, period=60)
+    limiter.update_from_headers({"ratelimit-limit": "30", "ratelimit-remaining": "1",
+                                 "ratelimit-reset": str(int(clock.now) + 300), "ratelimit-policy": "30;w=300"})
+    snapshot = limiter.snapshot()
+    assert snapshot["capacity"] == 30 and snapshot["tokens"] == 1
+    assert snapshot["refill_rate"] == pytest.approx(0.1)
+    assert snapshot["reset_in"] == pytest.approx(300)
+
+    assert limiter.acquire()
+    # リセット時刻までは補充しない（サーバーの窓に合わせる）
+    clock.now += 100
+    assert limiter.try_acquire() is False
+    assert limiter.acquire()
+    assert sum(clock.sleeps) == pytest.approx(200)
+    assert limiter.snapshot()["tokens"] == 29
+
+
+def test_headers_without_ratelimit_are_ignored():
+    limiter, _ = bucket()
+    assert limiter.update_from_headers({"Content-Type": "application/json"}) is False
+    assert limiter.update_from_headers(None) is False
+    assert limiter.update_from_headers(MagicMock()) is False
+    assert limiter.snapshot()["server_updates"] == 0
+
+
+def test_acquire_gives_up_after_max_wait():
+    limiter, clock = bucket(capacity=1, period=600, max_wait=5)
+    assert limiter.acquire()
+    assert limiter.acquire() is False
+    assert sum(clock.sleeps) == pytest.approx(5)
+    assert limiter.snapshot()["timeouts"] == 1
+
+
+def test_call_with_rate_limit_updates_from_error_response():
+    limiter, clock = bucket(capacity=10, period=10)
+    response = MagicMock(headers={"Ratelimit-Remaining": "0", "Ratelimit-Reset": str(int(clock.now) + 30)})
+    func = MagicMock(side_effect=requests.HTTPError(response=response))
+    with pytest.raises(requests.HTTPError):
+        call_with_rate_limit(limiter, func, "a", key="b")
+    func.assert_called_once_with("a", key="b")
+    assert limiter.snapshot()["tokens"] == 0
+
+    ok = MagicMock(return_value=MagicMock(headers={"Ratelimit-Remaining": "9"}))
+    assert call_with_rate_limit(limiter, ok) is ok.return_value
+    assert sum(clock.sleeps) == pytest.approx(30)
+
+
+def test_concurrent_acquire_never_oversubscribes():
+    limiter = TokenBucket("test", 5, 3600)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(limiter.try_acquire())) for _ in range(20)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results.count(True) == 5
+
+
+def test_shared_limiters_are_observable():
+    reset_rate_limiters()
+    limiter = get_rate_limiter("twitch.helix")
+    assert get_rate_limiter("twitch.helix") is limiter
+    limiter.try_acquire()
+    levels = get_rate_limit_levels()
+    assert levels["twitch.helix"]["capacity"] == 800
+    assert levels["twitch.helix"]["tokens"] == pytest.approx(799, abs=1)
+    log = MagicMock()
+    assert log_rate_limit_levels(log) == 1
+    assert log.info.call_args.args[0].startswith("呼び出し上限 twitch.helix: 残り 799/800, 待機 0回")
+    reset_rate_limiters()
+    assert get_rate_limit_levels() == {}
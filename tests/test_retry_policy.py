@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+import pytest
+import requests
+from retry_policy import (
+    RetryPolicy,
+    get_retry_metrics,
+    is_retryable_http_error,
+    log_retry_metrics,
+    reset_retry_metrics,
+    server_retry_delay,
+)
+from version_info import __version__
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+
+@pytest.fixture(autouse=True)
+def clear_metrics():
+    reset_retry_metrics()
+    yield
+    reset_retry_metrics()
+
+
+def http_error(status, headers=None):
+    response = MagicMock(status_code=status, headers=headers or {})
+    return requests.HTTPError(response=response)
+
+
+def test_backoff_is_full_jitter_with_cap():
+    policy = RetryPolicy("t", base_delay=2, max_delay=10, rng=lambda: 1.0)
+    assert [policy.backoff(n) for n in (1, 2, 3, 4)] == [2, 4, 8, 10]
+    policy.rng = lambda: 0.25
+    assert policy.backoff(3) == 2
+
+
+def test_server_retry_delay_from_headers():
+    assert server_retry_delay(http_error(429, {"Retry-After": "7"})) == 7
+    http_date = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+    assert 25 <= server_retry_delay(http_error(503, {"Retry-After": http_date})) <= 30
+    # TwitchのRatelimit-Reset（UNIX時刻）。atprotoのレスポンスは小文字のキー
+    assert server_retry_delay(http_error(429, {"Ratelimit-Reset": "1012"}), now=1000) == 12
+    assert server_retry_delay(http_error(200, {"ratelimit-remaining": "0", "ratelimit-reset": "1005"}), now=1000) == 5
+    # レート制限中でなければresetは使わない
+    assert server_retry_delay(http_error(500, {"Ratelimit-Reset": "1012"}), now=1000) is None
+    assert server_retry_delay(ValueError("x")) is None
+
+
+def test_http_errors_are_classified():
+    assert is_retryable_http_error(http_error(429)) is True
+    assert is_retryable_http_error(http_error(503)) is True
+    assert is_retryable_http_error(http_error(400)) is False
+    assert is_retryable_http_error(http_error(409)) is False
+    assert is_retryable_http_error(requests.ConnectionError("down")) is True
+    assert is_retryable_http_error(ValueError("x")) is None
+
+
+def test_call_retries_with_server_delay_and_counts_metrics():
+    sleeps = []
+    policy = RetryPolicy("twitch_test", max_attempts=3, base_delay=1, classify=is_retryable_http_error,
+                         sleep=sleeps.append, rng=lambda: 0.5)
+    func = MagicMock(side_effect=[http_error(429, {"Retry-After": "4"}), requests.Timeout("slow"), "ok"])
+
+    assert policy.call(func) == "ok"
+    assert sleeps == [4.0, 1.0]
+    metrics = get_retry_metrics()["twitch_test"]
+    assert metrics["calls"] == 1 and metrics["successes"] == 1
+    assert metrics["retries"] == 2 and metrics["rate_limited"] == 1
+
+
+def test_fatal_errors_and_exhausted_attempts_are_raised():
+    sleeps = []
+    policy = RetryPolicy("t", max_attempts=2, base_delay=1, retryable=(requests.RequestException,),
+                         classify=is_retryable_http_error, sleep=sleeps.append)
+    func = MagicMock(side_effect=http_error(400))
+    with pytest.raises(requests.HTTPError):
+        policy.call(func)
+    assert func.call_count == 1
+
+    func = MagicMock(side_effect=requests.ConnectionError("down"))
+    with pytest.raises(requests.ConnectionError):
+        policy.call(func)
+    assert func.call_count == 2
+    # 対象外の例外はそのまま送出する
+    with pytest.raises(KeyError):
+        policy.call(MagicMock(side_effect=KeyError("x")))
+    metrics = get_retry_metrics()["t"]
+    assert metrics["fatal"] == 2 and metrics["gave_up"] == 1
+
+
+def test_metrics_are_written_to_log():
+    policy = RetryPolicy("bluesky", max_attempts=2, base_delay=0, sleep=lambda d: None)
+    policy.call(MagicMock(side_effect=[http_error(429), "ok"]))
+    log = MagicMock()
+    assert log_retry_metrics(log) == 1
+    line = log.info.call_args.args[0]
+    assert line.startswith("リトライ集計 bluesky: 呼び出し 1回, 成功 1回, 再試行 1回 (うちレート制限 0回)")
+
+
+def test_deadline_stops_retrying():
+    policy = RetryPolicy("t", max_attempts=10, base_delay=1, deadline=5, sleep=lambda s: None)
+    func = MagicMock(side_effect=http_error(429, {"Retry-After": "30"}))
+    with pytest.raises(requests.HTTPError):
+        policy.call(func)
+    # 30秒待つと期限を超えるため、再試行せずに諦める
+    assert func.call_count == 1
+
+
+def test_retry_on_exception_uses_policy():
+    from utils import retry_on_exception
+
+    func = MagicMock(side_effect=[http_error(503, {"Retry-After": "3"}), "ok"])
+    func.__name__ = "fetch"
+    with patch("retry_policy.time.sleep") as mock_sleep:
+        wrapped = retry_on_exception(max_retries=2, wait_seconds=1,
+                                     exceptions=(requests.RequestException,))(func)
+        assert wrapped() == "ok"
+    mock_sleep.assert_called_once_with(3.0)
+    assert get_retry_metrics()["fetch"]["retries"] == 1
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+import threading
+import time
+import pytest
+from startup_graph import StartupGraph, StartupStepFailed, STEP_DONE, STEP_FAILED, STEP_SKIPPED
+from version_info import __version__
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+
+def _sleeper(seconds, order=None, name=None):
+    def step():
+        time.sleep(seconds)
+        if order is not None:
+            order.append(name)
+        return True
+    return step
+
+
+def test_independent_steps_overlap_and_dependents_wait():
+    order = []
+    graph = StartupGraph()
+    graph.add("validate", _sleeper(0.0, order, "validate"))
+    graph.add("token", _sleeper(0.3, order, "token"), depends=("validate",))
+    graph.add("tunnel", _sleeper(0.3, order, "tunnel"), depends=("validate",))
+    graph.add("eventsub", _sleeper(0.0, order, "eventsub"), depends=("token", "tunnel"))
+    events = []
+
+    result = graph.run(on_event=events.append)
+
+    assert result.success
+    assert order[0] == "validate" and order[-1] == "eventsub"
+    # 所要時間は合計ではなく最長の経路（約0.3秒）になる
+    assert result.sequential_seconds() >= 0.6
+    assert result.total_seconds < 0.5
+    assert set(result.timings) == {"validate", "token", "tunnel", "eventsub"}
+    assert [e["state"] for e in events if e["step"] == "eventsub"] == ["running", "done"]
+    assert result.finished_at["eventsub"] >= max(result.finished_at["token"], result.finished_at["tunnel"])
+
+
+def test_failure_waits_for_running_steps_and_skips_dependents():
+    tunnel_done = threading.Event()
+
+    def failing_token():
+        raise RuntimeError("oauth down")
+
+    def tunnel():
+        time.sleep(0.1)
+        tunnel_done.set()
+
+    graph = StartupGraph()
+    graph.add("token", failing_token, label="トークン取得")
+    graph.add("tunnel", tunnel)
+    graph.add("eventsub", _sleeper(0.0), depends=("token", "tunnel"))
+    events = []
+
+    result = graph.run(on_event=events.append)
+
+    assert not result.success
+    assert result.failed_step == "token"
+    assert isinstance(result.error, RuntimeError)
+    assert tunnel_done.is_set()
+    assert result.states == {"token": STEP_FAILED, "tunnel": STEP_DONE, "eventsub": STEP_SKIPPED}
+    failed = [e for e in events if e["state"] == STEP_FAILED][0]
+    assert failed["label"] == "トークン取得" and failed["error"] == "oauth down"
+
+
+def test_step_returning_false_fails_the_graph():
+    graph = StartupGraph()
+    graph.add("token", lambda: False, label="トークン取得")
+    result = graph.run()
+    assert result.failed_step == "token"
+    assert isinstance(result.error, StartupStepFailed)
+
+
+def test_unknown_dependency_is_rejected():
+    graph = StartupGraph()
+    with pytest.raises(ValueError):
+        graph.add("eventsub", lambda: True, depends=("token",))
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from datetime import datetime, timezone
+from unittest.mock import patch
+import pytest
+import pytz
+import timezone_service
+from app_settings import AppSettings
+from timezone_service import _normalize_rfc3339, get_timezone, localize, parse_rfc3339
+from version_info import __version__
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+
+def test_timezone_is_resolved_once_per_settings_snapshot():
+    tokyo = AppSettings.from_mapping({"TIMEZONE": "Asia/Tokyo"})
+    with patch("timezone_service.resolve_timezone", wraps=timezone_service.resolve_timezone) as resolve:
+        for _ in range(100):
+            assert get_timezone(tokyo).zone == "Asia/Tokyo"
+        assert resolve.call_count == 1
+
+        # 設定が差し替わったら解決し直す
+        utc = AppSettings.from_mapping({"TIMEZONE": "UTC"})
+        assert get_timezone(utc).zone == "UTC"
+        assert resolve.call_count == 2
+
+
+def test_unknown_timezone_falls_back_to_utc(caplog):
+    settings = AppSettings.from_mapping({"TIMEZONE": "Mars/OlympusMons"})
+    assert get_timezone(settings) is timezone.utc
+    assert "'Mars/OlympusMons' が不明です" in caplog.text
+
+
+@pytest.mark.parametrize("value, expected", [
+    # Twitchのナノ秒精度はマイクロ秒に切り詰める
+    ("2024-05-26T13:45:00.123456789Z", datetime(2024, 5, 26, 13, 45, 0, 123456, timezone.utc)),
+    ("2024-05-26T13:45:00.5Z", datetime(2024, 5, 26, 13, 45, 0, 500000, timezone.utc)),
+    ("2024-05-26T13:45:00Z", datetime(2024, 5, 26, 13, 45, 0, tzinfo=timezone.utc)),
+    ("2024-05-26T22:45:00.123+09:00", datetime(2024, 5, 26, 13, 45, 0, 123000, timezone.utc)),
+    # タイムゾーンなしはUTCとみなす
+    ("2024-05-26T13:45:00", datetime(2024, 5, 26, 13, 45, 0, tzinfo=timezone.utc)),
+])
+def test_parse_rfc3339(value, expected):
+    parsed = parse_rfc3339(value)
+    assert parsed == expected
+    assert parsed.tzinfo is not None
+
+
+def test_normalize_rfc3339_for_older_fromisoformat():
+    assert _normalize_rfc3339("2024-05-26T13:45:00.123456789Z") == "2024-05-26T13:45:00.123456+00:00"
+    assert _normalize_rfc3339("2024-05-26T13:45:00.1-05:00") == "2024-05-26T13:45:00.100000-05:00"
+    assert _normalize_rfc3339("2024-05-26T13:45:00Z") == "2024-05-26T13:45:00+00:00"
+    with pytest.raises(ValueError):
+        parse_rfc3339("not-a-date")
+
+
+def test_localize_supports_pytz_and_fixed_offsets():
+    naive = datetime(2024, 1, 1, 12, 0)
+    assert localize(naive, pytz.timezone("Asia/Tokyo")).utcoffset().total_seconds() == 9 * 3600
+    assert localize(naive, timezone.utc).tzinfo is timezone.utc
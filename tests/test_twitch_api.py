@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import threading
+import pytest
+import eventsub
+from rate_limiter import TokenBucket
+from twitch_api import TwitchApiClient
+from version_info import __version__
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+
+class _TwitchStubHandler(BaseHTTPRequestHandler):
+    # keep-aliveに対応したTwitch APIのスタブ
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body=None):
+        data = json.dumps(body).encode("utf-8") if body is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in self.server.ratelimit_headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _record(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        self.server.requests.append((self.command, self.path, dict(self.headers), body))
+        if self.server.fail_next:
+            self.server.fail_next -= 1
+            self._reply(503, {"error": "Service Unavailable"})
+            return False
+        return True
+
+    def do_GET(self):
+        if self._record():
+            self._reply(200, {"data": self.server.subscriptions})
+
+    def do_POST(self):
+        if self._record():
+            self._reply(202, {"data": [{"id": f"new-{len(self.server.requests)}", "status": "enabled"}]})
+
+    def do_DELETE(self):
+        if self._record():
+            self._reply(204)
+
+
+@pytest.fixture
+def twitch_stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _TwitchStubHandler)
+    server.connections = 0
+    server.requests = []
+    server.subscriptions = []
+    server.fail_next = 0
+    server.ratelimit_headers = {}
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base = f"http://127.0.0.1:{server.server_address[1]}"
+    yield server, base
+    server.shutdown()
+    server.server_close()
+
+
+def _client(base, **kwargs):
+    return TwitchApiClient("client-id", helix_base_url=f"{base}/helix",
+                           oauth_base_url=f"{base}/oauth2", retry_backoff=0, **kwargs)
+
+
+def test_default_headers_and_bearer_token(twitch_stub):
+    server, base = twitch_stub
+    client = _client(base)
+    client.get("/eventsub/subscriptions", token="abc")
+    _, path, headers, _ = server.requests[0]
+    assert path == "/helix/eventsub/subscriptions"
+    assert headers["Client-ID"] == "client-id"
+    assert headers["Authorization"] == "Bearer abc"
+    assert client.timeout == (5.0, 20.0)
+    client.close()
+
+
+def test_idempotent_requests_are_retried(twitch_stub):
+    # GETは503でもurllib3のRetryで再試行され、POSTは再試行されない
+    server, base = twitch_stub
+    client = _client(base, retry_total=2)
+    server.fail_next = 1
+    assert client.get("/eventsub/subscriptions", token="t").status_code == 200
+    assert len(server.requests) == 2
+
+    server.fail_next = 1
+    assert client.post("/eventsub/subscriptions", token="t", json={}).status_code == 503
+    assert len(server.requests) == 3
+    client.close()
+
+
+def test_startup_sequence_reuses_one_connection(twitch_stub, monkeypatch):
+    # 起動時のクリーンアップ→一覧取得→作成×2が1本の接続を使い回すことを確認
+    server, base = twitch_stub
+    server.subscriptions = [
+        {"id": "old", "type": "stream.online", "status": "enabled",
+         "condition": {"broadcaster_user_id": "999"},
+         "transport": {"callback": "https://old.example.com/webhook"}},
+    ]
+    client = _client(base)
+    monkeypatch.setattr(eventsub, "_twitch_api_client", client)
+    monkeypatch.setattr(eventsub, "get_valid_app_access_token", lambda logger_to_use=None: "token")
+    monkeypatch.setattr(eventsub, "TWITCH_BROADCASTER_ID", "12345")
+
+    eventsub.cleanup_eventsub_subscriptions("https://new.example.com/webhook")
+    eventsub.create_eventsub_subscription("stream.online", webhook_url="https://new.example.com/webhook")
+    eventsub.create_eventsub_subscription("stream.offline", webhook_url="https://new.example.com/webhook")
+
+    methods = [r[0] for r in server.requests]
+    assert methods == ["GET", "DELETE", "GET", "POST", "GET", "POST"]
+    assert server.requests[1][1] == "/helix/eventsub/subscriptions?id=old"
+    assert server.connections == 1
+    client.close()
+
+
+def test_helix_requests_wait_at_rate_limiter(twitch_stub):
+    # 残り0のRatelimitヘッダーを受け取ったら、リセット時刻まで待ってから次のリクエストを送る
+    server, base = twitch_stub
+    clock = [1000.0]
+    sleeps = []
+
+    def fake_sleep(seconds):
+        sleeps.append(seconds)
+        clock[0] += seconds
+
+    limiter = TokenBucket("twitch.helix", 800, 60, clock=lambda: clock[0], wall_clock=lambda: clock[0],
+                          sleep=fake_sleep)
+    client = _client(base, rate_limiter=limiter)
+    server.ratelimit_headers = {"Ratelimit-Limit": "800", "Ratelimit-Remaining": "0", "Ratelimit-Reset": "1030"}
+    client.get("/eventsub/subscriptions", token="t")
+    assert limiter.snapshot()["tokens"] == 0
+
+    server.ratelimit_headers = {"Ratelimit-Limit": "800", "Ratelimit-Remaining": "799", "Ratelimit-Reset": "1090"}
+    client.get("/eventsub/subscriptions", token="t")
+    assert sum(sleeps) == pytest.approx(30)
+    assert len(server.requests) == 2
+    levels = limiter.snapshot()
+    assert levels["tokens"] == 799 and levels["waits"] == 1
+
+    # OAuthのエンドポイントは対象外
+    client.post(f"{base}/oauth2/token")
+    assert limiter.snapshot()["tokens"] == 799
+    client.close()
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+import json
+import os
+import stat
+import sys
+import threading
+import time
+import pytest
+from twitch_token_manager import AppTokenManager
+from version_info import __version__
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+
+class _FakeOAuth:
+    # client credentialsのトークン発行を模したスタブ
+    def __init__(self, lifetime=3600, delay=0):
+        self.lifetime = lifetime
+        self.delay = delay
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def fetch(self):
+        with self._lock:
+            self.calls += 1
+            n = self.calls
+        if self.delay:
+            time.sleep(self.delay)
+        return f"token-{n}", time.time() + self.lifetime
+
+
+def _manager(tmp_path, oauth, **kwargs):
+    kwargs.setdefault("token_path", str(tmp_path / "app_token.json"))
+    return AppTokenManager("client-id", fetch_token=oauth.fetch, **kwargs)
+
+
+def test_token_is_persisted_and_reused_after_restart(tmp_path):
+    oauth = _FakeOAuth()
+    first = _manager(tmp_path, oauth)
+    assert first.get_token() == "token-1"
+    path = tmp_path / "app_token.json"
+    assert json.loads(path.read_text(encoding="utf-8"))["access_token"] == "token-1"
+    if sys.platform != "win32":
+        assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+
+    # 再起動相当：新しいマネージャーはファイルのトークンを検証して使い回す
+    validated = []
+    second = _manager(tmp_path, oauth, validate_token=lambda t: validated.append(t) or 3000)
+    assert second.get_token() == "token-1"
+    assert validated == ["token-1"]
+    assert oauth.calls == 1
+
+
+def test_revoked_or_foreign_token_is_fetched_again(tmp_path):
+    oauth = _FakeOAuth()
+    _manager(tmp_path, oauth).get_token()
+
+    # /validateで無効と判定されたら再取得する
+    revoked = _manager(tmp_path, oauth, validate_token=lambda t: None)
+    assert revoked.get_token() == "token-2"
+
+    # 別のクライアントIDのトークンは使わない
+    other = AppTokenManager("other-client", fetch_token=oauth.fetch,
+                            token_path=str(tmp_path / "app_token.json"))
+    assert other.get_token() == "token-3"
+
+
+def test_invalidate_discards_only_the_rejected_token(tmp_path):
+    # 401になったトークンだけを破棄し、別スレッドが取り直したトークンは残す
+    oauth = _FakeOAuth()
+    manager = _manager(tmp_path, oauth)
+    assert manager.get_token() == "token-1"
+    manager.invalidate("token-1")
+    assert not (tmp_path / "app_token.json").exists()
+    assert manager.get_token() == "token-2"
+    manager.invalidate("token-1")
+    assert manager.get_token() == "token-2"
+    assert oauth.calls == 2
+
+
+def test_validate_error_falls_back_to_stored_expiry(tmp_path):
+    oauth = _FakeOAuth()
+    _manager(tmp_path, oauth).get_token()
+
+    def unreachable(token):
+        raise ConnectionError("offline")
+
+    manager = _manager(tmp_path, oauth, validate_token=unreachable)
+    assert manager.get_token() == "token-1"
+    assert oauth.calls == 1
+
+
+def test_concurrent_callers_share_one_fetch(tmp_path):
+    oauth = _FakeOAuth(delay=0.2)
+    manager = _manager(tmp_path, oauth)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(manager.get_token())) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == ["token-1"] * 8
+    assert oauth.calls == 1
+
+
+def test_background_refresh_does_not_block_callers(tmp_path):
+    oauth = _FakeOAuth(lifetime=2)
+    manager = _manager(tmp_path, oauth, refresh_ratio=0.5)
+    assert manager.get_token() == "token-1"
+    assert manager.refresh_at == pytest.approx(manager.expires_at - 1, abs=0.1)
+
+    # 2回目の取得はOAuth側が応答するまで止めておく
+    release = threading.Event()
+    original_fetch = oauth.fetch
+
+    def slow_fetch():
+        release.wait(5)
+        return original_fetch()
+
+    manager.fetch_token = slow_fetch
+    manager.start()
+    try:
+        time.sleep(1.2)
+        started = time.monotonic()
+        # 更新中でも有効期限内の古いトークンが待たずに返る
+        assert manager.get_token() == "token-1"
+        assert time.monotonic() - started < 0.1
+        release.set()
+        deadline = time.monotonic() + 3
+        while manager.refresh_count < 2 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        assert manager.get_token() == "token-2"
+    finally:
+        release.set()
+        manager.stop()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+import time
+from twitch_user_resolver import TwitchUserResolver, UserIdCache
+from version_info import __version__
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+
+class _FakeHelixUsers:
+    # Helix /users を模したスタブ（存在しないログイン名は返さない）
+    def __init__(self, unknown=()):
+        self.unknown = set(unknown)
+        self.batches = []
+
+    def fetch(self, logins):
+        self.batches.append(list(logins))
+        return [{"id": str(1000 + int(login[4:])), "login": login}
+                for login in logins if login not in self.unknown]
+
+
+def test_misses_are_batched_by_100_and_cached_across_restarts(tmp_path):
+    helix = _FakeHelixUsers()
+    path = str(tmp_path / "user_ids.json")
+    logins = [f"user{i}" for i in range(250)]
+
+    resolver = TwitchUserResolver(helix.fetch, UserIdCache(path))
+    result = resolver.resolve(logins)
+    assert [len(b) for b in helix.batches] == [100, 100, 50]
+    assert result["user0"] == "1000" and result["user249"] == "1249"
+
+    # 再起動相当：キャッシュファイルから解決し、APIは呼ばない
+    restarted = TwitchUserResolver(helix.fetch, UserIdCache(path))
+    assert restarted.resolve(logins) == result
+    assert restarted.request_count == 0
+    assert len(helix.batches) == 3
+
+
+def test_only_expired_and_unknown_logins_are_fetched(tmp_path):
+    helix = _FakeHelixUsers(unknown={"user9"})
+    cache = UserIdCache(str(tmp_path / "user_ids.json"), ttl_seconds=60)
+    cache.put_many({"user1": "1001"})
+    cache.put_many({"user2": "1002"}, now=time.time() - 120)
+
+    resolver = TwitchUserResolver(helix.fetch, cache)
+    result = resolver.resolve(["User1", "user2", "user9", "12345", "user1"])
+    assert helix.batches == [["user2", "user9"]]
+    # 数値はIDとしてそのまま返し、存在しないログイン名は含めない
+    assert result == {"user1": "1001", "user2": "1002", "12345": "12345"}
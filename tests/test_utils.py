@@ -8,12 +8,14 @@ import logging  # caplog.set_level用
 import pytest
 import os
 import pytz  # pytzのインポート
+import threading
 from unittest.mock import patch, MagicMock  # patchの追加
 from utils import (
     update_env_file_preserve_comments,
     rotate_secret_if_needed,
     format_datetime_filter  # format_datetime_filterの追加
 )
+from app_settings import reset_settings
 from version_info import __version__
 
 __author__ = "mayuneco(mayunya)"
@@ -88,6 +90,24 @@ def test_update_env_file_preserve_comments_multiple_updates(env_file):
     assert "KEY2=VALUE2 # インラインコメント\n" in content  # 元のkey2も保持されている
 
 
+def test_update_env_file_concurrent_writes_are_not_lost(env_file):
+    # 並行して別のキーを書き換えても、どの更新も失われない
+    threads = [
+        threading.Thread(target=update_env_file_preserve_comments, args=(env_file, {f"KEY_T{i}": str(i)}))
+        for i in range(20)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    with open(env_file, "r", encoding='utf-8') as f:
+        content = f.read()
+    for i in range(20):
+        assert f"KEY_T{i}={i}\n" in content
+    assert "KEY1=VALUE1\n" in content
+    assert not os.path.exists(f"{env_file}.tmp")
+
+
 @pytest.fixture
 def mock_env_for_rotate(monkeypatch, env_file):
     # rotate_secret_if_needed 内の SETTINGS_ENV_PATH をテスト用パスに差し替え
@@ -173,6 +193,13 @@ def test_rotate_secret_if_needed_force_rotation(
 
 
 class TestFormatDateTimeFilter:
+    @pytest.fixture(autouse=True)
+    def reset_app_settings(self):
+        # TIMEZONEは設定スナップショットから読むため、テストごとに作り直す
+        reset_settings()
+        yield
+        reset_settings()
+
     def test_basic_formatting_default_utc(self, monkeypatch):
         monkeypatch.setenv("TIMEZONE", "UTC")
         iso_str = "2023-10-27T10:00:00Z"
@@ -214,7 +241,7 @@ class TestFormatDateTimeFilter:
         mock_local_tz = MagicMock()
         mock_local_tz.zone = "Europe/London"  # 例としてロンドン
 
-        with patch('utils.get_localzone', return_value=pytz.timezone("Europe/London")):
+        with patch('timezone_service.get_localzone', return_value=pytz.timezone("Europe/London")):
             monkeypatch.setenv("TIMEZONE", "system")
             iso_str_utc = "2023-10-27T10:00:00Z"
             # 期待値: 2023-10-27 11:00 BST（DST期間中）
@@ -249,7 +276,7 @@ class TestFormatDateTimeFilter:
 
     def test_get_localzone_returns_none(self, monkeypatch, caplog):
         monkeypatch.setenv("TIMEZONE", "system")
-        with patch('utils.get_localzone', return_value=None):
+        with patch('timezone_service.get_localzone', return_value=None):
             iso_str = "2023-10-27T10:00:00Z"
             result = format_datetime_filter(iso_str)
         assert "tzlocal.get_localzone()がNoneを返しました。UTCにフォールバックします。" in caplog.text
@@ -259,7 +286,7 @@ class TestFormatDateTimeFilter:
 
     def test_get_localzone_raises_exception(self, monkeypatch, caplog):
         monkeypatch.setenv("TIMEZONE", "system")
-        with patch('utils.get_localzone', side_effect=Exception("tzlocal failed")):
+        with patch('timezone_service.get_localzone', side_effect=Exception("tzlocal failed")):
             iso_str = "2023-10-27T10:00:00Z"
             result = format_datetime_filter(iso_str)
         assert "tzlocalでシステムタイムゾーン取得エラー: tzlocal failed。UTCにフォールバックします。" in caplog.text
@@ -23,8 +23,10 @@ Stream notify on Bluesky
 from niconico_monitor import NiconicoMonitor
 from youtube_monitor import YouTubeMonitor
 import pytest
+import requests
 import types
 import time
+from unittest.mock import MagicMock, patch
 from version_info import __version__
 import sys
 import os
@@ -68,7 +70,11 @@ def dummy_youtube_monitor(monkeypatch):
     monkeypatch.setattr(YouTubeMonitor, "check_live", fake_check_live)
     monkeypatch.setattr(YouTubeMonitor, "get_latest_video_id",
                         fake_get_latest_video_id)
-    return monitor
+    yield monitor
+    # 監視スレッドを止め、後続のテストのrequests.getのモックを呼ばないようにする
+    monitor.shutdown_event.set()
+    if monitor.is_alive():
+        monitor.join(timeout=1)
 
 
 @pytest.fixture
@@ -102,7 +108,10 @@ def dummy_niconico_monitor(monkeypatch):
                         fake_get_latest_live_id)
     monkeypatch.setattr(
         NiconicoMonitor, "get_latest_video_id", fake_get_latest_video_id)
-    return monitor
+    yield monitor
+    monitor.shutdown_event.set()
+    if monitor.is_alive():
+        monitor.join(timeout=1)
 
 
 def test_youtube_monitor_triggers_callbacks(dummy_youtube_monitor):
@@ -119,3 +128,227 @@ def test_niconico_monitor_triggers_callbacks(dummy_niconico_monitor):
     time.sleep(0.3)
     assert dummy_niconico_monitor.live_called
     assert dummy_niconico_monitor.video_called
+
+
+class _FakeYouTubeApi:
+    # YouTube Data APIのダミー。エンドポイントごとの呼び出しを記録する
+    def __init__(self, videos):
+        self.videos = videos
+        self.calls = []
+
+    def get(self, url, params=None, timeout=None):
+        endpoint = url.rsplit("/", 1)[-1]
+        self.calls.append((endpoint, dict(params)))
+        if endpoint == "channels":
+            data = {"items": [{"contentDetails": {"relatedPlaylists": {"uploads": "UUdummy"}}}]}
+        elif endpoint == "playlistItems":
+            items = [{"contentDetails": {"videoId": v["id"]}} for v in self.videos]
+            data = {"items": items[:params["maxResults"]]}
+        elif endpoint == "videos":
+            ids = params["id"].split(",")
+            data = {"items": [v for v in self.videos if v["id"] in ids]}
+        else:
+            raise AssertionError(f"unexpected endpoint: {endpoint}")
+        resp = MagicMock()
+        resp.json.return_value = data
+        return resp
+
+
+def _video(video_id, broadcast="none", live_details=None):
+    video = {"id": video_id, "snippet": {"liveBroadcastContent": broadcast}}
+    if live_details is not None:
+        video["liveStreamingDetails"] = live_details
+    return video
+
+
+def _youtube_monitor(monkeypatch, videos, **kwargs):
+    api = _FakeYouTubeApi(videos)
+    monkeypatch.setattr("youtube_monitor.requests.get", api.get)
+    monitor = YouTubeMonitor("key", "UCdummy", 60, lambda info: None, lambda vid: None, **kwargs)
+    return monitor, api
+
+
+def test_youtube_monitor_uses_uploads_playlist_instead_of_search(monkeypatch):
+    # 配信中の枠と通常動画を1サイクルのplaylistItems.list＋videos.listだけで判定する
+    videos = [
+        _video("live1", "live", {"actualStartTime": "2024-01-01T00:00:00Z"}),
+        _video("upcoming1", "upcoming", {"scheduledStartTime": "2024-02-01T00:00:00Z"}),
+        _video("video1"),
+        _video("video0"),
+    ]
+    monitor, api = _youtube_monitor(monkeypatch, videos)
+    monitor._in_cycle = True
+    monitor.quota.start_cycle()
+    assert monitor.check_live() is True
+    assert monitor.get_latest_video_id() == "video1"
+    usage = monitor.quota.end_cycle()
+
+    assert [c[0] for c in api.calls] == ["channels", "playlistItems", "videos"]
+    assert usage["units"] == 3
+    assert usage["calls"] == {"channels.list": 1, "playlistItems.list": 1, "videos.list": 1}
+
+
+def test_youtube_monitor_resolves_playlist_once(monkeypatch):
+    monitor, api = _youtube_monitor(monkeypatch, [_video("video1")])
+    monitor.get_latest_video_id()
+    monitor.quota.start_cycle()
+    monitor.get_latest_video_id()
+    usage = monitor.quota.end_cycle()
+    assert [c[0] for c in api.calls].count("channels") == 1
+    assert usage["units"] == 2
+    assert usage["total_units"] == 5
+
+
+def test_youtube_monitor_batches_videos_list_by_50(monkeypatch):
+    videos = [_video(f"v{i}") for i in range(60)]
+    monitor, api = _youtube_monitor(monkeypatch, videos)
+    result = monitor.get_videos([v["id"] for v in videos])
+    video_calls = [c for c in api.calls if c[0] == "videos"]
+    assert len(video_calls) == 2
+    assert len(video_calls[0][1]["id"].split(",")) == 50
+    assert [v["id"] for v in result] == [v["id"] for v in videos]
+    assert monitor.quota.total_units == 2
+
+
+def test_youtube_monitor_finished_stream_is_not_live(monkeypatch):
+    videos = [_video("archive1", "none", {"actualStartTime": "t1", "actualEndTime": "t2"}),
+              _video("video1")]
+    monitor, _ = _youtube_monitor(monkeypatch, videos)
+    assert monitor.check_live() is False
+    assert monitor.get_latest_video_id() == "video1"
+
+
+RSS_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<rss version="2.0"><channel><title>feed</title>
+{items}
+</channel></rss>"""
+
+
+class _FakeRssServer:
+    # ETag/Last-Modifiedに対応したRSS配信のダミー
+    def __init__(self, entry_ids):
+        self.calls = []
+        self.set_entries(entry_ids)
+
+    def set_entries(self, entry_ids):
+        items = "".join(
+            f"<item><title>{i}</title><guid>{i}</guid><link>https://example.com/{i}</link></item>"
+            for i in entry_ids)
+        self.body = RSS_TEMPLATE.format(items=items).encode("utf-8")
+        self.etag = f'"{abs(hash(self.body))}"'
+
+    def get(self, url, headers=None, timeout=None):
+        # 他のテストが起動した監視スレッドからの取得は対象外にする
+        if "/user/123" not in url:
+            raise requests.ConnectionError(f"unexpected url: {url}")
+        headers = headers or {}
+        self.calls.append(headers)
+        resp = MagicMock()
+        if headers.get("If-None-Match") == self.etag:
+            resp.status_code = 304
+            resp.content = b""
+        else:
+            resp.status_code = 200
+            resp.content = self.body
+            resp.headers = {"ETag": self.etag, "Last-Modified": "Mon, 01 Jan 2024 00:00:00 GMT"}
+        return resp
+
+
+def test_niconico_monitor_conditional_get_skips_parse(monkeypatch):
+    server = _FakeRssServer(["lv2", "lv1"])
+    monkeypatch.setattr("niconico_monitor.requests.get", server.get)
+    monitor = NiconicoMonitor("123", 60, lambda lid: None, lambda vid: None)
+
+    assert monitor.get_latest_live_id() == "lv2"
+    assert server.calls[0] == {}
+    first = monitor.get_poll_stats()["live"]
+    assert first["status"] == 200 and first["bytes"] == len(server.body)
+
+    # 更新がなければ304となり、解析せずに前回のIDを返す
+    with patch("niconico_monitor.feedparser.parse", side_effect=AssertionError("should not parse")):
+        assert monitor.get_latest_live_id() == "lv2"
+    assert server.calls[1] == {"If-None-Match": server.etag,
+                               "If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"}
+    stats = monitor.get_poll_stats()["live"]
+    assert stats["status"] == 304
+    assert stats["bytes"] == 0 and stats["parse_seconds"] == 0.0
+    assert stats["not_modified"] == 1 and stats["polls"] == 2
+
+    # フィードが更新されたら再取得して新しいIDを返す
+    server.set_entries(["lv3", "lv2", "lv1"])
+    assert monitor.get_latest_live_id() == "lv3"
+
+
+def test_niconico_monitor_tracks_feeds_separately(monkeypatch):
+    live_server = _FakeRssServer(["lv1"])
+    video_server = _FakeRssServer(["sm1"])
+
+    def fake_get(url, headers=None, timeout=None):
+        server = live_server if "live.nicovideo.jp" in url else video_server
+        return server.get(url, headers=headers, timeout=timeout)
+
+    monkeypatch.setattr("niconico_monitor.requests.get", fake_get)
+    monitor = NiconicoMonitor("123", 60, lambda lid: None, lambda vid: None)
+    assert monitor.get_latest_live_id() == "lv1"
+    assert monitor.get_latest_video_id() == "sm1"
+    assert monitor.live_feed.etag == live_server.etag
+    assert monitor.video_feed.etag == video_server.etag
+
+
+def test_niconico_feed_http_error_does_not_block_other_feed(monkeypatch):
+    # 生放送RSSが404でも動画RSSは確認し、監視間隔も延ばさない
+    video_server = _FakeRssServer(["sm1"])
+
+    def fake_get(url, headers=None, timeout=None):
+        if "live.nicovideo.jp" in url:
+            resp = MagicMock(status_code=404)
+            resp.raise_for_status.side_effect = requests.HTTPError(response=resp)
+            return resp
+        return video_server.get(url, headers=headers, timeout=timeout)
+
+    monkeypatch.setattr("niconico_monitor.requests.get", fake_get)
+    videos = []
+    monitor = NiconicoMonitor("123", 60, lambda lid: None, videos.append)
+    assert monitor.poll_once() == 60
+    assert monitor.poll_once() == 60
+    assert videos == ["sm1"]
+    stats = monitor.get_poll_stats()
+    assert stats["live"]["status"] == 404 and stats["video"]["status"] == 304
+    assert monitor.consecutive_failures == 0
+
+
+def test_niconico_rate_limit_delays_next_poll(monkeypatch):
+    # 429の場合は両方のフィードを確認したうえで、Retry-Afterに従って次回を遅らせる
+    video_server = _FakeRssServer(["sm1"])
+
+    def fake_get(url, headers=None, timeout=None):
+        if "live.nicovideo.jp" in url:
+            resp = MagicMock(status_code=429, headers={"Retry-After": "600"})
+            resp.raise_for_status.side_effect = requests.HTTPError(response=resp)
+            return resp
+        return video_server.get(url, headers=headers, timeout=timeout)
+
+    monkeypatch.setattr("niconico_monitor.requests.get", fake_get)
+    videos = []
+    monitor = NiconicoMonitor("123", 60, lambda lid: None, videos.append)
+    assert monitor.poll_once() == 600
+    assert videos == ["sm1"]
+
+
+def test_monitor_backs_off_after_consecutive_failures(monkeypatch):
+    monitor, _ = _youtube_monitor(monkeypatch, [])
+    monitor.retry_policy.rng = lambda: 1.0
+    error = requests.ConnectionError("down")
+    # 連続失敗のたびに間隔を延ばし、監視間隔の16倍で頭打ちにする
+    waits = [monitor.next_poll_delay(error) for _ in range(6)]
+    assert waits == [60, 120, 240, 480, 960, 960]
+
+    # レート制限のRetry-Afterがあればそれに従う（監視間隔より短くはしない）
+    limited = requests.HTTPError(response=MagicMock(status_code=429, headers={"Retry-After": "3600"}))
+    assert monitor.next_poll_delay(limited) == 3600
+    assert monitor.next_poll_delay(
+        requests.HTTPError(response=MagicMock(status_code=429, headers={"Retry-After": "5"}))) == 60
+
+    niconico = NiconicoMonitor("123", 30, lambda lid: None, lambda vid: None)
+    niconico.retry_policy.rng = lambda: 1.0
+    assert [niconico.next_poll_delay(error) for _ in range(2)] == [30, 60]
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from version_info import __version__
+from app_settings import get_settings
+from datetime import datetime, timezone
+from tzlocal import get_localzone
+import logging
+import pytz
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+logger = logging.getLogger("AppLogger")
+
+# (設定スナップショット, 解決済みのtzinfo)。スナップショットが差し替わったときだけ解決し直す
+_resolved = (None, None)
+
+
+def resolve_timezone(timezone_name, logger_to_use=None):
+    """
+    TIMEZONEの設定値からtzinfoを返す。
+    "system"ならシステムのタイムゾーン、不明な名前や取得失敗時はUTCにフォールバックする
+    """
+    current_logger = logger_to_use if logger_to_use else logger
+    timezone_name = (timezone_name or "system").strip()
+    if timezone_name.lower() == "system":
+        try:
+            tz = get_localzone()
+        except Exception as e:
+            current_logger.warning(f"tzlocalでシステムタイムゾーン取得エラー: {e}。UTCにフォールバックします。")
+            return timezone.utc
+        if tz is None:
+            current_logger.warning("tzlocal.get_localzone()がNoneを返しました。UTCにフォールバックします。")
+            return timezone.utc
+        return tz
+    try:
+        return pytz.timezone(timezone_name)
+    except pytz.UnknownTimeZoneError:
+        current_logger.warning(f"設定のタイムゾーン '{timezone_name}' が不明です。UTCにフォールバックします。")
+    except Exception as e:
+        current_logger.warning(f"タイムゾーン '{timezone_name}' の処理中にエラーが発生しました ({e})。UTCにフォールバックします。")
+    return timezone.utc
+
+
+def get_timezone(settings=None):
+    """
+    現在の設定のタイムゾーンを返す（設定スナップショットごとに一度だけ解決する）
+    """
+    global _resolved
+    settings = settings if settings is not None else get_settings()
+    cached_settings, tz = _resolved
+    if cached_settings is not settings:
+        tz = resolve_timezone(settings.timezone)
+        _resolved = (settings, tz)
+    return tz
+
+
+def now_local():
+    # 設定のタイムゾーンでの現在時刻
+    return datetime.now(get_timezone())
+
+
+def localize(dt, tz):
+    # タイムゾーンなしの日時にtzを付与する（pytzとzoneinfoの両方に対応）
+    if dt.tzinfo is not None:
+        return dt.astimezone(tz)
+    if hasattr(tz, "localize"):
+        return tz.localize(dt)
+    return dt.replace(tzinfo=tz)
+
+
+def parse_rfc3339(value):
+    """
+    ISO-8601/RFC3339形式の日時文字列をタイムゾーン付きdatetimeに変換する。
+    Twitchのナノ秒精度（例: 2024-05-26T13:45:00.123456789Z）はマイクロ秒に切り詰め、
+    タイムゾーンのない文字列はUTCとみなす
+    """
+    try:
+        # Python 3.11以降はZ・7桁以上の小数秒もそのまま解釈できる（最速の経路）
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        dt = datetime.fromisoformat(_normalize_rfc3339(value))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+def _normalize_rfc3339(value):
+    # 古いPythonのfromisoformatが解釈できる形（+00:00・小数秒6桁）に直す
+    value = value.strip()
+    if value[-1:] in ("Z", "z"):
+        value = value[:-1] + "+00:00"
+    dot = value.find(".", 19)
+    if dot == -1:
+        return value
+    end = dot + 1
+    while end < len(value) and value[end].isdigit():
+        end += 1
+    fraction = value[dot + 1:end][:6].ljust(6, "0")
+    return f"{value[:dot]}.{fraction}{value[end:]}"
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from version_info import __version__
+from rate_limiter import call_with_rate_limit, get_rate_limiter
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import logging
+import requests
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+TWITCH_HELIX_BASE_URL = "https://api.twitch.tv/helix"
+TWITCH_OAUTH_BASE_URL = "https://id.twitch.tv/oauth2"
+
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 20
+DEFAULT_POOL_CONNECTIONS = 2
+DEFAULT_POOL_MAXSIZE = 10
+DEFAULT_RETRY_TOTAL = 3
+DEFAULT_RETRY_BACKOFF = 0.5
+
+# urllib3のRetryで再試行する（冪等な）HTTPメソッドとステータス
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "DELETE"})
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+logger = logging.getLogger("AppLogger")
+
+
+class TwitchApiClient:
+    """
+    Twitch Helix/OAuth API用のHTTPクライアント。
+    接続プール付きのrequests.Sessionを共有し、api.twitch.tv / id.twitch.tv への接続を使い回す。
+    Client-IDは既定ヘッダーとして付与し、Bearerトークンは呼び出しごとに指定する。
+    """
+
+    def __init__(
+            self,
+            client_id,
+            helix_base_url=TWITCH_HELIX_BASE_URL,
+            oauth_base_url=TWITCH_OAUTH_BASE_URL,
+            connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+            read_timeout=DEFAULT_READ_TIMEOUT,
+            pool_connections=DEFAULT_POOL_CONNECTIONS,
+            pool_maxsize=DEFAULT_POOL_MAXSIZE,
+            retry_total=DEFAULT_RETRY_TOTAL,
+            retry_backoff=DEFAULT_RETRY_BACKOFF,
+            rate_limiter=None):
+        self.client_id = client_id
+        self.helix_base_url = helix_base_url.rstrip("/")
+        self.oauth_base_url = oauth_base_url.rstrip("/")
+        self.timeout = (float(connect_timeout), float(read_timeout))
+        # Helix APIの呼び出し上限（Ratelimit-*ヘッダーで残数を更新する）
+        self.rate_limiter = rate_limiter if rate_limiter is not None else get_rate_limiter("twitch.helix")
+        self.session = requests.Session()
+        if client_id:
+            self.session.headers["Client-ID"] = client_id
+        # 冪等なリクエストのみ、接続エラー・429・5xxをurllib3側で再試行する
+        # （POSTの再試行は呼び出し側の判断に任せる）
+        retry = Retry(
+            total=int(retry_total),
+            backoff_factor=float(retry_backoff),
+            status_forcelist=RETRY_STATUS_CODES,
+            allowed_methods=IDEMPOTENT_METHODS,
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=int(pool_connections),
+            pool_maxsize=int(pool_maxsize),
+            max_retries=retry,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def helix_url(self, path):
+        return f"{self.helix_base_url}/{path.lstrip('/')}"
+
+    def oauth_url(self, path):
+        return f"{self.oauth_base_url}/{path.lstrip('/')}"
+
+    def request(self, method, url, token=None, **kwargs):
+        """
+        リクエストを送信する。urlが「/」で始まる場合はHelix APIのパスとして扱う。
+        Helix APIへのリクエストは呼び出し上限の範囲で送信する（上限に達していれば回復を待つ）
+        """
+        if url.startswith("/"):
+            url = self.helix_url(url)
+        headers = dict(kwargs.pop("headers", None) or {})
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        kwargs.setdefault("timeout", self.timeout)
+        if url.startswith(self.helix_base_url):
+            return call_with_rate_limit(
+                self.rate_limiter, self.session.request, method, url, headers=headers, **kwargs)
+        return self.session.request(method, url, headers=headers, **kwargs)
+
+    def get(self, url, token=None, **kwargs):
+        return self.request("GET", url, token=token, **kwargs)
+
+    def post(self, url, token=None, **kwargs):
+        return self.request("POST", url, token=token, **kwargs)
+
+    def delete(self, url, token=None, **kwargs):
+        return self.request("DELETE", url, token=token, **kwargs)
+
+    def close(self):
+        # プール中の接続を閉じる
+        self.session.close()
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from version_info import __version__
+import json
+import logging
+import os
+import threading
+import time
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+DEFAULT_APP_TOKEN_PATH = "data/twitch_app_token.json"
+# トークン有効期間のこの割合が経過したらバックグラウンドで更新する
+DEFAULT_REFRESH_RATIO = 0.9
+# 更新に失敗したときの再試行間隔（秒）
+DEFAULT_REFRESH_RETRY_SECONDS = 60
+
+logger = logging.getLogger("AppLogger")
+
+
+class AppTokenManager:
+    """
+    Twitchアプリのアクセストークン（client credentials）を管理する。
+    トークンと有効期限をファイルに保存して再起動後も使い回し、
+    有効期間の一定割合が経過した時点でバックグラウンドスレッドが更新する。
+
+    fetch_token() は (token, expires_at) を返す関数、
+    validate_token(token) は残り有効秒数（無効ならNone）を返す関数。
+    validate_token が例外を出した場合は保存済みの有効期限を信用する。
+    """
+
+    def __init__(
+            self,
+            client_id,
+            fetch_token,
+            validate_token=None,
+            token_path=DEFAULT_APP_TOKEN_PATH,
+            refresh_ratio=DEFAULT_REFRESH_RATIO,
+            retry_seconds=DEFAULT_REFRESH_RETRY_SECONDS,
+            logger_to_use=None):
+        self.client_id = client_id
+        self.fetch_token = fetch_token
+        self.validate_token = validate_token
+        self.token_path = token_path or None
+        self.refresh_ratio = min(max(float(refresh_ratio), 0.1), 1.0)
+        self.retry_seconds = max(1.0, float(retry_seconds))
+        self.logger = logger_to_use if logger_to_use else logger
+        self._token = None
+        self._expires_at = 0.0
+        self._refresh_at = 0.0
+        self._obtained_at = 0.0
+        self._loaded = False
+        # トークン値の読み書き用（短時間のみ保持）と、更新の多重実行防止用のロック
+        self._state_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._refresher = None
+        self.refresh_count = 0
+
+    # --- トークンの取得 ---
+
+    def _current(self, now=None):
+        now = time.time() if now is None else now
+        with self._state_lock:
+            if self._token and now < self._expires_at:
+                return self._token
+        return None
+
+    def get_token(self):
+        """
+        有効なトークンを返す。保存済み・取得済みのトークンが無効な場合のみ同期的に取得する
+        """
+        self.load()
+        token = self._current()
+        if token:
+            return token
+        with self._refresh_lock:
+            # 待っている間に別スレッドが更新済みならそれを使う
+            token = self._current()
+            if token:
+                return token
+            self._refresh_locked()
+            return self._current()
+
+    def refresh(self):
+        """
+        トークンを取得し直す（同時に呼ばれても取得は1回だけ）。成功したらTrue
+        """
+        with self._refresh_lock:
+            return self._refresh_locked()
+
+    def _refresh_locked(self):
+        requested_at = time.time()
+        try:
+            token, expires_at = self.fetch_token()
+        except Exception as e:
+            self.logger.error(f"TwitchAPIアクセストークンの更新に失敗しました: {e}")
+            return False
+        if not token:
+            return False
+        self._set_token(token, float(expires_at), requested_at)
+        self.refresh_count += 1
+        self.save()
+        return True
+
+    def _set_token(self, token, expires_at, obtained_at):
+        lifetime = max(0.0, expires_at - obtained_at)
+        with self._state_lock:
+            self._token = token
+            self._expires_at = expires_at
+            self._obtained_at = obtained_at
+            self._refresh_at = obtained_at + lifetime * self.refresh_ratio
+
+    def invalidate(self, token=None):
+        # APIから401が返った場合などに、保持しているトークンを破棄する。
+        # tokenを指定した場合は、別スレッドが既に取り直していればそのトークンは破棄しない
+        with self._state_lock:
+            if token is not None and self._token != token:
+                return
+            self._token = None
+            self._expires_at = 0.0
+            self._refresh_at = 0.0
+        self._remove_file()
+
+    @property
+    def expires_at(self):
+        with self._state_lock:
+            return self._expires_at
+
+    @property
+    def refresh_at(self):
+        with self._state_lock:
+            return self._refresh_at
+
+    # --- ファイルへの保存・読み込み ---
+
+    def load(self):
+        """
+        保存済みのトークンを読み込み、/validate で有効か確認する（初回のみ）。
+        使えるトークンを読み込めた場合はTrue
+        """
+        # 読み込み済みなら、バックグラウンド更新中でもロックを待たずに返す
+        if self._loaded:
+            return self._current() is not None
+        with self._refresh_lock:
+            if self._loaded:
+                return self._current() is not None
+            self._loaded = True
+            return self._load_locked()
+
+    def _load_locked(self):
+        if not self.token_path or not os.path.exists(self.token_path):
+            return False
+        try:
+            with open(self.token_path, encoding="utf-8") as f:
+                data = json.load(f)
+            token = data["access_token"]
+            expires_at = float(data["expires_at"])
+            obtained_at = float(data.get("obtained_at", 0))
+            client_id = data.get("client_id")
+        except Exception as e:
+            self.logger.warning(f"保存済みTwitchAPIアクセストークンの読み込みに失敗しました: {self.token_path}, エラー: {e}")
+            return False
+
+        now = time.time()
+        if client_id != self.client_id or not token or now >= expires_at:
+            self.logger.info("保存済みTwitchAPIアクセストークンは期限切れか別のクライアントのものため、使用しません。")
+            self._remove_file()
+            return False
+
+        if self.validate_token is not None:
+            try:
+                remaining = self.validate_token(token)
+            except Exception as e:
+                # 検証APIに到達できない場合は保存済みの有効期限を信用する
+                self.logger.warning(f"TwitchAPIアクセストークンの検証に失敗しました（保存済みの有効期限を使用します）: {e}")
+            else:
+                if remaining is None:
+                    self.logger.info("保存済みTwitchAPIアクセストークンは無効になっていたため、再取得します。")
+                    self._remove_file()
+                    return False
+                expires_at = min(expires_at, now + float(remaining))
+
+        self._set_token(token, expires_at, obtained_at or now)
+        self.logger.info("保存済みのTwitchAPIアクセストークンを読み込みました。")
+        return True
+
+    def save(self):
+        """
+        トークンと有効期限をファイルに保存する（所有者のみ読み書き可能）
+        """
+        if not self.token_path:
+            return False
+        with self._state_lock:
+            if not self._token:
+                return False
+            data = {
+                "client_id": self.client_id,
+                "access_token": self._token,
+                "expires_at": self._expires_at,
+                "obtained_at": self._obtained_at,
+            }
+        try:
+            directory = os.path.dirname(self.token_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.token_path}.tmp"
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            # umaskや既存ファイルの権限に関係なく所有者のみに制限する
+            os.chmod(tmp_path, 0o600)
+            os.replace(tmp_path, self.token_path)
+            return True
+        except Exception as e:
+            self.logger.warning(f"TwitchAPIアクセストークンの保存に失敗しました: {self.token_path}, エラー: {e}")
+            return False
+
+    def _remove_file(self):
+        if not self.token_path:
+            return
+        try:
+            os.remove(self.token_path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            self.logger.warning(f"保存済みTwitchAPIアクセストークンの削除に失敗しました: {self.token_path}, エラー: {e}")
+
+    # --- バックグラウンド更新 ---
+
+    def start(self):
+        # 有効期間の一定割合が経過したら更新するスレッドを起動する（起動済みなら何もしない）
+        if self._refresher is not None and self._refresher.is_alive():
+            return
+        self._stop_event.clear()
+        self._refresher = threading.Thread(
+            target=self._refresh_loop, name="TwitchAppTokenRefresher", daemon=True)
+        self._refresher.start()
+
+    def stop(self, timeout=5):
+        self._stop_event.set()
+        if self._refresher is not None:
+            self._refresher.join(timeout=timeout)
+            self._refresher = None
+
+    def _refresh_loop(self):
+        self.load()
+        while not self._stop_event.is_set():
+            with self._state_lock:
+                has_token = self._token is not None
+                refresh_at = self._refresh_at
+            wait = refresh_at - time.time() if has_token else 0
+            if wait > 0:
+                # 同期取得などで更新時刻が変わることがあるので、最大でも再試行間隔ごとに見直す
+                self._stop_event.wait(min(wait, self.retry_seconds))
+                continue
+            if not self.refresh():
+                self._stop_event.wait(self.retry_seconds)
@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+Stream notify on Bluesky
+
+このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
+"""
+
+from version_info import __version__
+import json
+import logging
+import os
+import threading
+import time
+
+__author__ = "mayuneco(mayunya)"
+__copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
+__license__ = "GPLv2"
+__app_version__ = __version__
+
+# Stream notify on Bluesky
+# Copyright (C) 2025 mayuneco(mayunya)
+#
+# このプログラムはフリーソフトウェアです。フリーソフトウェア財団によって発行された
+# GNU 一般公衆利用許諾契約書（バージョン2またはそれ以降）に基づき、再配布または
+# 改変することができます。
+#
+# このプログラムは有用であることを願って配布されていますが、
+# 商品性や特定目的への適合性についての保証はありません。
+# 詳細はGNU一般公衆利用許諾契約書をご覧ください。
+#
+# このプログラムとともにGNU一般公衆利用許諾契約書が配布されているはずです。
+# もし同梱されていない場合は、フリーソフトウェア財団までご請求ください。
+# 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+
+DEFAULT_USER_ID_CACHE_PATH = "data/twitch_user_ids.json"
+# ログイン名は変更・再取得されることがあるため、一定期間で取り直す
+DEFAULT_USER_ID_TTL = 7 * 24 * 60 * 60
+# Helix /users に1回で指定できるlogin=パラメータの上限
+HELIX_USERS_BATCH_SIZE = 100
+
+logger = logging.getLogger("AppLogger")
+
+
+def normalize_login(login):
+    # Twitchのログイン名は大文字小文字を区別しないので小文字で扱う
+    return str(login).strip().lower()
+
+
+class UserIdCache:
+    """
+    Twitchのログイン名→ユーザーIDの対応をTTL付きでファイルに保存するキャッシュ。
+    """
+
+    def __init__(self, path=DEFAULT_USER_ID_CACHE_PATH, ttl_seconds=DEFAULT_USER_ID_TTL):
+        self.path = path or None
+        self.ttl_seconds = float(ttl_seconds)
+        # login -> (user_id, resolved_at)
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            for login, item in data.get("entries", {}).items():
+                self._entries[normalize_login(login)] = (str(item["id"]), float(item["resolved_at"]))
+        except Exception as e:
+            logger.warning(f"TwitchユーザーIDキャッシュの読み込みに失敗しました: {self.path}, エラー: {e}")
+            self._entries = {}
+
+    def get(self, login, now=None):
+        # 有効期限内のユーザーIDを返す（未登録・期限切れならNone）
+        now = time.time() if now is None else now
+        with self._lock:
+            self._ensure_loaded()
+            item = self._entries.get(normalize_login(login))
+        if item is None or now - item[1] >= self.ttl_seconds:
+            return None
+        return item[0]
+
+    def put_many(self, mapping, now=None):
+        now = time.time() if now is None else now
+        with self._lock:
+            self._ensure_loaded()
+            for login, user_id in mapping.items():
+                self._entries[normalize_login(login)] = (str(user_id), now)
+
+    def __len__(self):
+        with self._lock:
+            self._ensure_loaded()
+            return len(self._entries)
+
+    def save(self):
+        if not self.path:
+            return False
+        with self._lock:
+            self._ensure_loaded()
+            entries = {
+                login: {"id": user_id, "resolved_at": resolved_at}
+                for login, (user_id, resolved_at) in self._entries.items()
+            }
+        try:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"entries": entries}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            return True
+        except Exception as e:
+            logger.warning(f"TwitchユーザーIDキャッシュの保存に失敗しました: {self.path}, エラー: {e}")
+            return False
+
+
+class TwitchUserResolver:
+    """
+    複数のログイン名をまとめてユーザーIDに変換する。
+    キャッシュにないログイン名だけを、100件ずつHelix /users に問い合わせる。
+
+    fetch_users(logins) はHelix /users のdata配列（{"id","login",...}のリスト）を返す関数。
+    """
+
+    def __init__(self, fetch_users, cache=None, batch_size=HELIX_USERS_BATCH_SIZE):
+        self.fetch_users = fetch_users
+        self.cache = cache if cache is not None else UserIdCache()
+        self.batch_size = max(1, min(int(batch_size), HELIX_USERS_BATCH_SIZE))
+        self.request_count = 0
+
+    def resolve(self, logins):
+        """
+        ログイン名→ユーザーIDの辞書を返す（キーは小文字化したログイン名）。
+        数値のみの値は既にIDとみなしてそのまま返し、Twitchに存在しないログイン名は含めない
+        """
+        result = {}
+        misses = []
+        for login in logins:
+            key = normalize_login(login)
+            if not key or key in result or key in misses:
+                continue
+            if key.isdigit():
+                result[key] = key
+                continue
+            user_id = self.cache.get(key)
+            if user_id:
+                result[key] = user_id
+            else:
+                misses.append(key)
+
+        if not misses:
+            return result
+
+        resolved = {}
+        for start in range(0, len(misses), self.batch_size):
+            batch = misses[start:start + self.batch_size]
+            self.request_count += 1
+            for user in self.fetch_users(batch):
+                resolved[normalize_login(user["login"])] = str(user["id"])
+        if resolved:
+            self.cache.put_many(resolved)
+            self.cache.save()
+        for key in misses:
+            if key in resolved:
+                result[key] = resolved[key]
+        return result
@@ -5,19 +5,18 @@ Stream notify on Bluesky
 このモジュールはTwitch/YouTube/Niconicoの放送と動画投稿の通知をBlueskyに送信するBotの一部です。
 """
 
-from tkinter import filedialog
 import requests
 from version_info import __version__
+from timezone_service import get_timezone, localize, parse_rfc3339
+from retry_policy import RetryPolicy
 import re
 import datetime as dt_module  # datetimeクラスとの衝突を避けるためのエイリアス
-from datetime import datetime, timezone  # 必要なクラスのみインポート
+from datetime import datetime  # 必要なクラスのみインポート
 import os
 import secrets
 import logging
-import time
-import pytz
-from tzlocal import get_localzone
 import sys
+import threading
 sys.path.insert(0, os.path.abspath(
     os.path.join(os.path.dirname(__file__), '..')))
 
@@ -52,39 +51,9 @@ def format_datetime_filter(iso_datetime_str, fmt="%Y-%m-%d %H:%M %Z"):
     if not iso_datetime_str:
         return ""
     try:
-        # 例: "2023-10-27T10:00:00Z" のような文字列をUTCとして解釈
-        dt_utc = datetime.fromisoformat(
-            iso_datetime_str.replace('Z', '+00:00'))
-
-        # 環境変数からタイムゾーンを取得（未指定ならシステムローカル）
-        target_tz_name = os.getenv("TIMEZONE", "system")
-        target_tz = None
-
-        if target_tz_name.lower() == "system":
-            try:
-                target_tz = get_localzone()
-                if target_tz is None:
-                    util_logger.warning(
-                        "format_datetime_filter: tzlocal.get_localzone()がNoneを返しました。UTCにフォールバックします。")
-                    target_tz = timezone.utc
-            except Exception as e:
-                util_logger.warning(
-                    f"format_datetime_filter: tzlocalでシステムタイムゾーン取得エラー: {e}。UTCにフォールバックします。")
-                target_tz = timezone.utc
-        else:
-            try:
-                target_tz = pytz.timezone(target_tz_name)
-            except pytz.UnknownTimeZoneError:
-                util_logger.warning(
-                    f"format_datetime_filter: 設定のタイムゾーン '{target_tz_name}' が不明です。UTCにフォールバックします。")
-                target_tz = timezone.utc
-            except Exception as e:
-                util_logger.warning(
-                    f"format_datetime_filter: pytz.timezoneでエラー: '{target_tz_name}': {e}。UTCにフォールバックします。")
-                target_tz = timezone.utc
-
-        dt_localized = dt_utc.astimezone(target_tz)
-        return dt_localized.strftime(fmt)
+        # 例: "2023-10-27T10:00:00Z" のような文字列をUTCとして解釈し、設定のタイムゾーンに変換
+        # （タイムゾーンは設定スナップショットごとに一度だけ解決される）
+        return parse_rfc3339(iso_datetime_str).astimezone(get_timezone()).strftime(fmt)
     except ValueError as e:
         util_logger.error(
             f"format_datetime_filter: 日時文字列 '{iso_datetime_str}' のフォーマット '{fmt}' 変換エラー: {e}")
@@ -95,12 +64,36 @@ def format_datetime_filter(iso_datetime_str, fmt="%Y-%m-%d %H:%M %Z"):
         return iso_datetime_str
 
 
+# settings.envの読み込み→書き換えを直列化するロック（起動ステップは並行して書き込むことがある）
+_env_file_lock = threading.RLock()
+
+
+def _write_env_lines(file_path, lines):
+    """
+    一時ファイルに書いてから置き換える（読み込み側が書きかけのファイルを見ないようにする）
+    """
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.writelines(lines)
+    if os.path.exists(file_path):
+        try:
+            os.chmod(tmp_path, os.stat(file_path).st_mode & 0o777)
+        except OSError:
+            pass
+    os.replace(tmp_path, file_path)
+
+
 def update_env_file_preserve_comments(file_path, updates):
     """
     .envファイルのコメント・空行を保持したまま、指定キーのみ値を更新する
     file_path: .envファイルのパス
     updates: 更新するkey-valueの辞書
     """
+    with _env_file_lock:
+        _update_env_file(file_path, updates)
+
+
+def _update_env_file(file_path, updates):
     with open(file_path, 'r', encoding='utf-8') as f:
         lines = f.readlines()
 
@@ -126,8 +119,7 @@ def update_env_file_preserve_comments(file_path, updates):
         if key not in updated_keys:
             new_lines.append(f'{key}={value}\n')
 
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.writelines(new_lines)
+    _write_env_lines(file_path, new_lines)
 
 
 SETTINGS_ENV_PATH = "settings.env"
@@ -135,32 +127,50 @@ SECRET_KEY_NAME = "WEBHOOK_SECRET"
 ROTATED_KEY_NAME = "SECRET_LAST_ROTATED"
 
 
+def load_settings_env(path=None, override=False):
+    """
+    settings.envを環境変数に読み込む（エントリポイントから明示的に呼ぶ）。
+    pathを省略した場合はこのモジュールと同じディレクトリのsettings.envを読む。
+    ファイルが存在して読み込めたらTrue
+    """
+    from dotenv import load_dotenv
+
+    if path is None:
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), SETTINGS_ENV_PATH)
+    if not os.path.exists(path):
+        return False
+    return load_dotenv(dotenv_path=path, override=override)
+
+
+def env_int(name, default):
+    """
+    呼び出し時点の環境変数を整数で返す関数を作る。
+    デコレータの引数など、import時に値を決めたくない設定に使う
+    """
+    return lambda: int(os.getenv(name, default))
+
+
 def retry_on_exception(
-        max_retries: int = 3,
-        wait_seconds: float = 2,
-        exceptions=(Exception,)
+        max_retries=3,
+        wait_seconds=2,
+        exceptions=(Exception,),
+        classify=None,
+        policy=None
 ):
     """
-    指定した例外が発生した場合にリトライするデコレータ
+    指定した例外が発生した場合にリトライするデコレータ。
+    待ち時間はwait_secondsを基準にした指数バックオフ（ジッター付き）で、
+    サーバーのRetry-After・ratelimit-resetがあればそれに従う（retry_policy.RetryPolicy）。
+    max_retries・wait_secondsに関数を渡すと、呼び出しのたびに値を取得する
     """
     def decorator(func):
-        def wrapper(*args, **kwargs):
-            last_exception = None
-            for attempt in range(1, max_retries + 1):
-                try:
-                    return func(*args, **kwargs)
-                except exceptions as e:
-                    # ロガーが設定されている前提で警告を出力
-                    logging.getLogger("AppLogger").warning(
-                        f"リトライ{attempt}/{max_retries}回目: {func.__name__} "
-                        f"例外: {e}"
-                    )
-                    last_exception = e
-                    time.sleep(wait_seconds)
-            if last_exception is not None:
-                raise last_exception
-            return None  # ここに到達するのは想定外
-        return wrapper
+        retry_policy = policy if policy is not None else RetryPolicy(
+            func.__name__,
+            max_attempts=max_retries,
+            base_delay=wait_seconds,
+            retryable=exceptions,
+            classify=classify)
+        return retry_policy(func)
     return decorator
 
 
@@ -197,45 +207,7 @@ def rotate_secret_if_needed(logger=None, force=False):
 
     env = read_env()
 
-    TIMEZONE_NAME = os.getenv("TIMEZONE", "system")
-    tz_object = None
-    if TIMEZONE_NAME.lower() == "system":
-        try:
-            tz_object = get_localzone()
-            if tz_object is None:
-                logger_to_use.warning(
-                    "rotate_secret: tzlocal.get_localzone()がNoneを返しました。UTCにフォールバックします。")
-                tz_object = timezone.utc
-        except Exception as e:
-            logger_to_use.warning(
-                f"rotate_secret: tzlocalでシステムタイムゾーン取得エラー: {e}。UTCにフォールバックします。")
-            tz_object = timezone.utc
-    else:
-        try:
-            tz_object = pytz.timezone(TIMEZONE_NAME)
-        except pytz.UnknownTimeZoneError:
-            logger_to_use.warning(
-                f"rotate_secret: 指定タイムゾーン '{TIMEZONE_NAME}' は無効です。システムタイムゾーンにフォールバックします。"
-            )
-            try:
-                tz_object = get_localzone()
-                if tz_object is None:
-                    logger_to_use.warning(
-                        "rotate_secret: tzlocal.get_localzone() (fallback)がNoneを返しました。UTCにフォールバックします。")
-                    tz_object = timezone.utc
-            except Exception as e:
-                logger_to_use.warning(
-                    f"rotate_secret: システムタイムゾーン取得失敗 ({e})。UTCにフォールバックします。")
-                tz_object = timezone.utc
-        except Exception as e:
-            logger_to_use.warning(
-                f"rotate_secret: pytz.timezoneでエラー: '{TIMEZONE_NAME}' ({e})。UTCにフォールバックします。")
-            tz_object = timezone.utc
-
-    if tz_object is None:
-        logger_to_use.warning("rotate_secret: タイムゾーン解決に失敗。UTCを使用します。")
-        tz_object = timezone.utc
-
+    tz_object = get_timezone()
     now = datetime.now(tz_object)
     last_rotated_str = env.get(ROTATED_KEY_NAME)
     need_rotate = force
@@ -247,10 +219,7 @@ def rotate_secret_if_needed(logger=None, force=False):
         if last_rotated_str:
             try:
                 last_rotated_dt = datetime.fromisoformat(last_rotated_str)
-                if last_rotated_dt.tzinfo is None:
-                    last_rotated_dt = tz_object.localize(last_rotated_dt)
-                else:
-                    last_rotated_dt = last_rotated_dt.astimezone(tz_object)
+                last_rotated_dt = localize(last_rotated_dt, tz_object)
 
                 if (now - last_rotated_dt).days >= 30:
                     need_rotate = True
@@ -317,6 +286,9 @@ def change_template_file(var):
     """
     テンプレートファイル選択ダイアログを開き、選択したパスをStringVar等にセットする共通関数
     """
+    # GUIからのみ使うため、tkinterは呼び出し時に読み込む
+    from tkinter import filedialog
+
     path = filedialog.askopenfilename(
         title="テンプレートファイルを選択", filetypes=[("Text files", "*.txt")])
     if path:
@@ -327,6 +299,8 @@ def change_image_file(var):
     """
     画像ファイル選択ダイアログを開き、選択したパスをStringVar等にセットする共通関数
     """
+    from tkinter import filedialog
+
     path = filedialog.askopenfilename(
         title="画像ファイルを選択", filetypes=[("Image files", "*.png;*.jpg;*.jpeg;*.gif")])
     if path:
@@ -369,22 +343,22 @@ def set_webhook_callback_url_temporary(url, env_path="settings.env"):
     """
     settings.envのWEBHOOK_CALLBACK_URL_TEMPORARYを指定URLで更新
     """
-    lines = []
-    if os.path.exists(env_path):
-        with open(env_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
-    new_lines = []
-    found = False
-    for line in lines:
-        if line.startswith('WEBHOOK_CALLBACK_URL_TEMPORARY='):
+    with _env_file_lock:
+        lines = []
+        if os.path.exists(env_path):
+            with open(env_path, 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+        new_lines = []
+        found = False
+        for line in lines:
+            if line.startswith('WEBHOOK_CALLBACK_URL_TEMPORARY='):
+                new_lines.append(f'WEBHOOK_CALLBACK_URL_TEMPORARY={url}\n')
+                found = True
+            else:
+                new_lines.append(line)
+        if not found:
             new_lines.append(f'WEBHOOK_CALLBACK_URL_TEMPORARY={url}\n')
-            found = True
-        else:
-            new_lines.append(line)
-    if not found:
-        new_lines.append(f'WEBHOOK_CALLBACK_URL_TEMPORARY={url}\n')
-    with open(env_path, 'w', encoding='utf-8') as f:
-        f.writelines(new_lines)
+        _write_env_lines(env_path, new_lines)
 
 
 # このファイルを直接実行した場合のテストコード例
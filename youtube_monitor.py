@@ -21,9 +21,12 @@ Stream notify on Bluesky
 # 住所: 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
 
 from version_info import __version__
+import logging
+import threading
 import time
 import requests
 from threading import Thread, Event
+from retry_policy import RetryPolicy, is_retryable_http_error
 import sys
 import os
 sys.path.insert(0, os.path.abspath(
@@ -34,10 +37,72 @@ __copyright__ = "Copyright (C) 2025 mayuneco(mayunya)"
 __license__ = "GPLv2"
 __app_version__ = __version__
 
+YOUTUBE_API_BASE = "https://www.googleapis.com/youtube/v3"
+
+# YouTube Data API v3 の各メソッドのクォータ消費量（1回あたり）
+QUOTA_COSTS = {
+    "search.list": 100,
+    "channels.list": 1,
+    "playlistItems.list": 1,
+    "videos.list": 1,
+}
+
+# videos.listで一度に指定できる動画IDの上限
+VIDEOS_LIST_MAX_IDS = 50
+# 1回の監視で確認するアップロード済み動画の件数（playlistItems.listのmaxResults、最大50）
+DEFAULT_PLAYLIST_MAX_RESULTS = 10
+# 取得に失敗し続けた場合に監視間隔を延ばす上限（監視間隔の何倍まで延ばすか）
+MAX_BACKOFF_MULTIPLIER = 16
+
+logger = logging.getLogger("AppLogger")
+
+
+class YouTubeQuota:
+    """
+    YouTube Data APIのクォータ消費量を集計する。監視1回（サイクル）ごとの消費量と累計を記録する。
+    """
+
+    def __init__(self):
+        self.total_units = 0
+        self.cycle_units = 0
+        self.cycle_calls = {}
+        self.last_cycle_units = 0
+        self.last_cycle_calls = {}
+        self._lock = threading.Lock()
+
+    def charge(self, method, calls=1):
+        # APIを呼び出した分のクォータを加算する
+        units = QUOTA_COSTS.get(method, 1) * calls
+        with self._lock:
+            self.total_units += units
+            self.cycle_units += units
+            self.cycle_calls[method] = self.cycle_calls.get(method, 0) + calls
+        return units
+
+    def start_cycle(self):
+        with self._lock:
+            self.cycle_units = 0
+            self.cycle_calls = {}
+
+    def end_cycle(self):
+        """
+        サイクルを締めて、そのサイクルの消費量 {"units", "calls", "total_units"} を返す
+        """
+        with self._lock:
+            self.last_cycle_units = self.cycle_units
+            self.last_cycle_calls = dict(self.cycle_calls)
+            return {
+                "units": self.last_cycle_units,
+                "calls": self.last_cycle_calls,
+                "total_units": self.total_units,
+            }
+
 
 class YouTubeMonitor(Thread):
     """
     YouTubeライブ配信および動画投稿の新着を監視するスレッド。
+    search.list（100ユニット）は使わず、チャンネルのアップロード再生リストを
+    playlistItems.list（1ユニット）で取得し、videos.list（50件まで1ユニット）で配信状態を確認する。
     """
 
     def __init__(
@@ -47,7 +112,8 @@ class YouTubeMonitor(Thread):
             poll_interval,
             on_live,
             on_new_video,
-            shutdown_event=None):
+            shutdown_event=None,
+            playlist_max_results=DEFAULT_PLAYLIST_MAX_RESULTS):
         # APIキー、チャンネルID、ポーリング間隔、コールバック関数を初期化
         super().__init__(daemon=True)
         self.api_key = api_key
@@ -58,10 +124,26 @@ class YouTubeMonitor(Thread):
         self.last_live_status = False
         self.last_video_id = None
         self.shutdown_event = shutdown_event if shutdown_event is not None else Event()
+        self.playlist_max_results = max(1, min(50, int(playlist_max_results)))
+        self.quota = YouTubeQuota()
+        self.uploads_playlist_id = None
+        # 現在のサイクルで取得した動画情報（check_live/get_latest_video_idで共有する）
+        self._cycle_videos = None
+        self._in_cycle = False
+        # 失敗が続いたら次回の確認を遅らせる（429・クォータ超過時はサーバーの指定に従う）
+        self.retry_policy = RetryPolicy(
+            "youtube",
+            base_delay=poll_interval,
+            max_delay=poll_interval * MAX_BACKOFF_MULTIPLIER,
+            classify=is_retryable_http_error)
+        self.consecutive_failures = 0
 
     def run(self):
         # スレッドのメインループ。shutdown_eventがセットされたら安全に終了
         while not self.shutdown_event.is_set():
+            self.quota.start_cycle()
+            self._cycle_videos = None
+            self._in_cycle = True
             try:
                 # ライブ配信の有無を確認
                 live = self.check_live()
@@ -75,33 +157,119 @@ class YouTubeMonitor(Thread):
                     self.on_new_video(video_id)
                     self.last_video_id = video_id
 
+                self.consecutive_failures = 0
+                wait = self.poll_interval
             except Exception as e:
                 print(f"[YouTubeMonitor] エラー発生: {e}")
-            self.shutdown_event.wait(self.poll_interval)
+                wait = self.next_poll_delay(e)
+            finally:
+                self._in_cycle = False
+                self._cycle_videos = None
+                usage = self.quota.end_cycle()
+                logger.debug(
+                    f"[YouTubeMonitor] クォータ消費: {usage['units']}ユニット {usage['calls']} "
+                    f"(累計 {usage['total_units']}ユニット)")
+            self.shutdown_event.wait(wait)
+
+    def next_poll_delay(self, error):
+        # 失敗後、次に確認するまでの秒数（通常の監視間隔より短くはしない）
+        self.consecutive_failures += 1
+        wait = self.retry_policy.reschedule_delay(
+            self.consecutive_failures, error, minimum=self.poll_interval)
+        if wait > self.poll_interval:
+            logger.warning(f"[YouTubeMonitor] 取得エラーが続いているため、{wait:.0f}秒後に再確認します。")
+        return wait
+
+    def _api_get(self, method, endpoint, params):
+        # YouTube Data APIを呼び出し、クォータを記録してJSONを返す
+        self.quota.charge(method)
+        resp = requests.get(
+            f"{YOUTUBE_API_BASE}/{endpoint}",
+            params={**params, "key": self.api_key},
+            timeout=10)
+        resp.raise_for_status()
+        return resp.json()
+
+    def get_uploads_playlist_id(self):
+        """
+        チャンネルのアップロード再生リストIDを取得する（初回のみAPIを呼び、以降は保持した値を使う）
+        """
+        if self.uploads_playlist_id:
+            return self.uploads_playlist_id
+        data = self._api_get("channels.list", "channels", {
+            "part": "contentDetails",
+            "id": self.channel_id,
+        })
+        items = data.get("items", [])
+        if items:
+            self.uploads_playlist_id = items[0]["contentDetails"]["relatedPlaylists"]["uploads"]
+        elif self.channel_id.startswith("UC"):
+            # チャンネルIDの先頭「UC」を「UU」に置き換えたものがアップロード再生リストID
+            self.uploads_playlist_id = "UU" + self.channel_id[2:]
+        else:
+            raise ValueError(f"YouTubeチャンネルが見つかりません: {self.channel_id}")
+        return self.uploads_playlist_id
+
+    def list_recent_upload_ids(self):
+        """
+        アップロード再生リストから新しい順に動画IDを取得する
+        """
+        data = self._api_get("playlistItems.list", "playlistItems", {
+            "part": "contentDetails",
+            "playlistId": self.get_uploads_playlist_id(),
+            "maxResults": self.playlist_max_results,
+        })
+        return [item["contentDetails"]["videoId"]
+                for item in data.get("items", [])
+                if item.get("contentDetails", {}).get("videoId")]
+
+    def get_videos(self, video_ids):
+        """
+        videos.listで動画情報（snippet・liveStreamingDetails）を取得する。50件ずつまとめて問い合わせる
+        """
+        videos = {}
+        for i in range(0, len(video_ids), VIDEOS_LIST_MAX_IDS):
+            chunk = video_ids[i:i + VIDEOS_LIST_MAX_IDS]
+            data = self._api_get("videos.list", "videos", {
+                "part": "snippet,liveStreamingDetails",
+                "id": ",".join(chunk),
+                "maxResults": len(chunk),
+            })
+            for item in data.get("items", []):
+                videos[item["id"]] = item
+        # 再生リストの並び（新しい順）を保つ
+        return [videos[video_id] for video_id in video_ids if video_id in videos]
+
+    def _get_cycle_videos(self):
+        # 監視サイクル中は1回だけ再生リストと動画情報を取得し、check_live/get_latest_video_idで共有する
+        if self._cycle_videos is not None:
+            return self._cycle_videos
+        videos = self.get_videos(self.list_recent_upload_ids())
+        if self._in_cycle:
+            self._cycle_videos = videos
+        return videos
+
+    @staticmethod
+    def _is_live(video):
+        details = video.get("liveStreamingDetails") or {}
+        if video.get("snippet", {}).get("liveBroadcastContent") == "live":
+            return True
+        return bool(details.get("actualStartTime")) and not details.get("actualEndTime")
 
     def check_live(self):
         """
         チャンネルで現在ライブ配信中かどうかを判定。
         """
-        url = (
-            f"https://www.googleapis.com/youtube/v3/search"
-            f"?part=snippet&channelId={self.channel_id}&eventType=live&type=video&key={self.api_key}"
-        )
-        resp = requests.get(url)
-        data = resp.json()
-        return len(data.get("items", [])) > 0
+        return any(self._is_live(video) for video in self._get_cycle_videos())
 
     def get_latest_video_id(self):
         """
-        チャンネルの最新動画IDを取得。
+        チャンネルの最新動画IDを取得（ライブ配信・配信予定枠・配信アーカイブは除く）。
         """
-        url = (
-            f"https://www.googleapis.com/youtube/v3/search"
-            f"?part=snippet&channelId={self.channel_id}&order=date&type=video&key={self.api_key}&maxResults=1"
-        )
-        resp = requests.get(url)
-        data = resp.json()
-        items = data.get("items", [])
-        if items:
-            return items[0]["id"]["videoId"]
+        for video in self._get_cycle_videos():
+            if video.get("liveStreamingDetails"):
+                continue
+            if video.get("snippet", {}).get("liveBroadcastContent", "none") != "none":
+                continue
+            return video["id"]
         return None